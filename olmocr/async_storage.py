@@ -0,0 +1,334 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from olmocr.s3_utils import parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# Threads for blocking storage calls, kept apart from the default executor so that slow storage never holds up the
+# other work that runs via asyncio.to_thread. The S3 clients get a connection pool of the same size, so no thread waits on a connection.
+STORAGE_MAX_WORKERS = 64
+
+# Attempts that botocore makes of each request, in its adaptive mode, which also rate limits the client as a whole once S3
+# starts throttling it. AsyncStorage retries on top of that, with a backoff per bucket.
+S3_CLIENT_MAX_ATTEMPTS = 5
+
+# Most requests in flight to any one bucket, which is halved each time the bucket answers with SlowDown, and grows back by one
+# after as many successful requests as the current limit
+STORAGE_BUCKET_CONCURRENCY = 32
+
+# Transient errors are retried this many times, after a random delay of up to base * 2^attempt seconds, capped at max
+STORAGE_MAX_RETRIES = 8
+STORAGE_BACKOFF_BASE_SECS = 0.5
+STORAGE_BACKOFF_MAX_SECS = 30.0
+
+# Error codes with which S3 (or something S3-compatible) asks clients to send fewer requests
+THROTTLING_ERROR_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException", "503"}
+
+# Error codes of requests that failed on the server's side, and may well succeed if sent again
+TRANSIENT_ERROR_CODES = {"InternalError", "RequestTimeout", "ServiceUnavailable", "500", "502", "504"}
+
+
+def _classify_error(e: Exception) -> Optional[str]:
+    """Returns "throttled" or "transient" for errors worth retrying, None for the ones that would fail again"""
+    if isinstance(e, ClientError):
+        code = e.response.get("Error", {}).get("Code")
+        if code in THROTTLING_ERROR_CODES:
+            return "throttled"
+        if code in TRANSIENT_ERROR_CODES or e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500:
+            return "transient"
+        return None
+    if isinstance(e, (ConnectionError, HTTPClientError)):
+        return "transient"
+    return None
+
+
+@dataclass
+class S3RequestStats:
+    """Counters of the requests to one bucket, latencies are until the response headers, not the whole body"""
+
+    requests: int = 0
+    errors: int = 0
+    throttled: int = 0
+    retries: int = 0
+    total_secs: float = 0.0
+    max_secs: float = 0.0
+
+    def __str__(self) -> str:
+        mean_ms = 1000 * self.total_secs / self.requests if self.requests else 0.0
+        return (
+            f"{self.requests:,} requests, {self.errors:,} errors ({self.throttled:,} throttled), {self.retries:,} retries, "
+            f"{mean_ms:,.0f} ms mean, {1000 * self.max_secs:,.0f} ms max latency"
+        )
+
+
+# Clients made by get_s3_client, boto3 clients are thread safe, but not fork safe, so they are kept per process
+_s3_clients: Dict[tuple, Any] = {}
+_s3_clients_lock = threading.Lock()
+
+_request_stats: Dict[str, S3RequestStats] = defaultdict(S3RequestStats)
+_request_stats_lock = threading.Lock()
+
+
+def _start_request(params, context, **kwargs):
+    context["olmocr_bucket"] = params.get("Bucket")
+    context["olmocr_start_time"] = time.perf_counter()
+
+
+def _record_request(context, error_code: Optional[str], retries: int) -> None:
+    bucket = context.get("olmocr_bucket")
+    if bucket is None:
+        return
+
+    secs = time.perf_counter() - context["olmocr_start_time"]
+    with _request_stats_lock:
+        stats = _request_stats[bucket]
+        stats.requests += 1
+        stats.retries += retries
+        stats.total_secs += secs
+        stats.max_secs = max(stats.max_secs, secs)
+        if error_code is not None:
+            stats.errors += 1
+            stats.throttled += error_code in THROTTLING_ERROR_CODES
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    error_code = parsed.get("Error", {}).get("Code", str(http_response.status_code)) if http_response.status_code >= 300 else None
+    _record_request(context, error_code, parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+
+def _after_call_error(exception, context, **kwargs):
+    _record_request(context, type(exception).__name__, 0)
+
+
+def get_s3_client(
+    profile_name: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = STORAGE_MAX_WORKERS,
+    aws_access_key_id: Optional[str] = None,
+    aws_secret_access_key: Optional[str] = None,
+):
+    """
+    Returns a boto3 S3 client, shared by everyone in this process who asks for the same one, rather than making a new
+    client, with a cold connection pool, for every call.
+
+    The clients retry in botocore's adaptive mode, and count their requests per bucket, see s3_request_stats().
+
+    Args:
+        profile_name: AWS profile, None for the default credentials
+        endpoint_url: Endpoint of an S3-compatible store, None for S3 itself
+        max_pool_connections: Size of the connection pool, which should be at least the number of threads that use the client at once
+        aws_access_key_id: Explicit credentials, instead of the ones of the profile
+        aws_secret_access_key: Explicit credentials, instead of the ones of the profile
+    """
+    key = (os.getpid(), profile_name, endpoint_url, max_pool_connections, aws_access_key_id, aws_secret_access_key)
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is None:
+            # Sessions aren't thread safe, which the lock takes care of as well
+            session = boto3.Session(profile_name=profile_name, aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
+            config = Config(max_pool_connections=max_pool_connections, retries={"mode": "adaptive", "max_attempts": S3_CLIENT_MAX_ATTEMPTS})
+            client = session.client("s3", endpoint_url=endpoint_url, config=config)
+            client.meta.events.register("provide-client-params.s3", _start_request)
+            client.meta.events.register("after-call.s3", _after_call)
+            client.meta.events.register("after-call-error.s3", _after_call_error)
+            _s3_clients[key] = client
+        return client
+
+
+def clear_s3_clients() -> None:
+    """Forgets the clients made so far, so that the next ones pick up credentials that changed since"""
+    with _s3_clients_lock:
+        _s3_clients.clear()
+
+
+def s3_request_stats() -> Dict[str, S3RequestStats]:
+    """Copies of the request counters of each bucket, across all the clients made by get_s3_client"""
+    with _request_stats_lock:
+        return {bucket: replace(stats) for bucket, stats in _request_stats.items()}
+
+
+def format_s3_request_stats() -> str:
+    lines = ["S3 requests:"]
+    for bucket, stats in sorted(s3_request_stats().items()):
+        lines.append(f"  {bucket}: {stats}")
+    return "\n".join(lines)
+
+
+class _BucketLimiter:
+    """Bounds the requests in flight to one bucket, and holds all of them back for a while after the bucket asks for less"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.loop = asyncio.get_running_loop()
+        self._successes = 0
+        # Set and replaced on every release, which wakes everyone waiting for a slot to check again
+        self._released = asyncio.Event()
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._released.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return
+            await self._released.wait()
+
+    def release(self, throttled: bool = False, pause_secs: float = 0.0) -> None:
+        self.in_flight -= 1
+        if throttled:
+            self.limit = max(1, self.limit // 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause_secs)
+            self._successes = 0
+        else:
+            self._successes += 1
+            if self.limit < self.max_concurrency and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+
+        self._released.set()
+        self._released = asyncio.Event()
+
+
+class AsyncStorage:
+    """
+    Async access to S3, for the pipeline's downloads, lock files and result uploads.
+
+    Each request runs on a dedicated thread pool, takes one of a bounded number of slots of its bucket, and is retried
+    after a jittered backoff if it fails in a way that is worth retrying. The backoff is awaited, not slept in a thread,
+    so a slow or throttling bucket holds up only the coroutines that wait on it. A SlowDown from a bucket pauses all
+    requests to that bucket for the backoff, and halves how many can be in flight to it.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        max_workers: int = STORAGE_MAX_WORKERS,
+        bucket_concurrency: int = STORAGE_BUCKET_CONCURRENCY,
+        max_retries: int = STORAGE_MAX_RETRIES,
+        backoff_base_secs: float = STORAGE_BACKOFF_BASE_SECS,
+        backoff_max_secs: float = STORAGE_BACKOFF_MAX_SECS,
+    ):
+        """
+        Args:
+            s3_client: Boto3 S3 client, ideally from get_s3_client with a connection pool that fits max_workers
+            max_workers: Threads for the blocking calls of the client
+            bucket_concurrency: Most requests in flight to one bucket
+            max_retries: Retries of a request that fails with a throttling or transient error
+            backoff_base_secs: Longest delay before the first retry, which doubles with each retry
+            backoff_max_secs: Longest delay before any retry
+        """
+        self.s3_client = s3_client
+        self.bucket_concurrency = bucket_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_secs = backoff_base_secs
+        self.backoff_max_secs = backoff_max_secs
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="olmocr-storage")
+        self._limiters: Dict[str, _BucketLimiter] = {}
+
+    def _limiter(self, bucket: str) -> _BucketLimiter:
+        limiter = self._limiters.get(bucket)
+        # asyncio primitives belong to one event loop, so a new loop starts over with a fresh limiter
+        if limiter is None or limiter.loop is not asyncio.get_running_loop():
+            limiter = self._limiters[bucket] = _BucketLimiter(self.bucket_concurrency)
+        return limiter
+
+    def _backoff_secs(self, attempt: int) -> float:
+        # Full jitter, so that the workers a SlowDown hit at once don't all come back at once
+        return random.uniform(0, min(self.backoff_max_secs, self.backoff_base_secs * 2**attempt))
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs a blocking function on the storage threads, without a bucket slot or retries"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def request(self, bucket: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs a blocking function that makes requests to bucket on the storage threads, in a slot of the bucket, retrying
+        it on throttling and transient errors.
+
+        Args:
+            bucket: Bucket the function makes its requests to
+            fn: The function, called with args and kwargs, it has to be safe to call again after it failed
+
+        Returns:
+            The return value of fn
+        """
+        limiter = self._limiter(bucket)
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            try:
+                result = await self.run(fn, *args, **kwargs)
+            except Exception as e:
+                kind = _classify_error(e)
+                backoff_secs = self._backoff_secs(attempt)
+                limiter.release(throttled=kind == "throttled", pause_secs=backoff_secs)
+                if kind is None or attempt >= self.max_retries:
+                    raise
+
+                attempt += 1
+                logger.warning(f"Attempt {attempt} of a request to {bucket} failed ({kind}): {e}. Retrying in {backoff_secs:.1f} seconds...")
+                # A throttled request waits out the pause of its bucket when it takes a slot again
+                if kind != "throttled":
+                    await asyncio.sleep(backoff_secs)
+                continue
+            except BaseException:
+                # Cancelled, the call itself carries on in its thread, but nothing waits for it any more
+                limiter.release()
+                raise
+
+            limiter.release()
+            return result
+
+    async def call(self, method: str, **kwargs) -> Any:
+        """Calls a method of the S3 client, like call("put_object", Bucket=..., Key=..., Body=...), see request()"""
+        return await self.request(kwargs["Bucket"], getattr(self.s3_client, method), **kwargs)
+
+    async def get_bytes(self, path: str, start_index: Optional[int] = None, end_index: Optional[int] = None) -> bytes:
+        """The async equivalent of get_s3_bytes, for an s3:// path or a local file"""
+        if not path.startswith("s3://") and os.path.exists(path):
+            assert start_index is None and end_index is None, "Range query not supported yet"
+
+            def read_file() -> bytes:
+                with open(path, "rb") as f:
+                    return f.read()
+
+            return await self.run(read_file)
+
+        bucket, key = parse_s3_path(path)
+        kwargs = {"Bucket": bucket, "Key": key}
+        if start_index is not None or end_index is not None:
+            kwargs["Range"] = f"bytes={'' if start_index is None else start_index}-{'' if end_index is None else end_index}"
+
+        # The body is read within the same retried request, as the connection can drop halfway through it
+        return await self.request(bucket, lambda: self.s3_client.get_object(**kwargs)["Body"].read())
+
+    async def put_bytes(self, path: str, data: bytes, **kwargs) -> dict:
+        """Puts data at an s3:// path, any other put_object arguments, like IfNoneMatch, can be passed as kwargs"""
+        bucket, key = parse_s3_path(path)
+        return await self.call("put_object", Bucket=bucket, Key=key, Body=data, **kwargs)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
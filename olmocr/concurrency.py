@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ServerLoad:
+    """Snapshot of the inference server's scheduler, as read from its metrics endpoint"""
+
+    running_reqs: int
+    queue_reqs: int
+
+
+def parse_prometheus_metrics(text: str) -> Dict[str, float]:
+    """
+    Parses Prometheus text exposition format into {metric_name: value}, summing the values of all label sets of a metric.
+    """
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        if "{" in line:
+            name = line[: line.index("{")]
+            rest = line[line.rindex("}") + 1 :]
+        else:
+            name, _, rest = line.partition(" ")
+
+        parts = rest.split()
+        if not parts:
+            continue
+        try:
+            value = float(parts[0])
+        except ValueError:
+            continue
+        values[name] = values.get(name, 0.0) + value
+    return values
+
+
+class AdaptiveConcurrencyController:
+    """
+    Sizes the window of pages in flight to the inference server using AIMD (additive increase, multiplicative decrease).
+
+    Load information comes from polling the server's Prometheus metrics endpoint (sglang needs to be started with --enable-metrics),
+    rather than from parsing its logs. Each poll interval:
+      - If the server's queue of waiting requests is deeper than twice the target, or requests failed, the window shrinks by a constant factor.
+      - If the queue is at or below the target and the window is what limits us (pages are waiting for a slot), the window grows by a constant step.
+    The target queue depth is small but positive, so that the GPU always has the next request ready without requests piling up on the server.
+
+    Pages hold a slot from the window while their request is in flight, see slot(). Waiting pages get slots in FIFO order.
+    There are no locks here, waiters are plain futures in a deque, and everything runs on one event loop.
+    """
+
+    def __init__(
+        self,
+        metrics_url: str,
+        initial_window: int = 64,
+        min_window: int = 8,
+        max_window: int = 512,
+        additive_increase: int = 8,
+        multiplicative_decrease: float = 0.75,
+        target_queue_reqs: int = 8,
+        poll_interval: float = 1.0,
+        decrease_cooldown: float = 5.0,
+    ):
+        """
+        Args:
+            metrics_url: URL of the server's Prometheus metrics endpoint
+            initial_window: Number of pages allowed in flight at startup
+            min_window: The window never shrinks below this many pages
+            max_window: The window never grows above this many pages
+            additive_increase: Pages added to the window per poll interval while it's the bottleneck
+            multiplicative_decrease: Factor the window is multiplied by when the server is over-queued
+            target_queue_reqs: Number of waiting requests on the server considered healthy
+            poll_interval: Seconds between polls of the metrics endpoint
+            decrease_cooldown: Minimum seconds between two decreases, so the server has time to drain its queue
+        """
+        self.metrics_url = metrics_url
+        self.min_window = min_window
+        self.max_window = max_window
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.target_queue_reqs = target_queue_reqs
+        self.poll_interval = poll_interval
+        self.decrease_cooldown = decrease_cooldown
+
+        self.window: float = float(min(max(initial_window, min_window), max_window))
+        self.in_flight = 0
+        self.server_load: Optional[ServerLoad] = None
+        self.latency_ewma: Optional[float] = None
+
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._errors_since_update = 0
+        self._last_decrease = float("-inf")
+        self._spare_capacity_since: Optional[float] = None
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def server_available(self) -> bool:
+        """True if the last poll of the metrics endpoint succeeded"""
+        return self.server_load is not None
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.window) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were handed a slot just as we got cancelled, give it back
+                self.release()
+            elif future in self._waiters:
+                # _wake_waiters may have dropped the cancelled future already, before we got to run
+                self._waiters.remove(future)
+            raise
+
+    def release(self, latency: Optional[float] = None, success: bool = True) -> None:
+        self.in_flight -= 1
+
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency
+        if not success:
+            self._errors_since_update += 1
+
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one slot of the window for the duration of the block, and records the latency of the block.
+        Raising a ConnectionError or TimeoutError from within the block counts as a server error.
+        """
+        await self.acquire()
+        start = time.monotonic()
+        success = True
+        try:
+            yield
+        except (OSError, asyncio.TimeoutError):
+            success = False
+            raise
+        finally:
+            self.release(latency=time.monotonic() - start if success else None, success=success)
+
+    def update(self, server_load: Optional[ServerLoad], now: Optional[float] = None) -> None:
+        """Applies one AIMD step given the latest server load, or None if the server could not be reached"""
+        now = time.monotonic() if now is None else now
+        self.server_load = server_load
+        errors, self._errors_since_update = self._errors_since_update, 0
+
+        if server_load is None:
+            self._spare_capacity_since = None
+            return
+
+        over_queued = server_load.queue_reqs > 2 * self.target_queue_reqs
+        window_limited = bool(self._waiters) or self.in_flight >= int(self.window)
+
+        if (over_queued or errors > 0) and now - self._last_decrease >= self.decrease_cooldown:
+            self.window = max(self.min_window, self.window * self.multiplicative_decrease)
+            self._last_decrease = now
+            logger.debug(f"Decreased page window to {int(self.window)}, server queue {server_load.queue_reqs}, {errors} errors")
+        elif server_load.queue_reqs <= self.target_queue_reqs and window_limited:
+            self.window = min(self.max_window, self.window + self.additive_increase)
+
+        self._wake_waiters()
+
+        # Track how long the server has had room for more work than we are sending it
+        if not self._waiters and self.in_flight < int(self.window) and server_load.queue_reqs <= self.target_queue_reqs:
+            if self._spare_capacity_since is None:
+                self._spare_capacity_since = now
+        else:
+            self._spare_capacity_since = None
+
+    def spare_capacity_duration(self, now: Optional[float] = None) -> float:
+        """Seconds for which the server has continuously had spare capacity, ie. every page had a slot and the server queue was short"""
+        if self._spare_capacity_since is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return now - self._spare_capacity_since
+
+    async def poll_server_load(self, client: httpx.AsyncClient) -> Optional[ServerLoad]:
+        try:
+            response = await client.get(self.metrics_url)
+            if response.status_code != 200:
+                logger.debug(f"Metrics endpoint returned status {response.status_code}")
+                return None
+            values = parse_prometheus_metrics(response.text)
+            return ServerLoad(
+                running_reqs=int(values.get("sglang:num_running_reqs", 0)),
+                queue_reqs=int(values.get("sglang:num_queue_reqs", 0)),
+            )
+        except httpx.HTTPError as e:
+            logger.debug(f"Could not poll metrics endpoint {self.metrics_url}: {e}")
+            return None
+
+    async def run(self) -> None:
+        """Polls the metrics endpoint and updates the window forever, run this as a background task"""
+        async with httpx.AsyncClient(timeout=self.poll_interval * 5) as client:
+            while True:
+                self.update(await self.poll_server_load(client))
+                await asyncio.sleep(self.poll_interval)
+
+    def __str__(self) -> str:
+        load = f"running {self.server_load.running_reqs}, queued {self.server_load.queue_reqs}" if self.server_load else "unavailable"
+        latency = f"{self.latency_ewma:.1f}s" if self.latency_ewma is not None else "n/a"
+        return f"Page window {int(self.window)}, in flight {self.in_flight}, waiting {self.num_waiting}, avg latency {latency}, server {load}"
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.window):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+
+class ByteBudget:
+    """
+    Caps the number of bytes of something held at once, such as the local copies of the pdfs being processed.
+
+    Reservations are granted in FIFO order, like the slots of AdaptiveConcurrencyController. One that is larger than the
+    whole budget is granted once nothing else is held, so that it doesn't wait forever.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, num_bytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + num_bytes <= self.max_bytes
+
+    async def acquire(self, num_bytes: int) -> None:
+        if not self._waiters and self._fits(num_bytes):
+            self.in_use += num_bytes
+            return
+
+        waiter = (num_bytes, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled():
+                # We were granted the bytes just as we got cancelled, give them back
+                self.release(num_bytes)
+            elif waiter in self._waiters:
+                # release may have dropped the cancelled waiter already, before we got to run
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, num_bytes: int) -> None:
+        self.in_use -= num_bytes
+        while self._waiters and self._fits(self._waiters[0][0]):
+            num_waiter_bytes, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_use += num_waiter_bytes
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, num_bytes: int):
+        """Holds num_bytes of the budget for the duration of the block"""
+        await self.acquire(num_bytes)
+        try:
+            yield
+        finally:
+            self.release(num_bytes)
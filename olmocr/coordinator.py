@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import dataclasses
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from olmocr.async_storage import get_s3_client
+from olmocr.result_writer import work_hash_from_result_filename
+from olmocr.s3_utils import parse_s3_path
+from olmocr.work_index import WorkIndex
+from olmocr.work_queue import (
+    COORDINATOR_MAX_LINE_BYTES,
+    COORDINATOR_PORT,
+    SCHEDULING_POLICIES,
+    WORKER_LOCK_LEASE_SECS,
+    WorkItem,
+)
+
+logger = logging.getLogger(__name__)
+
+# The coordinator lists results/ this often, to pick up items that workers committed but never acked, and imports any
+# index shards that were added in the meantime
+RESULTS_REFRESH_INTERVAL = 300.0
+
+
+@dataclass
+class Lease:
+    worker: str
+    expires: float
+    claimed_at: float
+    speculative_worker: Optional[str] = None
+
+
+class Coordinator:
+    """
+    Hands out the work items of a workspace to pipeline workers over TCP, with leases that the workers renew with
+    heartbeats and give back when they are done, instead of each worker listing and writing lock files in the workspace.
+
+    The protocol is one JSON request per line, answered with one JSON response per line, see CoordinatorWorkQueue for
+    the client. Leases only live in memory. The workspace stays the source of truth for what is done: workers still
+    commit their results to results/, and a restarted coordinator rebuilds its state from the index and a listing of
+    results/. Leases come back as the workers that hold them renew them, so for lease_grace_secs after it starts, the
+    coordinator hands out no work items, and tells the workers to ask again once the live ones have renewed theirs.
+    """
+
+    def __init__(
+        self,
+        workspace_path: str,
+        s3_client=None,
+        scheduling: str = "random",
+        results_refresh_interval: float = RESULTS_REFRESH_INTERVAL,
+        lease_grace_secs: float = WORKER_LOCK_LEASE_SECS,
+    ):
+        """
+        Args:
+            workspace_path: Local or s3:// workspace to hand out the work items of
+            s3_client: Boto3 S3 client for an s3:// workspace
+            scheduling: Order to hand out work items in, one of SCHEDULING_POLICIES
+            results_refresh_interval: Seconds between listings of results/ and the index
+            lease_grace_secs: Seconds after starting in which no work items are handed out, so that workers still on their items
+                from before a restart renew their leases first. 0 for a workspace that no worker is on yet.
+        """
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling {scheduling}, choose from {', '.join(SCHEDULING_POLICIES)}")
+
+        self.workspace_path = workspace_path.rstrip("/")
+        self.s3_client = s3_client
+        self.scheduling = scheduling
+        self.results_refresh_interval = results_refresh_interval
+        self.lease_grace_secs = lease_grace_secs
+
+        self._index = WorkIndex(self.workspace_path, s3_client)
+        self._imported_shards: set = set()
+        self._refresh_lock = asyncio.Lock()
+        # time.monotonic() of when the last refresh started, and when results/ was last listed
+        self._last_refresh = float("-inf")
+        self._last_results_listing = float("-inf")
+
+        self._items: Dict[str, WorkItem] = {}
+        self._done: set = set()
+        self._num_done_items = 0
+
+        # Items that were never handed out, or whose lease expired, in the order they get handed out. Done and leased
+        # items are skipped when they come up, rather than searched for and removed.
+        self._todo: Deque[str] = deque()
+        self._leases: Dict[str, Lease] = {}
+        # (expires, hash) of every lease and renewal, only the latest one of each lease counts
+        self._expirations: List[Tuple[float, str]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+        self._refresher: Optional[asyncio.Task] = None
+        self._grace_ends = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self._items) - self._num_done_items
+
+    @property
+    def grace_secs_left(self) -> float:
+        """Seconds until work items get handed out, while workers from before a restart still renew their leases"""
+        return max(0.0, self._grace_ends - time.time())
+
+    def _add_done(self, work_hash: str) -> None:
+        if work_hash not in self._done:
+            self._done.add(work_hash)
+            if work_hash in self._items:
+                self._num_done_items += 1
+
+    def _list_done_hashes(self) -> set:
+        results_dir = os.path.join(self.workspace_path, "results")
+        if not self.workspace_path.startswith("s3://"):
+            if not os.path.isdir(results_dir):
+                return set()
+            return {work_hash for fn in os.listdir(results_dir) if (work_hash := work_hash_from_result_filename(fn))}
+
+        bucket, prefix = parse_s3_path(os.path.join(results_dir, "output_"))
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        return {
+            work_hash
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+            if (work_hash := work_hash_from_result_filename(obj["Key"]))
+        }
+
+    async def refresh(self, max_results_age: float = 0.0) -> None:
+        """
+        Imports the index shards that are new since the last refresh, and marks the items with results as done.
+
+        Refreshes asked for while another one runs share the next one, and results/ is only listed again if the last
+        listing is more than max_results_age seconds old, so a few hundred workers starting at once don't each have
+        the whole of results/ listed.
+        """
+        requested = time.monotonic()
+        async with self._refresh_lock:
+            if self._last_refresh >= requested:
+                # A refresh that started after this one was asked for has just finished
+                return
+            self._last_refresh = time.monotonic()
+
+            shards = await asyncio.to_thread(self._index.shards)
+            new_items: Dict[str, WorkItem] = {}
+            for shard in shards:
+                if shard.name in self._imported_shards:
+                    continue
+                for work_hash, paths, page_counts in await asyncio.to_thread(self._index.load_shard, shard):
+                    if work_hash not in self._items:
+                        new_items[work_hash] = WorkItem(hash=work_hash, work_paths=paths, num_pages=sum(page_counts))
+                self._imported_shards.add(shard.name)
+
+            if time.monotonic() - self._last_results_listing >= max_results_age:
+                self._last_results_listing = time.monotonic()
+                for work_hash in await asyncio.to_thread(self._list_done_hashes):
+                    self._add_done(work_hash)
+
+            hashes = list(new_items)
+            random.shuffle(hashes)
+            for work_hash in hashes:
+                self._items[work_hash] = new_items[work_hash]
+                if work_hash in self._done:
+                    self._num_done_items += 1
+                else:
+                    self._todo.append(work_hash)
+
+            if self.scheduling == "longest_first" and new_items:
+                # The sort is stable, so work items of the same size stay in random order
+                self._todo = deque(sorted(self._todo, key=lambda work_hash: -self._items[work_hash].num_pages))
+
+            logger.info(f"Coordinator has {self.size:,} of {len(self._items):,} work items left, {len(self._leases):,} leased")
+
+    def _lease(self, work_hash: str, worker: str, lease_secs: float, claimed_at: float) -> None:
+        expires = time.time() + lease_secs
+        self._leases[work_hash] = Lease(worker=worker, expires=expires, claimed_at=claimed_at)
+        heapq.heappush(self._expirations, (expires, work_hash))
+
+    def _expire_leases(self) -> None:
+        now = time.time()
+        while self._expirations and self._expirations[0][0] < now:
+            expires, work_hash = heapq.heappop(self._expirations)
+            lease = self._leases.get(work_hash)
+            if lease is None or lease.expires != expires:
+                continue
+
+            del self._leases[work_hash]
+            if work_hash not in self._done:
+                # The worker died, so its item goes out again before any that were never handed out
+                logger.info(f"Lease of {lease.worker} on {work_hash} expired")
+                self._todo.appendleft(work_hash)
+
+    def get_work(self, worker: str, lease_secs: float) -> Optional[WorkItem]:
+        self._expire_leases()
+        if self.grace_secs_left > 0:
+            # Any item without a lease may still be held by a worker that hasn't renewed it with this coordinator yet
+            return None
+        while self._todo:
+            work_hash = self._todo.popleft()
+            if work_hash in self._done or work_hash in self._leases:
+                continue
+            self._lease(work_hash, worker, lease_secs, claimed_at=time.time())
+            return self._items[work_hash]
+        return None
+
+    def renew(self, work_hash: str, worker: str, lease_secs: float) -> bool:
+        self._expire_leases()
+        if work_hash in self._done or work_hash not in self._items:
+            return False
+
+        lease = self._leases.get(work_hash)
+        if lease is None:
+            # After a restart, the coordinator learns who holds what from the renewals. It can't know when the item was
+            # claimed, so it goes by the time of the first renewal.
+            self._lease(work_hash, worker, lease_secs, claimed_at=time.time())
+            return True
+        if lease.worker != worker:
+            return False
+
+        lease.expires = time.time() + lease_secs
+        heapq.heappush(self._expirations, (lease.expires, work_hash))
+        return True
+
+    def mark_done(self, work_hash: str) -> None:
+        self._add_done(work_hash)
+        self._leases.pop(work_hash, None)
+
+    def find_straggler(self, worker: str, threshold_secs: float) -> Tuple[Optional[WorkItem], bool]:
+        """Gives worker the one copy of an item that another worker has held for more than threshold_secs, if there is one"""
+        self._expire_leases()
+        now = time.time()
+        others_working = False
+        for work_hash, lease in self._leases.items():
+            if lease.worker == worker or lease.speculative_worker is not None:
+                continue
+            others_working = True
+            if now - lease.claimed_at >= threshold_secs:
+                lease.speculative_worker = worker
+                return dataclasses.replace(self._items[work_hash], speculative=True), True
+        return None, others_working
+
+    async def _dispatch(self, request: dict) -> dict:
+        op = request["op"]
+        if op == "refresh":
+            # Sent by every worker as it starts, which needs the shards it just added, but not a fresh listing of results/
+            await self.refresh(max_results_age=self.results_refresh_interval)
+            return {}
+        if op == "get_work":
+            work_item = self.get_work(request["worker"], request["lease_secs"])
+            if work_item is None and self.grace_secs_left > 0:
+                return {"work_item": None, "retry_secs": self.grace_secs_left}
+            return {"work_item": dataclasses.asdict(work_item) if work_item is not None else None}
+        if op == "renew":
+            return {"ok": self.renew(request["hash"], request["worker"], request["lease_secs"])}
+        if op == "done":
+            self.mark_done(request["hash"])
+            return {}
+        if op == "is_completed":
+            return {"done": request["hash"] in self._done}
+        if op == "straggler":
+            work_item, others_working = self.find_straggler(request["worker"], request["threshold_secs"])
+            return {"work_item": dataclasses.asdict(work_item) if work_item is not None else None, "others_working": others_working}
+        raise ValueError(f"Unknown op {op}")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self._dispatch(json.loads(line))
+                except Exception as e:
+                    logger.exception(f"Failed to handle a request: {e}")
+                    response = {"error": str(e)}
+
+                response["size"] = self.size
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Workers come and go, whoever reconnects picks up where it was
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.results_refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to refresh the coordinator's view of the workspace: {e}")
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        """Loads the workspace and starts accepting workers. Port 0 picks a free port, see the sockets of the returned server."""
+        await self.refresh()
+        self._grace_ends = time.time() + self.lease_grace_secs
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=COORDINATOR_MAX_LINE_BYTES)
+        self._refresher = asyncio.create_task(self._refresh_periodically())
+        logger.info(f"Coordinating {self.workspace_path} on {', '.join(str(sock.getsockname()) for sock in self._server.sockets)}")
+        return self._server
+
+    async def stop(self) -> None:
+        """Stops accepting workers and drops the connections of the ones that are connected, which reconnect to the next coordinator"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await self.start(host, port)
+        try:
+            await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hands out the work items of a workspace to pipelines started with --coordinator host:port")
+    parser.add_argument("workspace", help="The workspace of the pipelines, a local directory or s3://bucket/prefix")
+    parser.add_argument("--workspace_profile", help="S3 configuration profile for accessing the workspace", default=None)
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=COORDINATOR_PORT, help="Port to listen on")
+    parser.add_argument("--scheduling", choices=SCHEDULING_POLICIES, default="random", help="Order to hand out work items in")
+    parser.add_argument("--results_refresh_interval", type=float, default=RESULTS_REFRESH_INTERVAL, help="Seconds between listings of results/")
+    parser.add_argument(
+        "--lease_grace_secs",
+        type=float,
+        default=WORKER_LOCK_LEASE_SECS,
+        help="Seconds after starting before work items are handed out, so workers still running from before a restart renew their leases first, 0 if no worker is running yet",
+    )
+    args = parser.parse_args()
+
+    s3_client = get_s3_client(args.workspace_profile) if args.workspace.startswith("s3://") else None
+    coordinator = Coordinator(
+        args.workspace,
+        s3_client,
+        scheduling=args.scheduling,
+        results_refresh_interval=args.results_refresh_interval,
+        lease_grace_secs=args.lease_grace_secs,
+    )
+    asyncio.run(coordinator.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
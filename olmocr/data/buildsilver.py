@@ -7,12 +7,13 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Generator
 from urllib.parse import urlparse
 
-import boto3
 from pypdf import PdfReader
 from tqdm import tqdm
 
+from olmocr.async_storage import get_s3_client
 from olmocr.data.renderpdf import render_pdf_to_base64png
 from olmocr.filter import PdfFilter
+from olmocr.pdf_cache import default_pdf_cache
 from olmocr.prompts import (
     build_openai_silver_data_prompt,
     openai_response_format_schema,
@@ -23,6 +24,7 @@ TARGET_IMAGE_DIM = 2048
 
 
 pdf_filter = PdfFilter()
+s3_client = get_s3_client()
 
 
 def build_page_query(local_pdf_path: str, pretty_pdf_path: str, page: int) -> dict:
@@ -94,22 +96,8 @@ def sample_pdf_pages(num_pages: int, first_n_pages: int, max_sample_pages: int)
     return sample_pages
 
 
-def fetch_s3_file(s3_url: str, local_path: str) -> str:
-    parsed = urlparse(s3_url)
-    bucket_name = parsed.netloc
-    key = parsed.path.lstrip("/")
-
-    s3 = boto3.client("s3")
-    s3.download_file(bucket_name, key, local_path)
-    return local_path
-
-
 def process_pdf(pdf_path: str, first_n_pages: int, max_sample_pages: int, no_filter: bool) -> Generator[dict, None, None]:
-    if pdf_path.startswith("s3://"):
-        local_pdf_path = os.path.join("/tmp", os.path.basename(pdf_path))
-        fetch_s3_file(pdf_path, local_pdf_path)
-    else:
-        local_pdf_path = pdf_path
+    local_pdf_path = default_pdf_cache().get(s3_client, pdf_path)
 
     if (not no_filter) and pdf_filter.filter_out_pdf(local_pdf_path):
         print(f"Skipping {local_pdf_path} due to common filter")
@@ -158,10 +146,9 @@ def main():
         if args.glob_path.startswith("s3://"):
             # Handle S3 globbing using boto3 with pagination
             parsed = urlparse(args.glob_path)
-            s3 = boto3.client("s3")
             bucket_name = parsed.netloc
             prefix = os.path.dirname(parsed.path.lstrip("/")) + "/"
-            paginator = s3.get_paginator("list_objects_v2")
+            paginator = s3_client.get_paginator("list_objects_v2")
             page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
 
             for page in page_iterator:
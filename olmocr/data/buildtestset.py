@@ -7,14 +7,16 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
 from urllib.parse import urlparse
 
-import boto3
 from pypdf import PdfReader, PdfWriter
 from tqdm import tqdm
 
+from olmocr.async_storage import get_s3_client
 from olmocr.data.renderpdf import render_pdf_to_base64png
 from olmocr.filter import PdfFilter
+from olmocr.pdf_cache import default_pdf_cache
 
 pdf_filter = PdfFilter()
+s3_client = get_s3_client()
 
 
 def sample_pdf_pages(num_pages: int, first_n_pages: int, max_sample_pages: int) -> List[int]:
@@ -34,18 +36,6 @@ def sample_pdf_pages(num_pages: int, first_n_pages: int, max_sample_pages: int)
     return sample_pages
 
 
-def fetch_s3_file(s3_url: str, local_path: str) -> str:
-    """
-    Download a file from an S3 URI (s3://bucket/key) to local_path.
-    """
-    parsed = urlparse(s3_url)
-    bucket_name = parsed.netloc
-    key = parsed.path.lstrip("/")
-    s3 = boto3.client("s3")
-    s3.download_file(bucket_name, key, local_path)
-    return local_path
-
-
 def extract_single_page_pdf(input_pdf_path: str, page_number: int, output_pdf_path: str) -> None:
     """
     Extracts exactly one page (page_number, 1-based) from input_pdf_path
@@ -66,11 +56,7 @@ def process_pdf(pdf_path: str, first_n_pages: int, max_sample_pages: int, no_fil
     - Sample the pages.
     - For each sampled page, extract a one-page PDF and also render it to PNG.
     """
-    if pdf_path.startswith("s3://"):
-        local_pdf_path = os.path.join("/tmp", os.path.basename(pdf_path))
-        fetch_s3_file(pdf_path, local_pdf_path)
-    else:
-        local_pdf_path = pdf_path
+    local_pdf_path = default_pdf_cache().get(s3_client, pdf_path)
 
     if (not no_filter) and pdf_filter.filter_out_pdf(local_pdf_path):
         print(f"Skipping {local_pdf_path} due to filter.")
@@ -135,10 +121,9 @@ def main():
         if args.glob_path.startswith("s3://"):
             # Handle S3 globbing
             parsed = urlparse(args.glob_path)
-            s3 = boto3.client("s3")
             bucket_name = parsed.netloc
             prefix = os.path.dirname(parsed.path.lstrip("/")) + "/"
-            paginator = s3.get_paginator("list_objects_v2")
+            paginator = s3_client.get_paginator("list_objects_v2")
             page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
 
             for page in page_iterator:
@@ -1,10 +1,8 @@
 import argparse
 import json
 import logging
-import os
 import re
 import sys
-import tempfile
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
@@ -15,6 +13,7 @@ import plotly.express as px
 import smart_open
 
 from olmocr.data.renderpdf import render_pdf_to_base64png
+from olmocr.pdf_cache import default_pdf_cache
 from olmocr.prompts import build_finetuning_prompt
 from olmocr.prompts.anchor import get_anchor_text
 
@@ -31,34 +30,21 @@ def is_s3_path(path):
 
 def download_pdf_from_s3(s3_path: str, pdf_profile: str) -> str:
     """
-    Downloads a PDF file from S3 to a temporary local file and returns the local file path.
+    Downloads a PDF file from S3 into the shared pdf cache, unless it is there already, and returns the local file path.
 
     Args:
         s3_path (str): S3 path in the format s3://bucket/key
         pdf_profile (str): The name of the boto3 profile to use.
 
     Returns:
-        str: Path to the downloaded PDF file in the local filesystem.
+        str: Path to the cached PDF file in the local filesystem.
     """
-    # Parse the bucket and key from the s3_path
-    # s3_path format: s3://bucket_name/some/folder/file.pdf
-    path_without_scheme = s3_path.split("s3://", 1)[1]
-    bucket_name, key = path_without_scheme.split("/", 1)
-
     # Create a session with the specified profile or default
     session = boto3.Session(profile_name=pdf_profile) if pdf_profile else boto3.Session()
     s3_client = session.client("s3")
 
-    # Create a temporary local file
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    tmp_file.close()  # We only want the path and not keep it locked
-
-    local_path = tmp_file.name
-
-    logging.info(f"Downloading PDF from {s3_path} to {local_path} using profile {pdf_profile}")
-    s3_client.download_file(bucket_name, key, local_path)
-
-    return local_path
+    logging.info(f"Fetching PDF {s3_path} using profile {pdf_profile}")
+    return default_pdf_cache().get(s3_client, s3_path)
 
 
 def transform_json_object(obj):
@@ -146,13 +132,6 @@ def process_file(input_file: str, output_file: str, rewrite_prompt_str: bool, pd
                         transformed["chat_messages"][0]["content"][0]["text"] = build_finetuning_prompt(raw_page_text)
                         transformed["chat_messages"][0]["content"][1]["image_url"]["url"] = f"data:image/png;base64,{image_base64}"
 
-                        # Clean up the temp PDF file if it was downloaded
-                        if is_s3_path(s3_path):
-                            try:
-                                os.remove(local_pdf_path)
-                            except OSError as remove_err:
-                                logging.error(f"Failed to remove temporary PDF file {local_pdf_path}: {remove_err}")
-
                 if transformed is not None:
                     prompt_text = transformed["chat_messages"][0]["content"][0]["text"]
                     prompt_length = len(prompt_text)
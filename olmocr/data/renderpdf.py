@@ -1,55 +1,129 @@
 import base64
 import io
+import os
 import subprocess
-from typing import List
-
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pypdfium2 as pdfium
 from PIL import Image
 
+from olmocr.pdf_handle import get_pdf_handle
 
-def get_pdf_media_box_width_height(local_pdf_path: str, page_num: int) -> tuple[float, float]:
+# pdftoppm and PIL both write PNGs at zlib's default compression level
+PNG_DEFAULT_COMPRESS_LEVEL = 6
+
+# Formats that pages can be encoded in, and their names in PIL
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+
+@dataclass(frozen=True)
+class ImageEncoding:
     """
-    Get the MediaBox dimensions for a specific page in a PDF file using the pdfinfo command.
+    How rendered pages are encoded, before they go into the model's requests as base64. quality is for jpeg and webp,
+    compress_level for png, and grayscale drops the color channels, which monochrome scans have no use for.
 
-    :param pdf_file: Path to the PDF file
-    :param page_num: The page number for which to extract MediaBox dimensions
-    :return: A dictionary containing MediaBox dimensions or None if not found
+    The renderers produce the encoding themselves where they can, pdftoppm writes png and jpeg, in grayscale too,
+    and in-process renderers encode their bitmap straight away. Anything else gets re-encoded from a png.
     """
-    # Construct the pdfinfo command to extract info for the specific page
-    command = ["pdfinfo", "-f", str(page_num), "-l", str(page_num), "-box", "-enc", "UTF-8", local_pdf_path]
 
-    # Run the command using subprocess
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    format: str = "png"
+    quality: int = 90
+    compress_level: int = PNG_DEFAULT_COMPRESS_LEVEL
+    grayscale: bool = False
+
+    def __post_init__(self):
+        if self.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format {self.format}, choose from {', '.join(IMAGE_FORMATS)}")
+        if not 1 <= self.quality <= 100:
+            raise ValueError(f"Image quality must be between 1 and 100, got {self.quality}")
+        if not 0 <= self.compress_level <= 9:
+            raise ValueError(f"PNG compress level must be between 0 and 9, got {self.compress_level}")
 
-    # Check if there is any error in executing the command
-    if result.returncode != 0:
-        raise ValueError(f"Error running pdfinfo: {result.stderr}")
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
 
-    # Parse the output to find MediaBox
-    output = result.stdout
+    @property
+    def pdftoppm_png_args(self) -> List[str]:
+        return ["-png", "-gray"] if self.grayscale else ["-png"]
 
-    for line in output.splitlines():
-        if "MediaBox" in line:
-            media_box_str: List[str] = line.split(":")[1].strip().split()
-            media_box: List[float] = [float(x) for x in media_box_str]
-            return abs(media_box[0] - media_box[2]), abs(media_box[3] - media_box[1])
+    @property
+    def png_as_is(self) -> bool:
+        """Whether pdftoppm's png output, with pdftoppm_png_args, already is in this encoding"""
+        return self.format == "png" and self.compress_level == PNG_DEFAULT_COMPRESS_LEVEL
 
-    raise ValueError("MediaBox not found in the PDF info.")
+    def encode(self, img: Image.Image) -> bytes:
+        if self.grayscale and img.mode != "L":
+            img = img.convert("L")
+        elif self.format == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
 
+        buffered = io.BytesIO()
+        if self.format == "png":
+            img.save(buffered, format="PNG", compress_level=self.compress_level)
+        else:
+            img.save(buffered, format=IMAGE_FORMATS[self.format], quality=self.quality)
+        return buffered.getvalue()
 
-def render_pdf_to_base64png(local_pdf_path: str, page_num: int, target_longest_image_dim: int = 2048):
-    longest_dim = max(get_pdf_media_box_width_height(local_pdf_path, page_num))
+    def encode_base64(self, img: Image.Image) -> str:
+        return base64.b64encode(self.encode(img)).decode("utf-8")
+
+    def reencode_base64(self, image_base64: str) -> str:
+        """Re-encodes a base64 image, in any format PIL reads, in this encoding"""
+        with Image.open(io.BytesIO(base64.b64decode(image_base64))) as img:
+            return self.encode_base64(img)
+
+
+# The encoding everything used before there was a choice, and still the default
+PNG_ENCODING = ImageEncoding()
+
+
+def get_pdf_media_box_width_height(local_pdf_path: str, page_num: int) -> tuple[float, float]:
+    """
+    Get the MediaBox dimensions for a specific page in a PDF file.
 
-    # Convert PDF page to PNG using pdftoppm
+    This used to shell out to pdfinfo for every page, now it reads the page tree through the
+    process-wide PdfHandle cache, so the document is only parsed once no matter how many pages get looked up.
+
+    :param pdf_file: Path to the PDF file
+    :param page_num: The page number for which to extract MediaBox dimensions
+    :return: A tuple of (width, height) of the MediaBox in PDF points
+    """
+    geometry = get_pdf_handle(local_pdf_path).geometry(page_num)
+    return geometry.width, geometry.height
+
+
+def render_pdf_to_base64png(
+    local_pdf_path: str, page_num: int, target_longest_image_dim: int = 2048, renderer: str = "poppler", encoding: ImageEncoding = PNG_ENCODING
+):
+    """Renders one page, as a base64 png by default, or in whichever other encoding is given"""
+    if renderer != "poppler":
+        return get_renderer(renderer).render_to_base64png(local_pdf_path, page_num, target_longest_image_dim, encoding)
+
+    if encoding.format == "jpeg":
+        format_args = ["-jpeg", "-jpegopt", f"quality={encoding.quality}"] + (["-gray"] if encoding.grayscale else [])
+    else:
+        format_args = encoding.pdftoppm_png_args
+
+    # Convert PDF page to an image using pdftoppm
     pdftoppm_result = subprocess.run(
         [
             "pdftoppm",
-            "-png",
+            *format_args,
             "-f",
             str(page_num),
             "-l",
             str(page_num),
-            "-r",
-            str(target_longest_image_dim * 72 / longest_dim),  # 72 pixels per point is the conversion factor
+            # Scales the longest side of the page's MediaBox to target_longest_image_dim, without having to read the MediaBox here first,
+            # which would mean parsing the document with pypdf in the calling process, the pipeline's event loop process for a start
+            "-scale-to",
+            str(target_longest_image_dim),
             local_pdf_path,
         ],
         timeout=120,
@@ -57,7 +131,300 @@ def render_pdf_to_base64png(local_pdf_path: str, page_num: int, target_longest_i
         stderr=subprocess.PIPE,
     )
     assert pdftoppm_result.returncode == 0, pdftoppm_result.stderr
-    return base64.b64encode(pdftoppm_result.stdout).decode("utf-8")
+    image_base64 = base64.b64encode(pdftoppm_result.stdout).decode("utf-8")
+    if encoding.format == "jpeg" or encoding.png_as_is:
+        return image_base64
+    return encoding.reencode_base64(image_base64)
+
+
+# Seconds pdftoppm gets to produce each page, same as the single page render
+PAGE_RENDER_TIMEOUT = 120
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PngStreamSplitter:
+    """
+    Splits a byte stream of back-to-back PNG files, such as pdftoppm writes to stdout when rendering several pages, into the individual files.
+    It walks the length-prefixed chunk structure, so an IEND byte sequence inside compressed image data can't fool it.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0  # Offset of the next unparsed chunk in the buffer, 0 means the signature hasn't been checked yet
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        pngs = []
+
+        while True:
+            if self._pos == 0:
+                if len(self._buffer) < len(PNG_SIGNATURE):
+                    break
+                if self._buffer[: len(PNG_SIGNATURE)] != PNG_SIGNATURE:
+                    raise ValueError("Not a valid PNG stream")
+                self._pos = len(PNG_SIGNATURE)
+
+            # Each chunk is a 4 byte length, 4 byte type, the data, and a 4 byte crc
+            if len(self._buffer) < self._pos + 8:
+                break
+            chunk_length = int.from_bytes(self._buffer[self._pos : self._pos + 4], "big")
+            chunk_type = bytes(self._buffer[self._pos + 4 : self._pos + 8])
+            chunk_end = self._pos + 12 + chunk_length
+            if len(self._buffer) < chunk_end:
+                break
+
+            if chunk_type == b"IEND":
+                pngs.append(bytes(self._buffer[:chunk_end]))
+                del self._buffer[:chunk_end]
+                self._pos = 0
+            else:
+                self._pos = chunk_end
+
+        return pngs
+
+    def finish(self) -> None:
+        if self._buffer:
+            raise ValueError(f"PNG stream ended with {len(self._buffer)} bytes of an incomplete image")
+
+
+def render_pdf_to_base64png_batch(
+    local_pdf_path: str, first_page: int = 1, last_page: Optional[int] = None, target_longest_image_dim: int = 2048, encoding: ImageEncoding = PNG_ENCODING
+) -> Iterator[Tuple[int, str]]:
+    """
+    Renders a range of pages of a document with a single pdftoppm process, so poppler only opens and parses the document once.
+    Yields (page_num, base64 png) for each page, in order, as soon as pdftoppm has written it out.
+
+    Each page is scaled so that its own longest MediaBox side comes out as target_longest_image_dim pixels,
+    which is what -scale-to does, same as render_pdf_to_base64png does for a single page.
+    pdftoppm always writes pngs here, as those are what the stream gets split into, which are re-encoded if the encoding asks for something else.
+
+    :param first_page: First page to render, 1-indexed
+    :param last_page: Last page to render, inclusive, defaults to the last page of the document
+    """
+    if last_page is None:
+        # pdfium counts the pages in C, where pypdf would parse the page tree in python, holding the GIL all along
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(local_pdf_path)
+            try:
+                last_page = len(pdf)
+            finally:
+                pdf.close()
+
+    if last_page < first_page:
+        return
+
+    with tempfile.TemporaryFile() as stderr_file:
+        # stderr goes to a file, so that a chatty pdftoppm can't fill up a pipe that nobody is reading and block
+        proc = subprocess.Popen(
+            ["pdftoppm", *encoding.pdftoppm_png_args, "-f", str(first_page), "-l", str(last_page), "-scale-to", str(target_longest_image_dim), local_pdf_path],
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+        assert proc.stdout is not None
+
+        splitter = PngStreamSplitter()
+        page_num = first_page
+
+        # The timeout applies to producing each page, and is paused while the caller has the page, since pdftoppm blocks on a full pipe then anyways
+        watchdog = threading.Timer(PAGE_RENDER_TIMEOUT, proc.kill)
+        watchdog.start()
+
+        try:
+            while data := proc.stdout.read1(1 << 16):
+                for png in splitter.feed(data):
+                    watchdog.cancel()
+                    image_base64 = base64.b64encode(png).decode("utf-8")
+                    yield page_num, image_base64 if encoding.png_as_is else encoding.reencode_base64(image_base64)
+                    page_num += 1
+                    watchdog = threading.Timer(PAGE_RENDER_TIMEOUT, proc.kill)
+                    watchdog.start()
+
+            splitter.finish()
+            returncode = proc.wait()
+            stderr_file.seek(0)
+            assert returncode == 0, stderr_file.read()
+            assert page_num == last_page + 1, f"pdftoppm rendered pages {first_page}-{page_num - 1} of {first_page}-{last_page}"
+        finally:
+            watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+
+def render_pdf_pages_to_base64png(
+    local_pdf_path: str,
+    page_nums: List[int],
+    target_longest_image_dim: int = 2048,
+    min_batch_pages: int = 4,
+    renderer: str = "poppler",
+    encoding: ImageEncoding = PNG_ENCODING,
+) -> Dict[int, str]:
+    """
+    Renders a set of pages of one document, returns {page_num: base64 png}.
+    With poppler, runs of nearby pages are rendered with one pdftoppm process each, as long as they contain at least min_batch_pages requested
+    pages and at least half of the pages in the run were requested. Anything else is rendered one page at a time.
+    In-process renderers keep the document open between pages anyways, so they always go one page at a time.
+    """
+    wanted = sorted(set(page_nums))
+    results: Dict[int, str] = {}
+
+    if renderer != "poppler":
+        pdf_renderer = get_renderer(renderer)
+        return {page_num: pdf_renderer.render_to_base64png(local_pdf_path, page_num, target_longest_image_dim, encoding) for page_num in wanted}
+
+    # Split the sorted pages into runs where rendering the gaps is cheaper than starting another pdftoppm
+    runs: List[List[int]] = []
+    for page_num in wanted:
+        if runs and page_num - runs[-1][-1] <= 2:
+            runs[-1].append(page_num)
+        else:
+            runs.append([page_num])
+
+    for run in runs:
+        span = run[-1] - run[0] + 1
+        if len(run) >= min_batch_pages and len(run) * 2 >= span:
+            run_pages = set(run)
+            for page_num, image_base64 in render_pdf_to_base64png_batch(local_pdf_path, run[0], run[-1], target_longest_image_dim, encoding=encoding):
+                if page_num in run_pages:
+                    results[page_num] = image_base64
+        else:
+            for page_num in run:
+                results[page_num] = render_pdf_to_base64png(local_pdf_path, page_num, target_longest_image_dim, encoding=encoding)
+
+    return results
+
+
+class PdfRenderer(ABC):
+    """
+    Renders pages of a PDF so that the longest side of each rendered page comes out as target_longest_image_dim pixels.
+
+    Set thread_safe to False if render calls must not run concurrently within one process,
+    callers that render many pages in parallel should then spread the work over processes instead of threads.
+    """
+
+    name: str
+    thread_safe: bool = True
+
+    @abstractmethod
+    def render_image(self, local_pdf_path: str, page_num: int, target_longest_image_dim: int) -> Image.Image:
+        pass
+
+    def render_to_base64png(self, local_pdf_path: str, page_num: int, target_longest_image_dim: int, encoding: ImageEncoding = PNG_ENCODING) -> str:
+        return encoding.encode_base64(self.render_image(local_pdf_path, page_num, target_longest_image_dim))
+
+    def render_pages(
+        self, local_pdf_path: str, first_page: int, last_page: int, target_longest_image_dim: int, encoding: ImageEncoding = PNG_ENCODING
+    ) -> Iterator[Tuple[int, str]]:
+        """Yields (page_num, base64 image) for a range of pages, inclusive, in order"""
+        for page_num in range(first_page, last_page + 1):
+            yield page_num, self.render_to_base64png(local_pdf_path, page_num, target_longest_image_dim, encoding)
+
+    def close_deleted_documents(self) -> None:
+        """Lets go of anything kept open for documents whose file was deleted, renderers that keep nothing open have nothing to do"""
+        pass
+
+
+class PopplerRenderer(PdfRenderer):
+    """Renders with pdftoppm subprocesses, which already write PNGs, and are safe to run from any number of threads"""
+
+    name = "poppler"
+
+    def render_image(self, local_pdf_path: str, page_num: int, target_longest_image_dim: int) -> Image.Image:
+        img = Image.open(io.BytesIO(base64.b64decode(self.render_to_base64png(local_pdf_path, page_num, target_longest_image_dim))))
+        img.load()
+        return img
+
+    def render_to_base64png(self, local_pdf_path: str, page_num: int, target_longest_image_dim: int, encoding: ImageEncoding = PNG_ENCODING) -> str:
+        return render_pdf_to_base64png(local_pdf_path, page_num, target_longest_image_dim, encoding=encoding)
+
+    def render_pages(
+        self, local_pdf_path: str, first_page: int, last_page: int, target_longest_image_dim: int, encoding: ImageEncoding = PNG_ENCODING
+    ) -> Iterator[Tuple[int, str]]:
+        return render_pdf_to_base64png_batch(local_pdf_path, first_page, last_page, target_longest_image_dim, encoding=encoding)
+
+
+# pdfium keeps global state and is not thread safe, every call into it in this process goes through this lock
+_pdfium_lock = threading.Lock()
+
+
+class PdfiumRenderer(PdfRenderer):
+    """
+    Renders in-process with pdfium, straight into a bitmap that becomes a PIL image, so there is no fork/exec per page,
+    and no PNG encode and decode in between for callers that want the image itself.
+    Recently used documents stay open, so rendering the next page of a document doesn't parse it again. An open document
+    holds on to its file, so documents whose file was deleted, like the pipeline's scratch copies once a pdf is done, are
+    closed the next time anything is rendered, or by close_deleted_documents.
+    """
+
+    name = "pdfium"
+    thread_safe = False
+
+    def __init__(self, max_open_documents: int = 4):
+        self.max_open_documents = max_open_documents
+        self._documents: "OrderedDict[Tuple[str, int, int], pdfium.PdfDocument]" = OrderedDict()
+
+    def _get_document(self, local_pdf_path: str) -> "pdfium.PdfDocument":
+        # Must be called with _pdfium_lock held
+        self._close_deleted_documents()
+
+        stat = os.stat(local_pdf_path)
+        key = (os.path.abspath(local_pdf_path), stat.st_size, stat.st_mtime_ns)
+
+        doc = self._documents.get(key)
+        if doc is None:
+            doc = pdfium.PdfDocument(local_pdf_path)
+            self._documents[key] = doc
+            while len(self._documents) > self.max_open_documents:
+                _, evicted = self._documents.popitem(last=False)
+                evicted.close()
+        self._documents.move_to_end(key)
+        return doc
+
+    def render_image(self, local_pdf_path: str, page_num: int, target_longest_image_dim: int) -> Image.Image:
+        with _pdfium_lock:
+            page = self._get_document(local_pdf_path)[page_num - 1]
+            try:
+                # Scale off the size of what gets rendered, the page's crop box, so its longest side comes out as target_longest_image_dim
+                scale = target_longest_image_dim / max(page.get_size())
+                bitmap = page.render(scale=scale)
+                try:
+                    return bitmap.to_pil().copy()
+                finally:
+                    bitmap.close()
+            finally:
+                page.close()
+
+    def _close_deleted_documents(self) -> None:
+        # Must be called with _pdfium_lock held
+        for key in [key for key in self._documents if not os.path.exists(key[0])]:
+            self._documents.pop(key).close()
+
+    def close_deleted_documents(self) -> None:
+        """Closes the open documents whose file was deleted, so they no longer keep its disk space in use"""
+        with _pdfium_lock:
+            self._close_deleted_documents()
+
+    def close(self) -> None:
+        with _pdfium_lock:
+            for doc in self._documents.values():
+                doc.close()
+            self._documents.clear()
+
+
+RENDERERS = {
+    PopplerRenderer.name: PopplerRenderer,
+    PdfiumRenderer.name: PdfiumRenderer,
+}
+
+
+@cache
+def get_renderer(name: str) -> PdfRenderer:
+    """Returns this process's instance of the named renderer, see RENDERERS for the choices"""
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown renderer {name}, choose from {', '.join(RENDERERS)}")
+    return RENDERERS[name]()
 
 
 def render_pdf_to_base64webp(local_pdf_path: str, page: int, target_longest_image_dim: int = 1024):
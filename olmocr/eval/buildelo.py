@@ -6,12 +6,12 @@ import re
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from itertools import combinations
 
-import boto3
 from dolma_refine.evaluate.aligners import HirschbergAligner
 from dolma_refine.evaluate.metrics import DocumentEditSimilarity
 from dolma_refine.evaluate.segmenters import SpacySegmenter
 from tqdm import tqdm
 
+from olmocr.async_storage import get_s3_client
 from olmocr.eval.evalhtml import create_review_html
 from olmocr.s3_utils import expand_s3_glob, get_s3_bytes
 
@@ -42,8 +42,8 @@ class Comparison:
 
 def process_single_pdf(pdf_path, all_mds, comparisons, segmenter_name="spacy"):
     """Process a single PDF and return its comparisons."""
-    # Create resources inside the worker process
-    s3_client = boto3.client("s3")
+    # Create resources inside the worker process, the client is shared by all the pdfs of the process
+    s3_client = get_s3_client()
     segmenter = SpacySegmenter(segmenter_name)
     aligner = HirschbergAligner(match_score=1, mismatch_score=-1, indel_score=-1)
     comparer = DocumentEditSimilarity(segmenter=segmenter, aligner=aligner)
@@ -129,8 +129,7 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    # Create S3 client only for initial file listing
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
 
     # Get all PDFs and MD files
     all_pdfs = set(expand_s3_glob(s3_client, args.s3_path + "/*.pdf"))
@@ -15,7 +15,6 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional
 
-import boto3
 import zstandard
 from dolma_refine.evaluate.aligners import HirschbergAligner
 from dolma_refine.evaluate.metrics import DocumentEditSimilarity
@@ -23,6 +22,8 @@ from dolma_refine.evaluate.segmenters import SpacySegmenter
 from smart_open import register_compressor, smart_open
 from tqdm import tqdm
 
+from olmocr.async_storage import get_s3_client
+
 from .evalhtml import create_review_html
 
 logging.getLogger("pypdf").setLevel(logging.ERROR)
@@ -30,7 +31,7 @@ logging.getLogger("pypdf").setLevel(logging.ERROR)
 
 CACHE_DIR = os.path.join(Path.home(), ".cache", "pdf_gold_data_cache")
 
-s3_client = boto3.client("s3")
+s3_client = get_s3_client()
 
 
 def _handle_zst(file_obj, mode):
@@ -5,7 +5,8 @@ from collections import Counter
 from typing import List
 
 from lingua import Language, LanguageDetectorBuilder
-from pypdf import PdfReader
+
+from olmocr.pdf_handle import get_pdf_handle
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -64,13 +65,14 @@ class PdfFilter:
     # Returns True if there is something wrong with this PDF
     def filter_out_pdf(self, local_pdf_path: str) -> bool:
         try:
-            # Attempt to read the PDF at the beginning
-            pdf_reader = PdfReader(local_pdf_path)
+            # Attempt to read the PDF at the beginning, the parsed document is shared with the rest of the process
+            handle = get_pdf_handle(local_pdf_path)
 
             # Form check
-            if self.apply_form_check and self._is_form(pdf_reader):
-                logger.info(f"Filtering out {local_pdf_path} because it's a form")
-                return True  # Filter out
+            with handle.lock:
+                if self.apply_form_check and self._is_form(handle.reader):
+                    logger.info(f"Filtering out {local_pdf_path} because it's a form")
+                    return True  # Filter out
         except Exception as e:
             logger.warning(f"Error reading PDF {local_pdf_path}: {e}")
             return True  # Filter out the PDF if an exception occurs
@@ -116,9 +118,9 @@ if __name__ == "__main__":
     import tempfile
     from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-    import boto3
     from tqdm import tqdm
 
+    from olmocr.async_storage import get_s3_client
     from olmocr.s3_utils import parse_s3_path
 
     # Quiet logs from pypdf
@@ -129,7 +131,7 @@ if __name__ == "__main__":
         Process a single PDF file to determine if it should be kept or removed.
         """
         s3_bucket, s3_key = parse_s3_path(s3_path)
-        pdf_s3 = boto3.client("s3")
+        pdf_s3 = get_s3_client()
 
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as tmp_file:
             pdf_s3.download_fileobj(s3_bucket, s3_key, tmp_file)
@@ -0,0 +1,215 @@
+# Minimal HTTP/1.1 keep-alive client for talking to the local inference server
+#
+# It feels strange perhaps, but httpx and aiohttp are very complex beasts.
+# Ex. the sessionpool in httpcore has 4 different locks in it, and we've noticed
+# that at the scale of 100M+ requests, they deadlock in different strange ways.
+#
+# So this pool is deliberately tiny: idle connections live in a plain list, and the only
+# synchronization primitive is one semaphore bounding the number of open connections.
+# A connection is either checked out by exactly one request, or sitting idle in the list.
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class IncompleteResponseError(ConnectionError):
+    """Raised when the server closes the connection before a full response was read"""
+
+    pass
+
+
+class ServerDisconnectedError(IncompleteResponseError):
+    """Raised when the server closes the connection without sending any response at all"""
+
+    pass
+
+
+@dataclass
+class _Connection:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    last_used: float = field(default_factory=time.monotonic)
+    num_requests: int = 0
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class HttpConnectionPool:
+    """
+    Bounded pool of persistent HTTP/1.1 connections to a single host and port.
+
+    Only POSTs of JSON bodies are supported, because that's all the pipeline needs. Responses may be
+    sent with a fixed Content-Length, with chunked Transfer-Encoding, or delimited by the server closing the connection.
+    """
+
+    def __init__(self, host: str, port: int, max_connections: int = 512, idle_timeout: float = 4.0):
+        """
+        Args:
+            host: Hostname of the server
+            port: Port of the server
+            max_connections: Maximum number of connections that can be open at the same time,
+                             extra requests wait until a connection is returned to the pool
+            idle_timeout: Idle connections older than this many seconds are closed instead of reused.
+                          Keep this below the server's keep-alive timeout (uvicorn defaults to 5 seconds)
+        """
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+
+        self._host_header = f"{host}:{port}".encode("ascii")
+        self._idle: List[_Connection] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+        # Counters, mostly useful for benchmarks and tests
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    @property
+    def num_idle(self) -> int:
+        return len(self._idle)
+
+    async def post_json(self, path: str, json_data: Any) -> Tuple[int, bytes]:
+        """
+        Send a JSON POST request and return the (status_code, response_body) tuple.
+
+        The body is serialized once straight to bytes, and headers plus body are handed to the transport in one writelines call.
+        """
+        try:
+            body = orjson.dumps(json_data)
+        except orjson.JSONEncodeError:
+            # orjson refuses strings with lone utf-16 surrogates, which can show up in pdf text, the json module escapes them instead
+            body = json.dumps(json_data).encode("utf-8")
+
+        head = b"POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % (
+            path.encode("ascii"),
+            self._host_header,
+            len(body),
+        )
+
+        async with self._slots:
+            conn = self._take_idle()
+
+            if conn is not None:
+                try:
+                    return await self._request(conn, head, body)
+                except (ServerDisconnectedError, ConnectionResetError, BrokenPipeError):
+                    # The server may have closed an idle keep-alive connection just as we reused it.
+                    # Nothing was processed in that case, so it's safe to retry once on a fresh connection.
+                    logger.debug(f"Reused connection to {self.host}:{self.port} was closed by the server, retrying on a new one")
+
+            conn = await self._open()
+            return await self._request(conn, head, body)
+
+    async def close(self) -> None:
+        """Close all idle connections"""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _take_idle(self) -> Optional[_Connection]:
+        now = time.monotonic()
+        while self._idle:
+            # Most recently used connections are the least likely to have been closed by the server
+            conn = self._idle.pop()
+            if now - conn.last_used < self.idle_timeout and not conn.reader.at_eof() and not conn.writer.is_closing():
+                return conn
+            conn.close()
+        return None
+
+    async def _open(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    async def _request(self, conn: _Connection, head: bytes, body: bytes) -> Tuple[int, bytes]:
+        reusable = False
+        try:
+            conn.writer.writelines((head, body))
+            await conn.writer.drain()
+            self.requests_sent += 1
+            conn.num_requests += 1
+
+            status_code, response_body, reusable = await self._read_response(conn.reader)
+            return status_code, response_body
+        finally:
+            # Any error, cancellation, or a server asking to close means the connection state is unknown, so it's never reused
+            if reusable:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            else:
+                conn.close()
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes, bool]:
+        # Read status line
+        status_line = await reader.readline()
+        if not status_line:
+            raise ServerDisconnectedError("No response from server")
+        status_parts = status_line.decode("latin-1").strip().split(" ", 2)
+        if len(status_parts) < 2:
+            raise ValueError(f"Malformed status line: {status_line.decode('latin-1').strip()}")
+        http_version = status_parts[0]
+        status_code = int(status_parts[1])
+
+        # Read headers
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise IncompleteResponseError("Connection closed while reading headers")
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if http_version == "HTTP/1.0" else connection != "close"
+
+        # Read response body
+        try:
+            if "chunked" in headers.get("transfer-encoding", "").lower():
+                response_body = await HttpConnectionPool._read_chunked(reader)
+            elif "content-length" in headers:
+                response_body = await reader.readexactly(int(headers["content-length"]))
+            else:
+                # Body is delimited by the server closing the connection
+                response_body = await reader.read()
+                keep_alive = False
+        except asyncio.IncompleteReadError as e:
+            raise IncompleteResponseError(f"Connection closed after {len(e.partial)} bytes of response body") from e
+
+        return status_code, response_body, keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                raise IncompleteResponseError("Connection closed while reading chunk size")
+            # Chunk extensions after a ';' are allowed by the spec, and ignored here
+            chunk_size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if chunk_size == 0:
+                break
+            chunks.append(await reader.readexactly(chunk_size))
+            await reader.readexactly(2)  # CRLF after each chunk
+
+        # Skip any trailer headers, up to the final blank line
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+        return b"".join(chunks)
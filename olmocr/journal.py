@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import zstandard as zstd
+
+from olmocr.s3_utils import parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# A segment is written once this many page results are buffered, or once the oldest buffered result is this old
+JOURNAL_FLUSH_PAGES = 32
+JOURNAL_FLUSH_INTERVAL = 60.0
+
+SEGMENT_SUFFIX = ".jsonl.zst"
+
+
+def journal_dir(workspace: str, work_hash: str) -> str:
+    return os.path.join(workspace, "journals", work_hash)
+
+
+class PageJournal:
+    """
+    Checkpoints the finished pages of a work item, so that a worker which picks up the work item after another one
+    crashed or was preempted only needs to send the missing pages to the server.
+
+    The journal lives in the workspace under journals/{work_hash}/, locally or on S3. S3 has no appends, so the journal
+    is a set of immutable segments instead of one growing file: page results are buffered in memory, and every so
+    often the buffer is written out as a new segment with a name that no other writer will pick. A crash loses at most
+    the buffered pages, and a segment is either fully there or not there at all.
+
+    record() and get() only touch memory and can be called from the event loop. replay(), flush() and delete() do
+    blocking IO, so call them via asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        workspace: str,
+        work_hash: str,
+        s3_client=None,
+        flush_pages: int = JOURNAL_FLUSH_PAGES,
+        flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+    ):
+        self.path = journal_dir(workspace, work_hash)
+        self.s3_client = s3_client
+        self.flush_pages = flush_pages
+        self.flush_interval = flush_interval
+
+        self._writer_id = uuid.uuid4().hex[:12]
+        self._next_segment = 0
+        self._entries: Dict[Tuple[str, int], dict] = {}
+        self._buffer: List[dict] = []
+        self._oldest_buffered: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_s3(self) -> bool:
+        return self.path.startswith("s3://")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, pdf_path: str, page_num: int) -> Optional[dict]:
+        """Returns the result recorded for this page, by this or an earlier run, or None if it still needs to be done"""
+        return self._entries.get((pdf_path, page_num))
+
+    def record(self, pdf_path: str, page_num: int, result: dict) -> bool:
+        """
+        Adds a finished page to the journal.
+
+        Returns:
+            True if enough has been buffered that the caller should flush() now.
+        """
+        with self._lock:
+            self._entries[(pdf_path, page_num)] = result
+            self._buffer.append({"pdf": pdf_path, "page": page_num, "result": result})
+            if self._oldest_buffered is None:
+                self._oldest_buffered = time.monotonic()
+
+            return len(self._buffer) >= self.flush_pages or time.monotonic() - self._oldest_buffered >= self.flush_interval
+
+    def flush(self) -> None:
+        """Writes whatever is buffered as a new segment. Failures are logged and the entries kept for the next flush."""
+        with self._lock:
+            if not self._buffer:
+                return
+            entries, self._buffer = self._buffer, []
+            self._oldest_buffered = None
+            segment_name = f"segment_{self._writer_id}_{self._next_segment:06d}{SEGMENT_SUFFIX}"
+            self._next_segment += 1
+
+        data = zstd.ZstdCompressor().compress("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+        try:
+            self._write_segment(segment_name, data)
+        except Exception as e:
+            logger.warning(f"Failed to write journal segment {segment_name} to {self.path}: {e}")
+            with self._lock:
+                self._buffer = entries + self._buffer
+                if self._oldest_buffered is None:
+                    self._oldest_buffered = time.monotonic()
+
+    def replay(self) -> int:
+        """
+        Loads the segments written by earlier runs on this work item.
+
+        Returns:
+            The number of pages that were loaded.
+        """
+        loaded = 0
+        for segment_name in self._list_segments():
+            try:
+                lines = zstd.ZstdDecompressor().decompress(self._read_segment(segment_name)).decode("utf-8").splitlines()
+                entries = [json.loads(line) for line in lines]
+            except Exception as e:
+                # The pages in a bad segment just get done again
+                logger.warning(f"Skipping unreadable journal segment {segment_name} in {self.path}: {e}")
+                continue
+
+            with self._lock:
+                for entry in entries:
+                    self._entries[(entry["pdf"], entry["page"])] = entry["result"]
+            loaded += len(entries)
+
+        return loaded
+
+    def delete(self) -> None:
+        """Removes every segment, once the result of the work item is committed and the journal is no longer needed"""
+        with self._lock:
+            self._buffer = []
+            self._oldest_buffered = None
+
+        if self.is_s3:
+            bucket, prefix = parse_s3_path(self.path)
+            keys = [f"{prefix}/{segment_name}" for segment_name in self._list_segments()]
+            # delete_objects takes at most 1000 keys per request
+            for i in range(0, len(keys), 1000):
+                self.s3_client.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i : i + 1000]], "Quiet": True})
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def _list_segments(self) -> List[str]:
+        if self.is_s3:
+            bucket, prefix = parse_s3_path(self.path)
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            names = []
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix + "/"):
+                for obj in page.get("Contents", []):
+                    names.append(obj["Key"][len(prefix) + 1 :])
+        else:
+            try:
+                names = os.listdir(self.path)
+            except FileNotFoundError:
+                return []
+
+        # Hidden files are local segments that are still being written
+        return sorted(name for name in names if name.endswith(SEGMENT_SUFFIX) and not name.startswith("."))
+
+    def _read_segment(self, segment_name: str) -> bytes:
+        if self.is_s3:
+            bucket, prefix = parse_s3_path(self.path)
+            return self.s3_client.get_object(Bucket=bucket, Key=f"{prefix}/{segment_name}")["Body"].read()
+
+        with open(os.path.join(self.path, segment_name), "rb") as f:
+            return f.read()
+
+    def _write_segment(self, segment_name: str, data: bytes) -> None:
+        if self.is_s3:
+            bucket, prefix = parse_s3_path(self.path)
+            self.s3_client.put_object(Bucket=bucket, Key=f"{prefix}/{segment_name}", Body=data)
+            return
+
+        # Write under a hidden name and rename into place, so a crash mid-write never leaves a truncated segment behind
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, f".{segment_name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.path, segment_name))
@@ -0,0 +1,101 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from olmocr.prompts.anchor import PageReport
+
+
+class PageCache:
+    """
+    Caches the expensive per-page work that goes into building a page query, so that retries of the same page
+    don't have to render the page or parse it with pypdf again.
+
+    Rendered images are keyed by (pdf, page, target_longest_image_dim, rotation), and the parsed PageReport
+    used for anchor text is keyed by (pdf, page). A retry with a smaller anchor text length then only needs to
+    re-linearize the cached report, and a retry with a rotation only needs to rotate the cached render.
+
+    Unrotated images can also be marked as pending, when something else (ie. a batch render of the whole document)
+    has promised to produce them. Whoever needs the image then awaits the pending future instead of rendering the page itself.
+    A pending future resolves to None if the image won't be coming after all.
+
+    Entries are grouped by pdf, so that everything belonging to a document can be dropped once it is finished.
+    This is only meant to be used from a single event loop, so there is no locking.
+    """
+
+    def __init__(self):
+        self._images: Dict[str, Dict[Tuple[int, int, int], str]] = defaultdict(dict)
+        self._reports: Dict[str, Dict[int, PageReport]] = defaultdict(dict)
+        self._pending: Dict[str, Dict[Tuple[int, int], asyncio.Future]] = defaultdict(dict)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_image(self, pdf_path: str, page: int, target_longest_image_dim: int, rotation: int) -> Optional[str]:
+        image_base64 = self._images.get(pdf_path, {}).get((page, target_longest_image_dim, rotation))
+        self._count(image_base64 is not None)
+        return image_base64
+
+    def put_image(self, pdf_path: str, page: int, target_longest_image_dim: int, rotation: int, image_base64: str) -> None:
+        self._images[pdf_path][(page, target_longest_image_dim, rotation)] = image_base64
+
+    def add_pending_image(self, pdf_path: str, page: int, target_longest_image_dim: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[pdf_path][(page, target_longest_image_dim)] = future
+        return future
+
+    def get_pending_image(self, pdf_path: str, page: int, target_longest_image_dim: int) -> Optional[asyncio.Future]:
+        return self._pending.get(pdf_path, {}).get((page, target_longest_image_dim))
+
+    def resolve_pending_image(self, pdf_path: str, page: int, target_longest_image_dim: int, image_base64: Optional[str]) -> None:
+        """Delivers a pending image, or None if it can't be produced. Images nobody is waiting for anymore are dropped"""
+        future = self._pending.get(pdf_path, {}).pop((page, target_longest_image_dim), None)
+        if future is None:
+            return
+
+        if image_base64 is not None:
+            self.put_image(pdf_path, page, target_longest_image_dim, 0, image_base64)
+        if not future.done():
+            future.set_result(image_base64)
+
+    def get_report(self, pdf_path: str, page: int) -> Optional[PageReport]:
+        report = self._reports.get(pdf_path, {}).get(page)
+        self._count(report is not None)
+        return report
+
+    def put_report(self, pdf_path: str, page: int, report: PageReport) -> None:
+        self._reports[pdf_path][page] = report
+
+    def evict_page(self, pdf_path: str, page: int) -> None:
+        """Drops everything cached for a single page, once that page has its final result"""
+        images = self._images.get(pdf_path)
+        if images:
+            for key in [key for key in images if key[0] == page]:
+                del images[key]
+
+        reports = self._reports.get(pdf_path)
+        if reports:
+            reports.pop(page, None)
+
+        pending = self._pending.get(pdf_path)
+        if pending:
+            for key in [key for key in pending if key[0] == page]:
+                self.resolve_pending_image(pdf_path, key[0], key[1], None)
+
+    def evict_document(self, pdf_path: str) -> None:
+        """Drops everything cached for a document"""
+        self._images.pop(pdf_path, None)
+        self._reports.pop(pdf_path, None)
+
+        for future in self._pending.pop(pdf_path, {}).values():
+            if not future.done():
+                future.set_result(None)
+
+    @property
+    def num_documents(self) -> int:
+        return len(set(self._images) | set(self._reports) | {pdf_path for pdf_path, pending in self._pending.items() if pending})
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
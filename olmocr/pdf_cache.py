@@ -0,0 +1,226 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from functools import cache
+from typing import Optional
+
+from filelock import FileLock, Timeout
+
+from olmocr.s3_utils import parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# Where the pdfs downloaded by any of the olmocr tools are kept, shared by all of them, and how much space they may take up
+PDF_CACHE_DIR = os.environ.get("OLMOCR_PDF_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "olmocr", "pdfs"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("OLMOCR_PDF_CACHE_MAX_BYTES", 20 * 1024**3))
+
+# Evicting lists the whole cache, so it only happens once this fraction of max_bytes was added since the last time, and then
+# goes down to PDF_CACHE_EVICT_TARGET of max_bytes, to leave some room before the next time
+PDF_CACHE_EVICT_EVERY = 0.05
+PDF_CACHE_EVICT_TARGET = 0.9
+
+# Entries are filled under a lock file shared by all the entries whose digest starts with the same this many hex digits, so that
+# there is a fixed number of lock files, instead of one per entry that would be left behind once the entry is evicted
+PDF_CACHE_LOCK_DIGITS = 3
+
+
+@dataclass
+class PdfCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_downloaded: int = 0
+    evicted_files: int = 0
+    evicted_bytes: int = 0
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"PDF cache: {self.hits:,} hits, {self.misses:,} misses ({hit_rate:.1%} hit rate), "
+            f"{self.bytes_downloaded / 1024**2:,.1f} MiB downloaded, {self.evicted_files:,} files ({self.evicted_bytes / 1024**2:,.1f} MiB) evicted"
+        )
+
+
+class PdfCache:
+    """
+    An on-disk cache of pdfs from S3, keyed by path and ETag, so a pdf that changed on S3 is never served from an old copy.
+
+    Many processes can share one cache directory. Each entry is filled under a file lock, shared with the entries whose
+    digest has the same first few digits, into a temporary file that is renamed into place, so the others either wait for
+    the download or find the finished file. Hits update
+    the modification time of their entry, and once the cache grows past max_bytes, the least recently used entries are
+    evicted, by whichever process gets to it first.
+    """
+
+    def __init__(self, cache_dir: str = PDF_CACHE_DIR, max_bytes: Optional[int] = PDF_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: Directory of the cache, created if it doesn't exist
+            max_bytes: Size that the cache is kept under, None for a cache that is never evicted from
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = PdfCacheStats()
+        self._stats_lock = threading.Lock()
+        # So that the first download in this process checks the size of the cache
+        self._bytes_since_eviction = max_bytes or 0
+
+    def entry_path(self, s3_path: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{s3_path}\n{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.pdf")
+
+    def _lock_path(self, path: str) -> str:
+        digest = os.path.basename(path)
+        return os.path.join(self.cache_dir, ".locks", f"{digest[:PDF_CACHE_LOCK_DIGITS]}.lock")
+
+    def _hit(self, path: str) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+
+        with self._stats_lock:
+            self.stats.hits += 1
+        return True
+
+    def get(self, s3_client, s3_path: str, etag: Optional[str] = None) -> str:
+        """
+        Returns the path of a local copy of s3_path, downloading it unless it is cached already. Local paths are
+        returned as they are. The returned file may get evicted later on, so open it soon.
+
+        Args:
+            s3_client: Boto3 S3 client that can read s3_path
+            s3_path: s3:// path of the pdf
+            etag: ETag of the pdf, if it is known already from a listing, otherwise it is looked up with a HEAD request
+
+        Returns:
+            Path of the local copy
+        """
+        if not s3_path.startswith("s3://"):
+            return s3_path
+
+        bucket, key = parse_s3_path(s3_path)
+        if etag is None:
+            etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        etag = etag.strip('"')
+
+        path = self.entry_path(s3_path, etag)
+        if self._hit(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, ".locks"), exist_ok=True)
+        with FileLock(self._lock_path(path)):
+            # Whoever held the lock before may have downloaded it in the meantime
+            if self._hit(path):
+                return path
+
+            self._download(s3_client, bucket, key, etag, path)
+
+        size = os.path.getsize(path)
+        with self._stats_lock:
+            self.stats.misses += 1
+            self.stats.bytes_downloaded += size
+            self._bytes_since_eviction += size
+            should_evict = self.max_bytes is not None and self._bytes_since_eviction >= self.max_bytes * PDF_CACHE_EVICT_EVERY
+            if should_evict:
+                self._bytes_since_eviction = 0
+
+        if should_evict:
+            self.evict()
+        return path
+
+    @staticmethod
+    def _download(s3_client, bucket: str, key: str, etag: str, dest_path: str) -> None:
+        tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Conditional on the ETag, so the file can't end up with the content of some other version of the pdf
+            response = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=f'"{etag}"')
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(response["Body"], f)
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _on_cache_filesystem(self, path: str) -> bool:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.stat(os.path.dirname(os.path.abspath(path))).st_dev == os.stat(self.cache_dir).st_dev
+
+    def link(self, s3_client, s3_path: str, dest_path: str, etag: Optional[str] = None) -> None:
+        """
+        Makes a copy of s3_path at dest_path, a hard link to the cache entry where dest_path is on the same filesystem,
+        so that the copy stays around and has a path of its own, even if the entry gets evicted.
+
+        Where dest_path is on another filesystem, such as a tmpfs, a pdf that isn't cached yet is downloaded straight to
+        dest_path and left out of the cache, rather than written to the cache and then copied, which would write it twice.
+        """
+        bucket, key = parse_s3_path(s3_path)
+        if etag is None:
+            etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        etag = etag.strip('"')
+
+        if not os.path.exists(self.entry_path(s3_path, etag)) and not self._on_cache_filesystem(dest_path):
+            self._download(s3_client, bucket, key, etag, dest_path)
+            with self._stats_lock:
+                self.stats.misses += 1
+                self.stats.bytes_downloaded += os.path.getsize(dest_path)
+            return
+
+        path = self.get(s3_client, s3_path, etag)
+        try:
+            os.link(path, dest_path)
+        except OSError:
+            shutil.copyfile(path, dest_path)
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is under max_bytes again"""
+        if self.max_bytes is None:
+            return
+
+        try:
+            # Another process that is evicting already does the job for everyone
+            with FileLock(os.path.join(self.cache_dir, ".evict.lock"), timeout=0):
+                entries = []
+                for shard in os.scandir(self.cache_dir):
+                    if not (shard.is_dir() and len(shard.name) == 2):
+                        continue
+                    for entry in os.scandir(shard.path):
+                        if entry.name.endswith(".pdf"):
+                            try:
+                                stat = entry.stat()
+                            except FileNotFoundError:
+                                continue
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+                total_bytes = sum(size for _, size, _ in entries)
+                if total_bytes <= self.max_bytes:
+                    return
+
+                evicted_files = evicted_bytes = 0
+                for _, size, path in sorted(entries):
+                    if total_bytes <= self.max_bytes * PDF_CACHE_EVICT_TARGET:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total_bytes -= size
+                    evicted_files += 1
+                    evicted_bytes += size
+        except Timeout:
+            return
+
+        with self._stats_lock:
+            self.stats.evicted_files += evicted_files
+            self.stats.evicted_bytes += evicted_bytes
+        logger.info(f"Evicted {evicted_files:,} pdfs ({evicted_bytes / 1024**2:,.1f} MiB) from {self.cache_dir}")
+
+
+@cache
+def default_pdf_cache() -> PdfCache:
+    """The cache at PDF_CACHE_DIR, shared by the olmocr tools that download pdfs"""
+    return PdfCache()
@@ -0,0 +1,170 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from pypdf import PageObject, PdfReader
+
+# Limits for the per-process handle cache. A PdfReader keeps the whole file in memory, plus every object
+# it has resolved so far, so we bound the cache both by number of documents and by their size on disk.
+# There is one of these caches in every process pool worker, so keep them modest.
+PDF_HANDLE_CACHE_MAX_HANDLES = 8
+PDF_HANDLE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class PageGeometry:
+    """MediaBox of a page, in PDF points"""
+
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+
+    @property
+    def width(self) -> float:
+        return abs(self.x1 - self.x0)
+
+    @property
+    def height(self) -> float:
+        return abs(self.y1 - self.y0)
+
+
+class PdfHandle:
+    """
+    A parsed PDF document that can be shared by everything in this process that needs to look inside it:
+    page counting, geometry lookups and anchor text extraction.
+
+    Parsing the xref table and page tree only happens once, and pypdf keeps every indirect object it resolves
+    on the reader, so fonts and XObjects shared between pages are also only parsed once per document.
+    Page objects, their geometry and their /XObject resources are memoized per page on top of that.
+
+    pypdf readers are not thread safe, so callers that may be running on several threads need to hold `lock`
+    while they use the reader or the page objects. The accessors on this class take it themselves.
+    """
+
+    def __init__(self, local_pdf_path: str, size: int, mtime_ns: int):
+        self.path = local_pdf_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.lock = threading.RLock()
+        self.reader = PdfReader(local_pdf_path)
+
+        self._num_pages: Optional[int] = None
+        self._pages: Dict[int, PageObject] = {}
+        self._geometry: Dict[int, PageGeometry] = {}
+        self._xobjects: Dict[int, dict] = {}
+
+    @property
+    def num_pages(self) -> int:
+        with self.lock:
+            if self._num_pages is None:
+                self._num_pages = self.reader.get_num_pages()
+            return self._num_pages
+
+    def page(self, page_num: int) -> PageObject:
+        """Returns the pypdf page object for a 1-indexed page number"""
+        with self.lock:
+            page = self._pages.get(page_num)
+            if page is None:
+                page = self.reader.pages[page_num - 1]
+                self._pages[page_num] = page
+            return page
+
+    def geometry(self, page_num: int) -> PageGeometry:
+        with self.lock:
+            geometry = self._geometry.get(page_num)
+            if geometry is None:
+                mediabox = self.page(page_num).mediabox
+                geometry = PageGeometry(float(mediabox[0]), float(mediabox[1]), float(mediabox[2]), float(mediabox[3]))
+                self._geometry[page_num] = geometry
+            return geometry
+
+    def xobjects(self, page_num: int) -> dict:
+        """Returns the /XObject dictionary from a page's resources, or an empty dict if it has none"""
+        with self.lock:
+            xobjects = self._xobjects.get(page_num)
+            if xobjects is None:
+                resources = self.page(page_num).get("/Resources", {})
+                xobjects = resources.get("/XObject", {})
+                self._xobjects[page_num] = xobjects
+            return xobjects
+
+
+class PdfHandleCache:
+    """
+    LRU cache of PdfHandles, keyed by (path, size, mtime) so that a file which gets rewritten in place is parsed again.
+
+    Whoever deletes a pdf usually isn't the process that has it cached, like the pipeline deleting the scratch copies that
+    its process pool workers parsed, so on every miss the handles of files that no longer exist are dropped as well.
+    """
+
+    def __init__(self, max_handles: int = PDF_HANDLE_CACHE_MAX_HANDLES, max_bytes: int = PDF_HANDLE_CACHE_MAX_BYTES):
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self._handles: "OrderedDict[str, PdfHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, local_pdf_path: str) -> PdfHandle:
+        stat = os.stat(local_pdf_path)
+        key = os.path.abspath(local_pdf_path)
+
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and (handle.size, handle.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                self._handles.move_to_end(key)
+                self.hits += 1
+                return handle
+
+        # Parse outside of the cache lock, so that other documents can still be looked up meanwhile
+        handle = PdfHandle(local_pdf_path, stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            self.misses += 1
+            for gone_key in [other_key for other_key in self._handles if not os.path.exists(other_key)]:
+                del self._handles[gone_key]
+            self._handles[key] = handle
+            self._handles.move_to_end(key)
+            self._evict()
+
+        return handle
+
+    def evict(self, local_pdf_path: str) -> None:
+        with self._lock:
+            self._handles.pop(os.path.abspath(local_pdf_path), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(handle.size for handle in self._handles.values())
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def _evict(self) -> None:
+        # Always keep the most recently used handle, even if it's bigger than the byte budget on its own
+        while len(self._handles) > 1 and (len(self._handles) > self.max_handles or self.num_bytes > self.max_bytes):
+            self._handles.popitem(last=False)
+
+
+# Each process gets its own cache, so process pool workers keep documents parsed between the pages they are handed
+_pdf_handle_cache = PdfHandleCache()
+
+
+def get_pdf_handle(local_pdf_path: str) -> PdfHandle:
+    return _pdf_handle_cache.get(local_pdf_path)
+
+
+def evict_pdf_handle(local_pdf_path: str) -> None:
+    _pdf_handle_cache.evict(local_pdf_path)
+
+
+def get_pdf_num_pages(local_pdf_path: str) -> int:
+    return get_pdf_handle(local_pdf_path).num_pages
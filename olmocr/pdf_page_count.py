@@ -0,0 +1,348 @@
+import os
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from olmocr.s3_utils import parse_s3_path
+
+# The first read takes this much off the end of the file, which usually covers startxref, the trailer and the last
+# xref section, and covers small pdfs entirely
+TAIL_READ_BYTES = 64 * 1024
+
+# Every request reads at least this much, so that the many small reads of parsing an xref table mostly come out of one
+MIN_READ_BYTES = 8 * 1024
+
+# Reads of objects at an offset found in the xref start at this much, growing 8x at a time for objects that don't fit
+OBJECT_READ_BYTES = 1024
+MAX_OBJECT_READS = 4
+
+# Incrementally updated pdfs chain one xref section per update, we give up on any with more than this
+MAX_XREF_SECTIONS = 32
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_OBJ_HEADER_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+_STREAM_RE = re.compile(rb">>\s*stream\r?\n")
+_SUBSECTION_RE = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)")
+_TRAILER_RE = re.compile(rb"\s*trailer\b")
+_ENTRY_RE = re.compile(rb"(\d{10})\s(\d{5})\s([nf])")
+
+
+class PdfStructureError(ValueError):
+    """The pdf isn't laid out in a way that read_page_count understands, so it needs to be opened the normal way"""
+
+
+def _ref(dict_text: bytes, key: bytes) -> Optional[int]:
+    match = re.search(rb"/" + key + rb"\s+(\d+)\s+\d+\s+R", dict_text)
+    return int(match.group(1)) if match else None
+
+
+def _int(dict_text: bytes, key: bytes) -> Optional[int]:
+    # \b stops a number from matching just the first digits of an indirect reference
+    match = re.search(rb"/" + key + rb"\s+(\d+)\b(?!\s+\d+\s+R)", dict_text)
+    return int(match.group(1)) if match else None
+
+
+class PdfRangeReader:
+    """
+    Reads byte ranges of a pdf, locally or on S3. Everything read is kept, so reads that fall within an earlier one,
+    such as objects near the end of the file, don't cost another request.
+    """
+
+    def __init__(self, s3_client, path: str):
+        self.s3_client = s3_client
+        self.path = path
+        self.size: Optional[int] = None
+        self.num_requests = 0
+        self._chunks: List[Tuple[int, bytes]] = []
+
+    def _fetch(self, range_value: str, start: int, length: int) -> bytes:
+        self.num_requests += 1
+        if not self.path.startswith("s3://"):
+            with open(self.path, "rb") as f:
+                if self.size is None:
+                    self.size = os.fstat(f.fileno()).st_size
+                    start = max(0, self.size - length)
+                f.seek(start)
+                data = f.read(length)
+            self._chunks.append((start, data))
+            return data
+
+        bucket, key = parse_s3_path(self.path)
+        response = self.s3_client.get_object(Bucket=bucket, Key=key, Range=range_value)
+        data = response["Body"].read()
+        if self.size is None:
+            # Content-Range is "bytes first-last/size"
+            self.size = int(response["ContentRange"].rsplit("/", 1)[1])
+            start = self.size - len(data)
+        self._chunks.append((start, data))
+        return data
+
+    def tail(self, length: int) -> Tuple[int, bytes]:
+        """Reads the last length bytes of the file, which also learns its size. Returns (offset, data)."""
+        data = self._fetch(f"bytes=-{length}", 0, length)
+        return self.size - len(data), data
+
+    def read(self, start: int, length: int) -> bytes:
+        end = min(start + length, self.size)
+        for chunk_start, chunk in self._chunks:
+            if chunk_start <= start and end <= chunk_start + len(chunk):
+                return chunk[start - chunk_start : end - chunk_start]
+
+        fetch_end = min(start + max(length, MIN_READ_BYTES), self.size)
+        return self._fetch(f"bytes={start}-{fetch_end - 1}", start, fetch_end - start)[: end - start]
+
+
+def _read_object(reader: PdfRangeReader, offset: int) -> Tuple[int, bytes, Optional[int]]:
+    """
+    Reads the object at offset.
+
+    Returns:
+        (object number, the object up to endobj or up to its stream, offset of the stream data if it has one)
+    """
+    for attempt in range(MAX_OBJECT_READS):
+        data = reader.read(offset, OBJECT_READ_BYTES * 8**attempt)
+        header = _OBJ_HEADER_RE.match(data)
+        if header is None:
+            raise PdfStructureError(f"No object at offset {offset}")
+
+        stream = _STREAM_RE.search(data, header.end())
+        end = data.find(b"endobj", header.end())
+        if stream is not None and (end < 0 or stream.start() < end):
+            return int(header.group(1)), data[header.end() : stream.start() + 2], offset + stream.end()
+        if end >= 0:
+            return int(header.group(1)), data[header.end() : end], None
+        if offset + len(data) >= reader.size:
+            break
+
+    raise PdfStructureError(f"Object at offset {offset} doesn't end")
+
+
+def _undo_png_predictor(data: bytes, columns: int) -> bytes:
+    decoded = bytearray()
+    previous = bytearray(columns)
+    for i in range(0, len(data), columns + 1):
+        filter_type = data[i]
+        row = bytearray(data[i + 1 : i + 1 + columns])
+        if filter_type == 1:
+            for j in range(1, len(row)):
+                row[j] = (row[j] + row[j - 1]) & 0xFF
+        elif filter_type == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif filter_type != 0:
+            raise PdfStructureError(f"Unsupported PNG predictor {filter_type}")
+        decoded += row
+        previous = row
+    return bytes(decoded)
+
+
+def _read_stream(reader: PdfRangeReader, dict_text: bytes, data_offset: int) -> bytes:
+    length = _int(dict_text, b"Length")
+    if length is None:
+        raise PdfStructureError("Stream without a direct length")
+    data = reader.read(data_offset, length)
+
+    filters = re.search(rb"/Filter\s*(\[[^\]]*\]|/\w+)", dict_text)
+    if filters is not None:
+        if re.sub(rb"[\s\[\]]", b"", filters.group(1)) != b"/FlateDecode":
+            raise PdfStructureError(f"Unsupported stream filter {filters.group(1)!r}")
+        data = zlib.decompress(data)
+
+    predictor = _int(dict_text, b"Predictor")
+    if predictor is not None and predictor >= 10:
+        data = _undo_png_predictor(data, _int(dict_text, b"Columns") or 1)
+    elif predictor not in (None, 1):
+        raise PdfStructureError(f"Unsupported predictor {predictor}")
+    return data
+
+
+XrefLookup = Callable[[int], Optional[Tuple[int, int, int]]]
+
+
+def _parse_xref_table(reader: PdfRangeReader, offset: int) -> Tuple[XrefLookup, bytes]:
+    """Parses just the layout of a classic xref table, entries are read when they get looked up"""
+    subsections = []
+    position = offset + reader.read(offset, 64).index(b"xref") + len(b"xref")
+    while True:
+        chunk = reader.read(position, 256)
+        if (match := _TRAILER_RE.match(chunk)) is not None:
+            trailer = reader.read(position + match.end(), OBJECT_READ_BYTES)
+            trailer = trailer[: trailer.find(b"startxref")] if b"startxref" in trailer else trailer
+            break
+        if (match := _SUBSECTION_RE.match(chunk)) is None:
+            raise PdfStructureError(f"Malformed xref table at offset {offset}")
+
+        first, count = int(match.group(1)), int(match.group(2))
+        subsections.append((first, count, position + match.end()))
+        # Entries are exactly 20 bytes each
+        position += match.end() + 20 * count
+
+    def lookup(obj_num: int) -> Optional[Tuple[int, int, int]]:
+        for first, count, entries_offset in subsections:
+            if first <= obj_num < first + count:
+                entry = _ENTRY_RE.match(reader.read(entries_offset + 20 * (obj_num - first), 20))
+                if entry is None:
+                    raise PdfStructureError(f"Malformed xref entry for object {obj_num}")
+                return (1, int(entry.group(1)), int(entry.group(2))) if entry.group(3) == b"n" else None
+        return None
+
+    return lookup, trailer
+
+
+def _parse_xref_stream(reader: PdfRangeReader, offset: int) -> Tuple[XrefLookup, bytes]:
+    _, dict_text, data_offset = _read_object(reader, offset)
+    widths = re.search(rb"/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]", dict_text)
+    if data_offset is None or not re.search(rb"/Type\s*/XRef", dict_text) or widths is None:
+        raise PdfStructureError(f"No xref stream at offset {offset}")
+
+    widths = [int(width) for width in widths.groups()]
+    index = re.search(rb"/Index\s*\[([\d\s]*)\]", dict_text)
+    index = [int(n) for n in index.group(1).split()] if index else [0, _int(dict_text, b"Size") or 0]
+    data = _read_stream(reader, dict_text, data_offset)
+
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    row_size = sum(widths)
+    row = 0
+    for first, count in zip(index[::2], index[1::2]):
+        for obj_num in range(first, first + count):
+            fields = []
+            position = row * row_size
+            for width in widths:
+                fields.append(int.from_bytes(data[position : position + width], "big"))
+                position += width
+            row += 1
+            # A missing type field means type 1
+            entry_type = fields[0] if widths[0] else 1
+            if entry_type in (1, 2):
+                entries[obj_num] = (entry_type, fields[1], fields[2])
+
+    return entries.get, dict_text
+
+
+class _Xref:
+    """The chain of xref sections of a pdf, newest first, loaded as far back as lookups need"""
+
+    def __init__(self, reader: PdfRangeReader, startxref: int):
+        self.reader = reader
+        self.sections: List[XrefLookup] = []
+        self.trailer: Optional[bytes] = None
+        self._pending = [startxref]
+        self._seen = set()
+
+    def _load_next(self) -> bool:
+        if not self._pending:
+            return False
+        if len(self.sections) >= MAX_XREF_SECTIONS:
+            raise PdfStructureError("Too many xref sections")
+
+        offset = self._pending.pop(0)
+        self._seen.add(offset)
+        if b"xref" in self.reader.read(offset, 16):
+            lookup, trailer = _parse_xref_table(self.reader, offset)
+        else:
+            lookup, trailer = _parse_xref_stream(self.reader, offset)
+
+        self.sections.append(lookup)
+        if self.trailer is None:
+            self.trailer = trailer
+
+        # Hybrid files keep the objects of the table's xref stream (XRefStm) ahead of the previous section
+        more = [offset for key in (b"XRefStm", b"Prev") if (offset := _int(trailer, key)) is not None and offset not in self._seen]
+        self._pending = more + self._pending
+        return True
+
+    def load_trailer(self) -> bytes:
+        if self.trailer is None:
+            self._load_next()
+        return self.trailer
+
+    def lookup(self, obj_num: int) -> Tuple[int, int, int]:
+        i = 0
+        while True:
+            while i < len(self.sections):
+                entry = self.sections[i](obj_num)
+                if entry is not None:
+                    return entry
+                i += 1
+            if not self._load_next():
+                raise PdfStructureError(f"Object {obj_num} is not in the xref")
+
+
+def _resolve(reader: PdfRangeReader, xref: _Xref, obj_num: int, object_streams: Dict[int, Tuple[Dict[int, int], bytes]]) -> bytes:
+    entry_type, field, _ = xref.lookup(obj_num)
+    if entry_type == 1:
+        found_num, text, _ = _read_object(reader, field)
+        if found_num != obj_num:
+            raise PdfStructureError(f"Xref points object {obj_num} at object {found_num}")
+        return text
+
+    # The object is compressed into an object stream, which starts with pairs of object number and offset
+    if field not in object_streams:
+        stream_type, stream_offset, _ = xref.lookup(field)
+        if stream_type != 1:
+            raise PdfStructureError(f"Object stream {field} is itself compressed")
+        _, dict_text, data_offset = _read_object(reader, stream_offset)
+        if data_offset is None:
+            raise PdfStructureError(f"Object stream {field} has no stream")
+        data = _read_stream(reader, dict_text, data_offset)
+        first = _int(dict_text, b"First")
+        if first is None:
+            raise PdfStructureError(f"Object stream {field} has no /First")
+        header = [int(n) for n in data[:first].split()]
+        object_streams[field] = ({num: first + offset for num, offset in zip(header[::2], header[1::2])}, data)
+
+    offsets, data = object_streams[field]
+    if obj_num not in offsets:
+        raise PdfStructureError(f"Object {obj_num} is not in object stream {field}")
+    start = offsets[obj_num]
+    end = min((offset for offset in offsets.values() if offset > start), default=len(data))
+    return data[start:end]
+
+
+def read_page_count(s3_client, pdf_path: str) -> int:
+    """
+    Counts the pages of a pdf from the /Count of its page tree, reading only the end of the file, the catalog and the
+    root of the page tree, which is usually 1-3 range requests instead of a download of the whole file.
+
+    Raises:
+        PdfStructureError: If the pdf is damaged, encrypted or laid out in an unusual way, in which case the caller
+                           should fall back to downloading and opening it
+    """
+    reader = PdfRangeReader(s3_client, pdf_path)
+    _, tail = reader.tail(TAIL_READ_BYTES)
+
+    position = tail.rfind(b"startxref")
+    match = _STARTXREF_RE.match(tail, position) if position >= 0 else None
+    if match is None or int(match.group(1)) >= reader.size:
+        raise PdfStructureError("No startxref at the end of the file")
+    startxref = int(match.group(1))
+
+    # A linearized pdf that wasn't updated since has its first xref near the start, right after the linearization
+    # dictionary in its first object, which has the number of pages as /N
+    if startxref < MIN_READ_BYTES:
+        first_object = re.search(rb"\bobj\s*<<(.*?)>>", reader.read(0, MIN_READ_BYTES), re.DOTALL)
+        if first_object is not None and b"/Linearized" in first_object.group(1) and (num_pages := _int(first_object.group(1), b"N")) is not None:
+            return num_pages
+
+    try:
+        xref = _Xref(reader, startxref)
+        trailer = xref.load_trailer()
+        if re.search(rb"/Encrypt\b", trailer):
+            raise PdfStructureError("Encrypted pdf")
+
+        root = _ref(trailer, b"Root")
+        if root is None:
+            raise PdfStructureError("Trailer has no /Root")
+
+        object_streams = {}
+        pages = _ref(_resolve(reader, xref, root, object_streams), b"Pages")
+        if pages is None:
+            raise PdfStructureError("Catalog has no /Pages")
+
+        count = _int(_resolve(reader, xref, pages, object_streams), b"Count")
+        if count is None:
+            raise PdfStructureError("Page tree has no /Count")
+        return count
+    except PdfStructureError:
+        raise
+    except (ValueError, IndexError, zlib.error) as e:
+        raise PdfStructureError(str(e)) from e
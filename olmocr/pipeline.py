@@ -3,51 +3,98 @@ import asyncio
 import atexit
 import base64
 import datetime
+import glob
 import hashlib
 import json
 import logging
 import multiprocessing
 import os
-import random
-import re
 import shutil
 import sys
 import tempfile
+import threading
 import time
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from concurrent.futures.process import BrokenProcessPool
-from dataclasses import dataclass
+from contextlib import AsyncExitStack, asynccontextmanager, closing
+from dataclasses import asdict, dataclass
 from functools import cache, partial
 from io import BytesIO
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
-import boto3
 import httpx
+import orjson
 import torch
 from botocore.exceptions import ClientError
 from PIL import Image
 from pypdf import PdfReader
 from tqdm import tqdm
 
+from olmocr.async_storage import (
+    STORAGE_MAX_WORKERS,
+    AsyncStorage,
+    clear_s3_clients,
+    format_s3_request_stats,
+    get_s3_client,
+)
 from olmocr.check import (
     check_poppler_version,
     check_sglang_version,
     check_torch_gpu_available,
 )
-from olmocr.data.renderpdf import render_pdf_to_base64png
+from olmocr.concurrency import AdaptiveConcurrencyController, ByteBudget
+from olmocr.data.renderpdf import (
+    IMAGE_FORMATS,
+    PNG_DEFAULT_COMPRESS_LEVEL,
+    PNG_ENCODING,
+    RENDERERS,
+    ImageEncoding,
+    get_renderer,
+    render_pdf_to_base64png,
+    render_pdf_to_base64png_batch,
+)
 from olmocr.filter.filter import Language, PdfFilter
+from olmocr.http_pool import HttpConnectionPool
+from olmocr.journal import JOURNAL_FLUSH_PAGES, PageJournal
 from olmocr.metrics import MetricsKeeper, WorkerTracker
+from olmocr.page_cache import PageCache
+from olmocr.pdf_cache import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, PdfCache
+from olmocr.pdf_handle import evict_pdf_handle, get_pdf_num_pages
+from olmocr.pdf_page_count import PdfStructureError, read_page_count
 from olmocr.prompts import PageResponse, build_finetuning_prompt
-from olmocr.prompts.anchor import get_anchor_text
+from olmocr.prompts.anchor import _linearize_pdf_report, _pdf_report, get_anchor_text
+from olmocr.result_summary import (
+    LONG_CONTEXT_THRESHOLD,
+    ResultSummary,
+    rollup_workspace_stats,
+    write_summary,
+)
+from olmocr.result_writer import (
+    RESULT_SUFFIXES,
+    ResultWriter,
+    open_result_writer,
+    result_filename,
+)
 from olmocr.s3_utils import (
-    download_zstd_csv,
+    S3RangeFile,
     expand_s3_glob,
     get_s3_bytes,
-    get_s3_bytes_with_backoff,
+    load_listing_manifest,
     parse_s3_path,
+    save_listing_manifest,
 )
 from olmocr.version import VERSION
-from olmocr.work_queue import LocalWorkQueue, S3WorkQueue, WorkQueue
+from olmocr.work_index import WorkIndex
+from olmocr.work_queue import (
+    SCHEDULING_POLICIES,
+    CoordinatorWorkQueue,
+    LocalWorkQueue,
+    S3WorkQueue,
+    SqliteWorkQueue,
+    WorkQueue,
+    parse_page_range_work_path,
+)
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -74,20 +121,54 @@ sglang_logger.addHandler(file_handler)
 logging.getLogger("pypdf").setLevel(logging.ERROR)
 
 # Global s3 clients fo the whole script, we have two separate ones in case your workspace and your pdfs are in different accounts
-workspace_s3 = boto3.client("s3")
-pdf_s3 = boto3.client("s3")
+workspace_s3 = get_s3_client()
+pdf_s3 = get_s3_client()
+
+# Every pdf that gets processed is downloaded into the cache, so retries of a work item and later runs on the same machine don't download it again
+pdf_cache = PdfCache()
+
+# Bytes of the local copies of the pdfs being processed, see local_pdf_copy
+PDF_BYTES_IN_FLIGHT = 4 * 1024**3
+pdf_bytes_budget = ByteBudget(PDF_BYTES_IN_FLIGHT)
+
+# How page images are encoded in the requests to the server, set from --image_format and friends. The page cache doesn't
+# key images by their encoding, which is fine, as it stays the same for the whole run.
+page_image_encoding = PNG_ENCODING
+
+# Async access to each of them, on threads of their own, with per-bucket limits and retries that don't block a thread while they wait
+workspace_storage = AsyncStorage(workspace_s3)
+pdf_storage = AsyncStorage(pdf_s3)
 
 # Global variables for token statistics
 metrics = MetricsKeeper(window=60 * 5)
 tracker = WorkerTracker()
 
+# Rendered images and parsed pages of the documents currently being processed, so page retries don't redo that work
+document_page_cache = PageCache()
+
+# Documents with at least this many pages are rendered in batch pdftoppm runs of BATCH_RENDER_CHUNK_PAGES pages, instead of one run per page
+# Chunks start as their pages get page slots, so a long document still gets spread over several cores, but never renders far ahead of the server
+BATCH_RENDER_MIN_PAGES = 8
+BATCH_RENDER_CHUNK_PAGES = 16
+
 # Process pool for offloading cpu bound work, like calculating anchor texts, max 32 workers, otherwise it can spawn way too many workers on a big machine
-process_pool = ProcessPoolExecutor(max_workers=min(multiprocessing.cpu_count() // 2 + 1, 32), mp_context=multiprocessing.get_context("spawn"))
+PROCESS_POOL_WORKERS = min(multiprocessing.cpu_count() // 2 + 1, 32)
+process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
 
 # Filter object, cached so it will only get loaded when/if you need it
 get_pdf_filter = cache(lambda: PdfFilter(languages_to_keep={Language.ENGLISH, None}, apply_download_spam_check=True, apply_form_check=True))
 
 SGLANG_SERVER_PORT = 30024
+SGLANG_MAX_CONNECTIONS = 512
+
+# Keep-alive connection pools used by apost, keyed by (host, port)
+http_pools: dict[tuple[str, int], HttpConnectionPool] = {}
+
+# Sizes the number of pages in flight to the sglang server, based on the load it reports on its metrics endpoint
+concurrency_controller = AdaptiveConcurrencyController(f"http://localhost:{SGLANG_SERVER_PORT}/metrics", max_window=SGLANG_MAX_CONNECTIONS)
+
+# Once the server has had spare capacity for this many seconds, another worker is allowed to start on a work item
+WORKER_ADMISSION_DELAY = 10
 
 
 @dataclass(frozen=True)
@@ -101,32 +182,205 @@ class PageResult:
     is_fallback: bool
 
 
-async def build_page_query(local_pdf_path: str, page: int, target_longest_image_dim: int, target_anchor_text_len: int, image_rotation: int = 0) -> dict:
-    MAX_TOKENS = 3000
-    assert image_rotation in [0, 90, 180, 270], "Invalid image rotation provided in build_page_query"
+def page_result_from_dict(data: dict) -> PageResult:
+    # The inverse of dataclasses.asdict, which is how page results get saved in the journal and in partial results
+    return PageResult(**{**data, "response": PageResponse(**data["response"])})
+
+
+def rotate_base64png(image_base64: str, image_rotation: int, encoding: ImageEncoding = PNG_ENCODING) -> str:
+    image_bytes = base64.b64decode(image_base64)
+    with Image.open(BytesIO(image_bytes)) as img:
+        rotated_img = img.rotate(-image_rotation, expand=True)
+
+    # Encode the rotated image back to base64, in the same encoding that it came in
+    return encoding.encode_base64(rotated_img)
 
-    # Allow the page rendering to process in the background while we get the anchor text (which blocks the main thread)
-    image_base64 = asyncio.to_thread(render_pdf_to_base64png, local_pdf_path, page, target_longest_image_dim=target_longest_image_dim)
 
-    # GET ANCHOR TEXT IS NOT THREAD SAFE!! Ahhhh..... don't try to do it
-    # and it's also CPU bound, so it needs to run in a process pool
+async def render_page_image(
+    local_pdf_path: str, page: int, target_longest_image_dim: int, renderer: str = "poppler", encoding: ImageEncoding = PNG_ENCODING
+) -> str:
+    render = partial(render_pdf_to_base64png, target_longest_image_dim=target_longest_image_dim, renderer=renderer, encoding=encoding)
+
+    # Poppler renders in a subprocess, so threads are enough, but in-process renderers like pdfium hold a lock
+    # while they render, so those go to the process pool to still render many pages in parallel
+    if get_renderer(renderer).thread_safe:
+        return await asyncio.to_thread(render, local_pdf_path, page)
+
     loop = asyncio.get_running_loop()
-    anchor_text = loop.run_in_executor(
-        process_pool, partial(get_anchor_text, pdf_engine="pdfreport", target_length=target_anchor_text_len), local_pdf_path, page
-    )
+    return await loop.run_in_executor(process_pool, render, local_pdf_path, page)
 
-    image_base64, anchor_text = await asyncio.gather(image_base64, anchor_text)  # type: ignore
-    if image_rotation != 0:
-        image_bytes = base64.b64decode(image_base64)
-        with Image.open(BytesIO(image_bytes)) as img:
-            rotated_img = img.rotate(-image_rotation, expand=True)
 
-            # Save the rotated image to a bytes buffer
-            buffered = BytesIO()
-            rotated_img.save(buffered, format="PNG")
+def _close_deleted_documents(renderer: str) -> None:
+    get_renderer(renderer).close_deleted_documents()
 
-        # Encode the rotated image back to base64
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+async def close_deleted_documents(renderer: str = "poppler") -> None:
+    """
+    Has the renderer let go of the documents whose scratch copies are gone, in whichever processes render_page_image renders them.
+    There is no way to pick which pool worker runs a call, so this asks once per pool worker, any worker busy rendering
+    instead does the same on its next render.
+    """
+    if get_renderer(renderer).thread_safe:
+        get_renderer(renderer).close_deleted_documents()
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(process_pool, _close_deleted_documents, renderer) for _ in range(PROCESS_POOL_WORKERS)))
+    except Exception:
+        logger.warning(f"Could not close the deleted documents of the {renderer} renderer", exc_info=True)
+
+
+async def _get_cached_page_image(
+    page_cache: PageCache,
+    local_pdf_path: str,
+    page: int,
+    target_longest_image_dim: int,
+    image_rotation: int,
+    renderer: str = "poppler",
+    encoding: ImageEncoding = PNG_ENCODING,
+) -> str:
+    image_base64 = page_cache.get_image(local_pdf_path, page, target_longest_image_dim, image_rotation)
+    if image_base64 is not None:
+        return image_base64
+
+    # Rotated images are derived from the unrotated render, so a rotation retry never renders the page again
+    base_image_base64 = page_cache.get_image(local_pdf_path, page, target_longest_image_dim, 0) if image_rotation != 0 else None
+    if base_image_base64 is None:
+        # If a batch render of this document is going to produce the page, wait for that instead of starting another pdftoppm
+        pending = page_cache.get_pending_image(local_pdf_path, page, target_longest_image_dim)
+        if pending is not None:
+            base_image_base64 = await pending
+
+    if base_image_base64 is None:
+        base_image_base64 = await render_page_image(local_pdf_path, page, target_longest_image_dim, renderer, encoding)
+        page_cache.put_image(local_pdf_path, page, target_longest_image_dim, 0, base_image_base64)
+
+    if image_rotation == 0:
+        return base_image_base64
+
+    image_base64 = await asyncio.to_thread(rotate_base64png, base_image_base64, image_rotation, encoding)
+    page_cache.put_image(local_pdf_path, page, target_longest_image_dim, image_rotation, image_base64)
+    return image_base64
+
+
+class BatchRender:
+    """
+    Renders pages first_page..last_page of a document with pdftoppm processes of up to chunk_pages pages each, instead of one process per page.
+
+    Chunks are only started on demand, when process_pdf hands one of their pages a page slot, so rendering keeps pace with the pages in flight,
+    and no more than about a chunk's worth of rendered pages ever sit in the page cache ahead of them. Once started, a chunk's pages are marked
+    as pending in the page cache, and handed over to the process_page waiting on each one as soon as it is rendered. If a chunk fails, its
+    remaining pages are released, and process_page renders them one at a time like before.
+    """
+
+    def __init__(
+        self,
+        page_cache: PageCache,
+        local_pdf_path: str,
+        first_page: int,
+        last_page: int,
+        target_longest_image_dim: int,
+        encoding: ImageEncoding = PNG_ENCODING,
+        chunk_pages: int = BATCH_RENDER_CHUNK_PAGES,
+    ):
+        self.page_cache = page_cache
+        self.local_pdf_path = local_pdf_path
+        self.first_page = first_page
+        self.last_page = last_page
+        self.target_longest_image_dim = target_longest_image_dim
+        self.encoding = encoding
+        self.chunk_pages = max(1, chunk_pages)
+
+        self._chunks: Dict[int, asyncio.Task] = {}
+        self._stop = threading.Event()
+
+    def render(self, page: int) -> None:
+        """Starts rendering the chunk holding this page, unless that is already underway"""
+        if not self.first_page <= page <= self.last_page:
+            return
+
+        chunk_first_page = page - (page - self.first_page) % self.chunk_pages
+        if chunk_first_page in self._chunks:
+            return
+
+        chunk_last_page = min(chunk_first_page + self.chunk_pages - 1, self.last_page)
+        for chunk_page in range(chunk_first_page, chunk_last_page + 1):
+            self.page_cache.add_pending_image(self.local_pdf_path, chunk_page, self.target_longest_image_dim)
+        self._chunks[chunk_first_page] = asyncio.create_task(
+            asyncio.to_thread(self._render_chunk, asyncio.get_running_loop(), chunk_first_page, chunk_last_page)
+        )
+
+    async def wait(self) -> None:
+        """Waits for the chunks started so far to finish"""
+        await asyncio.gather(*self._chunks.values())
+
+    def cancel(self) -> None:
+        """Stops the chunks from delivering any more pages, the pdftoppm processes are killed as soon as they produce their next page"""
+        self._stop.set()
+
+    def _render_chunk(self, loop: asyncio.AbstractEventLoop, first_page: int, last_page: int) -> None:
+        resolve = partial(loop.call_soon_threadsafe, self.page_cache.resolve_pending_image, self.local_pdf_path)
+        try:
+            with closing(
+                render_pdf_to_base64png_batch(self.local_pdf_path, first_page, last_page, self.target_longest_image_dim, encoding=self.encoding)
+            ) as pages:
+                for page, image_base64 in pages:
+                    if self._stop.is_set():
+                        break
+                    resolve(page, self.target_longest_image_dim, image_base64)
+        except Exception as e:
+            logger.warning(f"Batch render of pages {first_page}-{last_page} of {self.local_pdf_path} failed, rendering them one at a time: {e}")
+        finally:
+            if not self._stop.is_set():
+                for page in range(first_page, last_page + 1):
+                    resolve(page, self.target_longest_image_dim, None)
+
+
+async def _get_cached_anchor_text(page_cache: PageCache, local_pdf_path: str, page: int, target_anchor_text_len: int) -> str:
+    # Parsing the page with pypdf is the expensive part of building anchor text, and it doesn't depend on the target length,
+    # so only the report is cached and each retry just linearizes it again. Both are CPU bound, and run in the process pool
+    loop = asyncio.get_running_loop()
+    report = page_cache.get_report(local_pdf_path, page)
+    if report is None:
+        report = await loop.run_in_executor(process_pool, _pdf_report, local_pdf_path, page)
+        page_cache.put_report(local_pdf_path, page, report)
+
+    return await loop.run_in_executor(process_pool, partial(_linearize_pdf_report, max_length=target_anchor_text_len), report)
+
+
+async def build_page_query(
+    local_pdf_path: str,
+    page: int,
+    target_longest_image_dim: int,
+    target_anchor_text_len: int,
+    image_rotation: int = 0,
+    page_cache: Optional[PageCache] = None,
+    renderer: str = "poppler",
+    image_encoding: ImageEncoding = PNG_ENCODING,
+) -> dict:
+    MAX_TOKENS = 3000
+    assert image_rotation in [0, 90, 180, 270], "Invalid image rotation provided in build_page_query"
+
+    if page_cache is None:
+        # Allow the page rendering to process in the background while we get the anchor text (which blocks the main thread)
+        image_base64 = render_page_image(local_pdf_path, page, target_longest_image_dim, renderer, image_encoding)
+
+        # GET ANCHOR TEXT IS NOT THREAD SAFE!! Ahhhh..... don't try to do it
+        # and it's also CPU bound, so it needs to run in a process pool
+        loop = asyncio.get_running_loop()
+        anchor_text = loop.run_in_executor(
+            process_pool, partial(get_anchor_text, pdf_engine="pdfreport", target_length=target_anchor_text_len), local_pdf_path, page
+        )
+
+        image_base64, anchor_text = await asyncio.gather(image_base64, anchor_text)  # type: ignore
+        if image_rotation != 0:
+            image_base64 = rotate_base64png(image_base64, image_rotation, image_encoding)
+    else:
+        image_base64, anchor_text = await asyncio.gather(
+            _get_cached_page_image(page_cache, local_pdf_path, page, target_longest_image_dim, image_rotation, renderer, image_encoding),
+            _get_cached_anchor_text(page_cache, local_pdf_path, page, target_anchor_text_len),
+        )
 
     return {
         "model": "Qwen/Qwen2-VL-7B-Instruct",
@@ -135,7 +389,7 @@ async def build_page_query(local_pdf_path: str, page: int, target_longest_image_
                 "role": "user",
                 "content": [
                     {"type": "text", "text": build_finetuning_prompt(anchor_text)},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}},
+                    {"type": "image_url", "image_url": {"url": f"data:{image_encoding.mime_type};base64,{image_base64}"}},
                 ],
             }
         ],
@@ -144,75 +398,44 @@ async def build_page_query(local_pdf_path: str, page: int, target_longest_image_
     }
 
 
-# Manual simple implementation of HTTP Post
+# Manual simple implementation of HTTP Post, over a small pool of keep-alive connections
 # It feels strange perhaps, but httpx and aiohttp are very complex beasts
 # Ex. the sessionpool in httpcore has 4 different locks in it, and I've noticed
 # that at the scale of 100M+ requests, that they deadlock in different strange ways
+# See olmocr/http_pool.py, which has no locks, just a single semaphore bounding the open connections
 async def apost(url, json_data):
     parsed_url = urlparse(url)
     host = parsed_url.hostname
     port = parsed_url.port or 80
     path = parsed_url.path or "/"
 
-    writer = None
-    try:
-        reader, writer = await asyncio.open_connection(host, port)
-
-        json_payload = json.dumps(json_data)
-        request = (
-            f"POST {path} HTTP/1.1\r\n"
-            f"Host: {host}\r\n"
-            f"Content-Type: application/json\r\n"
-            f"Content-Length: {len(json_payload)}\r\n"
-            f"Connection: close\r\n\r\n"
-            f"{json_payload}"
-        )
-        writer.write(request.encode())
-        await writer.drain()
-
-        # Read status line
-        status_line = await reader.readline()
-        if not status_line:
-            raise ConnectionError("No response from server")
-        status_parts = status_line.decode().strip().split(" ", 2)
-        if len(status_parts) < 2:
-            raise ValueError(f"Malformed status line: {status_line.decode().strip()}")
-        status_code = int(status_parts[1])
-
-        # Read headers
-        headers = {}
-        while True:
-            line = await reader.readline()
-            if line in (b"\r\n", b"\n", b""):
-                break
-            key, _, value = line.decode().partition(":")
-            headers[key.strip().lower()] = value.strip()
+    pool = http_pools.get((host, port))
+    if pool is None:
+        pool = http_pools[(host, port)] = HttpConnectionPool(host, port, max_connections=SGLANG_MAX_CONNECTIONS)
 
-        # Read response body
-        if "content-length" in headers:
-            body_length = int(headers["content-length"])
-            response_body = await reader.readexactly(body_length)
-        else:
-            raise ConnectionError("Anything other than fixed content length responses are not implemented yet")
+    return await pool.post_json(path, json_data)
 
-        return status_code, response_body
-    except Exception as e:
-        # Pass through errors
-        raise e
-    finally:
-        # But just make sure to close the socket on your way out
-        if writer is not None:
-            try:
-                writer.close()
-                await writer.wait_closed()
-            except:
-                pass
 
+def loads_response_json(data):
+    # orjson is much faster on large response bodies, but unlike the json module it rejects
+    # lone utf-16 surrogate escapes, which the model does emit once in a while
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
 
-async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path: str, page_num: int) -> PageResult:
+
+async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path: str, page_num: int, journal: Optional[PageJournal] = None) -> PageResult:
     COMPLETION_URL = f"http://localhost:{SGLANG_SERVER_PORT}/v1/chat/completions"
     MAX_RETRIES = args.max_page_retries
 
+    # A previous run on this work item already got this page back from the server before it died
+    journaled = journal.get(pdf_orig_path, page_num) if journal is not None else None
+    if journaled is not None:
+        await tracker.track_work(worker_id, f"{pdf_orig_path}-{page_num}", "finished")
+        document_page_cache.evict_page(pdf_local_path, page_num)
+        return page_result_from_dict(journaled)
+
     exponential_backoffs = 0
     local_anchor_text_len = args.target_anchor_text_len
     local_image_rotation = 0
@@ -220,12 +443,22 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
     await tracker.track_work(worker_id, f"{pdf_orig_path}-{page_num}", "started")
 
     while attempt < MAX_RETRIES:
-        query = await build_page_query(pdf_local_path, page_num, args.target_longest_image_dim, local_anchor_text_len, image_rotation=local_image_rotation)
+        query = await build_page_query(
+            pdf_local_path,
+            page_num,
+            args.target_longest_image_dim,
+            local_anchor_text_len,
+            image_rotation=local_image_rotation,
+            page_cache=document_page_cache,
+            renderer=args.renderer,
+            image_encoding=page_image_encoding,
+        )
 
         logger.info(f"Built page query for {pdf_orig_path}-{page_num}")
 
         try:
-            status_code, response_body = await apost(COMPLETION_URL, json_data=query)
+            async with concurrency_controller.slot():
+                status_code, response_body = await apost(COMPLETION_URL, json_data=query)
 
             if status_code == 400:
                 raise ValueError(f"Got BadRequestError from server: {response_body}, skipping this response")
@@ -234,7 +467,7 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
             elif status_code != 200:
                 raise ValueError(f"Error http status {status_code}")
 
-            base_response_data = json.loads(response_body)
+            base_response_data = loads_response_json(response_body)
 
             if base_response_data["usage"]["total_tokens"] > args.model_max_context:
                 local_anchor_text_len = max(1, local_anchor_text_len // 2)
@@ -257,7 +490,8 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
                 raise ValueError(f"invalid_page rotation for {pdf_orig_path}-{page_num}")
 
             await tracker.track_work(worker_id, f"{pdf_orig_path}-{page_num}", "finished")
-            return PageResult(
+            document_page_cache.evict_page(pdf_local_path, page_num)
+            page_result = PageResult(
                 pdf_orig_path,
                 page_num,
                 page_response,
@@ -265,6 +499,12 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
                 output_tokens=base_response_data["usage"].get("completion_tokens", 0),
                 is_fallback=False,
             )
+
+            # Fallback pages are not journaled, so a later run gets another go at them with the server
+            if journal is not None and journal.record(pdf_orig_path, page_num, asdict(page_result)):
+                await workspace_storage.run(journal.flush)
+
+            return page_result
         except (ConnectionError, OSError, asyncio.TimeoutError) as e:
             logger.warning(f"Client error on attempt {attempt} for {pdf_orig_path}-{page_num}: {type(e)} {e}")
 
@@ -291,6 +531,7 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
 
     logger.error(f"Failed to process {pdf_orig_path}-{page_num} after {MAX_RETRIES} attempts.")
     await tracker.track_work(worker_id, f"{pdf_orig_path}-{page_num}", "errored")
+    document_page_cache.evict_page(pdf_local_path, page_num)
 
     return PageResult(
         pdf_orig_path,
@@ -309,56 +550,149 @@ async def process_page(args, worker_id: int, pdf_orig_path: str, pdf_local_path:
     )
 
 
-async def process_pdf(args, worker_id: int, pdf_orig_path: str):
-    with tempfile.NamedTemporaryFile("wb+", suffix=".pdf") as tf:
+def too_many_fallback_pages(args, pdf_orig_path: str, page_results: List[PageResult]) -> bool:
+    num_pages = len(page_results)
+    num_fallback_pages = sum(page_result.is_fallback for page_result in page_results)
+
+    if num_fallback_pages / num_pages > args.max_page_error_rate:
+        logger.error(
+            f"Document {pdf_orig_path} has {num_fallback_pages} fallback pages out of {num_pages} exceeding max_page_error_rate of {args.max_page_error_rate}, discarding document."
+        )
+        return True
+    elif num_fallback_pages > 0:
+        logger.warning(f"Document {pdf_orig_path} processed with {num_fallback_pages} fallback pages out of {num_pages}, proceeding to build Dolma document.")
+    return False
+
+
+@asynccontextmanager
+async def local_pdf_copy(args, pdf_orig_path: str):
+    """
+    Yields the path of a local copy of a pdf, under a scratch directory of its own, as the page cache and pdf handles are
+    keyed by path, and several ranges of one pdf can be processed at once. Pdfs on S3 are streamed into the pdf cache,
+    and hard linked from there where the scratch directory is on the same filesystem, or otherwise straight into the scratch directory.
+
+    The size of the pdf is held from pdf_bytes_budget until the block is done with the copy, so the copies stay under
+    --max_pdf_bytes_in_flight_gb, which matters most with a scratch directory on tmpfs.
+    """
+    etag = None
+    if pdf_orig_path.startswith("s3://"):
+        bucket, key = parse_s3_path(pdf_orig_path)
+        head = await pdf_storage.call("head_object", Bucket=bucket, Key=key)
+        pdf_size, etag = head["ContentLength"], head["ETag"]
+    else:
+        pdf_size = await pdf_storage.run(os.path.getsize, pdf_orig_path)
+
+    async with pdf_bytes_budget.reserve(pdf_size):
+        scratch_root = args.pdf_scratch_dir or pdf_cache.cache_dir
+        os.makedirs(scratch_root, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=scratch_root) as scratch_dir:
+            local_pdf_path = os.path.join(scratch_dir, "document.pdf")
+            if etag is not None:
+                await pdf_storage.request(bucket, pdf_cache.link, pdf_s3, pdf_orig_path, local_pdf_path, etag)
+            else:
+                await pdf_storage.run(shutil.copyfile, pdf_orig_path, local_pdf_path)
+            yield local_pdf_path
+
+
+async def process_pdf(args, worker_id: int, work_path: str, journal: Optional[PageJournal] = None):
+    """
+    Processes the pages of one work path. Returns a Dolma document for a whole pdf, or for a page range work path a partial result
+    holding the page results of just that range, which merge_partial_results later stitches together with the other ranges.
+    Returns None if there is nothing to write.
+    """
+    pdf_orig_path, first_page, last_page = parse_page_range_work_path(work_path)
+    is_page_range = first_page is not None
+
+    async with AsyncExitStack() as stack:
+        # Runs after local_pdf_copy has deleted the scratch copy, so the renderer doesn't keep its disk space in use
+        stack.push_async_callback(close_deleted_documents, args.renderer)
         try:
-            data = await asyncio.to_thread(lambda: get_s3_bytes_with_backoff(pdf_s3, pdf_orig_path))
-            tf.write(data)
-            tf.flush()
+            local_pdf_path = await stack.enter_async_context(local_pdf_copy(args, pdf_orig_path))
         except ClientError as ex:
-            if ex.response["Error"]["Code"] == "NoSuchKey":
+            # A HEAD of a missing key answers 404, rather than NoSuchKey
+            if ex.response["Error"]["Code"] in ("NoSuchKey", "404"):
                 logger.info(f"S3 File Not found, skipping it completely {pdf_orig_path}")
                 return None
             else:
                 raise
 
         try:
-            reader = PdfReader(tf.name)
-            num_pages = reader.get_num_pages()
+            # Counting pages parses the document, so do it in the process pool, which also leaves that worker with the document already parsed
+            num_pages = await asyncio.get_running_loop().run_in_executor(process_pool, get_pdf_num_pages, local_pdf_path)
         except:
             logger.exception(f"Could not count number of pages for {pdf_orig_path}, aborting document")
             return None
 
-        logger.info(f"Got {num_pages} pages to do for {pdf_orig_path} in worker {worker_id}")
-
-        if args.apply_filter and get_pdf_filter().filter_out_pdf(tf.name):
-            logger.info(f"Filtering out pdf {pdf_orig_path}")
-            return None
+        if not is_page_range:
+            first_page, last_page = 1, num_pages
+        elif last_page is None:
+            last_page = num_pages
+        page_nums = range(first_page, min(last_page, num_pages) + 1)
+
+        logger.info(f"Got {len(page_nums)} pages to do for {work_path} in worker {worker_id}")
+
+        if args.apply_filter:
+            filtered_out = get_pdf_filter().filter_out_pdf(local_pdf_path)
+            # The filter is the one thing that parses the pdf in this process, everything else does that in the process pool,
+            # whose workers drop the handles of scratch copies that are gone by themselves, see PdfHandleCache
+            evict_pdf_handle(local_pdf_path)
+            if filtered_out:
+                logger.info(f"Filtering out pdf {pdf_orig_path}")
+                return None
 
         # List to hold the tasks for processing each page
         page_tasks = []
         page_results = []
+        batch_render = None
+
+        # Caps how many pages of this pdf are being rendered or waiting on the server at once, so one huge pdf can't flood the process pool and the server queue
+        page_slots = asyncio.Semaphore(args.max_pages_in_flight_per_pdf)
+
+        async def process_page_in_slot(page_num: int) -> PageResult:
+            async with page_slots:
+                if batch_render is not None:
+                    batch_render.render(page_num)
+                return await process_page(args, worker_id, pdf_orig_path, local_pdf_path, page_num, journal)
 
         try:
+            num_journaled_pages = sum(journal.get(pdf_orig_path, page_num) is not None for page_num in page_nums) if journal is not None else 0
+            if num_journaled_pages > 0:
+                logger.info(f"Resuming {work_path} with {num_journaled_pages} of {len(page_nums)} pages already done")
+
+            # Long documents get rendered in a few batch pdftoppm runs, rather than having poppler parse the whole document again for every page
+            # A resumed document only needs some of its pages, so those are rendered one at a time instead
+            if args.renderer == "poppler" and len(page_nums) >= BATCH_RENDER_MIN_PAGES and num_journaled_pages == 0:
+                # A chunk no bigger than the page slots keeps the pages rendered ahead of their slot within that same budget
+                batch_render = BatchRender(
+                    document_page_cache,
+                    local_pdf_path,
+                    page_nums.start,
+                    page_nums.stop - 1,
+                    args.target_longest_image_dim,
+                    page_image_encoding,
+                    chunk_pages=min(BATCH_RENDER_CHUNK_PAGES, args.max_pages_in_flight_per_pdf),
+                )
+
             async with asyncio.TaskGroup() as tg:
-                for page_num in range(1, num_pages + 1):
-                    task = tg.create_task(process_page(args, worker_id, pdf_orig_path, tf.name, page_num))
+                for page_num in page_nums:
+                    task = tg.create_task(process_page_in_slot(page_num))
                     page_tasks.append(task)
 
             # Collect the results from the entire task group, assuming no exceptions
             page_results = [task.result() for task in page_tasks]
 
-            num_fallback_pages = sum(page_result.is_fallback for page_result in page_results)
-
-            if num_fallback_pages / num_pages > args.max_page_error_rate:
-                logger.error(
-                    f"Document {pdf_orig_path} has {num_fallback_pages} fallback pages out of {num_pages} exceeding max_page_error_rate of {args.max_page_error_rate}, discarding document."
-                )
+            if is_page_range:
+                # The max_page_error_rate check happens once all the ranges of the pdf are merged
+                return {
+                    "Source-File": pdf_orig_path,
+                    "pdf-total-pages": num_pages,
+                    "first_page": first_page,
+                    "last_page": last_page,
+                    "pages": [asdict(page_result) for page_result in page_results],
+                }
+
+            if too_many_fallback_pages(args, pdf_orig_path, page_results):
                 return None
-            elif num_fallback_pages > 0:
-                logger.warning(
-                    f"Document {pdf_orig_path} processed with {num_fallback_pages} fallback pages out of {num_pages}, proceeding to build Dolma document."
-                )
 
             return build_dolma_document(pdf_orig_path, page_results)
         except Exception as e:
@@ -369,10 +703,14 @@ async def process_pdf(args, worker_id: int, pdf_orig_path: str):
                     logger.critical("Encountered BrokenProcessPool, exiting process.")
                     sys.exit(1)
 
-            logger.exception(f"Exception in process_pdf for {pdf_orig_path}: {e}")
+            logger.exception(f"Exception in process_pdf for {work_path}: {e}")
             # You can't build a dolma doc with even 1 failed page, so just get out of here
             # However, you don't want to propagate an exception higher up and cancel the entire work_group
             return None
+        finally:
+            if batch_render is not None:
+                batch_render.cancel()
+            document_page_cache.evict_document(local_pdf_path)
 
 
 def build_dolma_document(pdf_orig_path, page_results):
@@ -420,6 +758,134 @@ def build_dolma_document(pdf_orig_path, page_results):
     return dolma_doc
 
 
+def document_hash(pdf_orig_path: str) -> str:
+    # The same hash as a work item holding just this pdf, so a merged document lands where the whole pdf's result would have
+    return hashlib.sha1(pdf_orig_path.encode("utf-8")).hexdigest()
+
+
+def list_partial_results(workspace: str, doc_hash: Optional[str] = None) -> List[str]:
+    """Lists the partial results in the workspace, of one pdf or of all of them"""
+    partials_dir = os.path.join(workspace, "partials", doc_hash) if doc_hash else os.path.join(workspace, "partials")
+
+    if partials_dir.startswith("s3://"):
+        bucket, prefix = parse_s3_path(partials_dir)
+        paginator = workspace_s3.get_paginator("list_objects_v2")
+        return [
+            f"s3://{bucket}/{obj['Key']}"
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix + "/")
+            for obj in page.get("Contents", [])
+            if obj["Key"].endswith(".jsonl")
+        ]
+
+    return glob.glob(os.path.join(partials_dir, "**", "*.jsonl"), recursive=True)
+
+
+def failed_partial_result(work_path: str) -> dict:
+    """A marker for a page range that could not be processed, so that merge_partial_results drops its pdf, rather than waiting on it forever"""
+    pdf_orig_path, first_page, last_page = parse_page_range_work_path(work_path)
+    return {"Source-File": pdf_orig_path, "first_page": first_page, "last_page": last_page, "failed": True, "pages": []}
+
+
+def write_partial_result(args, partial: dict) -> None:
+    if partial.get("failed"):
+        partial_name = f"failed_{partial['first_page']:06d}.jsonl"
+    else:
+        partial_name = f"pages_{partial['first_page']:06d}-{partial['last_page']:06d}.jsonl"
+    partial_path = os.path.join(args.workspace, "partials", document_hash(partial["Source-File"]), partial_name)
+    if not partial_path.startswith("s3://"):
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+
+    writer = open_result_writer(partial_path, workspace_s3)
+    try:
+        writer.write_doc(partial)
+        writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def merge_partial_results(args, doc_hash: str) -> bool:
+    """
+    Stitches the partial results of a pdf that was split into page ranges into one Dolma document, written to results/ like any other,
+    and then deletes the partials. Does nothing until every range of the pdf has either finished or failed, and if any range
+    failed, the pdf gets dropped, just like a whole pdf with a failed page.
+
+    Returns:
+        True if the pdf was merged or dropped.
+    """
+    partial_paths = list_partial_results(args.workspace, doc_hash)
+    if not partial_paths:
+        return False
+
+    partials = [json.loads(get_s3_bytes(workspace_s3, path)) for path in partial_paths]
+    pdf_orig_path = partials[0]["Source-File"]
+    done_partials = [partial for partial in partials if not partial.get("failed")]
+    # A failed range that a straggler copy of its work item did finish after all doesn't count
+    done_first_pages = {partial["first_page"] for partial in done_partials}
+    failed_partials = [partial for partial in partials if partial.get("failed") and partial["first_page"] not in done_first_pages]
+
+    # The ranges have to follow on from each other up to the end of the pdf, where only a finished range knows how many pages that has,
+    # and a failed range at the end, which stored no last page, covers whatever is left
+    num_pages = max((partial["pdf-total-pages"] for partial in done_partials), default=None)
+    next_page, runs_to_end = 1, False
+    for first_page, last_page in sorted(((p["first_page"], p["last_page"]) for p in done_partials + failed_partials), key=lambda r: r[0]):
+        if first_page > next_page:
+            return False
+        if last_page is None:
+            runs_to_end = True
+        else:
+            next_page = max(next_page, last_page + 1)
+    if not runs_to_end and (num_pages is None or next_page <= num_pages):
+        return False
+
+    if failed_partials:
+        failed_ranges = ", ".join(f"{partial['first_page']}-{partial['last_page'] or ''}" for partial in failed_partials)
+        logger.error(f"Dropping {pdf_orig_path}, because pages {failed_ranges} of it could not be processed")
+    else:
+        pages = {page["page_num"]: page for partial in done_partials for page in partial["pages"]}
+        if any(page_num not in pages for page_num in range(1, num_pages + 1)):
+            return False
+
+        page_results = [page_result_from_dict(pages[page_num]) for page_num in range(1, num_pages + 1)]
+        logger.info(f"Merging {len(partials)} page ranges of {pdf_orig_path}")
+        dolma_doc = None if too_many_fallback_pages(args, pdf_orig_path, page_results) else build_dolma_document(pdf_orig_path, page_results)
+        if dolma_doc is not None:
+            merged_path = os.path.join(args.workspace, "results", result_filename(doc_hash, args.output_compression))
+            writer = open_result_writer(merged_path, workspace_s3, args.output_compression)
+            try:
+                writer.write_doc(dolma_doc)
+                committed = writer.commit()
+            except Exception:
+                writer.abort()
+                raise
+
+            if committed:
+                summary = ResultSummary()
+                summary.add_doc(dolma_doc)
+                write_summary(args.workspace, doc_hash, summary, workspace_s3)
+
+    if args.workspace.startswith("s3://"):
+        bucket, _ = parse_s3_path(args.workspace)
+        keys = [parse_s3_path(path)[1] for path in partial_paths]
+        # delete_objects takes at most 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            workspace_s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i : i + 1000]], "Quiet": True})
+    else:
+        shutil.rmtree(os.path.join(args.workspace, "partials", doc_hash), ignore_errors=True)
+
+    return True
+
+
+async def merge_pending_partial_results(args) -> None:
+    """Merges any split pdf whose ranges are all done, but where the worker that finished the last range died before merging it"""
+    doc_hashes = {os.path.basename(os.path.dirname(path)) for path in await workspace_storage.run(list_partial_results, args.workspace)}
+    for doc_hash in doc_hashes:
+        try:
+            await workspace_storage.run(merge_partial_results, args, doc_hash)
+        except Exception as e:
+            logger.warning(f"Could not merge the partial results of {doc_hash}: {e}")
+
+
 async def worker(args, work_queue: WorkQueue, semaphore, worker_id):
     while True:
         # Wait until allowed to proceed
@@ -435,56 +901,103 @@ async def worker(args, work_queue: WorkQueue, semaphore, worker_id):
         logger.info(f"Worker {worker_id} processing work item {work_item.hash}")
         await tracker.clear_work(worker_id)
 
+        # Keeps renewing the lease on the work item's lock for as long as this worker is on it, so nobody else takes it over
+        heartbeat = asyncio.create_task(work_queue.heartbeat(work_item))
+
+        # Dolma docs get written out as soon as each pdf is done, so the worker never holds the whole work item in memory or on local disk
+        # Nothing appears at the output path until the writer is committed, so the output file still marks the work item as done
+        output_final_path = os.path.join(args.workspace, "results", result_filename(work_item.hash, args.output_compression))
+        writer = None
+        finished_input_tokens = 0
+        finished_output_tokens = 0
+        # Written next to the result, so that --stats doesn't need to read the result itself
+        summary = ResultSummary()
+
+        # Pages are checkpointed as they come back from the server, so if this worker dies, whoever picks up the work item next only redoes the rest
+        journal = PageJournal(args.workspace, work_item.hash, workspace_s3, flush_pages=args.page_journal_pages) if args.page_journal_pages > 0 else None
+
+        # Takes this work item's writer, summary and journal as arguments, rather than closing over the loop's variables
+        async def process_and_write(pdf: str, writer: ResultWriter, summary: ResultSummary, journal: Optional[PageJournal]):
+            nonlocal finished_input_tokens, finished_output_tokens
+            result = await process_pdf(args, worker_id, pdf, journal)
+            if result is None:
+                if parse_page_range_work_path(pdf)[1] is not None:
+                    # Otherwise the other ranges of the pdf would wait on this one forever, as committing the work item means it won't come back
+                    await workspace_storage.run(write_partial_result, args, failed_partial_result(pdf))
+                return
+
+            if parse_page_range_work_path(pdf)[1] is not None:
+                # A range of a split pdf goes to partials/, and gets stitched into one document once all of its ranges are done
+                await workspace_storage.run(write_partial_result, args, result)
+                finished_input_tokens += sum(page["input_tokens"] for page in result["pages"])
+                finished_output_tokens += sum(page["output_tokens"] for page in result["pages"])
+            else:
+                await workspace_storage.run(writer.write_doc, result)
+                summary.add_doc(result)
+                finished_input_tokens += result["metadata"]["total-input-tokens"]
+                finished_output_tokens += result["metadata"]["total-output-tokens"]
+
         try:
+            if journal is not None:
+                try:
+                    num_journaled_pages = await workspace_storage.run(journal.replay)
+                    if num_journaled_pages > 0:
+                        logger.info(f"Replayed {num_journaled_pages} finished pages from the journal of {work_item.hash}")
+                except Exception as e:
+                    logger.warning(f"Could not replay the journal of {work_item.hash}, doing all pages again: {e}")
+
+            writer = open_result_writer(output_final_path, workspace_s3, args.output_compression)
+
             async with asyncio.TaskGroup() as tg:
-                dolma_tasks = [tg.create_task(process_pdf(args, worker_id, pdf)) for pdf in work_item.work_paths]
+                for pdf in work_item.work_paths:
+                    tg.create_task(process_and_write(pdf, writer, summary, journal))
                 logger.info(f"Created all tasks for {work_item.hash}")
 
             logger.info(f"Finished TaskGroup for worker on {work_item.hash}")
+            logger.info(f"Got {writer.num_docs} docs for {work_item.hash}")
 
-            dolma_docs = []
-            for task in dolma_tasks:
+            # A copy of a straggler loses to the original if that finished first, or the other way round
+            committed = await workspace_storage.run(writer.commit)
+            if committed:
                 try:
-                    result = task.result()
-                except:
-                    # some dolma doc creations may have failed
-                    pass
-
-                if result is not None:
-                    dolma_docs.append(result)
-
-            logger.info(f"Got {len(dolma_docs)} docs for {work_item.hash}")
-
-            # Write the Dolma documents to a local temporary file in JSONL format
-            with tempfile.NamedTemporaryFile(mode="w+", delete=False) as tf:
-                for doc in dolma_docs:
-                    tf.write(json.dumps(doc))
-                    tf.write("\n")
-                tf.flush()
+                    await workspace_storage.run(write_summary, args.workspace, work_item.hash, summary, workspace_s3)
+                except Exception as e:
+                    # --stats reads the result itself when it has no summary
+                    logger.warning(f"Could not write the summary of {work_item.hash}: {e}")
 
-                # Define the output S3 path using the work_hash
-                output_final_path = os.path.join(args.workspace, "results", f"output_{work_item.hash}.jsonl")
-
-                if output_final_path.startswith("s3://"):
-                    bucket, key = parse_s3_path(output_final_path)
-                    workspace_s3.upload_file(tf.name, bucket, key)
-                else:
-                    shutil.copyfile(tf.name, output_final_path)
-
-            # Update finished token counts from successful documents
-            metrics.add_metrics(
-                finished_input_tokens=sum(doc["metadata"]["total-input-tokens"] for doc in dolma_docs),
-                finished_output_tokens=sum(doc["metadata"]["total-output-tokens"] for doc in dolma_docs),
-            )
+            if journal is not None:
+                try:
+                    await workspace_storage.run(journal.delete)
+                except Exception as e:
+                    logger.warning(f"Could not delete the journal of {work_item.hash}: {e}")
+
+            # Whichever worker finishes the last range of a split pdf merges it
+            for pdf in work_item.work_paths:
+                pdf_orig_path, first_page, _ = parse_page_range_work_path(pdf)
+                if first_page is not None:
+                    try:
+                        await workspace_storage.run(merge_partial_results, args, document_hash(pdf_orig_path))
+                    except Exception as e:
+                        logger.warning(f"Could not merge the partial results of {pdf_orig_path}: {e}")
+
+            # Update finished token counts from successful documents, where they weren't already counted by the worker that committed first
+            if committed:
+                metrics.add_metrics(finished_input_tokens=finished_input_tokens, finished_output_tokens=finished_output_tokens)
 
             await work_queue.mark_done(work_item)
         except Exception as e:
             logger.exception(f"Exception occurred while processing work_hash {work_item.hash}: {e}")
+            if writer is not None:
+                await workspace_storage.run(writer.abort)
+            # Keep the pages that did finish for the next attempt at this work item
+            if journal is not None:
+                await workspace_storage.run(journal.flush)
         finally:
+            heartbeat.cancel()
             semaphore.release()
 
 
-async def sglang_server_task(args, semaphore):
+async def sglang_server_task(args):
     model_name_or_path = args.model
 
     # if "://" in model_name_or_path:
@@ -520,6 +1033,7 @@ async def sglang_server_task(args, semaphore):
         str(SGLANG_SERVER_PORT),
         "--log-level-http",
         "warning",
+        "--enable-metrics",
     ]
     cmd.extend(mem_fraction_arg)
 
@@ -536,12 +1050,10 @@ async def sglang_server_task(args, semaphore):
     atexit.register(_kill_proc)
 
     # Shared variables between tasks
-    last_running_req, last_queue_req = 0, 0
     server_printed_ready_message = False
-    last_semaphore_release = time.time()
 
     async def process_line(line):
-        nonlocal last_running_req, last_queue_req, last_semaphore_release, server_printed_ready_message
+        nonlocal server_printed_ready_message
         sglang_logger.info(line)
 
         # if the server hasn't initialized yet, log all the lines to the main logger also, so that the user
@@ -560,16 +1072,6 @@ async def sglang_server_task(args, semaphore):
 
         if not server_printed_ready_message and "The server is fired up and ready to roll!" in line:
             server_printed_ready_message = True
-            last_semaphore_release = time.time()
-
-        match = re.search(r"#running-req: (\d+)", line)
-        if match:
-            last_running_req = int(match.group(1))
-
-        match = re.search(r"#queue-req: (\d+)", line)
-        if match:
-            last_queue_req = int(match.group(1))
-            logger.info(f"sglang running req: {last_running_req} queue req: {last_queue_req}")
 
     async def read_stream(stream):
         while True:
@@ -582,22 +1084,9 @@ async def sglang_server_task(args, semaphore):
             except Exception as ex:
                 logger.warning(f"Got {ex} when reading log line from inference server, skipping")
 
-    async def timeout_task():
-        nonlocal last_running_req, last_queue_req, last_semaphore_release
-        try:
-            while True:
-                await asyncio.sleep(1)
-                if server_printed_ready_message and last_queue_req == 0 and time.time() - last_semaphore_release > 30 and semaphore.locked():
-                    semaphore.release()
-                    last_semaphore_release = time.time()
-                    logger.info("Semaphore released, allowing a worker to proceed.")
-        except asyncio.CancelledError:
-            pass  # Clean up if the task is cancelled
-
-    # Start tasks to read stdout, stderr, and handle timeout logic
+    # Start tasks to read stdout and stderr
     stdout_task = asyncio.create_task(read_stream(proc.stdout))
     stderr_task = asyncio.create_task(read_stream(proc.stderr))
-    timeout_task = asyncio.create_task(timeout_task())
 
     try:
         await proc.wait()
@@ -606,16 +1095,15 @@ async def sglang_server_task(args, semaphore):
         proc.terminate()
         raise
 
-    timeout_task.cancel()
-    await asyncio.gather(stdout_task, stderr_task, timeout_task, return_exceptions=True)
+    await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
 
 
-async def sglang_server_host(args, semaphore):
+async def sglang_server_host(args):
     MAX_RETRIES = 5
     retry = 0
 
     while retry < MAX_RETRIES:
-        await sglang_server_task(args, semaphore)
+        await sglang_server_task(args)
         logger.warning("SGLang server task ended")
         retry += 1
 
@@ -626,6 +1114,23 @@ async def sglang_server_host(args, semaphore):
         sys.exit(1)
 
 
+async def worker_admission_task(semaphore):
+    # Workers need to acquire the semaphore before taking a work item. It starts out with one permit, and another worker
+    # is only let in once the server has had spare capacity for a while, ie. every page had a slot in the concurrency
+    # controller's window and the server's queue was short. This keeps the GPU saturated, while outputting dolma docs as soon as possible.
+    last_semaphore_release = time.time()
+    while True:
+        await asyncio.sleep(1)
+        if (
+            concurrency_controller.spare_capacity_duration() > WORKER_ADMISSION_DELAY
+            and time.time() - last_semaphore_release > WORKER_ADMISSION_DELAY
+            and semaphore.locked()
+        ):
+            semaphore.release()
+            last_semaphore_release = time.time()
+            logger.info("Semaphore released, allowing a worker to proceed.")
+
+
 async def sglang_server_ready():
     max_attempts = 300
     delay_sec = 1
@@ -653,6 +1158,9 @@ async def metrics_reporter(work_queue):
     while True:
         # Leading newlines preserve table formatting in logs
         logger.info(f"Queue remaining: {work_queue.size}")
+        logger.info(str(concurrency_controller))
+        logger.info(str(pdf_cache.stats))
+        logger.info(format_s3_request_stats())
         logger.info("\n" + str(metrics))
         logger.info("\n" + str(await tracker.get_status_table()))
         await asyncio.sleep(10)
@@ -766,102 +1274,15 @@ def submit_beaker_job(args):
 
 
 def print_stats(args):
-    LONG_CONTEXT_THRESHOLD = 32768
-
     assert args.workspace.startswith("s3://"), "Printing stats functionality only works with s3 workspaces for now."
 
-    # Get total work items and completed items
-    index_file_s3_path = os.path.join(args.workspace, "work_index_list.csv.zstd")
-    output_glob = os.path.join(args.workspace, "results", "*.jsonl")
-
-    done_work_items = expand_s3_glob(workspace_s3, output_glob)
-    work_queue = {parts[0]: parts[1:] for line in download_zstd_csv(workspace_s3, index_file_s3_path) if (parts := line.strip().split(",")) and line.strip()}
-
+    work_queue = WorkIndex(args.workspace, workspace_s3).load_items()
     total_items = len(work_queue)
-    completed_items = len(done_work_items)
 
-    def process_output_file(s3_path):
-        try:
-            data = get_s3_bytes(workspace_s3, s3_path)
-            doc_count = 0
-            total_input_tokens = 0
-            total_output_tokens = 0
-            total_pages = 0
-            total_fallback_pages = 0
-            processed_paths = set()
-
-            # Counters for long context docs within a single file
-            long_context_docs = 0
-            long_context_tokens = 0
-
-            for line in data.decode("utf-8").splitlines():
-                if line.strip():
-                    doc = json.loads(line)
-                    doc_count += 1
-                    doc_input_tokens = doc["metadata"].get("total-input-tokens", 0)
-                    doc_output_tokens = doc["metadata"].get("total-output-tokens", 0)
-                    doc_pages = doc["metadata"].get("pdf-total-pages", 0)
-                    doc_fallback_pages = doc["metadata"].get("total-fallback-pages", 0)
-
-                    total_input_tokens += doc_input_tokens
-                    total_output_tokens += doc_output_tokens
-                    total_pages += doc_pages
-                    total_fallback_pages += doc_fallback_pages
-                    processed_paths.add(doc["metadata"]["Source-File"])
-
-                    # Check if this doc exceeds the long context threshold
-                    if doc_output_tokens > LONG_CONTEXT_THRESHOLD:
-                        long_context_docs += 1
-                        long_context_tokens += doc_output_tokens
-
-            return (
-                doc_count,
-                total_input_tokens,
-                total_output_tokens,
-                total_pages,
-                total_fallback_pages,
-                processed_paths,
-                long_context_docs,
-                long_context_tokens,
-            )
-        except Exception as e:
-            logger.warning(f"Error processing {s3_path}: {e}")
-            return 0, 0, 0, 0, 0, set(), 0, 0
-
-    print("\nProcessing output files...")
-    docs_total = 0
-    input_tokens_total = 0
-    output_tokens_total = 0
-    pages_total = 0
-    fallback_pages_total = 0
-    all_processed_paths = set()
-    original_paths = set()
-
-    # Counters for long context documents across all files
-    long_context_docs_count = 0
-    long_context_tokens_total = 0
-
-    # First collect all original PDF paths
-    for done_work_item in done_work_items:
-        if match := re.search(r"output_(\w+).jsonl", done_work_item):
-            done_work_hash = match.group(1)
-            original_paths.update(work_queue[done_work_hash])
-
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(process_output_file, item): item for item in done_work_items}
-
-        for future in tqdm(as_completed(futures), total=len(futures)):
-            (doc_count, input_tokens, output_tokens, pages, fallback_pages, processed_paths, long_context_docs, long_context_tokens) = future.result()
-            docs_total += doc_count
-            input_tokens_total += input_tokens
-            output_tokens_total += output_tokens
-            pages_total += pages
-            fallback_pages_total += fallback_pages
-            all_processed_paths.update(processed_paths)
-            long_context_docs_count += long_context_docs
-            long_context_tokens_total += long_context_tokens
-
-    skipped_paths = original_paths - all_processed_paths
+    print("\nProcessing result summaries...")
+    stats = rollup_workspace_stats(workspace_s3, args.workspace, work_queue)
+    # Merged documents of split pdfs are in results/ too, but aren't work items of their own
+    completed_items = stats["completed_items"]
 
     print("\nWork Items Status:")
     print(f"Total work items: {total_items:,}")
@@ -869,21 +1290,89 @@ def print_stats(args):
     print(f"Remaining items: {total_items - completed_items:,}")
 
     print("\nResults:")
-    print(f"Total documents processed: {docs_total:,}")
-    print(f"Total documents skipped: {len(skipped_paths):,}")
-    print(f"Total pages on fallback: {fallback_pages_total:,}")
-    print(f"Total pages processed: {pages_total:,}")
+    print(f"Total documents processed: {stats['num_docs']:,}")
+    print(f"Total documents skipped: {stats['skipped_paths']:,}")
+    print(f"Total pages on fallback: {stats['fallback_pages']:,}")
+    print(f"Total pages processed: {stats['pages']:,}")
 
-    print(f"\nTotal output tokens: {output_tokens_total:,}")
-    print(f"Projected output tokens: {round((output_tokens_total/max(1, completed_items))*total_items):,}")
+    print(f"\nTotal output tokens: {stats['output_tokens']:,}")
+    print(f"Projected output tokens: {round((stats['output_tokens']/max(1, completed_items))*total_items):,}")
 
-    print(f"\nAverage pages per doc: {pages_total/max(1,docs_total):,.1f}")
-    print(f"Average output tokens per doc: {output_tokens_total/max(1,docs_total):,.1f}")
-    print(f"Average output tokens per page: {output_tokens_total/max(1,pages_total):,.1f}")
+    print(f"\nAverage pages per doc: {stats['pages']/max(1,stats['num_docs']):,.1f}")
+    print(f"Average output tokens per doc: {stats['output_tokens']/max(1,stats['num_docs']):,.1f}")
+    print(f"Average output tokens per page: {stats['output_tokens']/max(1,stats['pages']):,.1f}")
 
     # Print long context documents stats
-    print(f"\nLong Context Documents (>{LONG_CONTEXT_THRESHOLD} tokens): {long_context_docs_count:,}")
-    print(f"Total tokens in long context documents: {long_context_tokens_total:,}")
+    print(f"\nLong Context Documents (>{LONG_CONTEXT_THRESHOLD} tokens): {stats['long_context_docs']:,}")
+    print(f"Total tokens in long context documents: {stats['long_context_tokens']:,}")
+
+
+def count_pdf_pages(pdf_paths: List[str]) -> Dict[str, int]:
+    """
+    Counts the pages of each pdf, leaving out any that can't be read. Pdfs on S3 are counted from a few range reads of
+    their trailer, xref and page tree where possible, and only downloaded in full where that doesn't work out.
+    """
+
+    def count(pdf: str) -> int:
+        if not pdf.startswith("s3://"):
+            try:
+                return get_pdf_num_pages(pdf)
+            finally:
+                evict_pdf_handle(pdf)
+
+        try:
+            return read_page_count(pdf_s3, pdf)
+        except PdfStructureError as e:
+            logger.debug(f"Opening {pdf} with pypdf to count its pages: {e}")
+
+        # pypdf copes with more kinds of pdfs, and through a range file, it still only fetches the parts it reads
+        try:
+            with S3RangeFile(pdf_s3, pdf) as range_file:
+                num_pages = len(PdfReader(range_file).pages)
+            logger.debug(f"Counted the pages of {pdf} from {range_file.bytes_fetched:,} of its {range_file.size:,} bytes")
+            return num_pages
+        except Exception as e:
+            logger.debug(f"Downloading {pdf} to count its pages: {e}")
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp_file:
+            tmp_file.write(get_s3_bytes(pdf_s3, pdf))
+            tmp_file.flush()
+            try:
+                return get_pdf_num_pages(tmp_file.name)
+            finally:
+                evict_pdf_handle(tmp_file.name)
+
+    page_counts = {}
+    # Counting is mostly waiting on S3, so it can go wide
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        futures = {executor.submit(count, pdf): pdf for pdf in pdf_paths}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Counting pdf pages"):
+            try:
+                page_counts[futures[future]] = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to read {futures[future]}: {e}")
+
+    return page_counts
+
+
+def expand_pdf_glob(args, pdf_glob: str) -> Dict[str, str]:
+    """
+    Lists the pdfs matching an s3 glob, as {path: etag}. Every listing is saved to listings/ in the workspace, and with
+    --reuse_pdf_listing, a saved listing of the same glob is loaded instead of listing the bucket again.
+    """
+    manifest_path = os.path.join(args.workspace, "listings", f"{hashlib.sha1(pdf_glob.encode('utf-8')).hexdigest()}.tsv.zst")
+    if args.reuse_pdf_listing:
+        listing = load_listing_manifest(workspace_s3, manifest_path, pdf_glob)
+        if listing is not None:
+            return listing
+
+    logger.info(f"Expanding s3 glob at {pdf_glob}")
+    listing = expand_s3_glob(pdf_s3, pdf_glob)
+    try:
+        save_listing_manifest(workspace_s3, manifest_path, pdf_glob, listing)
+    except Exception as e:
+        logger.warning(f"Failed to save the listing of {pdf_glob} to {manifest_path}: {e}")
+    return listing
 
 
 async def main():
@@ -898,12 +1387,67 @@ async def main():
         help="Path to add pdfs stored in s3 to the workspace, can be a glob path s3://bucket/prefix/*.pdf or path to file containing list of pdf paths",
         default=None,
     )
+    parser.add_argument(
+        "--reuse_pdf_listing",
+        action="store_true",
+        help="Load the listing of each s3 glob in --pdfs from listings/ in the workspace, where it was saved by an earlier run, instead of listing the bucket again",
+    )
     parser.add_argument("--workspace_profile", help="S3 configuration profile for accessing the workspace", default=None)
     parser.add_argument("--pdf_profile", help="S3 configuration profile for accessing the raw pdf documents", default=None)
     parser.add_argument("--pages_per_group", type=int, default=500, help="Aiming for this many pdf pages per work item group")
     parser.add_argument("--max_page_retries", type=int, default=8, help="Max number of times we will retry rendering a page")
     parser.add_argument("--max_page_error_rate", type=float, default=0.004, help="Rate of allowable failed pages in a document, 1/250 by default")
     parser.add_argument("--workers", type=int, default=8, help="Number of workers to run at a time")
+    parser.add_argument(
+        "--local_queue",
+        choices=["sqlite", "files"],
+        default="sqlite",
+        help="Work queue for local workspaces: sqlite lets several pipeline processes share one workspace, files uses lock files, for workspaces on network filesystems",
+    )
+    parser.add_argument(
+        "--coordinator",
+        default=None,
+        help="host:port of an olmocr.coordinator to get work items from, instead of coordinating with the other workers through lock files in the workspace",
+    )
+    parser.add_argument(
+        "--scheduling",
+        choices=SCHEDULING_POLICIES,
+        default="random",
+        help="Order to process work items in: random, or longest_first, which starts with the work items with the most pages so the job doesn't end on them. With --coordinator, the coordinator's --scheduling applies",
+    )
+    parser.add_argument(
+        "--straggler_factor",
+        type=float,
+        default=0.0,
+        help="Once the queue is empty, idle workers take a copy of work items that another worker has been on for this many times the median, and the first copy to finish wins. 0 disables",
+    )
+    parser.add_argument(
+        "--max_pages_per_unit",
+        type=int,
+        default=0,
+        help="Split pdfs with more pages than this into page range work items, merged back into one document at the end, 0 never splits. Counts the pages of every pdf when adding them",
+    )
+    parser.add_argument("--max_pages_in_flight_per_pdf", type=int, default=128, help="Most pages of one pdf being rendered or sent to the server at once")
+    parser.add_argument(
+        "--pdf_cache_dir", default=PDF_CACHE_DIR, help="Directory to cache downloaded pdfs in, shared with other olmocr tools and pipelines on this machine"
+    )
+    parser.add_argument(
+        "--pdf_cache_max_gb",
+        type=float,
+        default=PDF_CACHE_MAX_BYTES / 1024**3,
+        help="Size that the pdf cache is kept under, least recently used pdfs are evicted past it",
+    )
+    parser.add_argument(
+        "--pdf_scratch_dir",
+        default=None,
+        help="Directory for the local copies of the pdfs being processed, such as a tmpfs like /dev/shm, by default within --pdf_cache_dir, where the copies are hard links into the cache",
+    )
+    parser.add_argument(
+        "--max_pdf_bytes_in_flight_gb",
+        type=float,
+        default=PDF_BYTES_IN_FLIGHT / 1024**3,
+        help="Most GB of pdfs with a local copy at once, further pdfs wait for some to finish",
+    )
     parser.add_argument("--apply_filter", action="store_true", help="Apply basic filtering to English pdfs which are not forms, and not likely seo spam")
     parser.add_argument("--stats", action="store_true", help="Instead of running any job, reports some statistics about the current workspace")
 
@@ -917,6 +1461,36 @@ async def main():
     parser.add_argument("--model_chat_template", type=str, default="qwen2-vl", help="Chat template to pass to sglang server")
     parser.add_argument("--target_longest_image_dim", type=int, help="Dimension on longest side to use for rendering the pdf pages", default=1024)
     parser.add_argument("--target_anchor_text_len", type=int, help="Maximum amount of anchor text to use (characters)", default=6000)
+    parser.add_argument(
+        "--output_compression",
+        type=str,
+        choices=list(RESULT_SUFFIXES),
+        default="none",
+        help="Compression for the dolma docs in results/, zstd writes output_[hash].jsonl.zst instead of output_[hash].jsonl",
+    )
+    parser.add_argument(
+        "--page_journal_pages",
+        type=int,
+        default=JOURNAL_FLUSH_PAGES,
+        help="Checkpoint finished pages to journals/ in the workspace every this many pages, so a restarted work item skips them, 0 disables",
+    )
+    parser.add_argument(
+        "--renderer",
+        type=str,
+        choices=list(RENDERERS),
+        default="poppler",
+        help="Backend used to render pdf pages, poppler runs pdftoppm subprocesses, pdfium renders in-process",
+    )
+    parser.add_argument(
+        "--image_format",
+        type=str,
+        choices=list(IMAGE_FORMATS),
+        default="png",
+        help="Encoding of the page images sent to the server, jpeg and webp make much smaller requests for scanned pages",
+    )
+    parser.add_argument("--image_quality", type=int, default=90, help="Quality of jpeg and webp page images, 1-100")
+    parser.add_argument("--png_compress_level", type=int, default=PNG_DEFAULT_COMPRESS_LEVEL, help="zlib level of png page images, 0-9")
+    parser.add_argument("--image_grayscale", action="store_true", help="Send page images in grayscale, which loses nothing on monochrome scans")
 
     # Beaker/job running stuff
     parser.add_argument("--beaker", action="store_true", help="Submit this job to beaker instead of running locally")
@@ -930,7 +1504,7 @@ async def main():
     parser.add_argument("--beaker_priority", type=str, default="normal", help="Beaker priority level for the job")
     args = parser.parse_args()
 
-    global workspace_s3, pdf_s3
+    global workspace_s3, pdf_s3, workspace_storage, pdf_storage, pdf_cache, pdf_bytes_budget, page_image_encoding
 
     # setup the job to work in beaker environment, load secrets, adjust logging, etc.
     if "BEAKER_JOB_NAME" in os.environ:
@@ -944,25 +1518,31 @@ async def main():
         with open(cred_path, "w") as f:
             f.write(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_FILE"))
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = cred_path
-        workspace_s3 = boto3.client("s3")
-        pdf_s3 = boto3.client("s3")
+        # The clients made on import had none of these credentials
+        clear_s3_clients()
 
-    if args.workspace_profile:
-        workspace_session = boto3.Session(profile_name=args.workspace_profile)
-        workspace_s3 = workspace_session.client("s3")
+    # Where the profiles match, both storages share one client, so its pool has room for the threads of both
+    workspace_s3 = get_s3_client(args.workspace_profile, max_pool_connections=2 * STORAGE_MAX_WORKERS)
+    pdf_s3 = get_s3_client(args.pdf_profile, max_pool_connections=2 * STORAGE_MAX_WORKERS)
 
-    if args.pdf_profile:
-        pdf_session = boto3.Session(profile_name=args.pdf_profile)
-        pdf_s3 = pdf_session.client("s3")
+    workspace_storage = AsyncStorage(workspace_s3)
+    pdf_storage = AsyncStorage(pdf_s3)
+    pdf_cache = PdfCache(args.pdf_cache_dir, int(args.pdf_cache_max_gb * 1024**3))
+    pdf_bytes_budget = ByteBudget(int(args.max_pdf_bytes_in_flight_gb * 1024**3))
+    page_image_encoding = ImageEncoding(args.image_format, args.image_quality, args.png_compress_level, args.image_grayscale)
 
     # We need poppler to load the initial pdfs, even if we are not processing them here
     check_poppler_version()
 
     # Create work queue
-    if args.workspace.startswith("s3://"):
-        work_queue = S3WorkQueue(workspace_s3, args.workspace)
+    if args.coordinator:
+        work_queue = CoordinatorWorkQueue(args.coordinator, args.workspace, workspace_s3, straggler_factor=args.straggler_factor)
+    elif args.workspace.startswith("s3://"):
+        work_queue = S3WorkQueue(workspace_s3, args.workspace, scheduling=args.scheduling, straggler_factor=args.straggler_factor, storage=workspace_storage)
+    elif args.local_queue == "sqlite":
+        work_queue = SqliteWorkQueue(args.workspace, scheduling=args.scheduling, straggler_factor=args.straggler_factor)
     else:
-        work_queue = LocalWorkQueue(args.workspace)
+        work_queue = LocalWorkQueue(args.workspace, scheduling=args.scheduling, straggler_factor=args.straggler_factor)
 
     if args.pdfs:
         logger.info("Got --pdfs argument, going to add to the work queue")
@@ -971,8 +1551,7 @@ async def main():
         for pdf_path in args.pdfs:
             # Expand s3 paths
             if pdf_path.startswith("s3://"):
-                logger.info(f"Expanding s3 glob at {pdf_path}")
-                pdf_work_paths |= set(expand_s3_glob(pdf_s3, pdf_path))
+                pdf_work_paths |= set(expand_pdf_glob(args, pdf_path))
             elif os.path.exists(pdf_path):
                 if open(pdf_path, "rb").read(4) == b"%PDF":
                     logger.info(f"Loading file at {pdf_path} as PDF document")
@@ -986,33 +1565,16 @@ async def main():
 
         logger.info(f"Found {len(pdf_work_paths):,} total pdf paths to add")
 
-        # Estimate average pages per pdf
-        sample_size = min(100, len(pdf_work_paths))
-        sampled_pdfs = random.sample(list(pdf_work_paths), sample_size)
-        page_counts = []
-
-        for pdf in tqdm(sampled_pdfs, desc="Sampling PDFs to calculate optimal length"):
-            try:
-                # Download the PDF to a temp file
-                with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp_file:
-                    tmp_file.write(get_s3_bytes(pdf_s3, pdf))
-                    tmp_file.flush()
-                    reader = PdfReader(tmp_file.name)
-                    page_counts.append(len(reader.pages))
-            except Exception as e:
-                logger.warning(f"Failed to read {pdf}: {e}")
-
-        if page_counts:
-            avg_pages_per_pdf = sum(page_counts) / len(page_counts)
-        else:
-            logger.warning("Could not read any PDFs to estimate average page count.")
-            avg_pages_per_pdf = 10  # Default to 10 pages per PDF if sampling fails
-
-        items_per_group = max(1, int(args.pages_per_group / avg_pages_per_pdf))
-        logger.info(f"Calculated items_per_group: {items_per_group} based on average pages per PDF: {avg_pages_per_pdf:.2f}")
-
-        # Now call populate_queue
-        await work_queue.populate_queue(pdf_work_paths, items_per_group)
+        # The new pdfs get their pages counted, and are packed into work items of about pages_per_group pages. Any pdfs
+        # that can't be counted are grouped as if they had the average page count, or 10 pages if none could be counted.
+        items_per_group = max(1, args.pages_per_group // 10)
+        await work_queue.populate_queue(
+            pdf_work_paths,
+            items_per_group,
+            max_pages_per_unit=args.max_pages_per_unit,
+            pages_per_group=args.pages_per_group,
+            count_pages=count_pdf_pages,
+        )
 
     if args.stats:
         print_stats(args)
@@ -1032,15 +1594,17 @@ async def main():
     await work_queue.initialize_queue()
 
     # Create a semaphore to control worker access
-    # We only allow one worker to move forward with requests, until the server has no more requests in its queue
+    # We only allow one worker to move forward with requests, until the server has spare capacity
     # This lets us get full utilization by having many workers, but also to be outputting dolma docs as soon as possible
     # As soon as one worker is no longer saturating the gpu, the next one can start sending requests
     semaphore = asyncio.Semaphore(1)
 
-    sglang_server = asyncio.create_task(sglang_server_host(args, semaphore))
+    sglang_server = asyncio.create_task(sglang_server_host(args))
 
     await sglang_server_ready()
 
+    controller_task = asyncio.create_task(concurrency_controller.run())
+    admission_task = asyncio.create_task(worker_admission_task(semaphore))
     metrics_task = asyncio.create_task(metrics_reporter(work_queue))
 
     # Create worker tasks to process the queue concurrently.
@@ -1052,10 +1616,14 @@ async def main():
     # Wait for all worker tasks to finish
     await asyncio.gather(*worker_tasks)
 
+    await merge_pending_partial_results(args)
+
     # Wait for server to stop
     process_pool.shutdown(wait=False)
 
     sglang_server.cancel()
+    controller_task.cancel()
+    admission_task.cancel()
     metrics_task.cancel()
     logger.info("Work done")
 
@@ -9,10 +9,10 @@ from typing import List, Literal
 
 import ftfy
 import pypdfium2 as pdfium
-from pypdf import PdfReader
 from pypdf.generic import RectangleObject
 
 from olmocr.filter.coherency import get_document_coherency
+from olmocr.pdf_handle import get_pdf_handle
 
 
 def get_anchor_text(
@@ -59,10 +59,9 @@ def _get_pdftotext(local_pdf_path: str, page: int) -> str:
 
 
 def _get_pypdf_raw(local_pdf_path: str, page: int) -> str:
-    reader = PdfReader(local_pdf_path)
-    pypage = reader.pages[page - 1]
-
-    return pypage.extract_text()
+    handle = get_pdf_handle(local_pdf_path)
+    with handle.lock:
+        return handle.page(page).extract_text()
 
 
 def _get_pdfium(local_pdf_path: str, page: int) -> str:
@@ -126,10 +125,12 @@ class PageReport:
 
 
 def _pdf_report(local_pdf_path: str, page_num: int) -> PageReport:
-    reader = PdfReader(local_pdf_path)
-    page = reader.pages[page_num - 1]
-    resources = page.get("/Resources", {})
-    xobjects = resources.get("/XObject", {})
+    # The handle is shared with every other page of this document that lands in the same process,
+    # so the document is only parsed once per process instead of once per page
+    handle = get_pdf_handle(local_pdf_path)
+    page = handle.page(page_num)
+    xobjects = handle.xobjects(page_num)
+    geometry = handle.geometry(page_num)
     text_elements, image_elements = [], []
 
     def visitor_body(text, cm, tm, font_dict, font_size):
@@ -149,10 +150,11 @@ def _pdf_report(local_pdf_path: str, page_num: int) -> PageReport:
                 x1, y1 = _transform_point(1, 1, cm)
                 image_elements.append(ImageElement(xobject_name, BoundingBox(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))))
 
-    page.extract_text(visitor_text=visitor_body, visitor_operand_before=visitor_op)
+    with handle.lock:
+        page.extract_text(visitor_text=visitor_body, visitor_operand_before=visitor_op)
 
     return PageReport(
-        mediabox=BoundingBox.from_rectangle(page.mediabox),
+        mediabox=BoundingBox(geometry.x0, geometry.y0, geometry.x1, geometry.y1),
         text_elements=text_elements,
         image_elements=image_elements,
     )
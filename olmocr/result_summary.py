@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional
+
+import zstandard as zstd
+from botocore.exceptions import ClientError
+
+from olmocr.result_writer import decode_result_bytes, work_hash_from_result_filename
+from olmocr.s3_utils import expand_s3_glob, get_s3_bytes, parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# Every result file results/output_{hash}.jsonl[.zst] gets a small summary at summaries/output_{hash}.json, written after the
+# result is committed, so that workspace statistics never need to read the results themselves
+SUMMARIES_DIR = "summaries"
+SUMMARY_SUFFIX = ".json"
+
+# The totals of every summary seen so far, with the ETag each was read at, so --stats only reads summaries that are new or changed
+ROLLUP_NAME = "summaries_rollup.json.zst"
+
+# Documents with more output tokens than this are counted as long context documents
+LONG_CONTEXT_THRESHOLD = 32768
+
+
+@dataclass
+class ResultSummary:
+    """Counts over the Dolma documents of one result file"""
+
+    num_docs: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    pages: int = 0
+    fallback_pages: int = 0
+    long_context_docs: int = 0
+    long_context_tokens: int = 0
+    source_paths: List[str] = field(default_factory=list)
+
+    def add_doc(self, doc: dict) -> None:
+        metadata = doc["metadata"]
+        self.num_docs += 1
+        self.input_tokens += metadata.get("total-input-tokens", 0)
+        self.output_tokens += metadata.get("total-output-tokens", 0)
+        self.pages += metadata.get("pdf-total-pages", 0)
+        self.fallback_pages += metadata.get("total-fallback-pages", 0)
+        self.source_paths.append(metadata["Source-File"])
+
+        if metadata.get("total-output-tokens", 0) > LONG_CONTEXT_THRESHOLD:
+            self.long_context_docs += 1
+            self.long_context_tokens += metadata["total-output-tokens"]
+
+    @classmethod
+    def from_result(cls, path: str, data: bytes) -> "ResultSummary":
+        """Summarizes a result file the slow way, by parsing every document in it"""
+        summary = cls()
+        for line in decode_result_bytes(path, data).splitlines():
+            if line.strip():
+                summary.add_doc(json.loads(line))
+        return summary
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(asdict(self)).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ResultSummary":
+        return cls(**json.loads(data))
+
+
+# The totals that the rollup keeps per summary and adds up over the workspace
+STAT_FIELDS = [f.name for f in fields(ResultSummary) if f.name != "source_paths"] + ["skipped_paths"]
+
+
+def summary_path(workspace: str, work_hash: str) -> str:
+    return os.path.join(workspace, SUMMARIES_DIR, f"output_{work_hash}{SUMMARY_SUFFIX}")
+
+
+def write_summary(workspace: str, work_hash: str, summary: ResultSummary, s3_client=None) -> None:
+    """Writes the summary of the result of work_hash. Does blocking IO, so call it via asyncio.to_thread."""
+    path = summary_path(workspace, work_hash)
+    if path.startswith("s3://"):
+        bucket, key = parse_s3_path(path)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=summary.to_bytes())
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(summary.to_bytes())
+    os.replace(tmp_path, path)
+
+
+def _load_rollup(s3_client, rollup_path: str) -> Dict[str, dict]:
+    try:
+        data = get_s3_bytes(s3_client, rollup_path)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {}
+        raise
+
+    try:
+        return json.loads(zstd.ZstdDecompressor().decompress(data))["entries"]
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable stats rollup {rollup_path}: {e}")
+        return {}
+
+
+def rollup_workspace_stats(s3_client, workspace: str, index_items: Dict[str, List[str]], max_workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Adds up the summaries of every result in an S3 workspace, reading only the summaries that changed since the last
+    rollup, by ETag. Results without a summary, such as those of workspaces from before summaries existed, are read in
+    full once, and get a summary written for next time.
+
+    Args:
+        s3_client: Boto3 S3 client for the workspace
+        workspace: s3:// path of the workspace
+        index_items: {hash: paths} of the work index, to count the paths of each work item that produced no document
+        max_workers: Threads for reading summaries and results
+
+    Returns:
+        The totals of STAT_FIELDS, and the number of completed work items and of results as completed_items and num_results
+    """
+    result_paths = {
+        work_hash: path
+        for path in expand_s3_glob(s3_client, os.path.join(workspace, "results", "output_*"))
+        if (work_hash := work_hash_from_result_filename(path))
+    }
+    summary_etags = {
+        os.path.basename(path)[len("output_") : -len(SUMMARY_SUFFIX)]: etag
+        for path, etag in expand_s3_glob(s3_client, os.path.join(workspace, SUMMARIES_DIR, f"output_*{SUMMARY_SUFFIX}")).items()
+    }
+
+    rollup_path = os.path.join(workspace, ROLLUP_NAME)
+    rollup = _load_rollup(s3_client, rollup_path)
+
+    def entry(summary: ResultSummary, work_hash: str, etag: str) -> dict:
+        # Only paths of work items count as skipped, merged documents of split pdfs aren't work items of their own
+        skipped_paths = len(set(index_items.get(work_hash, [])) - set(summary.source_paths))
+        return {"etag": etag, "stats": [getattr(summary, name) for name in STAT_FIELDS[:-1]] + [skipped_paths]}
+
+    def read_summary(work_hash: str) -> dict:
+        etag = summary_etags.get(work_hash)
+        try:
+            if etag is not None:
+                return entry(ResultSummary.from_bytes(get_s3_bytes(s3_client, summary_path(workspace, work_hash))), work_hash, etag)
+
+            # The first rollup of an older workspace reads its results once, after that their summaries are used
+            summary = ResultSummary.from_result(result_paths[work_hash], get_s3_bytes(s3_client, result_paths[work_hash]))
+            write_summary(workspace, work_hash, summary, s3_client)
+            # Anything but a real ETag, so the written summary gets read once on the next rollup, and matched by ETag after that
+            return entry(summary, work_hash, "")
+        except Exception as e:
+            logger.warning(f"Error summarizing {result_paths[work_hash]}: {e}")
+            # No ETag matches None, so this one is tried again on the next rollup
+            return {"etag": None, "stats": [0] * len(STAT_FIELDS)}
+
+    stale_hashes = [work_hash for work_hash in result_paths if work_hash not in rollup or rollup[work_hash]["etag"] != summary_etags.get(work_hash, "")]
+    logger.info(f"Reading {len(stale_hashes):,} new or changed summaries of {len(result_paths):,} results")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for work_hash, new_entry in zip(stale_hashes, executor.map(read_summary, stale_hashes)):
+            rollup[work_hash] = new_entry
+
+    # Results can go away, for example when a workspace gets cleaned up, and their entries with them
+    rollup = {work_hash: rollup[work_hash] for work_hash in result_paths}
+    if stale_hashes:
+        bucket, key = parse_s3_path(rollup_path)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=zstd.ZstdCompressor().compress(json.dumps({"version": 1, "entries": rollup}).encode("utf-8")))
+
+    totals = {name: sum(rollup_entry["stats"][i] for rollup_entry in rollup.values()) for i, name in enumerate(STAT_FIELDS)}
+    totals["num_results"] = len(result_paths)
+    totals["completed_items"] = sum(work_hash in index_items for work_hash in result_paths)
+    return totals
@@ -0,0 +1,223 @@
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Optional
+
+import zstandard as zstd
+from botocore.exceptions import ClientError
+
+from olmocr.s3_utils import parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# Result files are named output_{work_hash}{suffix}, and a work item counts as done once either one exists
+RESULT_SUFFIXES = {
+    "none": ".jsonl",
+    "zstd": ".jsonl.zst",
+}
+
+# S3 needs every part of a multipart upload except the last to be at least 5MiB
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+
+def result_filename(work_hash: str, compression: str = "none") -> str:
+    return f"output_{work_hash}{RESULT_SUFFIXES[compression]}"
+
+
+def work_hash_from_result_filename(filename: str) -> Optional[str]:
+    """Returns the work hash of a results/ filename, or None if it isn't a finished result file"""
+    filename = os.path.basename(filename)
+    if not filename.startswith("output_"):
+        return None
+
+    # Check the longest suffix first, since .jsonl.zst does not end in .jsonl, but do it in a way that keeps working if more get added
+    for suffix in sorted(RESULT_SUFFIXES.values(), key=len, reverse=True):
+        if filename.endswith(suffix):
+            return filename[len("output_") : -len(suffix)]
+    return None
+
+
+def decode_result_bytes(path: str, data: bytes) -> str:
+    """Decodes the contents of a result file, which may be zstd compressed, based on its name"""
+    if path.endswith(".zst"):
+        # The writer streams its frames, so they carry no content size, and need to be decompressed as a stream
+        with zstd.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            data = reader.read()
+    return data.decode("utf-8")
+
+
+class ResultWriter:
+    """
+    Writes a work item's Dolma documents to their final location as they are produced, one at a time,
+    instead of collecting the whole work item in memory and on local disk first.
+
+    Nothing is visible at the final path until commit() is called, so the existence of the output file keeps
+    meaning that the work item is done. If the work item fails, call abort() to throw away what was written.
+
+    Commits never overwrite an existing result: when two workers finish the same work item, such as a straggler that
+    was re-issued to an idle worker, the first commit wins, and the later one is thrown away.
+
+    write_doc is safe to call from several threads. The methods do blocking IO, so call them via asyncio.to_thread
+    from the event loop.
+    """
+
+    def __init__(self, compression: str = "none"):
+        if compression not in RESULT_SUFFIXES:
+            raise ValueError(f"Unknown compression {compression}, choose from {', '.join(RESULT_SUFFIXES)}")
+
+        self.compression = compression
+        self.num_docs = 0
+        self.num_bytes = 0
+        self._compressor = zstd.ZstdCompressor().compressobj() if compression == "zstd" else None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def write_doc(self, doc: dict) -> None:
+        line = (json.dumps(doc) + "\n").encode("utf-8")
+        with self._lock:
+            assert not self._closed, "Writer was already committed or aborted"
+            self.num_docs += 1
+            self.num_bytes += len(line)
+            self._write_bytes(self._compressor.compress(line) if self._compressor is not None else line)
+
+    def commit(self) -> bool:
+        """
+        Makes the result visible at the final path, unless another writer committed one there first.
+
+        Returns:
+            True if this writer's result is the one at the final path, False if it lost to an earlier commit.
+        """
+        with self._lock:
+            assert not self._closed, "Writer was already committed or aborted"
+            self._closed = True
+            if self._compressor is not None:
+                self._write_bytes(self._compressor.flush())
+            committed = self._commit()
+
+        if not committed:
+            logger.info(f"{self.output_path} was committed by another worker first, dropping this copy")
+        return committed
+
+    def abort(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._abort()
+
+    def _write_bytes(self, data: bytes) -> None:
+        raise NotImplementedError()
+
+    def _commit(self) -> bool:
+        raise NotImplementedError()
+
+    def _abort(self) -> None:
+        raise NotImplementedError()
+
+
+class LocalResultWriter(ResultWriter):
+    """Appends to a hidden temporary file next to the final path, and links it into place on commit"""
+
+    def __init__(self, output_path: str, compression: str = "none"):
+        super().__init__(compression)
+        self.output_path = output_path
+        # Hidden and with a different suffix, so nothing scanning the results directory mistakes it for a finished result
+        self._tmp_path = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.{uuid.uuid4().hex}.tmp")
+        self._file = open(self._tmp_path, "wb")
+
+    def _write_bytes(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def _commit(self) -> bool:
+        self._file.close()
+        # Unlike a rename, a link fails if the final path exists, so an earlier commit never gets replaced
+        try:
+            os.link(self._tmp_path, self.output_path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(self._tmp_path)
+
+    def _abort(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class S3ResultWriter(ResultWriter):
+    """
+    Streams to S3 with a multipart upload, holding at most one part in memory. S3 only makes the object visible once
+    the multipart upload is completed, which makes commit atomic. Results that never fill a single part are written
+    with one put_object on commit instead.
+    """
+
+    def __init__(self, s3_client, output_path: str, compression: str = "none", part_size: int = S3_DEFAULT_PART_SIZE):
+        super().__init__(compression)
+        assert part_size >= S3_MIN_PART_SIZE, f"S3 parts must be at least {S3_MIN_PART_SIZE} bytes"
+        self.s3_client = s3_client
+        self.output_path = output_path
+        self.part_size = part_size
+        self.bucket, self.key = parse_s3_path(output_path)
+
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict] = []
+
+    def _write_bytes(self, data: bytes) -> None:
+        self._buffer += data
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=bytes(self._buffer))
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self._buffer.clear()
+
+    def _commit(self) -> bool:
+        # Both ways of writing the object are conditional on there being none yet, so an earlier commit never gets replaced
+        try:
+            if self._upload_id is None:
+                self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), IfNoneMatch="*")
+                self._buffer.clear()
+                return True
+
+            if self._buffer:
+                self._upload_part()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}, IfNoneMatch="*"
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+
+        self._buffer.clear()
+        if self._upload_id is not None:
+            self._abort()
+        return False
+
+    def _abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                logger.warning(f"Failed to abort multipart upload of {self.output_path}: {e}")
+
+
+def open_result_writer(output_path: str, s3_client=None, compression: str = "none") -> ResultWriter:
+    """Opens a writer for an s3:// or local result path"""
+    if output_path.startswith("s3://"):
+        return S3ResultWriter(s3_client, output_path, compression)
+    return LocalResultWriter(output_path, compression)
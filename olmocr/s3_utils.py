@@ -1,20 +1,25 @@
 import base64
 import concurrent.futures
-import glob
+import fnmatch
 import hashlib
+import io
+import json
 import logging
 import os
-import posixpath
+import re
+import shutil
+import threading
 import time
+from collections import OrderedDict
+from functools import partial
 from io import BytesIO, TextIOWrapper
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Set
 from urllib.parse import urlparse
 
 import boto3
 import requests  # type: ignore
 import zstandard as zstd
-from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from google.cloud import storage
@@ -23,6 +28,25 @@ from tqdm import tqdm
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Listings fan out over this many sub-prefixes at a time
+S3_LISTING_WORKERS = 32
+
+LISTING_MANIFEST_VERSION = 1
+
+# S3RangeFile fetches whole blocks of this size, and keeps the most recently read S3_RANGE_CACHE_BLOCKS of them
+S3_RANGE_BLOCK_SIZE = 32 * 1024
+S3_RANGE_CACHE_BLOCKS = 256
+
+# Model files are downloaded in ranged requests of this size, at most MODEL_DOWNLOAD_WORKERS of them at a time across all
+# the files, fewer from Weka, which doesn't cope with as many
+MODEL_DOWNLOAD_PART_SIZE = 64 * 1024 * 1024
+MODEL_DOWNLOAD_WORKERS = 32
+WEKA_DOWNLOAD_WORKERS = 10
+
+# Records the remote version, size and modification time of each file that was downloaded and verified, so a warm
+# model directory is checked with a stat per file, rather than by hashing gigabytes of weights
+DOWNLOAD_MANIFEST_NAME = ".olmocr-download.json"
+
 
 def parse_s3_path(s3_path: str) -> tuple[str, str]:
     if not (s3_path.startswith("s3://") or s3_path.startswith("gs://") or s3_path.startswith("weka://")):
@@ -34,6 +58,38 @@ def parse_s3_path(s3_path: str) -> tuple[str, str]:
     return bucket, key
 
 
+def list_s3_objects(s3_client, bucket: str, prefix: str, max_workers: int = S3_LISTING_WORKERS) -> Dict[str, str]:
+    """
+    Lists every object under a prefix, as {key: etag}.
+
+    Each level of the key hierarchy is listed with a "/" delimiter, and the sub-prefixes that turn up are listed
+    concurrently, so a tree of many prefixes is listed many requests at a time, instead of one page after another.
+    A single flat prefix still has to be paged through in order.
+    """
+
+    def list_level(level_prefix: str):
+        objects = {}
+        sub_prefixes = []
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=level_prefix, Delimiter="/"):
+            for obj in page.get("Contents", []):
+                objects[obj["Key"]] = obj["ETag"].strip('"')
+            sub_prefixes.extend(common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", []))
+        return objects, sub_prefixes
+
+    listed: Dict[str, str] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(list_level, prefix)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                objects, sub_prefixes = future.result()
+                listed.update(objects)
+                pending |= {executor.submit(list_level, sub_prefix) for sub_prefix in sub_prefixes}
+
+    return listed
+
+
 def expand_s3_glob(s3_client, s3_glob: str) -> dict[str, str]:
     """
     Expand an S3 path that may or may not contain wildcards (e.g., *.pdf).
@@ -44,23 +100,17 @@ def expand_s3_glob(s3_client, s3_glob: str) -> dict[str, str]:
     if not parsed.scheme.startswith("s3"):
         raise ValueError("Path must start with s3://")
 
-    bucket = parsed.netloc
-    raw_path = parsed.path.lstrip("/")
-    prefix = posixpath.dirname(raw_path)
-    pattern = posixpath.basename(raw_path)
+    # Not parsed.path, which would cut a ? wildcard off as the start of a query string
+    bucket, _, raw_path = s3_glob[len(f"{parsed.scheme}://") :].partition("/")
+    raw_path = raw_path.lstrip("/")
 
     # Case 1: We have a wildcard
-    if any(wc in pattern for wc in ["*", "?", "[", "]"]):
-        if prefix and not prefix.endswith("/"):
-            prefix += "/"
-        paginator = s3_client.get_paginator("list_objects_v2")
-        matched = {}
-        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if glob.fnmatch.fnmatch(key, posixpath.join(prefix, pattern)):  # type: ignore
-                    matched[f"s3://{bucket}/{key}"] = obj["ETag"].strip('"')
-        return matched
+    wildcard_positions = [raw_path.index(wc) for wc in ["*", "?", "["] if wc in raw_path]
+    if wildcard_positions:
+        # Everything up to the first wildcard is a literal prefix of every match, as * matches across / like before
+        pattern = re.compile(fnmatch.translate(raw_path))
+        listed = list_s3_objects(s3_client, bucket, raw_path[: min(wildcard_positions)])
+        return {f"s3://{bucket}/{key}": etag for key, etag in listed.items() if pattern.match(key)}
 
     # Case 2: No wildcard → single file or a bare prefix
     try:
@@ -84,6 +134,77 @@ def expand_s3_glob(s3_client, s3_glob: str) -> dict[str, str]:
             raise
 
 
+def save_listing_manifest(s3_client, manifest_path: str, s3_glob: str, listing: Dict[str, str]) -> None:
+    """
+    Saves the result of expand_s3_glob, so that a later run can load it instead of listing the bucket again.
+
+    The manifest is zstd compressed text: a JSON header line, then one "etag<TAB>path" line per object.
+
+    Args:
+        s3_client: Boto3 S3 client, for an s3:// manifest_path
+        manifest_path: Local or s3:// path to save the manifest at
+        s3_glob: The glob that was expanded
+        listing: {path: etag}, as returned by expand_s3_glob
+    """
+    header = json.dumps({"version": LISTING_MANIFEST_VERSION, "glob": s3_glob, "listed_at": time.time(), "num_objects": len(listing)})
+    lines = [header] + [f"{etag}\t{path}" for path, etag in sorted(listing.items())]
+    data = zstd.ZstdCompressor().compress("\n".join(lines).encode("utf-8"))
+
+    if manifest_path.startswith("s3://"):
+        bucket, key = parse_s3_path(manifest_path)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=data)
+        return
+
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_listing_manifest(s3_client, manifest_path: str, s3_glob: str) -> Optional[Dict[str, str]]:
+    """
+    Loads a listing saved by save_listing_manifest.
+
+    Returns:
+        {path: etag} of the saved listing, or None if there is no readable manifest for s3_glob at manifest_path
+    """
+    try:
+        if manifest_path.startswith("s3://"):
+            data = get_s3_bytes(s3_client, manifest_path)
+        elif os.path.exists(manifest_path):
+            with open(manifest_path, "rb") as f:
+                data = f.read()
+        else:
+            return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+
+    try:
+        header_line, _, body = zstd.ZstdDecompressor().decompress(data).decode("utf-8").partition("\n")
+        header = json.loads(header_line)
+        if header.get("version") != LISTING_MANIFEST_VERSION or header.get("glob") != s3_glob:
+            logger.warning(f"Ignoring listing manifest {manifest_path}, it was saved for {header.get('glob')}")
+            return None
+
+        listing = {}
+        for line in body.splitlines():
+            etag, path = line.split("\t", 1)
+            listing[path] = etag
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable listing manifest {manifest_path}: {e}")
+        return None
+
+    if len(listing) != header.get("num_objects"):
+        logger.warning(f"Ignoring truncated listing manifest {manifest_path}")
+        return None
+
+    logger.info(f"Loaded {len(listing):,} objects of {s3_glob} listed at {time.ctime(header['listed_at'])} from {manifest_path}")
+    return listing
+
+
 def get_s3_bytes(s3_client, s3_path: str, start_index: Optional[int] = None, end_index: Optional[int] = None) -> bytes:
     # Fall back for local files
     if os.path.exists(s3_path):
@@ -116,6 +237,110 @@ def get_s3_bytes(s3_client, s3_path: str, start_index: Optional[int] = None, end
     return obj["Body"].read()
 
 
+class S3RangeFile(io.RawIOBase):
+    """
+    A read-only, seekable file object over an S3 object that only downloads the parts that are read, in ranged GETs of
+    whole blocks, and keeps the most recently read blocks in memory. pypdf's PdfReader and pypdfium2's PdfDocument both
+    take it in place of a path, and then only fetch what they look at, such as the trailer, the xref and a few pages.
+
+    bytes_fetched and num_requests count what was actually downloaded.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        s3_path: str,
+        size: Optional[int] = None,
+        block_size: int = S3_RANGE_BLOCK_SIZE,
+        max_cached_blocks: int = S3_RANGE_CACHE_BLOCKS,
+    ):
+        """
+        Args:
+            s3_client: Boto3 S3 client that can read s3_path
+            s3_path: s3:// path of the object
+            size: Size of the object, if it is known already, otherwise it is looked up with a HEAD request
+            block_size: Bytes per block, every request fetches one or more whole blocks
+            max_cached_blocks: Most blocks kept in memory
+        """
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket, self.key = parse_s3_path(s3_path)
+        self.size = size if size is not None else s3_client.head_object(Bucket=self.bucket, Key=self.key)["ContentLength"]
+        self.block_size = block_size
+        self.max_cached_blocks = max_cached_blocks
+
+        self.bytes_fetched = 0
+        self.num_requests = 0
+        self._position = 0
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def _fetch_blocks(self, first_block: int, last_block: int) -> None:
+        # Each run of consecutive blocks that aren't cached is fetched in one request
+        run_start = None
+        for block in range(first_block, last_block + 2):
+            missing = block <= last_block and block not in self._blocks
+            if missing and run_start is None:
+                run_start = block
+            elif not missing and run_start is not None:
+                start = run_start * self.block_size
+                end = min(block * self.block_size, self.size)
+                data = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+                self.num_requests += 1
+                self.bytes_fetched += len(data)
+                for i in range(run_start, block):
+                    self._blocks[i] = data[(i - run_start) * self.block_size : (i - run_start + 1) * self.block_size]
+                run_start = None
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        end = min(self._position + len(view), self.size)
+        if end <= self._position:
+            return 0
+
+        first_block, last_block = self._position // self.block_size, (end - 1) // self.block_size
+        self._fetch_blocks(first_block, last_block)
+
+        written = 0
+        for block in range(first_block, last_block + 1):
+            data = self._blocks[block]
+            self._blocks.move_to_end(block)
+            block_start = block * self.block_size
+            lo = max(self._position, block_start) - block_start
+            hi = min(end, block_start + len(data)) - block_start
+            view[written : written + hi - lo] = data[lo:hi]
+            written += hi - lo
+
+        while len(self._blocks) > self.max_cached_blocks:
+            self._blocks.popitem(last=False)
+
+        self._position = end
+        return written
+
+
 def get_s3_bytes_with_backoff(s3_client, pdf_s3_path, max_retries: int = 8, backoff_factor: int = 2):
     attempt = 0
 
@@ -203,6 +428,7 @@ def download_directory(model_choices: List[str], local_dir: str):
     Raises:
         ValueError: If no valid model path is found in the provided choices.
     """
+    start_time = time.perf_counter()
     local_path = Path(os.path.expanduser(local_dir))
     local_path.mkdir(parents=True, exist_ok=True)
     logger.info(f"Local directory set to: {local_path}")
@@ -222,15 +448,15 @@ def download_directory(model_choices: List[str], local_dir: str):
         try:
             if model_path.startswith("weka://"):
                 download_dir_from_storage(model_path, str(local_path), storage_type="weka")
-                logger.info(f"Successfully downloaded model from Weka: {model_path}")
+                logger.info(f"Successfully downloaded model from Weka: {model_path} in {time.perf_counter() - start_time:.1f} seconds")
                 return
             elif model_path.startswith("gs://"):
                 download_dir_from_storage(model_path, str(local_path), storage_type="gcs")
-                logger.info(f"Successfully downloaded model from Google Cloud Storage: {model_path}")
+                logger.info(f"Successfully downloaded model from Google Cloud Storage: {model_path} in {time.perf_counter() - start_time:.1f} seconds")
                 return
             elif model_path.startswith("s3://"):
                 download_dir_from_storage(model_path, str(local_path), storage_type="s3")
-                logger.info(f"Successfully downloaded model from S3: {model_path}")
+                logger.info(f"Successfully downloaded model from S3: {model_path} in {time.perf_counter() - start_time:.1f} seconds")
                 return
             else:
                 logger.warning(f"Unsupported model path scheme: {model_path}")
@@ -241,22 +467,113 @@ def download_directory(model_choices: List[str], local_dir: str):
     raise ValueError("Failed to download the model from all provided sources.")
 
 
-def download_dir_from_storage(storage_path: str, local_dir: str, storage_type: str):
+class _PartialDownload:
+    """
+    A file that is downloaded in parts, written in place into {path}.part, with the parts that are done listed in
+    {path}.part.done, so that an interrupted download picks up where it left off
+    """
+
+    def __init__(self, local_file_path: str, size: int, version: str, part_size: int):
+        self.local_file_path = local_file_path
+        self.size = size
+        self.part_size = part_size
+        self.num_parts = -(-size // part_size)
+        self.part_path = f"{local_file_path}.part"
+        self.done_path = f"{local_file_path}.part.done"
+        self._header = f"{version}\t{size}\t{part_size}"
+        self._lock = threading.Lock()
+        self.done_parts = self._resume()
+
+    def _resume(self) -> Set[int]:
+        try:
+            with open(self.done_path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+
+        # The parts that are done are only any use for the same version of the file, cut up the same way
+        if lines[:1] == [self._header] and os.path.exists(self.part_path):
+            # The last line may be cut short if we were killed while writing it
+            done_parts = {int(line) for line in lines[1:] if line.isdigit() and int(line) < self.num_parts}
+            if done_parts:
+                logger.info(f"Resuming download of {self.local_file_path}, {len(done_parts)} of {self.num_parts} parts done already")
+            return done_parts
+
+        with open(self.part_path, "wb") as f:
+            f.truncate(self.size)
+        with open(self.done_path, "w") as f:
+            f.write(self._header + "\n")
+        return set()
+
+    def missing_parts(self) -> List[int]:
+        return [index for index in range(self.num_parts) if index not in self.done_parts]
+
+    def part_bytes(self, index: int) -> int:
+        return min(self.size, (index + 1) * self.part_size) - index * self.part_size
+
+    def download_part(self, write_range: Callable, index: int) -> None:
+        """Downloads one part, write_range(f, start, end) writes the bytes from start to end, inclusive, at the position of f"""
+        start = index * self.part_size
+        end = start + self.part_bytes(index) - 1
+        with open(self.part_path, "r+b") as f:
+            f.seek(start)
+            write_range(f, start, end)
+            if f.tell() != end + 1:
+                raise IOError(f"Got {f.tell() - start} bytes of part {index} of {self.local_file_path}, expected {end + 1 - start}")
+
+        with self._lock:
+            with open(self.done_path, "a") as f:
+                f.write(f"{index}\n")
+            self.done_parts.add(index)
+
+    def finish(self) -> None:
+        os.replace(self.part_path, self.local_file_path)
+        os.remove(self.done_path)
+
+
+def _load_download_manifest(local_dir: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(local_dir, DOWNLOAD_MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_download_manifest(local_dir: str, manifest: Dict[str, dict]) -> None:
+    path = os.path.join(local_dir, DOWNLOAD_MANIFEST_NAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _manifest_entry(local_file_path: str, version: str) -> dict:
+    stat = os.stat(local_file_path)
+    return {"version": version, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def download_dir_from_storage(storage_path: str, local_dir: str, storage_type: str, part_size: int = MODEL_DOWNLOAD_PART_SIZE):
     """
     Generalized function to download model files from different storage services
     to a local directory, syncing using MD5 hashes where possible.
 
+    Files are downloaded in ranged parts, in parallel across and within files, and a download that was interrupted
+    resumes from the parts it already has. Every downloaded file is verified against its remote hash, or its size where
+    there is no usable hash, and recorded in a manifest in local_dir, so that the next call skips it after a stat.
+
     Args:
         storage_path (str): The path to the storage location (weka://, gs://, or s3://).
         local_dir (str): The local directory where files will be downloaded.
         storage_type (str): Type of storage ('weka', 'gcs', or 's3').
+        part_size (int): Bytes per ranged request.
 
     Raises:
         ValueError: If the storage type is unsupported or credentials are missing.
+        IOError: If some files failed to download or to verify, calling again resumes them.
     """
     bucket_name, prefix = parse_s3_path(storage_path)
     total_files = 0
     objects = []
+    max_workers = MODEL_DOWNLOAD_WORKERS
 
     if storage_type == "gcs":
         client = storage.Client()
@@ -268,13 +585,17 @@ def download_dir_from_storage(storage_path: str, local_dir: str, storage_type: s
         def should_download(blob, local_file_path):
             return compare_hashes_gcs(blob, local_file_path)
 
-        def download_blob(blob, local_file_path):
-            try:
-                blob.download_to_filename(local_file_path)
-                logger.info(f"Successfully downloaded {blob.name} to {local_file_path}")
-            except Exception as e:
-                logger.error(f"Failed to download {blob.name} to {local_file_path}: {e}")
-                raise
+        def item_name(blob):
+            return blob.name
+
+        def item_size(blob):
+            return blob.size
+
+        def item_version(blob):
+            return blob.md5_hash or blob.etag
+
+        def write_range(blob, f, start, end):
+            blob.download_to_file(f, start=start, end=end)
 
         items = blobs
     elif storage_type in ("s3", "weka"):
@@ -288,6 +609,7 @@ def download_dir_from_storage(storage_path: str, local_dir: str, storage_type: s
             s3_client = boto3.client(
                 "s3", endpoint_url=endpoint_url, aws_access_key_id=weka_access_key, aws_secret_access_key=weka_secret_key, config=boto3_config
             )
+            max_workers = WEKA_DOWNLOAD_WORKERS
         else:
             s3_client = boto3.client("s3", config=Config(max_pool_connections=500))
 
@@ -301,51 +623,111 @@ def download_dir_from_storage(storage_path: str, local_dir: str, storage_type: s
         total_files = len(objects)
         logger.info(f"Found {total_files} files in {'Weka' if storage_type == 'weka' else 'S3'} bucket '{bucket_name}' with prefix '{prefix}'.")
 
-        transfer_config = TransferConfig(
-            multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=10, use_threads=True  # Reduced for WekaFS compatibility
-        )
-
         def should_download(obj, local_file_path):
             return compare_hashes_s3(obj, local_file_path, storage_type)
 
-        def download_blob(obj, local_file_path):
-            logger.info(f"Starting download of {obj['Key']} to {local_file_path}")
-            try:
-                with open(local_file_path, "wb") as f:
-                    s3_client.download_fileobj(bucket_name, obj["Key"], f, Config=transfer_config)
-                logger.info(f"Successfully downloaded {obj['Key']} to {local_file_path}")
-            except Exception as e:
-                logger.error(f"Failed to download {obj['Key']} to {local_file_path}: {e}")
-                raise
+        def item_name(obj):
+            return obj["Key"]
+
+        def item_size(obj):
+            return obj["Size"]
+
+        def item_version(obj):
+            return obj["ETag"].strip('"')
+
+        def write_range(obj, f, start, end):
+            response = s3_client.get_object(Bucket=bucket_name, Key=obj["Key"], Range=f"bytes={start}-{end}")
+            shutil.copyfileobj(response["Body"], f, 1024 * 1024)
 
         items = objects
     else:
         raise ValueError(f"Unsupported storage type: {storage_type}")
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = []
-        for item in items:
-            if storage_type == "gcs":
-                relative_path = os.path.relpath(item.name, prefix)
-            else:
-                relative_path = os.path.relpath(item["Key"], prefix)
-            local_file_path = os.path.join(local_dir, relative_path)
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-            if should_download(item, local_file_path):
-                futures.append(executor.submit(download_blob, item, local_file_path))
-            else:
-                total_files -= 1  # Decrement total_files as we're skipping this file
+    def verify(item, local_file_path):
+        if storage_type == "gcs":
+            return not compare_hashes_gcs(item, local_file_path)
+        if storage_type == "weka":
+            # Weka's ETags aren't MD5s of the content
+            return os.path.getsize(local_file_path) == item_size(item)
+        return not compare_hashes_s3(item, local_file_path, storage_type)
+
+    start_time = time.perf_counter()
+    manifest = _load_download_manifest(local_dir)
+    downloads = []
+    for item in items:
+        relative_path = os.path.relpath(item_name(item), prefix)
+        local_file_path = os.path.join(local_dir, relative_path)
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+
+        version = item_version(item)
+        entry = manifest.get(relative_path)
+        if entry is not None and os.path.exists(local_file_path) and entry == _manifest_entry(local_file_path, version):
+            total_files -= 1
+            continue
+        if not should_download(item, local_file_path):
+            manifest[relative_path] = _manifest_entry(local_file_path, version)
+            total_files -= 1  # Decrement total_files as we're skipping this file
+            continue
+
+        manifest.pop(relative_path, None)
+        downloads.append((item, relative_path, _PartialDownload(local_file_path, item_size(item), version, part_size)))
 
+    failed_files = []
+
+    def finish(item, relative_path, download):
+        download.finish()
+        if verify(item, download.local_file_path):
+            manifest[relative_path] = _manifest_entry(download.local_file_path, item_version(item))
+        else:
+            logger.error(f"Downloaded {download.local_file_path} does not match {item_name(item)}, removing it")
+            os.remove(download.local_file_path)
+            failed_files.append(relative_path)
+
+    downloaded_bytes = 0
+    try:
         if total_files > 0:
-            for future in tqdm(concurrent.futures.as_completed(futures), total=total_files, desc=f"Downloading from {storage_type.upper()}"):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"Error occurred during download: {e}")
+            total_bytes = sum(download.part_bytes(index) for _, _, download in downloads for index in download.missing_parts())
+            progress = tqdm(total=total_bytes, unit="B", unit_scale=True, desc=f"Downloading from {storage_type.upper()}")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, progress:
+                futures = {}
+                # Counted here rather than by the workers, so that each file gets finished exactly once
+                remaining_parts = {}
+                for item, relative_path, download in downloads:
+                    remaining_parts[relative_path] = len(download.missing_parts())
+                    if remaining_parts[relative_path] == 0:
+                        finish(item, relative_path, download)
+                    for index in download.missing_parts():
+                        future = executor.submit(download.download_part, partial(write_range, item), index)
+                        futures[future] = (item, relative_path, download, index)
+
+                for future in concurrent.futures.as_completed(futures):
+                    item, relative_path, download, index = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to download part {index} of {item_name(item)} to {download.local_file_path}: {e}")
+                        if relative_path not in failed_files:
+                            failed_files.append(relative_path)
+                        continue
+
+                    progress.update(download.part_bytes(index))
+                    downloaded_bytes += download.part_bytes(index)
+                    remaining_parts[relative_path] -= 1
+                    if remaining_parts[relative_path] == 0:
+                        finish(item, relative_path, download)
         else:
             logger.info("All files are up-to-date. No downloads needed.")
+    finally:
+        _save_download_manifest(local_dir, manifest)
+
+    if failed_files:
+        raise IOError(f"Failed to download {len(failed_files)} files from {storage_path}: {failed_files}, calling again resumes them")
 
-    logger.info(f"Downloaded model from {storage_type.upper()} to {local_dir}")
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Downloaded model from {storage_type.upper()} to {local_dir}: {total_files} of {len(items)} files, "
+        f"{downloaded_bytes / 1024**3:.2f} GiB in {elapsed:.1f} seconds ({downloaded_bytes / 1024**2 / max(elapsed, 1e-9):.1f} MiB/s)"
+    )
 
 
 def compare_hashes_gcs(blob, local_file_path: str) -> bool:
@@ -4,13 +4,13 @@ import os
 import re
 from typing import Optional
 
-import boto3
 from datasets import Dataset, load_dataset
-from filelock import FileLock
 
+from olmocr.async_storage import get_s3_client
 from olmocr.data.renderpdf import get_pdf_media_box_width_height
+from olmocr.pdf_cache import PdfCache
 from olmocr.prompts.anchor import get_anchor_text
-from olmocr.s3_utils import parse_custom_id, parse_s3_path
+from olmocr.s3_utils import parse_custom_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,7 +26,7 @@ def list_dataset_files(s3_glob_path: str):
     Lists files in the specified S3 path that match the glob pattern.
     """
     if s3_glob_path.startswith("s3://"):
-        s3 = boto3.client("s3")
+        s3 = get_s3_client()
         match = re.match(r"s3://([^/]+)/(.+)", s3_glob_path)
         if not match:
             logger.error(f"Invalid S3 path: {s3_glob_path}")
@@ -89,28 +89,16 @@ def extract_openai_batch_response(example):
     return {"s3_path": s3_path, "page_num": page_num, "response": response, "finish_reason": finish_reason}
 
 
+def _dataset_s3_client():
+    return get_s3_client(aws_access_key_id=os.getenv("DS_AWS_ACCESS_KEY_ID"), aws_secret_access_key=os.getenv("DS_AWS_SECRET_ACCESS_KEY"))
+
+
 def _cache_s3_file(s3_path: str, local_cache_dir: str):
     """
     Downloads an S3 object to a local cache directory, ensuring no two writers corrupt the same file.
+    The dataset refers to the cached files by path, so nothing is ever evicted from this cache.
     """
-    bucket, key = parse_s3_path(s3_path)
-
-    # Define the local file path
-    local_file_path = os.path.join(local_cache_dir, bucket + "__" + key.replace("/", "_"))
-    os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-    lock_file = f"{local_file_path}.lock"
-
-    # Use a file lock to prevent concurrent writes
-    with FileLock(lock_file):
-        if not os.path.exists(local_file_path):
-            logger.info(f"Downloading {s3_path} to {local_file_path}")
-            s3_client = boto3.client("s3", aws_access_key_id=os.getenv("DS_AWS_ACCESS_KEY_ID"), aws_secret_access_key=os.getenv("DS_AWS_SECRET_ACCESS_KEY"))
-            s3_client.download_file(bucket, key, local_file_path)
-        else:
-            pass
-            # logger.info(f"File {local_file_path} already exists, skipping download.")
-
-    return local_file_path
+    return PdfCache(local_cache_dir, max_bytes=None).get(_dataset_s3_client(), s3_path)
 
 
 def cache_s3_files(dataset: Dataset, pdf_cache_location: str, num_proc: int = 32) -> Dataset:
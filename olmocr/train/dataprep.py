@@ -1,5 +1,6 @@
 import base64
 import random
+from collections import defaultdict
 from io import BytesIO
 from typing import Union
 
@@ -7,7 +8,10 @@ import numpy as np
 import torch  # Make sure to import torch as it's used in the DataCollator
 from PIL import Image
 
-from olmocr.data.renderpdf import render_pdf_to_base64png
+from olmocr.data.renderpdf import (
+    render_pdf_pages_to_base64png,
+    render_pdf_to_base64png,
+)
 from olmocr.prompts import build_finetuning_prompt
 from olmocr.prompts.anchor import get_anchor_text
 
@@ -20,7 +24,9 @@ def prepare_data_for_qwen2_training(example, processor, target_longest_image_dim
         target_anchor_text_len = random.choice(target_anchor_text_len)
 
     anchor_text = get_anchor_text(example["local_pdf_path"], example["page_num"], pdf_engine="pdfreport", target_length=target_anchor_text_len)
-    base64_page_image = render_pdf_to_base64png(example["local_pdf_path"], example["page_num"], target_longest_image_dim=target_longest_image_dim)
+    base64_page_image = example.get("page_image") or render_pdf_to_base64png(
+        example["local_pdf_path"], example["page_num"], target_longest_image_dim=target_longest_image_dim
+    )
 
     # Prepare messages
     messages = [
@@ -86,12 +92,28 @@ def prepare_data_for_qwen2_training(example, processor, target_longest_image_dim
 
 
 def batch_prepare_data_for_qwen2_training(batch, processor, target_longest_image_dim: list[int], target_anchor_text_len: list[int]):
+    examples = [
+        {"local_pdf_path": batch["local_pdf_path"][i], "page_num": batch["page_num"][i], "response": batch["response"][i]}
+        for i in range(len(batch["response"]))
+    ]
+    image_dims = [random.choice(target_longest_image_dim) if isinstance(target_longest_image_dim, list) else target_longest_image_dim for _ in examples]
+
+    # Batches often hold many pages of the same document, render those together, so poppler only parses each document once
+    pages_to_render = defaultdict(list)
+    for example, image_dim in zip(examples, image_dims):
+        pages_to_render[(example["local_pdf_path"], image_dim)].append(example["page_num"])
+
+    page_images = {}
+    for (local_pdf_path, image_dim), page_nums in pages_to_render.items():
+        for page_num, image_base64 in render_pdf_pages_to_base64png(local_pdf_path, page_nums, target_longest_image_dim=image_dim).items():
+            page_images[(local_pdf_path, page_num, image_dim)] = image_base64
+
     # Process each example in the batch using the helper function
     processed_examples = []
-    for i in range(len(batch["response"])):
-        example = {"local_pdf_path": batch["local_pdf_path"][i], "page_num": batch["page_num"][i], "response": batch["response"][i]}
+    for example, image_dim in zip(examples, image_dims):
+        example["page_image"] = page_images[(example["local_pdf_path"], example["page_num"], image_dim)]
         processed_example = prepare_data_for_qwen2_training(
-            example, processor, target_longest_image_dim=target_longest_image_dim, target_anchor_text_len=target_anchor_text_len
+            example, processor, target_longest_image_dim=image_dim, target_anchor_text_len=target_anchor_text_len
         )
         processed_examples.append(processed_example)
 
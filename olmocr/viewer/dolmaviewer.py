@@ -3,7 +3,6 @@ import glob
 import html
 import json
 import os
-import tempfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
@@ -14,7 +13,8 @@ from jinja2 import Template
 from tqdm import tqdm
 
 from olmocr.data.renderpdf import render_pdf_to_base64webp
-from olmocr.s3_utils import get_s3_bytes, parse_s3_path
+from olmocr.pdf_cache import default_pdf_cache
+from olmocr.s3_utils import parse_s3_path
 
 
 def read_jsonl(paths):
@@ -51,14 +51,8 @@ def process_document(data, s3_client, template, output_dir):
     source_file = metadata.get("Source-File")
 
     # Generate base64 image of the corresponding PDF page
-    local_pdf = tempfile.NamedTemporaryFile("wb+", suffix=".pdf", delete=False)
     try:
-        pdf_bytes = get_s3_bytes(s3_client, source_file)
-        if pdf_bytes is None:
-            print(f"Failed to retrieve PDF from {source_file}")
-            return
-        local_pdf.write(pdf_bytes)
-        local_pdf.flush()
+        local_pdf_path = default_pdf_cache().get(s3_client, source_file)
 
         pages = []
         for span in pdf_page_numbers:
@@ -69,16 +63,13 @@ def process_document(data, s3_client, template, output_dir):
             page_text = html.escape(page_text, quote=True).replace("&lt;br&gt;", "<br>")
             page_text = markdown2.markdown(page_text, extras=["tables"])
 
-            base64_image = render_pdf_to_base64webp(local_pdf.name, page_num)
+            base64_image = render_pdf_to_base64webp(local_pdf_path, page_num)
 
             pages.append({"page_num": page_num, "text": page_text, "image": base64_image})
 
     except Exception as e:
         print(f"Error processing document ID {id_}: {e}")
         return
-    finally:
-        local_pdf.close()
-        os.unlink(local_pdf.name)
 
     # Generate pre-signed URL if source_file is an S3 path
     s3_link = None
@@ -0,0 +1,300 @@
+import fcntl
+import json
+import logging
+import os
+import struct
+import sys
+import uuid
+from array import array
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import zstandard as zstd
+from botocore.exceptions import ClientError
+
+from olmocr.s3_utils import download_zstd_csv, get_s3_bytes, parse_s3_path
+
+logger = logging.getLogger(__name__)
+
+# The index is a manifest listing immutable shards, all under work_index/ in the workspace
+INDEX_DIR = "work_index"
+MANIFEST_NAME = "manifest.json"
+
+# Workspaces from before the sharded index kept every work item in this one CSV, which is still read, but never written
+LEGACY_INDEX_NAME = "work_index_list.csv.zstd"
+
+SHARD_MAGIC = b"OLMIDX"
+SHARD_VERSION = 1
+SHARD_HEADER = struct.Struct("<6sBII")
+SHARD_SUFFIX = ".idx.zst"
+
+# Adding paths writes new shards of at most this many paths each
+SHARD_MAX_PATHS = 100_000
+
+
+@dataclass(frozen=True)
+class ShardInfo:
+    name: str
+    num_items: int
+    num_paths: int
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+# A work item in the index: (hash, paths, number of pages of each path, 0 where unknown)
+IndexItem = Tuple[str, List[str], List[int]]
+
+
+def encode_shard(items: List[IndexItem]) -> bytes:
+    """
+    Encodes work items into a shard. The shard is columnar, so it decodes with a few array copies instead of
+    parsing every line, and it has no delimiters, so paths can contain any character:
+
+        header: magic, version, number of items, number of paths
+        hashes: 20 bytes of sha1 per item
+        path counts: uint32 per item
+        path lengths: uint32 per path, in utf-8 bytes
+        page counts: uint32 per path
+        paths: all paths concatenated, utf-8
+    """
+    hashes = b"".join(bytes.fromhex(work_hash) for work_hash, _, _ in items)
+    encoded_paths = [path.encode("utf-8") for _, paths, _ in items for path in paths]
+    path_counts = _little_endian(array("I", [len(paths) for _, paths, _ in items]))
+    path_lengths = _little_endian(array("I", [len(path) for path in encoded_paths]))
+    page_counts = _little_endian(array("I", [num_pages for _, _, item_page_counts in items for num_pages in item_page_counts]))
+    if len(page_counts) != len(encoded_paths):
+        raise ValueError("Every path of a work item needs a page count")
+
+    header = SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, len(items), len(encoded_paths))
+    return zstd.ZstdCompressor().compress(header + hashes + path_counts.tobytes() + path_lengths.tobytes() + page_counts.tobytes() + b"".join(encoded_paths))
+
+
+def decode_shard(data: bytes) -> List[IndexItem]:
+    data = zstd.ZstdDecompressor().decompress(data)
+    magic, version, num_items, num_paths = SHARD_HEADER.unpack_from(data)
+    if magic != SHARD_MAGIC or version != SHARD_VERSION:
+        raise ValueError(f"Not a version {SHARD_VERSION} work index shard")
+
+    offset = SHARD_HEADER.size
+    hashes = data[offset : offset + 20 * num_items]
+    offset += 20 * num_items
+
+    path_counts = array("I")
+    path_counts.frombytes(data[offset : offset + 4 * num_items])
+    offset += 4 * num_items
+
+    path_lengths = array("I")
+    path_lengths.frombytes(data[offset : offset + 4 * num_paths])
+    offset += 4 * num_paths
+
+    page_counts = array("I")
+    page_counts.frombytes(data[offset : offset + 4 * num_paths])
+    offset += 4 * num_paths
+
+    _little_endian(path_counts)
+    _little_endian(path_lengths)
+    _little_endian(page_counts)
+
+    paths = []
+    for length in path_lengths:
+        paths.append(data[offset : offset + length].decode("utf-8"))
+        offset += length
+
+    items = []
+    path_index = 0
+    for i, count in enumerate(path_counts):
+        items.append((hashes[20 * i : 20 * (i + 1)].hex(), paths[path_index : path_index + count], page_counts[path_index : path_index + count].tolist()))
+        path_index += count
+    return items
+
+
+def _is_missing(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] in ("NoSuchKey", "404")
+
+
+def _is_precondition_failure(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+class WorkIndex:
+    """
+    The list of work items of a workspace, as a manifest plus immutable shards, locally or on S3.
+
+    Adding work items only writes new shards and a new manifest, instead of downloading and rewriting the whole index,
+    and readers can go through the index a shard at a time. On S3, the manifest is replaced with a conditional put,
+    and locally under an exclusive lock on a file next to it, so two processes adding paths at the same time don't lose each other's shards.
+
+    The methods do blocking IO, so call them via asyncio.to_thread.
+    """
+
+    def __init__(self, workspace_path: str, s3_client=None):
+        self.workspace_path = workspace_path.rstrip("/")
+        self.s3_client = s3_client
+        self.index_dir = os.path.join(self.workspace_path, INDEX_DIR)
+        self.manifest_path = os.path.join(self.index_dir, MANIFEST_NAME)
+        self.legacy_path = os.path.join(self.workspace_path, LEGACY_INDEX_NAME)
+
+    @property
+    def is_s3(self) -> bool:
+        return self.workspace_path.startswith("s3://")
+
+    def _read(self, path: str) -> Optional[bytes]:
+        if not self.is_s3:
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+
+        try:
+            return get_s3_bytes(self.s3_client, path)
+        except ClientError as e:
+            if _is_missing(e):
+                return None
+            raise
+
+    def _write(self, path: str, data: bytes) -> None:
+        if self.is_s3:
+            bucket, key = parse_s3_path(path)
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=data)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_manifest(self) -> Tuple[List[ShardInfo], Optional[str]]:
+        """Returns the shards in the manifest, and the ETag of the manifest on S3"""
+        if not self.is_s3:
+            data = self._read(self.manifest_path)
+            etag = None
+        else:
+            bucket, key = parse_s3_path(self.manifest_path)
+            try:
+                response = self.s3_client.get_object(Bucket=bucket, Key=key)
+            except ClientError as e:
+                if _is_missing(e):
+                    return [], None
+                raise
+            data = response["Body"].read()
+            etag = response["ETag"]
+
+        if data is None:
+            return [], None
+        return [ShardInfo(**shard) for shard in json.loads(data)["shards"]], etag
+
+    @contextmanager
+    def _manifest_lock(self):
+        """Holds off other processes updating a local manifest. S3 needs no lock, as the manifest is replaced with a conditional put there."""
+        if self.is_s3:
+            yield
+            return
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(f"{self.manifest_path}.lock", "ab") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_manifest(self, shards: List[ShardInfo], etag: Optional[str]) -> bool:
+        """Replaces the manifest, unless on S3 it changed since it was read. Returns False if it did, locally the caller holds _manifest_lock."""
+        data = json.dumps({"version": SHARD_VERSION, "shards": [asdict(shard) for shard in shards]}).encode("utf-8")
+        if not self.is_s3:
+            self._write(self.manifest_path, data)
+            return True
+
+        bucket, key = parse_s3_path(self.manifest_path)
+        condition = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+        try:
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=data, **condition)
+        except ClientError as e:
+            if _is_precondition_failure(e):
+                return False
+            raise
+        return True
+
+    def shards(self) -> List[ShardInfo]:
+        """Lists the shards of the index, with the legacy CSV index first if the workspace has one"""
+        shards, _ = self._read_manifest()
+        if self._legacy_exists():
+            shards = [ShardInfo(LEGACY_INDEX_NAME, num_items=0, num_paths=0)] + shards
+        return shards
+
+    def _legacy_exists(self) -> bool:
+        if not self.is_s3:
+            return os.path.exists(self.legacy_path)
+
+        bucket, key = parse_s3_path(self.legacy_path)
+        try:
+            self.s3_client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if _is_missing(e):
+                return False
+            raise
+
+    def load_shard(self, shard: ShardInfo) -> List[IndexItem]:
+        if shard.name == LEGACY_INDEX_NAME:
+            return self._load_legacy()
+
+        data = self._read(os.path.join(self.index_dir, shard.name))
+        if data is None:
+            raise FileNotFoundError(f"Work index shard {shard.name} is in the manifest, but missing")
+        return decode_shard(data)
+
+    def _load_legacy(self) -> List[IndexItem]:
+        if self.is_s3:
+            lines = download_zstd_csv(self.s3_client, self.legacy_path)
+        else:
+            with open(self.legacy_path, "rb") as f:
+                lines = zstd.ZstdDecompressor().decompress(f.read()).decode("utf-8").splitlines()
+
+        # The CSV index has no page counts
+        return [(parts[0], parts[1:], [0] * (len(parts) - 1)) for line in lines if (parts := line.strip().split(",")) and line.strip()]
+
+    def load_items(self) -> Dict[str, List[str]]:
+        """Loads every work item in the index, as {hash: paths}"""
+        return {work_hash: paths for shard in self.shards() for work_hash, paths, _ in self.load_shard(shard)}
+
+    def append(self, items: List[IndexItem], max_paths_per_shard: int = SHARD_MAX_PATHS) -> List[ShardInfo]:
+        """
+        Adds work items to the index as new shards, without touching the existing ones.
+
+        Returns:
+            The shards that were written.
+        """
+        if not items:
+            return []
+
+        # Each shard gets a name of its own, so shards written by several processes at once never collide
+        new_shards = []
+        batch: List[IndexItem] = []
+        batch_paths = 0
+        for i, item in enumerate(items):
+            batch.append(item)
+            batch_paths += len(item[1])
+            if batch_paths >= max_paths_per_shard or i == len(items) - 1:
+                shard = ShardInfo(f"shard_{uuid.uuid4().hex}{SHARD_SUFFIX}", num_items=len(batch), num_paths=batch_paths)
+                self._write(os.path.join(self.index_dir, shard.name), encode_shard(batch))
+                new_shards.append(shard)
+                batch, batch_paths = [], 0
+
+        # The shards are only part of the index once the manifest lists them. If someone else changed the manifest in
+        # the meantime, add our shards to their version instead.
+        with self._manifest_lock():
+            while True:
+                shards, etag = self._read_manifest()
+                if self._write_manifest(shards + new_shards, etag):
+                    break
+                logger.info("Work index manifest changed while adding shards, retrying")
+
+        logger.info(f"Added {len(items):,} work items to the index in {len(new_shards)} shards")
+        return new_shards
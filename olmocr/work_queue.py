@@ -2,22 +2,111 @@ import abc
 import asyncio
 import datetime
 import hashlib
+import heapq
+import json
 import logging
 import os
 import random
+import re
+import socket
+import sqlite3
+import statistics
+import threading
+import time
+import uuid
 from asyncio import Queue
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from olmocr.s3_utils import (
-    download_zstd_csv,
-    expand_s3_glob,
-    parse_s3_path,
-    upload_zstd_csv,
+from olmocr.async_storage import AsyncStorage
+from olmocr.result_writer import (
+    RESULT_SUFFIXES,
+    result_filename,
+    work_hash_from_result_filename,
 )
+from olmocr.s3_utils import parse_s3_path
+from olmocr.work_index import LEGACY_INDEX_NAME, IndexItem, ShardInfo, WorkIndex
 
 logger = logging.getLogger(__name__)
 
+# A worker renews the lock on the work item it is on every WORKER_LOCK_HEARTBEAT_SECS, and a lock that hasn't been
+# renewed for WORKER_LOCK_LEASE_SECS belongs to a dead worker, so its work item can be taken over
+WORKER_LOCK_LEASE_SECS = 300
+WORKER_LOCK_HEARTBEAT_SECS = 60
+
+# S3WorkQueue lists results/ and worker_locks/ at most this often, or less often if listing takes long, to keep its view of the workspace current
+STATUS_REFRESH_INTERVAL = 60.0
+STATUS_REFRESH_COST_FACTOR = 10
+
+# Orders in which a queue hands out work items: random spreads the workers over the whole index, longest_first starts
+# with the work items with the most pages, so that the job doesn't end with a few workers on the biggest ones
+SCHEDULING_POLICIES = ("random", "longest_first")
+
+# Once the queue is empty, idle workers look this often for straggling work items to take a copy of
+STRAGGLER_POLL_SECS = 30.0
+
+# SqliteWorkQueue keeps its database in the workspace, and waits this long for other processes to release it
+SQLITE_QUEUE_NAME = "work_queue.sqlite3"
+SQLITE_BUSY_TIMEOUT_MS = 60_000
+
+# CoordinatorWorkQueue talks to an olmocr.coordinator process on this port by default, with one JSON message per line,
+# and retries with backoff for about as long as a coordinator takes to restart
+COORDINATOR_PORT = 7461
+COORDINATOR_MAX_LINE_BYTES = 16 * 1024 * 1024
+COORDINATOR_RETRIES = 8
+
+# A work path can name just some of the pages of a pdf, as path#pages=first-last, so that huge documents get split across work items
+_PAGE_RANGE_RE = re.compile(r"^(.*)#pages=(\d+)-(\d*)$")
+
+
+def page_range_work_path(path: str, first_page: int, last_page: Optional[int]) -> str:
+    """A work path for pages first_page..last_page of path, or for first_page to the end of the document if last_page is None"""
+    return f"{path}#pages={first_page}-{last_page if last_page is not None else ''}"
+
+
+def parse_page_range_work_path(work_path: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    Returns (path, first_page, last_page) of a work path, with both pages None if it covers the whole document,
+    and just last_page None if the range runs to the end of the document.
+    """
+    match = _PAGE_RANGE_RE.match(work_path)
+    if match is None:
+        return work_path, None, None
+    return match.group(1), int(match.group(2)), int(match.group(3)) if match.group(3) else None
+
+
+def split_page_ranges(num_pages: int, max_pages_per_unit: int) -> List[Tuple[int, int]]:
+    """Splits pages 1..num_pages into as few evenly sized (first_page, last_page) ranges as fit within max_pages_per_unit"""
+    num_units = -(-num_pages // max_pages_per_unit)
+    unit_size = -(-num_pages // num_units)
+    return [(first_page, min(first_page + unit_size - 1, num_pages)) for first_page in range(1, num_pages + 1, unit_size)]
+
+
+def pack_by_pages(page_counts: Dict[str, int], pages_per_group: int) -> List[List[str]]:
+    """
+    Packs paths into groups of about pages_per_group pages each, so that work items take about the same time to process.
+
+    The number of groups is fixed by the total page count, and the paths are dealt out largest first, each to the group
+    with the fewest pages so far (longest processing time first scheduling). That keeps every group within one path of
+    the average, where cutting a sorted list every n paths gives groups that differ by orders of magnitude in pages.
+    """
+    if not page_counts:
+        return []
+
+    num_groups = max(1, -(-sum(page_counts.values()) // pages_per_group))
+    groups: List[List[str]] = [[] for _ in range(num_groups)]
+    group_pages = [(0, i) for i in range(num_groups)]
+    for path in sorted(page_counts, key=lambda path: (-page_counts[path], path)):
+        pages, i = heapq.heappop(group_pages)
+        groups[i].append(path)
+        heapq.heappush(group_pages, (pages + page_counts[path], i))
+
+    return [sorted(group) for group in groups if group]
+
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
 
 @dataclass
 class WorkItem:
@@ -25,24 +114,83 @@ class WorkItem:
 
     hash: str
     work_paths: List[str]
+    num_pages: int = 0  # Total pages of the work paths, as far as the index knows them
+    speculative: bool = False  # A copy of a straggler that another worker still holds the lock on
 
 
 class WorkQueue(abc.ABC):
     """
     Base class defining the interface for a work queue.
+
+    Implementations keep the work items in a WorkIndex (self._index). The in-memory queues load it a shard at a time:
+    self._pending_shards are the shards not loaded yet, and work items in self._done_hashes are never queued.
+
+    Once the queue is empty, get_work can hand out copies of straggling work items, which other workers have held for
+    much longer than work items usually take. Whichever copy commits its result first wins, see ResultWriter.commit.
     """
 
-    @abc.abstractmethod
-    async def populate_queue(self, work_paths: List[str], items_per_group: int) -> None:
+    _index: WorkIndex
+    _queue: Queue
+    _pending_shards: List[ShardInfo]
+    _done_hashes: set
+
+    def __init__(self, scheduling: str = "random", straggler_factor: float = 0.0):
         """
-        Add new items to the work queue. The specifics will vary depending on
-        whether this is a local or S3-backed queue.
+        Args:
+            scheduling: Order to hand out work items in, one of SCHEDULING_POLICIES
+            straggler_factor: Once the queue is empty, hand out copies of work items that another worker has held for this many times
+                              the median time work items take here, 0 never does
+        """
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling {scheduling}, choose from {', '.join(SCHEDULING_POLICIES)}")
+
+        self.scheduling = scheduling
+        self.straggler_factor = straggler_factor
+
+        # When this worker claimed each work item it holds, and how long the ones it finished took, in wall clock seconds
+        self._claimed_at: Dict[str, float] = {}
+        self._durations: List[float] = []
+
+    async def populate_queue(
+        self,
+        work_paths: List[str],
+        items_per_group: int,
+        page_counts: Optional[Dict[str, int]] = None,
+        max_pages_per_unit: int = 0,
+        pages_per_group: int = 0,
+        count_pages: Optional[Callable[[List[str]], Dict[str, int]]] = None,
+    ) -> None:
+        """
+        Add new items to the work queue. Only the paths that are new to the workspace are added, as new shards of the work index.
 
         Args:
             work_paths: Each individual path that we will process over
-            items_per_group: Number of items to group together in a single work item
+            items_per_group: Number of items to group together in a single work item, where page counts are unknown
+            page_counts: Number of pages of each path, where known
+            max_pages_per_unit: Paths with more pages than this are split into page range work items, 0 never splits
+            pages_per_group: Paths with a page count are packed into work items of about this many pages, 0 groups by items_per_group
+            count_pages: Called with the new paths that page_counts doesn't cover, returns the page counts it could find
         """
-        pass
+        all_paths = set(work_paths)
+        logger.info(f"Found {len(all_paths):,} total paths")
+
+        existing_groups = await asyncio.to_thread(self._index.load_items)
+        new_paths = all_paths - self._existing_paths(existing_groups)
+        logger.info(f"{len(new_paths):,} new paths to add to the workspace")
+
+        if not new_paths:
+            return
+
+        page_counts = dict(page_counts or {})
+        if count_pages is not None:
+            # Only the new paths get counted, so adding a few pdfs to a big workspace stays cheap
+            uncounted = sorted(path for path in new_paths if path not in page_counts)
+            page_counts.update(await asyncio.to_thread(count_pages, uncounted))
+
+        new_groups = self._build_work_groups(new_paths, items_per_group, page_counts, max_pages_per_unit, pages_per_group)
+        logger.info(f"Created {len(new_groups):,} new work groups")
+
+        await asyncio.to_thread(self._index.append, new_groups)
 
     @abc.abstractmethod
     async def initialize_queue(self) -> None:
@@ -69,19 +217,102 @@ class WorkQueue(abc.ABC):
         pass
 
     @abc.abstractmethod
-    async def get_work(self, worker_lock_timeout_secs: int = 1800) -> Optional[WorkItem]:
+    async def get_work(self, worker_lock_timeout_secs: int = WORKER_LOCK_LEASE_SECS) -> Optional[WorkItem]:
         """
         Get the next available work item that isn't completed or locked.
 
         Args:
-            worker_lock_timeout_secs: Number of seconds before considering
-                                      a worker lock stale (default 30 mins)
+            worker_lock_timeout_secs: Number of seconds without a heartbeat before
+                                      considering a worker lock stale (default 5 mins)
 
         Returns:
             WorkItem if work is available, None if queue is empty
         """
         pass
 
+    async def _find_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        """
+        Looks for a work item that another worker has held for more than threshold_secs, and that nobody has taken a copy of yet.
+        By default, runs _scan_for_straggler in a thread.
+
+        Args:
+            threshold_secs: Seconds since the other worker claimed the item, after which it counts as straggling
+            worker_lock_timeout_secs: Number of seconds without a heartbeat before considering a worker lock stale
+
+        Returns:
+            The speculative copy of a straggler, if there is one and this worker got it, and whether any other worker
+            still holds a work item that nobody has a copy of
+        """
+        return await asyncio.to_thread(self._scan_for_straggler, threshold_secs, worker_lock_timeout_secs)
+
+    def _scan_for_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        """Blocking version of _find_straggler"""
+        raise NotImplementedError()
+
+    async def _wait_for_straggler(self, worker_lock_timeout_secs: int) -> Optional[WorkItem]:
+        """
+        Called once the queue is empty. Rather than sitting idle until the last workers finish, waits for one of their work
+        items to run straggler_factor times longer than the median time of the ones this worker finished, and takes a copy.
+
+        Returns:
+            A speculative WorkItem, or None once no other worker holds a work item that could still get a copy
+        """
+        while self.straggler_factor > 0 and self._durations:
+            threshold_secs = self.straggler_factor * statistics.median(self._durations)
+            try:
+                work_item, others_working = await self._find_straggler(threshold_secs, worker_lock_timeout_secs)
+            except Exception as e:
+                logger.warning(f"Failed to look for straggling work items: {e}")
+                work_item, others_working = None, True
+
+            if work_item is not None:
+                logger.info(f"Taking a copy of straggling work item {work_item.hash}")
+                return work_item
+            if not others_working:
+                break
+            await asyncio.sleep(STRAGGLER_POLL_SECS)
+        return None
+
+    def _record_done(self, work_item: WorkItem) -> None:
+        claimed_at = self._claimed_at.pop(work_item.hash, None)
+        if claimed_at is not None and not work_item.speculative:
+            self._durations.append(time.time() - claimed_at)
+
+    @abc.abstractmethod
+    async def renew_lock(self, work_item: WorkItem) -> bool:
+        """
+        Extend the lease on a work item that this worker has locked.
+
+        Args:
+            work_item: The WorkItem to renew the lock of
+
+        Returns:
+            True if renewed, False if the lock now belongs to another worker
+        """
+        pass
+
+    async def heartbeat(self, work_item: WorkItem, interval: float = WORKER_LOCK_HEARTBEAT_SECS) -> None:
+        """
+        Renews the lock on a work item every interval seconds, until cancelled. Run it as a task for as long as the work item is being worked on.
+
+        Args:
+            work_item: The WorkItem that this worker is working on
+            interval: Seconds between renewals, well under the lease timeout
+        """
+        if work_item.speculative:
+            # The lock stays with the worker that holds the original
+            return
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.renew_lock(work_item):
+                    logger.warning(f"Lost the lock on {work_item.hash} to another worker")
+                    return
+            except Exception as e:
+                # Try again on the next beat, the lease has room for a few missed ones
+                logger.warning(f"Failed to renew the lock on {work_item.hash}: {e}")
+
     @abc.abstractmethod
     async def mark_done(self, work_item: WorkItem) -> None:
         """
@@ -99,6 +330,50 @@ class WorkQueue(abc.ABC):
         """Get current size of work queue"""
         pass
 
+    def _start_shards(self, shards: List[ShardInfo]) -> None:
+        """Resets the queue to go through these shards, in random order so that workers start on different parts of the index"""
+        shards = list(shards)
+        random.shuffle(shards)
+        # The legacy index doesn't know its size up front, so it is loaded first, for size to count it from the start
+        shards.sort(key=lambda shard: shard.name != LEGACY_INDEX_NAME)
+        self._pending_shards = shards
+        self._queue = asyncio.Queue()
+
+    async def _load_next_shard(self) -> bool:
+        """
+        Queues the work items of the next shard that aren't done yet, in random order. With longest_first scheduling, the
+        largest work items need to go first across the whole index, so every shard gets loaded at once, sorted by pages.
+
+        Returns:
+            False once every shard has been loaded, True otherwise
+        """
+        while self._pending_shards:
+            num_shards = len(self._pending_shards) if self.scheduling == "longest_first" else 1
+            shards, self._pending_shards = self._pending_shards[:num_shards], self._pending_shards[num_shards:]
+
+            remaining_items = []
+            for shard in shards:
+                items = await asyncio.to_thread(self._index.load_shard, shard)
+                remaining_items.extend(
+                    WorkItem(hash=work_hash, work_paths=paths, num_pages=sum(page_counts))
+                    for work_hash, paths, page_counts in items
+                    if work_hash not in self._done_hashes
+                )
+
+            random.shuffle(remaining_items)
+            if self.scheduling == "longest_first":
+                # The sort is stable, so work items of the same size stay in random order
+                remaining_items.sort(key=lambda item: -item.num_pages)
+            for item in remaining_items:
+                self._queue.put_nowait(item)
+
+            if remaining_items:
+                return True
+        return False
+
+    def _unloaded_size(self) -> int:
+        return sum(shard.num_items for shard in self._pending_shards)
+
     @staticmethod
     def _compute_workgroup_hash(work_paths: List[str]) -> str:
         """
@@ -115,51 +390,55 @@ class WorkQueue(abc.ABC):
             sha1.update(path.encode("utf-8"))
         return sha1.hexdigest()
 
+    @staticmethod
+    def _existing_paths(existing_groups: Dict[str, List[str]]) -> set:
+        """Paths already in the index, counting a document that was split into page ranges as present"""
+        return {parse_page_range_work_path(path)[0] for paths in existing_groups.values() for path in paths}
+
+    @classmethod
+    def _build_work_groups(
+        cls,
+        new_paths: set,
+        items_per_group: int,
+        page_counts: Optional[Dict[str, int]] = None,
+        max_pages_per_unit: int = 0,
+        pages_per_group: int = 0,
+    ) -> List[IndexItem]:
+        """
+        Groups new paths into (hash, paths, page counts) work items. Any path with more than max_pages_per_unit pages
+        is split into page ranges, each of which becomes a work item of its own.
 
-# --------------------------------------------------------------------------------------
-# Local Helpers for reading/writing the index CSV (compressed with zstd) to disk
-# --------------------------------------------------------------------------------------
-
-try:
-    import zstandard
-except ImportError:
-    zstandard = None
-
-
-def download_zstd_csv_local(local_path: str) -> List[str]:
-    """
-    Download a zstd-compressed CSV from a local path.
-    If the file doesn't exist, returns an empty list.
-    """
-    if not os.path.exists(local_path):
-        return []
-
-    if not zstandard:
-        raise RuntimeError("zstandard package is required for local zstd CSV operations.")
-
-    with open(local_path, "rb") as f:
-        dctx = zstandard.ZstdDecompressor()
-        data = dctx.decompress(f.read())
-    lines = data.decode("utf-8").splitlines()
-    return lines
-
+        With pages_per_group, paths with a known page count are bin packed into work items of about that many pages,
+        and the rest are grouped by the average page count of those. Otherwise work items get items_per_group paths each.
+        """
+        page_counts = page_counts or {}
+        new_groups = []
+        packed_page_counts = {}
+        unpacked_paths = []
+        for path in sorted(new_paths):
+            num_pages = page_counts.get(path, 0)
+            if max_pages_per_unit > 0 and num_pages > max_pages_per_unit:
+                for first_page, last_page in split_page_ranges(num_pages, max_pages_per_unit):
+                    # The last range runs to the end of the document, in case that holds more pages than were counted here
+                    unit = [page_range_work_path(path, first_page, last_page if last_page < num_pages else None)]
+                    new_groups.append((cls._compute_workgroup_hash(unit), unit, [last_page - first_page + 1]))
+            elif pages_per_group > 0 and num_pages > 0:
+                packed_page_counts[path] = num_pages
+            else:
+                unpacked_paths.append(path)
 
-def upload_zstd_csv_local(local_path: str, lines: List[str]) -> None:
-    """
-    Upload a zstd-compressed CSV to a local path.
-    """
-    if not zstandard:
-        raise RuntimeError("zstandard package is required for local zstd CSV operations.")
+        for group in pack_by_pages(packed_page_counts, pages_per_group):
+            new_groups.append((cls._compute_workgroup_hash(group), group, [packed_page_counts[path] for path in group]))
 
-    data = "\n".join(lines).encode("utf-8")
-    cctx = zstandard.ZstdCompressor()
-    compressed_data = cctx.compress(data)
+        if packed_page_counts:
+            avg_pages_per_path = sum(packed_page_counts.values()) / len(packed_page_counts)
+            items_per_group = max(1, int(pages_per_group / avg_pages_per_path))
 
-    # Ensure parent directories exist
-    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        for i in range(0, len(unpacked_paths), items_per_group):
+            group = unpacked_paths[i : i + items_per_group]
+            new_groups.append((cls._compute_workgroup_hash(group), group, [page_counts.get(path, 0) for path in group]))
 
-    with open(local_path, "wb") as f:
-        f.write(compressed_data)
+        return new_groups
 
 
 # --------------------------------------------------------------------------------------
@@ -174,19 +453,24 @@ class LocalWorkQueue(WorkQueue):
     and completed results for persistent resumption across process restarts.
     """
 
-    def __init__(self, workspace_path: str):
+    def __init__(self, workspace_path: str, scheduling: str = "random", straggler_factor: float = 0.0):
         """
         Initialize the local work queue.
 
         Args:
             workspace_path: Local directory path where the queue index,
                             results, and locks are stored.
+            scheduling: Order to hand out work items in, one of SCHEDULING_POLICIES
+            straggler_factor: Once the queue is empty, hand out copies of work items held this many times longer than the median, 0 never does
         """
+        super().__init__(scheduling, straggler_factor)
         self.workspace_path = os.path.abspath(workspace_path)
         os.makedirs(self.workspace_path, exist_ok=True)
 
-        # Local index file (compressed)
-        self._index_path = os.path.join(self.workspace_path, "work_index_list.csv.zstd")
+        # Sharded index of all work items
+        self._index = WorkIndex(self.workspace_path)
+        self._pending_shards: List[ShardInfo] = []
+        self._done_hashes: set = set()
 
         # Output directory for completed tasks
         self._results_dir = os.path.join(self.workspace_path, "results")
@@ -199,107 +483,115 @@ class LocalWorkQueue(WorkQueue):
         # Internal queue
         self._queue: Queue[Any] = Queue()
 
-    async def populate_queue(self, work_paths: List[str], items_per_group: int) -> None:
-        """
-        Add new items to the work queue (local version).
-
-        Args:
-            work_paths: Each individual path (local in this context)
-                           that we will process over
-            items_per_group: Number of items to group together in a single work item
-        """
-        # Treat them as local paths, but keep variable name for consistency
-        all_paths = set(work_paths)
-        logger.info(f"Found {len(all_paths):,} total paths")
-
-        # Load existing work groups from local index
-        existing_lines = await asyncio.to_thread(download_zstd_csv_local, self._index_path)
-        existing_groups = {}
-        for line in existing_lines:
-            if line.strip():
-                parts = line.strip().split(",")
-                group_hash = parts[0]
-                group_paths = parts[1:]
-                existing_groups[group_hash] = group_paths
-
-        existing_path_set = {p for paths in existing_groups.values() for p in paths}
-        new_paths = all_paths - existing_path_set
-        logger.info(f"{len(new_paths):,} new paths to add to the workspace")
-
-        if not new_paths:
-            return
-
-        # Create new work groups
-        new_groups = []
-        current_group = []
-        for path in sorted(new_paths):
-            current_group.append(path)
-            if len(current_group) == items_per_group:
-                group_hash = self._compute_workgroup_hash(current_group)
-                new_groups.append((group_hash, current_group))
-                current_group = []
-        if current_group:
-            group_hash = self._compute_workgroup_hash(current_group)
-            new_groups.append((group_hash, current_group))
-
-        logger.info(f"Created {len(new_groups):,} new work groups")
-
-        # Combine and save updated work groups
-        combined_groups = existing_groups.copy()
-        for group_hash, group_paths in new_groups:
-            combined_groups[group_hash] = group_paths
-
-        combined_lines = [",".join([group_hash] + group_paths) for group_hash, group_paths in combined_groups.items()]
-
-        if new_groups:
-            # Write the combined data back to disk in zstd CSV format
-            await asyncio.to_thread(upload_zstd_csv_local, self._index_path, combined_lines)
+        # Written into each lock file, so that a lock can be told apart from another worker's
+        self.worker_id = worker_identity()
 
     async def initialize_queue(self) -> None:
         """
-        Load the work queue from the local index file and initialize it for processing.
-        Removes already completed work items and randomizes the order.
+        Initialize the work queue from the local index for processing. Shards of the index are loaded one at a time,
+        as the queue runs dry, with already completed work items removed and the order randomized.
         """
-        # 1) Read the index
-        work_queue_lines = await asyncio.to_thread(download_zstd_csv_local, self._index_path)
-        work_queue = {parts[0]: parts[1:] for line in work_queue_lines if (parts := line.strip().split(",")) and line.strip()}
-
-        # 2) Determine which items are completed by scanning local results/*.jsonl
+        # 1) Determine which items are completed by scanning local results/*.jsonl (or *.jsonl.zst)
         if not os.path.isdir(self._results_dir):
             os.makedirs(self._results_dir, exist_ok=True)
-        done_work_items = [f for f in os.listdir(self._results_dir) if f.startswith("output_") and f.endswith(".jsonl")]
-        done_work_hashes = {fn[len("output_") : -len(".jsonl")] for fn in done_work_items}
+        self._done_hashes = {work_hash for fn in os.listdir(self._results_dir) if (work_hash := work_hash_from_result_filename(fn))}
 
-        # 3) Filter out completed items
-        remaining_work_hashes = set(work_queue) - done_work_hashes
-        remaining_items = [WorkItem(hash=hash_, work_paths=work_queue[hash_]) for hash_ in remaining_work_hashes]
-        random.shuffle(remaining_items)
-
-        # 4) Initialize our in-memory queue
-        self._queue = asyncio.Queue()
-        for item in remaining_items:
-            await self._queue.put(item)
+        # 2) Queue up the first shard of the index
+        shards = await asyncio.to_thread(self._index.shards)
+        self._start_shards(shards)
+        await self._load_next_shard()
 
-        logger.info(f"Initialized local queue with {self._queue.qsize()} work items")
+        logger.info(f"Initialized local queue with {self.size} work items from {len(shards)} index shards")
 
     async def is_completed(self, work_hash: str) -> bool:
         """
         Check if a work item has been completed locally by seeing if
-        output_{work_hash}.jsonl is present in the results directory.
+        output_{work_hash}.jsonl, or its compressed version, is present in the results directory.
 
         Args:
             work_hash: Hash of the work item to check
         """
-        output_file = os.path.join(self._results_dir, f"output_{work_hash}.jsonl")
-        return os.path.exists(output_file)
+        return any(os.path.exists(os.path.join(self._results_dir, result_filename(work_hash, compression))) for compression in RESULT_SUFFIXES)
+
+    def _lock_file(self, work_hash: str) -> str:
+        return os.path.join(self._locks_dir, f"output_{work_hash}.jsonl")
+
+    def _speculation_marker(self, work_hash: str) -> str:
+        # Whoever creates this is the one worker that takes a copy of the work item, the name doesn't end in .jsonl, so it is never mistaken for a lock
+        return self._lock_file(work_hash) + ".speculative"
+
+    def _lock_body(self, work_item: WorkItem) -> bytes:
+        # Renewals only touch the lock file, so its time stays the time the work item was claimed. The work paths let
+        # an idle worker take a copy of the item if it straggles.
+        return json.dumps(
+            {
+                "worker": self.worker_id,
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "work_paths": work_item.work_paths,
+                "num_pages": work_item.num_pages,
+            }
+        ).encode("utf-8")
+
+    def _is_stale(self, lock_file: str, worker_lock_timeout_secs: int) -> bool:
+        mtime = datetime.datetime.fromtimestamp(os.path.getmtime(lock_file), datetime.timezone.utc)
+        return (datetime.datetime.now(datetime.timezone.utc) - mtime).total_seconds() > worker_lock_timeout_secs
+
+    def _create_exclusive(self, path: str, body: bytes) -> bool:
+        # O_EXCL makes creating the file atomic, only one worker can create a given lock file
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        return True
+
+    def _create_lock(self, lock_file: str, work_item: WorkItem) -> bool:
+        if not self._create_exclusive(lock_file, self._lock_body(work_item)):
+            return False
+        self._claimed_at[work_item.hash] = time.time()
+        return True
+
+    def _try_lock(self, work_item: WorkItem, worker_lock_timeout_secs: int) -> bool:
+        work_hash = work_item.hash
+        lock_file = self._lock_file(work_hash)
+        if self._create_lock(lock_file, work_item):
+            return True
+
+        try:
+            if not self._is_stale(lock_file, worker_lock_timeout_secs):
+                logger.debug(f"Work item {work_hash} is locked by another worker, skipping")
+                return False
+
+            # Move the stale lock out of the way under a name of our own, which only one of the workers racing for it can do
+            moved_lock_file = f"{lock_file}.{self.worker_id}.stale"
+            os.rename(lock_file, moved_lock_file)
+        except FileNotFoundError:
+            # The lock went away while we looked at it, so leave this item to whoever is faster
+            return False
+
+        if not self._is_stale(moved_lock_file, worker_lock_timeout_secs):
+            # Another worker took over the stale lock between our check and the rename, so give its lock back. Linking it back fails,
+            # rather than overwriting, if yet another worker created a fresh lock in the meantime, which then wins, and the worker whose
+            # lock we moved finds out on its next renewal
+            try:
+                os.link(moved_lock_file, lock_file)
+            except FileExistsError:
+                pass
+            os.remove(moved_lock_file)
+            return False
+
+        os.remove(moved_lock_file)
+        logger.debug(f"Found stale lock for {work_hash}, taking work item")
+        return self._create_lock(lock_file, work_item)
 
-    async def get_work(self, worker_lock_timeout_secs: int = 1800) -> Optional[WorkItem]:
+    async def get_work(self, worker_lock_timeout_secs: int = WORKER_LOCK_LEASE_SECS) -> Optional[WorkItem]:
         """
         Get the next available work item that isn't completed or locked.
 
         Args:
-            worker_lock_timeout_secs: Number of seconds before considering
-                                      a worker lock stale (default 30 mins)
+            worker_lock_timeout_secs: Number of seconds without a heartbeat before
+                                      considering a worker lock stale (default 5 mins)
 
         Returns:
             WorkItem if work is available, None if queue is empty
@@ -308,7 +600,9 @@ class LocalWorkQueue(WorkQueue):
             try:
                 work_item = self._queue.get_nowait()
             except asyncio.QueueEmpty:
-                return None
+                if await self._load_next_shard():
+                    continue
+                return await self._wait_for_straggler(worker_lock_timeout_secs)
 
             # Check if work is already completed
             if await self.is_completed(work_item.hash):
@@ -316,50 +610,318 @@ class LocalWorkQueue(WorkQueue):
                 self._queue.task_done()
                 continue
 
-            # Check for worker lock
-            lock_file = os.path.join(self._locks_dir, f"output_{work_item.hash}.jsonl")
-            if os.path.exists(lock_file):
-                # Check modification time
-                mtime = datetime.datetime.fromtimestamp(os.path.getmtime(lock_file), datetime.timezone.utc)
-                if (datetime.datetime.now(datetime.timezone.utc) - mtime).total_seconds() > worker_lock_timeout_secs:
-                    # Lock is stale, we can take this work
-                    logger.debug(f"Found stale lock for {work_item.hash}, taking work item")
-                else:
-                    # Lock is active, skip this work
-                    logger.debug(f"Work item {work_item.hash} is locked by another worker, skipping")
-                    self._queue.task_done()
-                    continue
-
-            # Create our lock file (touch an empty file)
             try:
-                with open(lock_file, "wb") as f:
-                    f.write(b"")
+                locked = self._try_lock(work_item, worker_lock_timeout_secs)
             except Exception as e:
                 logger.warning(f"Failed to create lock file for {work_item.hash}: {e}")
+                locked = False
+
+            if not locked:
                 self._queue.task_done()
                 continue
 
             return work_item
 
+    async def renew_lock(self, work_item: WorkItem) -> bool:
+        """
+        Extend the lease on a work item by touching its lock file, as long as the lock is still ours.
+
+        Args:
+            work_item: The WorkItem to renew the lock of
+        """
+        lock_file = self._lock_file(work_item.hash)
+        try:
+            with open(lock_file, "rb") as f:
+                holder = json.loads(f.read() or b"{}").get("worker")
+        except FileNotFoundError:
+            return False
+
+        if holder != self.worker_id:
+            return False
+
+        os.utime(lock_file)
+        return True
+
+    def _scan_for_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        others_working = False
+        for name in sorted(os.listdir(self._locks_dir)):
+            if not (name.startswith("output_") and name.endswith(".jsonl")):
+                continue
+            work_hash = name[len("output_") : -len(".jsonl")]
+            lock_file = os.path.join(self._locks_dir, name)
+            try:
+                if self._is_stale(lock_file, worker_lock_timeout_secs) or os.path.exists(self._speculation_marker(work_hash)):
+                    continue
+                with open(lock_file, "rb") as f:
+                    lock = json.loads(f.read())
+            except (FileNotFoundError, ValueError):
+                continue
+
+            # Locks written before they carried the work paths can't be copied
+            if lock.get("worker") == self.worker_id or "work_paths" not in lock:
+                continue
+
+            others_working = True
+            if (now - datetime.datetime.fromisoformat(lock["time"])).total_seconds() < threshold_secs:
+                continue
+            if self._create_exclusive(self._speculation_marker(work_hash), self.worker_id.encode("utf-8")):
+                return WorkItem(hash=work_hash, work_paths=lock["work_paths"], num_pages=lock.get("num_pages", 0), speculative=True), True
+
+        return None, others_working
+
     async def mark_done(self, work_item: WorkItem) -> None:
         """
-        Mark a work item as done by removing its lock file.
+        Mark a work item as done by removing its lock file, or for a copy of a straggler, the marker of the copy.
 
         Args:
             work_item: The WorkItem to mark as done
         """
-        lock_file = os.path.join(self._locks_dir, f"output_{work_item.hash}.jsonl")
+        lock_file = self._speculation_marker(work_item.hash) if work_item.speculative else self._lock_file(work_item.hash)
         if os.path.exists(lock_file):
             try:
                 os.remove(lock_file)
             except Exception as e:
                 logger.warning(f"Failed to delete lock file for {work_item.hash}: {e}")
-        self._queue.task_done()
+        self._done_hashes.add(work_item.hash)
+        self._record_done(work_item)
+        # Copies of stragglers never came out of the internal queue
+        if not work_item.speculative:
+            self._queue.task_done()
 
     @property
     def size(self) -> int:
-        """Get current size of local work queue"""
-        return self._queue.qsize()
+        """Get current size of local work queue, counting the shards that aren't loaded yet"""
+        return self._queue.qsize() + self._unloaded_size()
+
+
+# --------------------------------------------------------------------------------------
+# SqliteWorkQueue Implementation
+# --------------------------------------------------------------------------------------
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    A local WorkQueue that any number of processes on the same machine can share, such as one pipeline per GPU, backed by
+    a SQLite database in WAL mode in the workspace.
+
+    The work index is imported into the database a shard at a time, in a shared random order, which longest_first scheduling
+    overrides with the largest work items first. A worker claims a work item
+    with a single UPDATE, which gives it a lease that expires unless renewed, and so no two processes ever hold the same
+    item. Finished items are marked done in the database, so nothing needs to list results/ or the lock files, except to
+    pick up the results of a workspace that was run before the database existed.
+
+    SQLite locking relies on the filesystem, so the workspace has to be on a local disk, not a network share.
+    """
+
+    def __init__(self, workspace_path: str, scheduling: str = "random", straggler_factor: float = 0.0):
+        """
+        Initialize the SQLite work queue.
+
+        Args:
+            workspace_path: Local directory path where the queue index, database and results are stored.
+            scheduling: Order to hand out work items in, one of SCHEDULING_POLICIES
+            straggler_factor: Once the queue is empty, hand out copies of work items held this many times longer than the median, 0 never does
+        """
+        super().__init__(scheduling, straggler_factor)
+        self.workspace_path = os.path.abspath(workspace_path)
+        self._results_dir = os.path.join(self.workspace_path, "results")
+        os.makedirs(self._results_dir, exist_ok=True)
+
+        self._index = WorkIndex(self.workspace_path)
+        self.db_path = os.path.join(self.workspace_path, SQLITE_QUEUE_NAME)
+        self.worker_id = worker_identity()
+
+        # Renewals extend the lease by as much as the last claim got
+        self._lease_secs = WORKER_LOCK_LEASE_SECS
+
+        # Work items not done yet, counted again by every operation that goes to the database anyways, so reading size never blocks the event loop
+        self._size = 0
+
+        # One connection per queue, which asyncio.to_thread calls from different threads, one at a time
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    hash TEXT PRIMARY KEY,
+                    work_paths TEXT NOT NULL,
+                    num_pages INTEGER NOT NULL,
+                    position REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    claimed_at REAL,
+                    speculative_worker TEXT
+                )
+                """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_todo ON items (done, position)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS items_longest_first ON items (done, num_pages DESC, position)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS imported_shards (name TEXT PRIMARY KEY)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        # Rows are fetched under the lock too, a statement holds on to its transaction until all of its rows are read
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _count_remaining(self) -> None:
+        # Other processes finish work items too, so this counts the database rather than keeping track of this queue's own
+        self._size = self._execute("SELECT COUNT(*) FROM items WHERE done = 0")[0][0]
+
+    def _import_shards(self) -> int:
+        """Adds the work items of index shards that aren't in the database yet. Returns the number of shards imported."""
+        shards = self._index.shards()
+        imported = {name for (name,) in self._execute("SELECT name FROM imported_shards")}
+        new_shards = [shard for shard in shards if shard.name not in imported]
+        if not new_shards:
+            self._count_remaining()
+            return 0
+
+        # Workspaces that were run before the database existed already have results for some items
+        done_hashes = {work_hash for fn in os.listdir(self._results_dir) if (work_hash := work_hash_from_result_filename(fn))}
+
+        for shard in new_shards:
+            rows = [
+                (work_hash, json.dumps(paths), sum(page_counts), random.random(), int(work_hash in done_hashes))
+                for work_hash, paths, page_counts in self._index.load_shard(shard)
+            ]
+            with self._db_lock:
+                # Another process may be importing the same shard, the primary keys keep that from adding anything twice
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.executemany("INSERT OR IGNORE INTO items (hash, work_paths, num_pages, position, done) VALUES (?, ?, ?, ?, ?)", rows)
+                    self._db.execute("INSERT OR IGNORE INTO imported_shards (name) VALUES (?)", (shard.name,))
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+
+        self._count_remaining()
+        return len(new_shards)
+
+    async def initialize_queue(self) -> None:
+        """
+        Import any index shards that are new since the last run into the database.
+        """
+        num_imported = await asyncio.to_thread(self._import_shards)
+        logger.info(f"Initialized SQLite queue with {self.size} work items, {num_imported} new index shards")
+
+    async def is_completed(self, work_hash: str) -> bool:
+        """
+        Check if a work item has been completed, by the database or by its output file in the results directory.
+
+        Args:
+            work_hash: Hash of the work item to check
+        """
+        rows = await asyncio.to_thread(self._execute, "SELECT done FROM items WHERE hash = ?", (work_hash,))
+        if rows and rows[0][0]:
+            return True
+        return any(os.path.exists(os.path.join(self._results_dir, result_filename(work_hash, compression))) for compression in RESULT_SUFFIXES)
+
+    def _claim(self, worker_lock_timeout_secs: int) -> Optional[WorkItem]:
+        now = time.time()
+        order = "num_pages DESC, position" if self.scheduling == "longest_first" else "position"
+        # One statement both finds and leases the item, so no other process can claim it in between
+        rows = self._execute(
+            f"""
+            UPDATE items SET worker = ?, lease_expires = ?, claimed_at = ?, speculative_worker = NULL
+            WHERE hash = (
+                SELECT hash FROM items WHERE done = 0 AND (lease_expires IS NULL OR lease_expires < ?) ORDER BY {order} LIMIT 1
+            )
+            RETURNING hash, work_paths, num_pages
+            """,
+            (self.worker_id, now + worker_lock_timeout_secs, now, now),
+        )
+        self._count_remaining()
+        if not rows:
+            return None
+        work_hash, work_paths, num_pages = rows[0]
+        self._claimed_at[work_hash] = now
+        return WorkItem(hash=work_hash, work_paths=json.loads(work_paths), num_pages=num_pages)
+
+    async def get_work(self, worker_lock_timeout_secs: int = WORKER_LOCK_LEASE_SECS) -> Optional[WorkItem]:
+        """
+        Claim the next work item that isn't completed, and isn't leased to another worker.
+
+        Args:
+            worker_lock_timeout_secs: Length of the lease, after which the item goes to another worker unless renewed (default 5 mins)
+
+        Returns:
+            WorkItem if work is available, None if queue is empty
+        """
+        self._lease_secs = worker_lock_timeout_secs
+        while True:
+            work_item = await asyncio.to_thread(self._claim, worker_lock_timeout_secs)
+            if work_item is None:
+                return await self._wait_for_straggler(worker_lock_timeout_secs)
+
+            # A worker that died between committing its output and marking the item done leaves it claimable
+            if await self.is_completed(work_item.hash):
+                logger.debug(f"Work item {work_item.hash} already completed, skipping")
+                self._claimed_at.pop(work_item.hash, None)
+                await self.mark_done(work_item)
+                continue
+
+            return work_item
+
+    async def renew_lock(self, work_item: WorkItem) -> bool:
+        """
+        Extend the lease on a work item, as long as it is still leased to this worker.
+
+        Args:
+            work_item: The WorkItem to renew the lock of
+        """
+        rows = await asyncio.to_thread(
+            self._execute,
+            "UPDATE items SET lease_expires = ? WHERE hash = ? AND worker = ? AND done = 0 RETURNING hash",
+            (time.time() + self._lease_secs, work_item.hash, self.worker_id),
+        )
+        return len(rows) == 1
+
+    def _scan_for_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        now = time.time()
+        # Like claiming, one statement both finds the straggler and records this worker as the one with its copy
+        rows = self._execute(
+            """
+            UPDATE items SET speculative_worker = ?
+            WHERE hash = (
+                SELECT hash FROM items
+                WHERE done = 0 AND lease_expires >= ? AND worker != ? AND speculative_worker IS NULL AND claimed_at < ?
+                ORDER BY claimed_at LIMIT 1
+            )
+            RETURNING hash, work_paths, num_pages
+            """,
+            (self.worker_id, now, self.worker_id, now - threshold_secs),
+        )
+        if rows:
+            work_hash, work_paths, num_pages = rows[0]
+            return WorkItem(hash=work_hash, work_paths=json.loads(work_paths), num_pages=num_pages, speculative=True), True
+
+        (num_others,) = self._execute(
+            "SELECT COUNT(*) FROM items WHERE done = 0 AND lease_expires >= ? AND worker != ? AND speculative_worker IS NULL", (now, self.worker_id)
+        )[0]
+        return None, num_others > 0
+
+    async def mark_done(self, work_item: WorkItem) -> None:
+        """
+        Mark a work item as done in the database.
+
+        Args:
+            work_item: The WorkItem to mark as done
+        """
+        await asyncio.to_thread(self._mark_done, work_item.hash)
+        self._record_done(work_item)
+
+    def _mark_done(self, work_hash: str) -> None:
+        self._execute("UPDATE items SET done = 1, worker = NULL, lease_expires = NULL WHERE hash = ?", (work_hash,))
+        self._count_remaining()
+
+    @property
+    def size(self) -> int:
+        """Get the number of work items that aren't done, including those leased to a worker, as of the last operation on the queue"""
+        return self._size
 
 
 # --------------------------------------------------------------------------------------
@@ -374,123 +936,86 @@ class S3WorkQueue(WorkQueue):
     that should be processed together.
 
     Each work item gets a hash, and completed work items will have their results
-    stored in s3://workspace_path/results/output_[hash].jsonl
+    stored in s3://workspace_path/results/output_[hash].jsonl, or output_[hash].jsonl.zst if compressed
 
     This is the ground source of truth about which work items are done.
 
-    When a worker takes an item off the queue, it will write an empty s3 file to
+    When a worker takes an item off the queue, it will write a lock file naming the worker to
     s3://workspace_path/worker_locks/output_[hash].jsonl
+    with a conditional put, so only one worker can create it, and rewrite it every minute or so while it works on the item.
 
     The queue gets randomized on each worker, so workers pull random work items to operate on.
     As you pull an item, we will check to see if it has been completed. If yes,
-    then it will immediately fetch the next item. If a lock file was created within a configurable
-    timeout (30 mins by default), then that work item is also skipped.
+    then it will immediately fetch the next item. If a lock file was written within a configurable
+    lease timeout (5 mins by default), then that work item is also skipped. A stale lock is taken over
+    with a put that is conditional on its ETag, so only one of the workers racing for it wins.
+
+    Those checks are made against a local view of which items are done and locked, built by listing
+    results/ and worker_locks/, and refreshed in the background every status_refresh_interval seconds.
+    Only the item that is about to be taken gets a request of its own, the conditional put of its lock.
 
     The lock will will be deleted once the worker is done with that item.
     """
 
-    def __init__(self, s3_client, workspace_path: str):
+    def __init__(
+        self,
+        s3_client,
+        workspace_path: str,
+        status_refresh_interval: float = STATUS_REFRESH_INTERVAL,
+        scheduling: str = "random",
+        straggler_factor: float = 0.0,
+        storage: Optional[AsyncStorage] = None,
+    ):
         """
         Initialize the work queue.
 
         Args:
             s3_client: Boto3 S3 client to use for operations
             workspace_path: S3 path where work queue and results are stored
+            status_refresh_interval: Seconds between listings of results/ and worker_locks/
+            scheduling: Order to hand out work items in, one of SCHEDULING_POLICIES
+            straggler_factor: Once the queue is empty, hand out copies of work items held this many times longer than the median, 0 never does
+            storage: AsyncStorage of s3_client for the requests of the queue, shared with the rest of the pipeline, one of its own by default
         """
+        super().__init__(scheduling, straggler_factor)
         self.s3_client = s3_client
+        self.storage = storage if storage is not None else AsyncStorage(s3_client)
         self.workspace_path = workspace_path.rstrip("/")
+        self.status_refresh_interval = status_refresh_interval
 
-        self._index_path = os.path.join(self.workspace_path, "work_index_list.csv.zstd")
-        self._output_glob = os.path.join(self.workspace_path, "results", "*.jsonl")
+        self._index = WorkIndex(self.workspace_path, s3_client)
+        self._pending_shards: List[ShardInfo] = []
+        self._results_prefix = os.path.join(self.workspace_path, "results", "output_")
+        self._locks_prefix = os.path.join(self.workspace_path, "worker_locks", "output_")
         self._queue: Queue[Any] = Queue()
 
-    async def populate_queue(self, work_paths: List[str], items_per_group: int) -> None:
-        """
-        Add new items to the work queue.
-
-        Args:
-            work_paths: Each individual s3 path that we will process over
-            items_per_group: Number of items to group together in a single work item
-        """
-        all_paths = set(work_paths)
-        logger.info(f"Found {len(all_paths):,} total paths")
+        # Local view of the workspace, as of the last listing
+        self._done_hashes: set = set()
+        self._lock_times: Dict[str, datetime.datetime] = {}
+        self._speculated_hashes: set = set()
+        self._status_listed_at: Optional[float] = None
+        self._status_listing_secs = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
 
-        # Load existing work groups
-        existing_lines = await asyncio.to_thread(download_zstd_csv, self.s3_client, self._index_path)
-        existing_groups = {}
-        for line in existing_lines:
-            if line.strip():
-                parts = line.strip().split(",")
-                group_hash = parts[0]
-                group_paths = parts[1:]
-                existing_groups[group_hash] = group_paths
+        # Written into each lock file, and the ETag of each lock this worker holds, which renewals are conditional on
+        self.worker_id = worker_identity()
+        self._lock_etags: Dict[str, str] = {}
 
-        existing_path_set = {path for paths in existing_groups.values() for path in paths}
-
-        # Find new paths to process
-        new_paths = all_paths - existing_path_set
-        logger.info(f"{len(new_paths):,} new paths to add to the workspace")
-
-        if not new_paths:
-            return
-
-        # Create new work groups
-        new_groups = []
-        current_group = []
-        for path in sorted(new_paths):
-            current_group.append(path)
-            if len(current_group) == items_per_group:
-                group_hash = self._compute_workgroup_hash(current_group)
-                new_groups.append((group_hash, current_group))
-                current_group = []
-        if current_group:
-            group_hash = self._compute_workgroup_hash(current_group)
-            new_groups.append((group_hash, current_group))
-
-        logger.info(f"Created {len(new_groups):,} new work groups")
-
-        # Combine and save updated work groups
-        combined_groups = existing_groups.copy()
-        for group_hash, group_paths in new_groups:
-            combined_groups[group_hash] = group_paths
-
-        combined_lines = [",".join([group_hash] + group_paths) for group_hash, group_paths in combined_groups.items()]
-
-        if new_groups:
-            await asyncio.to_thread(upload_zstd_csv, self.s3_client, self._index_path, combined_lines)
+        # The contents of other workers' locks, which only change when a lock is taken over, for finding stragglers
+        self._other_locks: Dict[str, dict] = {}
 
     async def initialize_queue(self) -> None:
         """
-        Load the work queue from S3 and initialize it for processing.
-        Removes already completed work items and randomizes the order.
+        Initialize the work queue from the index on S3 for processing. Shards of the index are loaded one at a time,
+        as the queue runs dry, with already completed work items removed and the order randomized.
         """
-        # Load work items and completed items in parallel
-        download_task = asyncio.to_thread(download_zstd_csv, self.s3_client, self._index_path)
-        expand_task = asyncio.to_thread(expand_s3_glob, self.s3_client, self._output_glob)
-
-        work_queue_lines, done_work_items = await asyncio.gather(download_task, expand_task)
+        # List the shards and the status of the workspace in parallel
+        shards, _ = await asyncio.gather(asyncio.to_thread(self._index.shards), self.refresh_status())
 
-        # Process work queue lines
-        work_queue = {parts[0]: parts[1:] for line in work_queue_lines if (parts := line.strip().split(",")) and line.strip()}
+        self._start_shards(shards)
+        await self._load_next_shard()
 
-        # Get set of completed work hashes
-        done_work_hashes = {
-            os.path.basename(item)[len("output_") : -len(".jsonl")]
-            for item in done_work_items
-            if os.path.basename(item).startswith("output_") and os.path.basename(item).endswith(".jsonl")
-        }
-
-        # Find remaining work and shuffle
-        remaining_work_hashes = set(work_queue) - done_work_hashes
-        remaining_items = [WorkItem(hash=hash_, work_paths=work_queue[hash_]) for hash_ in remaining_work_hashes]
-        random.shuffle(remaining_items)
-
-        # Initialize queue
-        self._queue = asyncio.Queue()
-        for item in remaining_items:
-            await self._queue.put(item)
-
-        logger.info(f"Initialized queue with {self._queue.qsize()} work items")
+        logger.info(f"Initialized queue with {self.size} work items from {len(shards)} index shards")
 
     async def is_completed(self, work_hash: str) -> bool:
         """
@@ -502,87 +1027,404 @@ class S3WorkQueue(WorkQueue):
         Returns:
             True if the work is completed, False otherwise
         """
-        output_s3_path = os.path.join(self.workspace_path, "results", f"output_{work_hash}.jsonl")
-        bucket, key = parse_s3_path(output_s3_path)
+        # output_[hash].jsonl is a prefix of every result suffix, so a single listing finds the result however it was compressed
+        output_s3_prefix = os.path.join(self.workspace_path, "results", result_filename(work_hash))
+        bucket, prefix = parse_s3_path(output_s3_prefix)
+
+        response = await self.storage.call("list_objects_v2", Bucket=bucket, Prefix=prefix, MaxKeys=len(RESULT_SUFFIXES) + 1)
+        return any(work_hash_from_result_filename(obj["Key"]) == work_hash for obj in response.get("Contents", []))
 
+    async def _list_objects(self, s3_prefix: str) -> List[dict]:
+        bucket, prefix = parse_s3_path(s3_prefix)
+        objects = []
+        kwargs = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            response = await self.storage.call("list_objects_v2", **kwargs)
+            objects.extend(response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return objects
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def refresh_status(self) -> None:
+        """Rebuilds the local view of which work items are done and locked, from a listing of results/ and worker_locks/"""
+        start = time.monotonic()
+        results, locks = await asyncio.gather(self._list_objects(self._results_prefix), self._list_objects(self._locks_prefix))
+
+        self._done_hashes = {work_hash for obj in results if (work_hash := work_hash_from_result_filename(obj["Key"]))}
+        self._lock_times = {
+            os.path.basename(obj["Key"])[len("output_") : -len(".jsonl")]: obj["LastModified"] for obj in locks if obj["Key"].endswith(".jsonl")
+        }
+        self._speculated_hashes = {
+            os.path.basename(obj["Key"])[len("output_") : -len(".jsonl.speculative")] for obj in locks if obj["Key"].endswith(".jsonl.speculative")
+        }
+        self._status_listed_at = time.monotonic()
+        self._status_listing_secs = self._status_listed_at - start
+        logger.debug(f"Listed {len(self._done_hashes):,} done and {len(self._lock_times):,} locked work items in {self._status_listing_secs:.1f}s")
+
+    async def _refresh_status_in_background(self) -> None:
+        try:
+            await self.refresh_status()
+        except Exception as e:
+            # Keep working from the old view, and try again after another interval
+            logger.warning(f"Failed to refresh the work queue status: {e}")
+            self._status_listed_at = time.monotonic()
+
+    def _maybe_start_refresh(self) -> None:
+        # Listings of a huge workspace take a while, so never spend more than a small fraction of the time listing
+        interval = max(self.status_refresh_interval, STATUS_REFRESH_COST_FACTOR * self._status_listing_secs)
+        if (self._refresh_task is None or self._refresh_task.done()) and time.monotonic() - self._status_listed_at > interval:
+            self._refresh_task = asyncio.create_task(self._refresh_status_in_background())
+
+    def _lock_key(self, work_hash: str) -> Tuple[str, str]:
+        return parse_s3_path(os.path.join(self.workspace_path, "worker_locks", f"output_{work_hash}.jsonl"))
+
+    def _speculation_marker_key(self, work_hash: str) -> Tuple[str, str]:
+        # Whoever creates this is the one worker that takes a copy of the work item, the name doesn't end in .jsonl, so it is never mistaken for a lock
+        bucket, key = self._lock_key(work_hash)
+        return bucket, key + ".speculative"
+
+    def _lock_body(self, work_item: WorkItem, claimed_at: float) -> bytes:
+        # Renewals rewrite the lock, so the time the work item was claimed is kept separately. The work paths let an
+        # idle worker take a copy of the item if it straggles.
+        return json.dumps(
+            {
+                "worker": self.worker_id,
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "claimed": datetime.datetime.fromtimestamp(claimed_at, datetime.timezone.utc).isoformat(),
+                "work_paths": work_item.work_paths,
+                "num_pages": work_item.num_pages,
+            }
+        ).encode("utf-8")
+
+    def _is_precondition_failure(self, e: Exception) -> bool:
+        # S3 answers a conditional put that lost with 412 PreconditionFailed, or with 409 ConditionalRequestConflict if it raced another request
+        return isinstance(e, self.s3_client.exceptions.ClientError) and e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict")
+
+    async def _try_lock(self, work_item: WorkItem, worker_lock_timeout_secs: int) -> bool:
+        work_hash = work_item.hash
+        bucket, key = self._lock_key(work_hash)
+        claimed_at = time.time()
         try:
-            await asyncio.to_thread(self.s3_client.head_object, Bucket=bucket, Key=key)
+            response = await self.storage.call("put_object", Bucket=bucket, Key=key, Body=self._lock_body(work_item, claimed_at), IfNoneMatch="*")
+            self._lock_etags[work_hash] = response["ETag"]
+            self._claimed_at[work_hash] = claimed_at
             return True
+        except Exception as e:
+            if not self._is_precondition_failure(e):
+                raise
+
+        # There is a lock already, which can be taken over if its worker stopped renewing it
+        try:
+            response = await self.storage.call("head_object", Bucket=bucket, Key=key)
         except self.s3_client.exceptions.ClientError:
+            # The lock went away while we looked at it, so leave this item to whoever is faster
+            return False
+
+        if (datetime.datetime.now(datetime.timezone.utc) - response["LastModified"]).total_seconds() <= worker_lock_timeout_secs:
+            logger.debug(f"Work item {work_hash} is locked by another worker, skipping")
             return False
 
-    async def get_work(self, worker_lock_timeout_secs: int = 1800) -> Optional[WorkItem]:
+        try:
+            response = await self.storage.call("put_object", Bucket=bucket, Key=key, Body=self._lock_body(work_item, claimed_at), IfMatch=response["ETag"])
+        except Exception as e:
+            if self._is_precondition_failure(e):
+                return False
+            raise
+
+        logger.debug(f"Found stale lock for {work_hash}, taking work item")
+        self._lock_etags[work_hash] = response["ETag"]
+        self._claimed_at[work_hash] = claimed_at
+        return True
+
+    async def get_work(self, worker_lock_timeout_secs: int = WORKER_LOCK_LEASE_SECS) -> Optional[WorkItem]:
         """
         Get the next available work item that isn't completed or locked.
 
         Args:
-            worker_lock_timeout_secs: Number of seconds before considering a worker lock stale (default 30 mins)
+            worker_lock_timeout_secs: Number of seconds without a heartbeat before considering a worker lock stale (default 5 mins)
 
         Returns:
             WorkItem if work is available, None if queue is empty
         """
+        if self._status_listed_at is None:
+            await self.refresh_status()
+
         while True:
+            self._maybe_start_refresh()
+
             try:
                 work_item = self._queue.get_nowait()
             except asyncio.QueueEmpty:
-                return None
+                if await self._load_next_shard():
+                    continue
+                return await self._wait_for_straggler(worker_lock_timeout_secs)
 
             # Check if work is already completed
-            if await self.is_completed(work_item.hash):
+            if work_item.hash in self._done_hashes:
                 logger.debug(f"Work item {work_item.hash} already completed, skipping")
                 self._queue.task_done()
                 continue
 
-            # Check for worker lock
-            lock_path = os.path.join(self.workspace_path, "worker_locks", f"output_{work_item.hash}.jsonl")
-            bucket, key = parse_s3_path(lock_path)
-
-            try:
-                response = await asyncio.to_thread(self.s3_client.head_object, Bucket=bucket, Key=key)
-
-                # Check if lock is stale
-                last_modified = response["LastModified"]
-                if (datetime.datetime.now(datetime.timezone.utc) - last_modified).total_seconds() > worker_lock_timeout_secs:
-                    # Lock is stale, we can take this work
-                    logger.debug(f"Found stale lock for {work_item.hash}, taking work item")
-                else:
-                    # Lock is active, skip this work
-                    logger.debug(f"Work item {work_item.hash} is locked by another worker, skipping")
-                    self._queue.task_done()
-                    continue
-
-            except self.s3_client.exceptions.ClientError:
-                # No lock exists, we can take this work
-                pass
+            lock_time = self._lock_times.get(work_item.hash)
+            if lock_time is not None and (datetime.datetime.now(datetime.timezone.utc) - lock_time).total_seconds() <= worker_lock_timeout_secs:
+                logger.debug(f"Work item {work_item.hash} is locked by another worker, skipping")
+                self._queue.task_done()
+                continue
 
-            # Create our lock file
+            # The view can be an interval behind, but the lock is only created if there is none, which confirms that no other worker took this item since
             try:
-                await asyncio.to_thread(self.s3_client.put_object, Bucket=bucket, Key=key, Body=b"")
+                locked = await self._try_lock(work_item, worker_lock_timeout_secs)
             except Exception as e:
                 logger.warning(f"Failed to create lock file for {work_item.hash}: {e}")
+                locked = False
+
+            if not locked:
                 self._queue.task_done()
                 continue
 
+            self._lock_times[work_item.hash] = datetime.datetime.now(datetime.timezone.utc)
             return work_item
 
+    async def renew_lock(self, work_item: WorkItem) -> bool:
+        """
+        Extend the lease on a work item by rewriting its lock file, conditional on it still being the one this worker wrote.
+
+        Args:
+            work_item: The WorkItem to renew the lock of
+        """
+        etag = self._lock_etags.get(work_item.hash)
+        if etag is None:
+            return False
+
+        bucket, key = self._lock_key(work_item.hash)
+        try:
+            body = self._lock_body(work_item, self._claimed_at.get(work_item.hash, time.time()))
+            response = await self.storage.call("put_object", Bucket=bucket, Key=key, Body=body, IfMatch=etag)
+        except Exception as e:
+            if self._is_precondition_failure(e):
+                self._lock_etags.pop(work_item.hash, None)
+                return False
+            raise
+
+        self._lock_etags[work_item.hash] = response["ETag"]
+        return True
+
+    async def _read_other_lock(self, work_hash: str) -> Optional[dict]:
+        if work_hash not in self._other_locks:
+            bucket, key = self._lock_key(work_hash)
+            try:
+                self._other_locks[work_hash] = json.loads(await self.storage.get_bytes(f"s3://{bucket}/{key}"))
+            except self.s3_client.exceptions.ClientError:
+                # The lock went away since the last listing
+                return None
+        return self._other_locks[work_hash]
+
+    async def _find_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        # Goes by the last listing, which is enough for items that have already run for many times the median
+        now = datetime.datetime.now(datetime.timezone.utc)
+        others_working = False
+        for work_hash, lock_time in list(self._lock_times.items()):
+            if work_hash in self._done_hashes or work_hash in self._lock_etags or work_hash in self._speculated_hashes:
+                continue
+            if (now - lock_time).total_seconds() > worker_lock_timeout_secs:
+                continue
+
+            # Locks written before they carried the claim time and work paths can't be copied
+            lock = await self._read_other_lock(work_hash)
+            if lock is None or lock.get("worker") == self.worker_id or "claimed" not in lock:
+                continue
+
+            others_working = True
+            if (now - datetime.datetime.fromisoformat(lock["claimed"])).total_seconds() < threshold_secs:
+                continue
+
+            bucket, key = self._speculation_marker_key(work_hash)
+            self._speculated_hashes.add(work_hash)
+            try:
+                await self.storage.call("put_object", Bucket=bucket, Key=key, Body=self.worker_id.encode("utf-8"), IfNoneMatch="*")
+            except Exception as e:
+                if self._is_precondition_failure(e):
+                    continue
+                raise
+            return WorkItem(hash=work_hash, work_paths=lock["work_paths"], num_pages=lock.get("num_pages", 0), speculative=True), True
+
+        return None, others_working
+
     async def mark_done(self, work_item: WorkItem) -> None:
         """
-        Mark a work item as done by removing its lock file.
+        Mark a work item as done by removing its lock file, or for a copy of a straggler, the marker of the copy.
 
         Args:
             work_item: The WorkItem to mark as done
         """
-        lock_path = os.path.join(self.workspace_path, "worker_locks", f"output_{work_item.hash}.jsonl")
-        bucket, key = parse_s3_path(lock_path)
+        bucket, key = self._speculation_marker_key(work_item.hash) if work_item.speculative else self._lock_key(work_item.hash)
+        self._lock_etags.pop(work_item.hash, None)
+        self._other_locks.pop(work_item.hash, None)
 
         try:
-            await asyncio.to_thread(self.s3_client.delete_object, Bucket=bucket, Key=key)
+            await self.storage.call("delete_object", Bucket=bucket, Key=key)
         except Exception as e:
             logger.warning(f"Failed to delete lock file for {work_item.hash}: {e}")
 
-        self._queue.task_done()
+        self._done_hashes.add(work_item.hash)
+        self._lock_times.pop(work_item.hash, None)
+        self._record_done(work_item)
+        # Copies of stragglers never came out of the internal queue
+        if not work_item.speculative:
+            self._queue.task_done()
 
     @property
     def size(self) -> int:
-        """Get current size of work queue"""
-        return self._queue.qsize()
+        """Get current size of work queue, counting the shards that aren't loaded yet"""
+        return self._queue.qsize() + self._unloaded_size()
+
+
+# --------------------------------------------------------------------------------------
+# CoordinatorWorkQueue Implementation
+# --------------------------------------------------------------------------------------
+
+
+class CoordinatorWorkQueue(WorkQueue):
+    """
+    A WorkQueue that gets its work items from an olmocr.coordinator process, which keeps the leases of every worker in
+    memory, so that hundreds of workers don't each list and write lock files in an S3 workspace.
+
+    Results are still committed to the workspace, which stays the source of truth, and adding pdfs still writes index
+    shards there, which the coordinator imports on initialize_queue. The order of the work items is up to the coordinator.
+    """
+
+    def __init__(self, address: str, workspace_path: str, s3_client=None, straggler_factor: float = 0.0):
+        """
+        Initialize the coordinator work queue.
+
+        Args:
+            address: host:port of the coordinator, the port defaults to COORDINATOR_PORT
+            workspace_path: Local or S3 path of the workspace, where the index and results are stored
+            s3_client: Boto3 S3 client for an s3:// workspace
+            straggler_factor: Once the queue is empty, hand out copies of work items held this many times longer than the median, 0 never does
+        """
+        super().__init__(straggler_factor=straggler_factor)
+        host, _, port = address.rpartition(":") if ":" in address else (address, "", str(COORDINATOR_PORT))
+        self.host = host
+        self.port = int(port)
+        self.workspace_path = workspace_path.rstrip("/")
+
+        self._index = WorkIndex(self.workspace_path, s3_client)
+        self.worker_id = worker_identity()
+        self._lease_secs = WORKER_LOCK_LEASE_SECS
+
+        # One connection per queue, which carries one request at a time
+        self._request_lock = asyncio.Lock()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+        # As of the last response, every response carries it
+        self._size = 0
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader, self._writer = None, None
+
+    async def _request(self, op: str, **params) -> dict:
+        """Sends one request to the coordinator and returns its response, reconnecting if the connection drops"""
+        message = json.dumps({"op": op, **params}).encode("utf-8") + b"\n"
+        async with self._request_lock:
+            for attempt in range(COORDINATOR_RETRIES):
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=COORDINATOR_MAX_LINE_BYTES)
+                    self._writer.write(message)
+                    await self._writer.drain()
+                    line = await self._reader.readline()
+                    if not line:
+                        raise ConnectionError("Coordinator closed the connection")
+                    break
+                except OSError as e:
+                    self._disconnect()
+                    if attempt == COORDINATOR_RETRIES - 1:
+                        raise
+                    wait_secs = min(2**attempt, 30)
+                    logger.warning(f"Lost the connection to the coordinator at {self.host}:{self.port}, retrying in {wait_secs}s: {e}")
+                    await asyncio.sleep(wait_secs)
+                except BaseException:
+                    # Cancelled halfway, the response may still be on its way, and the next request would read it as its own
+                    self._disconnect()
+                    raise
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Coordinator failed to {op}: {response['error']}")
+        self._size = response["size"]
+        return response
+
+    async def initialize_queue(self) -> None:
+        """
+        Has the coordinator import any index shards that were added since it last looked.
+        """
+        await self._request("refresh")
+        logger.info(f"Initialized coordinator queue at {self.host}:{self.port} with {self.size} work items")
+
+    async def is_completed(self, work_hash: str) -> bool:
+        """
+        Check if a work item has been completed, as far as the coordinator knows.
+
+        Args:
+            work_hash: Hash of the work item to check
+        """
+        return (await self._request("is_completed", hash=work_hash))["done"]
+
+    async def get_work(self, worker_lock_timeout_secs: int = WORKER_LOCK_LEASE_SECS) -> Optional[WorkItem]:
+        """
+        Get a lease on the next work item that isn't completed or leased to another worker.
+
+        Args:
+            worker_lock_timeout_secs: Length of the lease, after which the item goes to another worker unless renewed (default 5 mins)
+
+        Returns:
+            WorkItem if work is available, None if queue is empty
+        """
+        self._lease_secs = worker_lock_timeout_secs
+        while True:
+            response = await self._request("get_work", worker=self.worker_id, lease_secs=worker_lock_timeout_secs)
+            if response["work_item"] is not None or not response.get("retry_secs"):
+                break
+            # The coordinator just (re)started, and waits for the workers on items from before that to renew their leases
+            logger.info(f"Coordinator holds back work items for another {response['retry_secs']:.0f}s after its start, waiting")
+            await asyncio.sleep(response["retry_secs"])
+
+        if response["work_item"] is None:
+            return await self._wait_for_straggler(worker_lock_timeout_secs)
+
+        work_item = WorkItem(**response["work_item"])
+        self._claimed_at[work_item.hash] = time.time()
+        return work_item
+
+    async def renew_lock(self, work_item: WorkItem) -> bool:
+        """
+        Extend the lease on a work item, as long as it is still leased to this worker.
+
+        Args:
+            work_item: The WorkItem to renew the lock of
+        """
+        return (await self._request("renew", hash=work_item.hash, worker=self.worker_id, lease_secs=self._lease_secs))["ok"]
+
+    async def _find_straggler(self, threshold_secs: float, worker_lock_timeout_secs: int) -> Tuple[Optional[WorkItem], bool]:
+        response = await self._request("straggler", worker=self.worker_id, threshold_secs=threshold_secs)
+        work_item = WorkItem(**response["work_item"]) if response["work_item"] is not None else None
+        return work_item, response["others_working"]
+
+    async def mark_done(self, work_item: WorkItem) -> None:
+        """
+        Tell the coordinator that a work item is done.
+
+        Args:
+            work_item: The WorkItem to mark as done
+        """
+        await self._request("done", hash=work_item.hash)
+        self._record_done(work_item)
+
+    @property
+    def size(self) -> int:
+        """Get the number of work items that aren't done, as of the last response of the coordinator"""
+        return self._size
@@ -0,0 +1,165 @@
+"""Benchmark request throughput of the pipeline's HTTP client against a local stub server.
+
+Compares the old one-connection-per-request client (Connection: close, json.dumps plus string concat)
+with the keep-alive HttpConnectionPool that olmocr.pipeline.apost now uses.
+
+Example:
+    python scripts/benchmark_apost.py --requests 5000 --concurrency 256 --payload_kb 1500
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+from olmocr.http_pool import HttpConnectionPool
+
+RESPONSE_BODY = json.dumps(
+    {
+        "choices": [{"message": {"content": json.dumps({"natural_text": "Lorem ipsum " * 200})}}],
+        "usage": {"prompt_tokens": 1500, "completion_tokens": 600, "total_tokens": 2100},
+    }
+).encode()
+
+
+async def stub_server_handler(reader, writer, delay: float):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                key, _, value = line.decode().partition(":")
+                headers[key.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers["content-length"]))
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            close = headers.get("connection", "").lower() == "close"
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n%s"
+                % (len(RESPONSE_BODY), b"Connection: close\r\n" if close else b"", RESPONSE_BODY)
+            )
+            await writer.drain()
+            if close:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+# The client that olmocr.pipeline used before the keep-alive pool, kept here as the baseline
+async def apost_connection_close(url, json_data):
+    parsed_url = urlparse(url)
+    host = parsed_url.hostname
+    port = parsed_url.port or 80
+    path = parsed_url.path or "/"
+
+    writer = None
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+
+        json_payload = json.dumps(json_data)
+        request = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(json_payload)}\r\n"
+            f"Connection: close\r\n\r\n"
+            f"{json_payload}"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status_code = int(status_line.decode().strip().split(" ", 2)[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        response_body = await reader.readexactly(int(headers["content-length"]))
+        json.loads(response_body)
+        return status_code, response_body
+    finally:
+        if writer is not None:
+            writer.close()
+            await writer.wait_closed()
+
+
+async def run_client(name, post, num_requests: int, concurrency: int, query: dict):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await post(query)
+            assert status == 200
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(num_requests)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{name:<20} {num_requests / elapsed:>12.1f} {p50:>12.2f} {p99:>12.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark apost implementations against a local stub server")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of requests to send per client")
+    parser.add_argument("--concurrency", type=int, default=128, help="Number of requests in flight at once")
+    parser.add_argument("--max_connections", type=int, default=512, help="Connection limit for the keep-alive pool")
+    parser.add_argument("--payload_kb", type=int, default=1024, help="Size of the fake base64 image in each request, in KB")
+    parser.add_argument("--server_delay", type=float, default=0.0, help="Seconds the stub server waits before responding")
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(lambda r, w: stub_server_handler(r, w, args.server_delay), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    image_base64 = base64.b64encode(os.urandom(args.payload_kb * 1024 * 3 // 4)).decode("ascii")
+    query = {
+        "model": "Qwen/Qwen2-VL-7B-Instruct",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "RAW_TEXT_START\n" + "anchor text " * 500 + "\nRAW_TEXT_END"},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}},
+                ],
+            }
+        ],
+        "max_tokens": 3000,
+        "temperature": 0.8,
+    }
+
+    pool = HttpConnectionPool("127.0.0.1", port, max_connections=args.max_connections)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, payload {args.payload_kb} KB")
+    print(f"{'Client':<20} {'Requests/sec':>12} {'p50 (ms)':>12} {'p99 (ms)':>12}")
+    await run_client("connection-close", lambda q: apost_connection_close(url, q), args.requests, args.concurrency, query)
+    await run_client("keep-alive pool", lambda q: pool.post_json("/v1/chat/completions", q), args.requests, args.concurrency, query)
+    print(f"Keep-alive pool opened {pool.connections_opened} connections for {pool.requests_sent} requests")
+
+    await pool.close()
+    await asyncio.sleep(0.1)  # Let the server handlers see the closed connections before shutting down
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
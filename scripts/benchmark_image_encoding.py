@@ -0,0 +1,159 @@
+"""Benchmark the page image encodings that the pipeline can send to the model, see --image_format in olmocr.pipeline.
+
+Renders every page of every pdf in a directory (tests/gnarly_pdfs by default) once, then encodes it with each setting,
+and reports the base64 payload size per page, and how long encoding takes. With pdftoppm, png and jpeg pages come
+straight out of the renderer in the pipeline, so the encode times here are an upper bound for those.
+
+Payload size alone says nothing about what the model makes of the pages, so given an olmOCR-bench data folder and a
+running sglang server, each setting also gets scored on the bench: the model's output for every bench pdf goes into a
+candidate folder per setting in the bench folder, which is then evaluated like any other candidate.
+
+Settings are written as format[:key=value...], with the fields of ImageEncoding as keys.
+
+Example:
+    python scripts/benchmark_image_encoding.py --settings png jpeg:quality=85 webp:quality=80 jpeg:quality=85:grayscale=1
+
+    python scripts/benchmark_image_encoding.py --bench_dir olmocr/bench/sample_data --server http://localhost:30024
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from olmocr.bench.benchmark import evaluate_candidate, validate_jsonl_file
+from olmocr.bench.convert import parse_method_arg
+from olmocr.data.renderpdf import RENDERERS, ImageEncoding, get_renderer
+from olmocr.pdf_handle import get_pdf_num_pages
+
+DEFAULT_SETTINGS = [
+    "png",
+    "png:compress_level=1",
+    "png:grayscale=1",
+    "jpeg:quality=90",
+    "jpeg:quality=75",
+    "jpeg:quality=85:grayscale=1",
+    "webp:quality=80",
+]
+
+
+def parse_setting(setting: str) -> ImageEncoding:
+    image_format, kwargs = parse_method_arg(setting)
+    if "grayscale" in kwargs:
+        kwargs["grayscale"] = bool(kwargs["grayscale"])
+    return ImageEncoding(image_format, **kwargs)
+
+
+def measure_payloads(args, encodings: Dict[str, ImageEncoding]) -> None:
+    pages: List[Tuple[str, int]] = []
+    for pdf_path in sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf"))):
+        try:
+            num_pages = get_pdf_num_pages(pdf_path)
+        except Exception as e:
+            print(f"Skipping {pdf_path}: {e}")
+            continue
+        pages.extend((pdf_path, page_num) for page_num in range(1, min(num_pages, args.max_pages_per_pdf) + 1))
+
+    renderer = get_renderer(args.renderer)
+    images = []
+    for pdf_path, page_num in pages:
+        try:
+            images.append(renderer.render_image(pdf_path, page_num, args.target_longest_image_dim))
+        except Exception as e:
+            print(f"Skipping {os.path.basename(pdf_path)} page {page_num}: {e}")
+
+    print(f"Encoding {len(images)} pages rendered at {args.target_longest_image_dim}px with {args.renderer}")
+    print(f"{'Setting':<28} {'KB/page':>9} {'Total MB':>9} {'vs first':>9} {'Mean (ms)':>10} {'p95 (ms)':>10}")
+
+    first_total = None
+    for setting, encoding in encodings.items():
+        sizes = []
+        latencies = []
+        for img in images:
+            start = time.perf_counter()
+            image_base64 = encoding.encode_base64(img)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(image_base64))
+
+        total = sum(sizes)
+        first_total = first_total or total
+        latencies.sort()
+        mean = sum(latencies) / max(1, len(latencies)) * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        print(f"{setting:<28} {total / max(1, len(sizes)) / 1024:>9.1f} {total / 1024**2:>9.2f} {total / max(1, first_total):>8.0%} {mean:>10.1f} {p95:>10.1f}")
+
+
+def score_on_bench(args, encodings: Dict[str, ImageEncoding]) -> None:
+    # The pipeline pulls in torch and friends, so it is only imported when scoring
+    from olmocr.pipeline import build_page_query
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.bench_dir, "pdfs", "*.pdf")))
+    all_rules = []
+    for jsonl_path in glob.glob(os.path.join(args.bench_dir, "*.jsonl")):
+        all_rules.extend(validate_jsonl_file(jsonl_path, pdf_paths))
+    pdf_basenames = [os.path.basename(pdf_path) for pdf_path in pdf_paths]
+
+    print(f"Scoring on {len(pdf_paths)} bench pdfs, {len(all_rules)} rules, with the server at {args.server}")
+    print(f"{'Setting':<28} {'Score':>7} {'Request KB/page':>16} {'Failed pages':>13}")
+
+    with httpx.Client(base_url=args.server, timeout=600) as client:
+        for setting, encoding in encodings.items():
+            candidate_dir = os.path.join(args.bench_dir, f"image_encoding_{setting.replace(':', '_').replace('=', '')}")
+            os.makedirs(candidate_dir, exist_ok=True)
+
+            request_bytes = 0
+            failed = 0
+            for pdf_path in pdf_paths:
+                query = asyncio.run(
+                    build_page_query(pdf_path, 1, args.target_longest_image_dim, args.target_anchor_text_len, renderer=args.renderer, image_encoding=encoding)
+                )
+                body = json.dumps(query)
+                request_bytes += len(body)
+
+                try:
+                    response = client.post("/v1/chat/completions", content=body, headers={"Content-Type": "application/json"})
+                    response.raise_for_status()
+                    natural_text = json.loads(response.json()["choices"][0]["message"]["content"]).get("natural_text") or ""
+                except Exception as e:
+                    print(f"  {os.path.basename(pdf_path)} failed with {setting}: {e}")
+                    failed += 1
+                    natural_text = ""
+
+                md_name = os.path.splitext(os.path.basename(pdf_path))[0] + "_1.md"
+                with open(os.path.join(candidate_dir, md_name), "w") as f:
+                    f.write(natural_text)
+
+            score, _, errors, _, _ = evaluate_candidate(candidate_dir, all_rules, pdf_basenames)
+            for error in errors:
+                print(f"  [ERROR] {error}")
+            print(f"{setting:<28} {score:>7.1%} {request_bytes / max(1, len(pdf_paths)) / 1024:>16.1f} {failed:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare payload size, encode time and bench score of page image encodings")
+    parser.add_argument("--pdf_dir", default=os.path.join(os.path.dirname(__file__), "..", "tests", "gnarly_pdfs"), help="Directory of pdfs to encode")
+    parser.add_argument(
+        "--settings", nargs="+", default=DEFAULT_SETTINGS, help="Encodings to compare, as format[:key=value...], sizes are relative to the first"
+    )
+    parser.add_argument("--renderer", choices=list(RENDERERS), default="pdfium", help="Renderer of the pages")
+    parser.add_argument("--target_longest_image_dim", type=int, default=1024, help="Longest side of the rendered pages")
+    parser.add_argument("--target_anchor_text_len", type=int, default=6000, help="Anchor text length of the bench queries")
+    parser.add_argument("--max_pages_per_pdf", type=int, default=10, help="Only encode this many pages of each pdf")
+    parser.add_argument("--bench_dir", help="olmOCR-bench data folder, with pdfs/ and the rule .jsonl files, to score each setting on")
+    parser.add_argument("--server", default="http://localhost:30024", help="sglang server that serves the olmOCR model, for scoring")
+    args = parser.parse_args()
+
+    encodings = {setting: parse_setting(setting) for setting in args.settings}
+    measure_payloads(args, encodings)
+
+    if args.bench_dir:
+        score_on_bench(args, encodings)
+
+
+if __name__ == "__main__":
+    main()
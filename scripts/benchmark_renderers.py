@@ -0,0 +1,107 @@
+"""Benchmark the pdf page renderers in olmocr.data.renderpdf against each other.
+
+Renders every page of every pdf in a directory (tests/gnarly_pdfs by default) with each renderer, and reports
+wall clock latency per page, CPU time per page including any subprocesses, and how closely each renderer's output
+matches the first renderer given, in image size and mean absolute pixel difference.
+
+Example:
+    python scripts/benchmark_renderers.py --renderers poppler pdfium --target_longest_image_dim 1024
+"""
+
+import argparse
+import glob
+import os
+import resource
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+from olmocr.data.renderpdf import RENDERERS, get_renderer
+from olmocr.pdf_handle import get_pdf_num_pages
+
+
+def cpu_seconds() -> float:
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + child_usage.ru_utime + child_usage.ru_stime
+
+
+def mean_abs_diff(a: Image.Image, b: Image.Image) -> float:
+    a = a.convert("L")
+    b = b.convert("L")
+    if a.size != b.size:
+        b = b.resize(a.size)
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency, CPU and output parity of the pdf renderers")
+    parser.add_argument("--pdf_dir", default=os.path.join(os.path.dirname(__file__), "..", "tests", "gnarly_pdfs"), help="Directory of pdfs to render")
+    parser.add_argument("--renderers", nargs="+", default=list(RENDERERS), choices=list(RENDERERS), help="Renderers to compare, parity is against the first")
+    parser.add_argument("--target_longest_image_dim", type=int, default=1024, help="Longest side of the rendered pages")
+    parser.add_argument("--max_pages_per_pdf", type=int, default=10, help="Only render this many pages of each pdf")
+    args = parser.parse_args()
+
+    if "poppler" in args.renderers and shutil.which("pdftoppm") is None:
+        print("pdftoppm not found, skipping the poppler renderer")
+        args.renderers = [name for name in args.renderers if name != "poppler"]
+
+    pages: List[Tuple[str, int]] = []
+    for pdf_path in sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf"))):
+        try:
+            num_pages = get_pdf_num_pages(pdf_path)
+        except Exception as e:
+            print(f"Skipping {pdf_path}: {e}")
+            continue
+        pages.extend((pdf_path, page_num) for page_num in range(1, min(num_pages, args.max_pages_per_pdf) + 1))
+
+    print(f"Rendering {len(pages)} pages at {args.target_longest_image_dim}px with {', '.join(args.renderers)}")
+
+    images: Dict[str, Dict[Tuple[str, int], Image.Image]] = {}
+    print(f"{'Renderer':<10} {'Pages':>6} {'Failed':>6} {'Mean (ms)':>10} {'p95 (ms)':>10} {'CPU/page (ms)':>14}")
+
+    for name in args.renderers:
+        renderer = get_renderer(name)
+        images[name] = {}
+        latencies = []
+        failed = 0
+
+        cpu_start = cpu_seconds()
+        for pdf_path, page_num in pages:
+            start = time.perf_counter()
+            try:
+                img = renderer.render_image(pdf_path, page_num, args.target_longest_image_dim)
+            except Exception:
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            images[name][(pdf_path, page_num)] = img
+        cpu_per_page = (cpu_seconds() - cpu_start) / max(1, len(latencies))
+
+        latencies.sort()
+        mean = sum(latencies) / max(1, len(latencies)) * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        print(f"{name:<10} {len(latencies):>6} {failed:>6} {mean:>10.1f} {p95:>10.1f} {cpu_per_page * 1000:>14.1f}")
+
+    reference = args.renderers[0]
+    for name in args.renderers[1:]:
+        common = [key for key in images[reference] if key in images[name]]
+        if not common:
+            continue
+
+        size_mismatches = [key for key in common if images[reference][key].size != images[name][key].size]
+        diffs = sorted(mean_abs_diff(images[reference][key], images[name][key]) for key in common)
+        print(
+            f"Parity {name} vs {reference}: {len(common)} pages, {len(size_mismatches)} size mismatches, "
+            f"mean abs pixel diff {sum(diffs) / len(diffs):.2f} (worst {diffs[-1]:.2f}) on a 0-255 scale"
+        )
+        for pdf_path, page_num in size_mismatches[:10]:
+            print(
+                f"  {os.path.basename(pdf_path)} page {page_num}: {images[reference][(pdf_path, page_num)].size} vs {images[name][(pdf_path, page_num)].size}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import io
+import threading
+import time
+import unittest
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from olmocr.async_storage import AsyncStorage, get_s3_client, s3_request_stats
+
+
+def client_error(code, status=400):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+class FakeS3Client:
+    """Answers get_object with the key as the body, after failing with the queued errors, and tracks the calls in flight"""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.num_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range=None):
+        with self.lock:
+            self.num_calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            time.sleep(self.delay)
+            if error is not None:
+                raise error
+            return {"Body": io.BytesIO(Key.encode("utf-8"))}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class TestAsyncStorage(unittest.IsolatedAsyncioTestCase):
+    async def test_slowdown_is_retried_and_slows_the_bucket(self):
+        s3_client = FakeS3Client(errors=[client_error("SlowDown", 503), client_error("InternalError", 500)])
+        storage = AsyncStorage(s3_client, bucket_concurrency=8, backoff_base_secs=0.01)
+
+        self.assertEqual(await storage.get_bytes("s3://bucket/a.pdf"), b"a.pdf")
+        self.assertEqual(s3_client.num_calls, 3)
+        self.assertEqual(storage._limiter("bucket").limit, 4)
+
+    async def test_other_errors_are_raised_at_once(self):
+        s3_client = FakeS3Client(errors=[client_error("NoSuchKey", 404)])
+        storage = AsyncStorage(s3_client, backoff_base_secs=0.01)
+
+        with self.assertRaises(ClientError):
+            await storage.get_bytes("s3://bucket/missing.pdf")
+        self.assertEqual(s3_client.num_calls, 1)
+
+    async def test_requests_per_bucket_are_bounded(self):
+        s3_client = FakeS3Client(delay=0.02)
+        storage = AsyncStorage(s3_client, bucket_concurrency=3)
+
+        results = await asyncio.gather(*[storage.get_bytes(f"s3://bucket/{i}.pdf") for i in range(12)])
+        self.assertEqual(results, [f"{i}.pdf".encode("utf-8") for i in range(12)])
+        self.assertEqual(s3_client.max_in_flight, 3)
+
+    async def test_backoff_does_not_hold_a_thread(self):
+        # With a single thread, a request to a healthy bucket still goes through while another one backs off
+        s3_client = FakeS3Client(errors=[client_error("InternalError", 500)])
+        storage = AsyncStorage(s3_client, max_workers=1, backoff_base_secs=1.0)
+        storage._backoff_secs = lambda attempt: 1.0
+
+        retried = asyncio.create_task(storage.get_bytes("s3://slow-bucket/a.pdf"))
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        self.assertEqual(await storage.get_bytes("s3://other-bucket/b.pdf"), b"b.pdf")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(await retried, b"a.pdf")
+
+
+class TestS3ClientFactory(unittest.TestCase):
+    def test_clients_are_shared(self):
+        client = get_s3_client(aws_access_key_id="test", aws_secret_access_key="test")
+        self.assertIs(get_s3_client(aws_access_key_id="test", aws_secret_access_key="test"), client)
+        self.assertIsNot(get_s3_client(max_pool_connections=8, aws_access_key_id="test", aws_secret_access_key="test"), client)
+        self.assertEqual(client.meta.config.max_pool_connections, 64)
+        self.assertEqual(client.meta.config.retries["mode"], "adaptive")
+
+    def test_requests_are_counted_per_bucket(self):
+        client = get_s3_client(endpoint_url="http://localhost:9", aws_access_key_id="test", aws_secret_access_key="test")
+        with Stubber(client) as stubber:
+            stubber.add_response("head_object", {"ContentLength": 1}, {"Bucket": "stats-bucket", "Key": "a.pdf"})
+            stubber.add_client_error("head_object", service_error_code="SlowDown", http_status_code=503)
+            stubber.add_client_error("head_object", service_error_code="NoSuchKey", http_status_code=404)
+
+            client.head_object(Bucket="stats-bucket", Key="a.pdf")
+            for _ in range(2):
+                with self.assertRaises(ClientError):
+                    client.head_object(Bucket="stats-bucket", Key="b.pdf")
+
+        stats = s3_request_stats()["stats-bucket"]
+        self.assertEqual((stats.requests, stats.errors, stats.throttled), (3, 2, 1))
+        self.assertGreaterEqual(stats.max_secs, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import asyncio
+import unittest
+
+import httpx
+
+from olmocr.concurrency import (
+    AdaptiveConcurrencyController,
+    ByteBudget,
+    ServerLoad,
+    parse_prometheus_metrics,
+)
+
+METRICS_TEXT = """# HELP sglang:num_running_reqs The number of running requests.
+# TYPE sglang:num_running_reqs gauge
+sglang:num_running_reqs{model_name="Qwen/Qwen2-VL-7B-Instruct"} 48.0
+# HELP sglang:num_queue_reqs The number of requests in the waiting queue.
+# TYPE sglang:num_queue_reqs gauge
+sglang:num_queue_reqs{model_name="Qwen/Qwen2-VL-7B-Instruct"} 3.0
+sglang:num_queue_reqs{model_name="other"} 2.0
+sglang:cache_hit_rate 0.5 1700000000
+"""
+
+
+class FakeMetricsServer:
+    """Serves a fixed Prometheus metrics page over HTTP/1.1"""
+
+    def __init__(self, text):
+        self.text = text
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while await reader.readline() not in (b"\r\n", b""):
+                pass
+            body = self.text.encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+class TestParsePrometheusMetrics(unittest.TestCase):
+    def test_sums_label_sets(self):
+        values = parse_prometheus_metrics(METRICS_TEXT)
+        self.assertEqual(values["sglang:num_running_reqs"], 48.0)
+        self.assertEqual(values["sglang:num_queue_reqs"], 5.0)
+        self.assertEqual(values["sglang:cache_hit_rate"], 0.5)
+
+    def test_ignores_garbage(self):
+        self.assertEqual(parse_prometheus_metrics('\n# comment\nbroken_line\nname{a="}"} nan_not_a_number\n'), {})
+
+
+class TestAdaptiveConcurrencyController(unittest.IsolatedAsyncioTestCase):
+    async def test_window_limits_in_flight(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=8, min_window=8)
+        max_in_flight = 0
+
+        async def page():
+            nonlocal max_in_flight
+            async with controller.slot():
+                max_in_flight = max(max_in_flight, controller.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[page() for _ in range(40)])
+        self.assertEqual(max_in_flight, 8)
+        self.assertEqual(controller.in_flight, 0)
+        self.assertIsNotNone(controller.latency_ewma)
+
+    async def test_additive_increase_when_window_limited(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=8, min_window=8, additive_increase=8)
+        for _ in range(8):
+            await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(controller.num_waiting, 1)
+
+        controller.update(ServerLoad(running_reqs=8, queue_reqs=0), now=0.0)
+        self.assertEqual(int(controller.window), 16)
+        await waiter
+        self.assertEqual(controller.in_flight, 9)
+
+        # No pages waiting for a slot, so there is no reason to grow the window
+        controller.update(ServerLoad(running_reqs=9, queue_reqs=0), now=1.0)
+        self.assertEqual(int(controller.window), 16)
+
+    async def test_multiplicative_decrease_with_cooldown(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=100, min_window=8, target_queue_reqs=4, decrease_cooldown=5.0)
+
+        controller.update(ServerLoad(running_reqs=64, queue_reqs=50), now=0.0)
+        self.assertEqual(int(controller.window), 75)
+
+        controller.update(ServerLoad(running_reqs=64, queue_reqs=50), now=1.0)
+        self.assertEqual(int(controller.window), 75)
+
+        controller.update(ServerLoad(running_reqs=64, queue_reqs=50), now=6.0)
+        self.assertEqual(int(controller.window), 56)
+
+        for i in range(100):
+            controller.update(ServerLoad(running_reqs=64, queue_reqs=50), now=100.0 + 10 * i)
+        self.assertEqual(int(controller.window), 8)
+
+    async def test_errors_shrink_window(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=64)
+
+        with self.assertRaises(ConnectionError):
+            async with controller.slot():
+                raise ConnectionError("server went away")
+
+        controller.update(ServerLoad(running_reqs=0, queue_reqs=0), now=0.0)
+        self.assertEqual(int(controller.window), 48)
+        self.assertEqual(controller.in_flight, 0)
+
+    async def test_cancelled_waiter_gives_up_its_place(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=8, min_window=8)
+        for _ in range(8):
+            await controller.acquire()
+
+        waiters = [asyncio.create_task(controller.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(controller.num_waiting, 1)
+
+        controller.release()
+        await waiters[1]
+        self.assertEqual(controller.in_flight, 8)
+        self.assertEqual(controller.num_waiting, 0)
+
+    async def test_waiter_cancelled_before_release(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=8, min_window=8)
+        for _ in range(8):
+            await controller.acquire()
+
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        # The release drops the cancelled future before the waiter gets to run
+        controller.release()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(controller.in_flight, 7)
+        self.assertEqual(controller.num_waiting, 0)
+
+    async def test_spare_capacity_duration(self):
+        controller = AdaptiveConcurrencyController("http://unused", initial_window=8, target_queue_reqs=4)
+        controller.update(ServerLoad(running_reqs=2, queue_reqs=0), now=10.0)
+        self.assertEqual(controller.spare_capacity_duration(now=25.0), 15.0)
+
+        controller.update(ServerLoad(running_reqs=2, queue_reqs=0), now=20.0)
+        self.assertEqual(controller.spare_capacity_duration(now=25.0), 15.0)
+
+        controller.update(ServerLoad(running_reqs=64, queue_reqs=10), now=30.0)
+        self.assertEqual(controller.spare_capacity_duration(now=35.0), 0.0)
+
+        controller.update(None, now=40.0)
+        self.assertEqual(controller.spare_capacity_duration(now=45.0), 0.0)
+        self.assertFalse(controller.server_available)
+
+    async def test_poll_server_load(self):
+        server = FakeMetricsServer(METRICS_TEXT)
+        await server.start()
+        try:
+            controller = AdaptiveConcurrencyController(f"http://127.0.0.1:{server.port}/metrics")
+            async with httpx.AsyncClient() as client:
+                load = await controller.poll_server_load(client)
+            self.assertEqual(load, ServerLoad(running_reqs=48, queue_reqs=5))
+        finally:
+            await server.stop()
+
+        async with httpx.AsyncClient() as client:
+            self.assertIsNone(await controller.poll_server_load(client))
+
+
+class TestByteBudget(unittest.IsolatedAsyncioTestCase):
+    async def test_reservations_wait_for_room_in_order(self):
+        budget = ByteBudget(100)
+        granted = []
+
+        async def reserve(name, num_bytes, hold_secs):
+            async with budget.reserve(num_bytes):
+                granted.append(name)
+                await asyncio.sleep(hold_secs)
+
+        tasks = [
+            asyncio.create_task(reserve("a", 60, 0.05)),
+            asyncio.create_task(reserve("b", 60, 0.0)),
+            # Fits next to a, but has to wait its turn behind b
+            asyncio.create_task(reserve("c", 30, 0.0)),
+        ]
+        await asyncio.sleep(0.01)
+        self.assertEqual(granted, ["a"])
+        self.assertEqual(budget.num_waiting, 2)
+
+        await asyncio.gather(*tasks)
+        self.assertEqual(granted, ["a", "b", "c"])
+        self.assertEqual(budget.in_use, 0)
+
+    async def test_oversized_reservation_runs_alone(self):
+        budget = ByteBudget(100)
+        async with budget.reserve(500):
+            self.assertEqual(budget.in_use, 500)
+            waiter = asyncio.create_task(budget.acquire(1))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+
+            # A cancelled waiter gives up its place
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            self.assertEqual(budget.num_waiting, 0)
+        self.assertEqual(budget.in_use, 0)
+
+    async def test_waiter_cancelled_before_release(self):
+        budget = ByteBudget(10)
+        await budget.acquire(10)
+
+        waiter = asyncio.create_task(budget.acquire(5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        # The release drops the cancelled waiter before it gets to run
+        budget.release(10)
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(budget.in_use, 0)
+        self.assertEqual(budget.num_waiting, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from olmocr.coordinator import Coordinator
+from olmocr.work_queue import CoordinatorWorkQueue
+
+NUM_PATHS = 20
+
+
+class TestCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.address = await self._start_coordinator()
+
+        self.first = CoordinatorWorkQueue(self.address, self.tmpdir.name)
+        await self.first.populate_queue([f"{i}.pdf" for i in range(NUM_PATHS)], items_per_group=1)
+        await self.first.initialize_queue()
+
+        self.second = CoordinatorWorkQueue(self.address, self.tmpdir.name)
+        await self.second.initialize_queue()
+
+    async def asyncTearDown(self):
+        for work_queue in (self.first, self.second):
+            work_queue._disconnect()
+        await self.coordinator.stop()
+        self.tmpdir.cleanup()
+
+    async def _start_coordinator(self, port=0, lease_grace_secs=0):
+        self.coordinator = Coordinator(self.tmpdir.name, lease_grace_secs=lease_grace_secs)
+        server = await self.coordinator.start("127.0.0.1", port)
+        self.port = server.sockets[0].getsockname()[1]
+        return f"127.0.0.1:{self.port}"
+
+    async def test_workers_never_share_items(self):
+        async def drain(work_queue):
+            claimed = []
+            while (work_item := await work_queue.get_work()) is not None:
+                claimed.append(work_item.hash)
+                await work_queue.mark_done(work_item)
+                await asyncio.sleep(0)
+            return claimed
+
+        self.assertEqual(self.first.size, NUM_PATHS)
+        first, second = await asyncio.gather(drain(self.first), drain(self.second))
+
+        self.assertEqual(len(first) + len(second), NUM_PATHS)
+        self.assertEqual(len(set(first) | set(second)), NUM_PATHS)
+        self.assertEqual(self.second.size, 0)
+
+    async def test_expired_lease_is_taken_over(self):
+        work_item = await self.first.get_work(worker_lock_timeout_secs=0)
+        await asyncio.sleep(0.01)
+
+        others = []
+        while (other := await self.second.get_work()) is not None:
+            others.append(other.hash)
+        self.assertEqual(others[0], work_item.hash)
+        self.assertEqual(len(others), NUM_PATHS)
+
+        # The first worker finds out on its next heartbeat that the item isn't its own any more
+        self.assertFalse(await self.first.renew_lock(work_item))
+        self.assertTrue(await self.second.renew_lock(work_item))
+
+    async def test_cancelled_request_leaves_no_stale_response(self):
+        dispatch = self.coordinator._dispatch
+
+        async def slow_dispatch(request):
+            if request["op"] == "refresh":
+                await asyncio.sleep(0.2)
+            return await dispatch(request)
+
+        self.coordinator._dispatch = slow_dispatch
+        request = asyncio.create_task(self.first._request("refresh"))
+        await asyncio.sleep(0.05)
+        request.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await request
+
+        # The refresh response must not be taken for the response to this request
+        work_item = await self.first.get_work()
+        self.assertIsNotNone(work_item)
+        await asyncio.sleep(0.3)
+        self.assertIsNotNone(await self.first.get_work())
+
+    async def test_worker_refreshes_are_coalesced(self):
+        listings = 0
+        list_done_hashes = self.coordinator._list_done_hashes
+
+        def counting_list_done_hashes():
+            nonlocal listings
+            listings += 1
+            return list_done_hashes()
+
+        self.coordinator._list_done_hashes = counting_list_done_hashes
+        with patch.object(self.coordinator._index, "shards", wraps=self.coordinator._index.shards) as mock_shards:
+            await asyncio.gather(*[self.coordinator._dispatch({"op": "refresh"}) for _ in range(50)])
+
+        # results/ was listed when the coordinator started, and the refreshes that queued up behind the first one share the next
+        self.assertEqual(listings, 0)
+        self.assertEqual(mock_shards.call_count, 2)
+
+        # The periodic refresh still lists results/
+        await self.coordinator.refresh()
+        self.assertEqual(listings, 1)
+
+    async def test_restart_rebuilds_from_results(self):
+        done_item = await self.first.get_work()
+        os.makedirs(os.path.join(self.tmpdir.name, "results"))
+        with open(os.path.join(self.tmpdir.name, "results", f"output_{done_item.hash}.jsonl"), "w"):
+            pass
+        held_item = await self.first.get_work()
+
+        # A new coordinator on the same port, which the workers reconnect to
+        await self.coordinator.stop()
+        await self._start_coordinator(self.port, lease_grace_secs=3)
+
+        # Both workers reconnect, which takes them a second of backoff
+        completed = await asyncio.gather(self.first.is_completed(done_item.hash), self.second.is_completed(done_item.hash))
+        self.assertEqual(completed, [True, True])
+        self.assertEqual(self.second.size, NUM_PATHS - 1)
+
+        # Until the worker holding it renews its lease, the new coordinator doesn't know the item is taken, so it hands out nothing for a while
+        second_get_work = asyncio.create_task(self.second.get_work())
+        await asyncio.sleep(0.1)
+        self.assertFalse(second_get_work.done())
+        self.assertIsNone(self.coordinator.get_work("third", 300))
+
+        # The lease comes back with the renewal of the worker that held it
+        self.assertTrue(await self.first.renew_lock(held_item))
+        others = [(await second_get_work).hash]
+        while (other := await self.second.get_work()) is not None:
+            others.append(other.hash)
+        self.assertEqual(len(others), NUM_PATHS - 2)
+        self.assertNotIn(held_item.hash, others)
+
+    async def test_unrenewed_items_go_out_after_the_grace(self):
+        held_item = await self.first.get_work()
+        await self.coordinator.stop()
+        await self._start_coordinator(self.port, lease_grace_secs=0.2)
+
+        # The worker that held the item died along with the coordinator, so it goes out again once the grace is over
+        others = []
+        while (other := await self.second.get_work()) is not None:
+            others.append(other.hash)
+        self.assertEqual(len(others), NUM_PATHS)
+        self.assertIn(held_item.hash, others)
+
+    async def test_straggler_gets_one_copy(self):
+        work_item = await self.first.get_work()
+        self.coordinator._leases[work_item.hash].claimed_at -= 3600
+
+        while (other := await self.second.get_work()) is not None:
+            await self.second.mark_done(other)
+
+        self.second.straggler_factor = 3
+        self.second._durations = [10.0]
+        copy = await self.second.get_work()
+        self.assertTrue(copy.speculative)
+        self.assertEqual(copy.work_paths, work_item.work_paths)
+
+        third = CoordinatorWorkQueue(self.address, self.tmpdir.name, straggler_factor=3)
+        third._durations = [10.0]
+        self.assertIsNone(await third.get_work())
+        third._disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import unittest
+
+from olmocr.http_pool import HttpConnectionPool, IncompleteResponseError
+
+
+class StubServer:
+    """Tiny HTTP/1.1 server that echoes the length of the request body back as JSON"""
+
+    def __init__(self, mode="content-length", close_after=None):
+        self.mode = mode
+        self.close_after = close_after
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        handled = 0
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                self.requests += 1
+                handled += 1
+
+                payload = json.dumps({"received": len(body), "request": json.loads(body)}).encode()
+                close = self.close_after is not None and handled >= self.close_after
+
+                if self.mode == "chunked":
+                    writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+                    for i in range(0, len(payload), 7):
+                        chunk = payload[i : i + 7]
+                        writer.write(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk))
+                    writer.write(b"0\r\nX-Trailer: yes\r\n\r\n")
+                elif self.mode == "eof":
+                    writer.write(b"HTTP/1.1 200 OK\r\n\r\n" + payload)
+                    close = True
+                else:
+                    extra = b"Connection: close\r\n" if close else b""
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n%s" % (len(payload), extra, payload))
+                await writer.drain()
+
+                if close:
+                    break
+        finally:
+            writer.close()
+
+
+class TestHttpConnectionPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            await server.stop()
+
+    async def _start(self, **kwargs):
+        server = StubServer(**kwargs)
+        await server.start()
+        self.servers.append(server)
+        return server
+
+    async def test_reuses_connections(self):
+        server = await self._start()
+        pool = HttpConnectionPool("127.0.0.1", server.port, max_connections=4)
+
+        for i in range(10):
+            status, body = await pool.post_json("/v1/chat/completions", {"i": i})
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)["request"], {"i": i})
+
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.requests, 10)
+        await pool.close()
+
+    async def test_bounded_connections(self):
+        server = await self._start()
+        pool = HttpConnectionPool("127.0.0.1", server.port, max_connections=3)
+
+        results = await asyncio.gather(*[pool.post_json("/", {"i": i}) for i in range(50)])
+
+        self.assertTrue(all(status == 200 for status, _ in results))
+        self.assertLessEqual(server.connections, 3)
+        self.assertLessEqual(pool.num_idle, 3)
+        await pool.close()
+
+    async def test_chunked_response(self):
+        server = await self._start(mode="chunked")
+        pool = HttpConnectionPool("127.0.0.1", server.port)
+
+        for _ in range(3):
+            status, body = await pool.post_json("/", {"text": "hello world" * 10})
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)["request"]["text"], "hello world" * 10)
+
+        self.assertEqual(server.connections, 1)
+        await pool.close()
+
+    async def test_connection_close_and_eof_delimited(self):
+        server = await self._start(close_after=1)
+        pool = HttpConnectionPool("127.0.0.1", server.port)
+        for _ in range(3):
+            status, _ = await pool.post_json("/", {})
+            self.assertEqual(status, 200)
+        self.assertEqual(server.connections, 3)
+
+        server = await self._start(mode="eof")
+        pool = HttpConnectionPool("127.0.0.1", server.port)
+        for _ in range(2):
+            status, body = await pool.post_json("/", {"a": 1})
+            self.assertEqual(json.loads(body)["request"], {"a": 1})
+        self.assertEqual(server.connections, 2)
+
+    async def test_retries_stale_idle_connection(self):
+        server = await self._start()
+        pool = HttpConnectionPool("127.0.0.1", server.port)
+        await pool.post_json("/", {})
+
+        # Simulate the server dropping the idle keep-alive connection after its timeout
+        stale = pool._idle[0]
+        stale.reader.feed_eof()
+
+        status, _ = await pool.post_json("/", {})
+        self.assertEqual(status, 200)
+        self.assertEqual(server.connections, 2)
+        await pool.close()
+
+    async def test_surrogates_in_body(self):
+        server = await self._start()
+        pool = HttpConnectionPool("127.0.0.1", server.port)
+        status, body = await pool.post_json("/", {"text": "bad \ud800 text"})
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["request"]["text"], "bad \ud800 text")
+        await pool.close()
+
+    async def test_truncated_body_raises(self):
+        async def truncated(reader, writer):
+            await reader.readline()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nshort")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(truncated, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = HttpConnectionPool("127.0.0.1", port)
+
+        with self.assertRaises(IncompleteResponseError):
+            await pool.post_json("/", {})
+        self.assertEqual(pool.num_idle, 0)
+
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from olmocr.journal import PageJournal, journal_dir
+from olmocr.pipeline import process_page
+
+
+class FakeS3Client:
+    """Just enough of an S3 client, backed by a dict, to list, read, write and delete journal segments"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(key for bucket, key in client.objects if bucket == Bucket and key.startswith(Prefix))
+                yield {"Contents": [{"Key": key} for key in keys]}
+
+        return Paginator()
+
+
+def make_result(page_num):
+    return {
+        "s3_path": "s3://bucket/doc.pdf",
+        "page_num": page_num,
+        "response": {
+            "primary_language": "en",
+            "is_rotation_valid": True,
+            "rotation_correction": 0,
+            "is_table": False,
+            "is_diagram": False,
+            "natural_text": f"Text of page {page_num}",
+        },
+        "input_tokens": 100 + page_num,
+        "output_tokens": 10 + page_num,
+        "is_fallback": False,
+    }
+
+
+class TestLocalPageJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workspace = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replay_after_crash(self):
+        journal = PageJournal(self.workspace, "abc", flush_pages=3)
+        flushes = 0
+        for page_num in range(1, 8):
+            if journal.record("s3://bucket/doc.pdf", page_num, make_result(page_num)):
+                journal.flush()
+                flushes += 1
+        self.assertEqual(flushes, 2)
+
+        # The worker dies here, without flushing page 7
+        resumed = PageJournal(self.workspace, "abc")
+        self.assertEqual(resumed.replay(), 6)
+        self.assertEqual(resumed.get("s3://bucket/doc.pdf", 4), make_result(4))
+        self.assertIsNone(resumed.get("s3://bucket/doc.pdf", 7))
+        self.assertIsNone(resumed.get("s3://bucket/other.pdf", 1))
+
+        # The second run adds its own segments next to the first one's, and a third run sees both
+        resumed.record("s3://bucket/doc.pdf", 7, make_result(7))
+        resumed.flush()
+        self.assertEqual(PageJournal(self.workspace, "abc").replay(), 7)
+
+        self.assertEqual(PageJournal(self.workspace, "other").replay(), 0)
+
+    def test_interval_triggers_flush(self):
+        journal = PageJournal(self.workspace, "abc", flush_pages=100, flush_interval=0.0)
+        self.assertTrue(journal.record("doc.pdf", 1, make_result(1)))
+
+        journal = PageJournal(self.workspace, "abc", flush_pages=100, flush_interval=3600.0)
+        self.assertFalse(journal.record("doc.pdf", 1, make_result(1)))
+
+    def test_partial_and_bad_segments_are_ignored(self):
+        journal = PageJournal(self.workspace, "abc")
+        journal.record("doc.pdf", 1, make_result(1))
+        journal.flush()
+
+        path = journal_dir(self.workspace, "abc")
+        with open(os.path.join(path, ".segment_dead_000000.jsonl.zst.tmp"), "wb") as f:
+            f.write(b"half written")
+        with open(os.path.join(path, "segment_dead_000001.jsonl.zst"), "wb") as f:
+            f.write(b"not zstd")
+
+        resumed = PageJournal(self.workspace, "abc")
+        self.assertEqual(resumed.replay(), 1)
+
+    def test_failed_flush_keeps_entries(self):
+        journal = PageJournal(self.workspace, "abc")
+        journal.record("doc.pdf", 1, make_result(1))
+
+        with patch.object(journal, "_write_segment", side_effect=OSError("disk full")):
+            journal.flush()
+        journal.flush()
+
+        self.assertEqual(PageJournal(self.workspace, "abc").replay(), 1)
+
+    def test_delete(self):
+        journal = PageJournal(self.workspace, "abc")
+        journal.record("doc.pdf", 1, make_result(1))
+        journal.flush()
+        journal.delete()
+
+        self.assertFalse(os.path.exists(journal_dir(self.workspace, "abc")))
+        self.assertEqual(PageJournal(self.workspace, "abc").replay(), 0)
+
+
+class TestS3PageJournal(unittest.TestCase):
+    def test_round_trip_and_delete(self):
+        s3_client = FakeS3Client()
+        s3_client.put_object(Bucket="bucket", Key="ws/results/output_abc.jsonl", Body=b"")
+
+        journal = PageJournal("s3://bucket/ws", "abc", s3_client, flush_pages=2)
+        for page_num in range(1, 5):
+            if journal.record("s3://bucket/doc.pdf", page_num, make_result(page_num)):
+                journal.flush()
+
+        segment_keys = sorted(key for _, key in s3_client.objects if key.startswith("ws/journals/abc/"))
+        self.assertEqual(len(segment_keys), 2)
+
+        resumed = PageJournal("s3://bucket/ws", "abc", s3_client)
+        self.assertEqual(resumed.replay(), 4)
+        self.assertEqual(resumed.get("s3://bucket/doc.pdf", 2), make_result(2))
+
+        resumed.delete()
+        self.assertEqual(list(s3_client.objects), [("bucket", "ws/results/output_abc.jsonl")])
+
+
+class TestProcessPageJournal(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = argparse.Namespace(
+            max_page_retries=2, target_anchor_text_len=6000, target_longest_image_dim=1024, model_max_context=8192, renderer="poppler"
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def test_journaled_page_skips_server(self):
+        journal = PageJournal(self.tmpdir.name, "abc")
+        journal.record("s3://bucket/doc.pdf", 3, make_result(3))
+
+        with (
+            patch("olmocr.pipeline.apost", new_callable=AsyncMock) as mock_apost,
+            patch("olmocr.pipeline.build_page_query", new_callable=AsyncMock) as mock_query,
+        ):
+            page_result = await process_page(self.args, 0, "s3://bucket/doc.pdf", "/tmp/doc.pdf", 3, journal)
+
+        mock_apost.assert_not_called()
+        mock_query.assert_not_called()
+        self.assertEqual(page_result.response.natural_text, "Text of page 3")
+        self.assertEqual((page_result.input_tokens, page_result.output_tokens, page_result.is_fallback), (103, 13, False))
+
+    async def test_finished_page_is_recorded(self):
+        journal = PageJournal(self.tmpdir.name, "abc", flush_pages=1)
+        completion = {
+            "usage": {"prompt_tokens": 50, "completion_tokens": 5, "total_tokens": 55},
+            "choices": [{"message": {"content": json.dumps(dict(make_result(1)["response"], natural_text="Hello"))}}],
+        }
+
+        with (
+            patch("olmocr.pipeline.apost", new_callable=AsyncMock, return_value=(200, json.dumps(completion).encode())),
+            patch("olmocr.pipeline.build_page_query", new_callable=AsyncMock, return_value={}),
+        ):
+            page_result = await process_page(self.args, 0, "s3://bucket/doc.pdf", "/tmp/doc.pdf", 1, journal)
+
+        self.assertEqual(page_result.response.natural_text, "Hello")
+
+        # flush_pages=1 means the page is already on disk for whoever resumes the work item
+        resumed = PageJournal(self.tmpdir.name, "abc")
+        self.assertEqual(resumed.replay(), 1)
+        self.assertEqual(resumed.get("s3://bucket/doc.pdf", 1)["response"]["natural_text"], "Hello")
+        self.assertEqual(resumed.get("s3://bucket/doc.pdf", 1)["input_tokens"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
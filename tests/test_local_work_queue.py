@@ -0,0 +1,127 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from olmocr.work_queue import LocalWorkQueue
+
+
+class TestLocalWorkQueueLocks(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.first = LocalWorkQueue(self.tmpdir.name)
+        await self.first.populate_queue(["a.pdf"], items_per_group=1)
+        await self.first.initialize_queue()
+
+        self.second = LocalWorkQueue(self.tmpdir.name)
+        await self.second.initialize_queue()
+
+    async def asyncTearDown(self):
+        self.tmpdir.cleanup()
+
+    def _lock_file(self, work_item):
+        return os.path.join(self.tmpdir.name, "worker_locks", f"output_{work_item.hash}.jsonl")
+
+    def _age_lock(self, work_item, seconds):
+        old = time.time() - seconds
+        os.utime(self._lock_file(work_item), (old, old))
+
+    async def test_only_one_worker_gets_an_item(self):
+        work_item = await self.first.get_work()
+        self.assertIsNotNone(work_item)
+
+        with open(self._lock_file(work_item)) as f:
+            self.assertEqual(json.load(f)["worker"], self.first.worker_id)
+
+        self.assertIsNone(await self.second.get_work())
+
+    async def test_stale_lock_is_taken_over(self):
+        work_item = await self.first.get_work()
+        self._age_lock(work_item, 3600)
+
+        self.assertEqual(await self.second.get_work(), work_item)
+        with open(self._lock_file(work_item)) as f:
+            self.assertEqual(json.load(f)["worker"], self.second.worker_id)
+        self.assertEqual(os.listdir(os.path.dirname(self._lock_file(work_item))), [os.path.basename(self._lock_file(work_item))])
+
+        # The first worker finds out on its next heartbeat that the item isn't its own any more
+        self.assertFalse(await self.first.renew_lock(work_item))
+        self.assertTrue(await self.second.renew_lock(work_item))
+
+    async def test_giving_back_a_lock_never_overwrites_a_newer_one(self):
+        work_item = await self.first.get_work()
+        self._age_lock(work_item, 3600)
+        lock_file = self._lock_file(work_item)
+        third = LocalWorkQueue(self.tmpdir.name)
+        original_rename = os.rename
+
+        def racing_rename(src, dst):
+            # The first worker takes its stale lock back over just before the second one moves it out of the way,
+            # and a third worker creates a fresh lock once it is gone
+            with open(src, "wb") as f:
+                f.write(self.first._lock_body(work_item))
+            original_rename(src, dst)
+            self.assertTrue(third._try_lock(work_item, 300))
+
+        with patch("olmocr.work_queue.os.rename", side_effect=racing_rename):
+            self.assertFalse(self.second._try_lock(work_item, 300))
+
+        with open(lock_file) as f:
+            self.assertEqual(json.load(f)["worker"], third.worker_id)
+        self.assertEqual(os.listdir(os.path.dirname(lock_file)), [os.path.basename(lock_file)])
+        self.assertFalse(await self.first.renew_lock(work_item))
+
+    async def test_heartbeat_keeps_lease(self):
+        work_item = await self.first.get_work()
+        self._age_lock(work_item, 3600)
+
+        heartbeat = asyncio.create_task(self.first.heartbeat(work_item, interval=0.01))
+        await asyncio.sleep(0.1)
+
+        # Renewed well within the lease, so the second worker leaves it alone
+        self.assertLess(time.time() - os.path.getmtime(self._lock_file(work_item)), 60)
+        self.assertIsNone(await self.second.get_work())
+
+        heartbeat.cancel()
+        await self.first.mark_done(work_item)
+        self.assertFalse(os.path.exists(self._lock_file(work_item)))
+
+    async def test_heartbeat_stops_when_lock_is_lost(self):
+        work_item = await self.first.get_work()
+        os.remove(self._lock_file(work_item))
+
+        await asyncio.wait_for(self.first.heartbeat(work_item, interval=0.01), timeout=5)
+
+    async def test_straggler_gets_one_copy(self):
+        work_item = await self.first.get_work()
+
+        # The second worker has finished items in 10s, and the first one claimed its item an hour ago
+        self.second.straggler_factor = 3
+        self.second._durations = [10.0]
+        with open(self._lock_file(work_item)) as f:
+            lock = json.load(f)
+        lock["time"] = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)).isoformat()
+        with open(self._lock_file(work_item), "w") as f:
+            json.dump(lock, f)
+
+        copy = await self.second.get_work()
+        self.assertTrue(copy.speculative)
+        self.assertEqual((copy.hash, copy.work_paths), (work_item.hash, work_item.work_paths))
+
+        # Nobody else gets another copy, and the copy leaves the original's lock alone
+        third = LocalWorkQueue(self.tmpdir.name, straggler_factor=3)
+        third._durations = [10.0]
+        await third.initialize_queue()
+        self.assertIsNone(await third.get_work())
+
+        await asyncio.wait_for(self.second.heartbeat(copy), timeout=5)
+        await self.second.mark_done(copy)
+        self.assertTrue(await self.first.renew_lock(work_item))
+
+
+if __name__ == "__main__":
+    unittest.main()
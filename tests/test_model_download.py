@@ -0,0 +1,118 @@
+import hashlib
+import io
+import os
+import random
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from olmocr.s3_utils import _PartialDownload, download_dir_from_storage
+
+
+class FakeS3Client:
+    """Objects under a prefix, with MD5 ETags, serving ranged GETs and recording every range that was requested"""
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.ranges = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                contents = [
+                    {"Key": key, "Size": len(data), "ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+                    for key, data in sorted(client.objects.items())
+                    if key.startswith(Prefix)
+                ]
+                yield {"Contents": contents}
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(value) for value in Range[len("bytes=") :].split("-"))
+        with self.lock:
+            self.ranges.append((Key, start, end))
+        return {"Body": io.BytesIO(self.objects[Key][start : end + 1])}
+
+
+class TestModelDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = random.Random(0)
+        self.s3_client = FakeS3Client(
+            {
+                "model/config.json": b'{"model_type": "qwen2_vl"}',
+                "model/weights/model-00001.safetensors": rng.randbytes(10_000),
+                "model/weights/model-00002.safetensors": rng.randbytes(7_000),
+                "model/empty.txt": b"",
+            }
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def download(self):
+        with mock.patch("olmocr.s3_utils.boto3.client", return_value=self.s3_client):
+            download_dir_from_storage("s3://bucket/model", self.tmpdir.name, storage_type="s3", part_size=1024)
+
+    def assert_downloaded(self):
+        for key, data in self.s3_client.objects.items():
+            with open(os.path.join(self.tmpdir.name, os.path.relpath(key, "model")), "rb") as f:
+                self.assertEqual(f.read(), data)
+
+    def test_download_in_parts_then_skip_when_warm(self):
+        self.download()
+        self.assert_downloaded()
+        # 10 parts of the first shard, 7 of the second, 1 of the config, none of the empty file
+        self.assertEqual(len(self.s3_client.ranges), 18)
+        self.assertEqual([name for name in os.listdir(os.path.join(self.tmpdir.name, "weights")) if ".part" in name], [])
+
+        with mock.patch("olmocr.s3_utils.compare_hashes_s3") as compare_hashes:
+            self.download()
+        self.assertEqual(len(self.s3_client.ranges), 18)
+        compare_hashes.assert_not_called()
+
+    def test_resumes_partial_download(self):
+        key = "model/weights/model-00001.safetensors"
+        data = self.s3_client.objects[key]
+        local_file_path = os.path.join(self.tmpdir.name, "weights", "model-00001.safetensors")
+        os.makedirs(os.path.dirname(local_file_path))
+
+        # As left behind by a download that was killed after its first three parts
+        partial_download = _PartialDownload(local_file_path, len(data), hashlib.md5(data).hexdigest(), 1024)
+        for index in range(3):
+            partial_download.download_part(lambda f, start, end: f.write(data[start : end + 1]), index)
+
+        self.download()
+        self.assert_downloaded()
+        starts = sorted(start for requested_key, start, _ in self.s3_client.ranges if requested_key == key)
+        self.assertEqual(starts, list(range(3 * 1024, len(data), 1024)))
+
+    def test_corrupt_download_is_removed(self):
+        key = "model/config.json"
+        good_data = self.s3_client.objects[key]
+        get_object = self.s3_client.get_object
+
+        def corrupt_get_object(Bucket, Key, Range):
+            response = get_object(Bucket, Key, Range)
+            if Key == key:
+                response["Body"] = io.BytesIO(response["Body"].read().upper())
+            return response
+
+        self.s3_client.get_object = corrupt_get_object
+        with self.assertRaises(IOError):
+            self.download()
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "config.json")))
+
+        self.s3_client.get_object = get_object
+        self.download()
+        with open(os.path.join(self.tmpdir.name, "config.json"), "rb") as f:
+            self.assertEqual(f.read(), good_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
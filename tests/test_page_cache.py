@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from olmocr.page_cache import PageCache
+from olmocr.pipeline import BatchRender, build_page_query
+from olmocr.prompts.anchor import BoundingBox, PageReport, _pdf_report
+
+
+def fake_render(local_pdf_path, page_num, target_longest_image_dim=2048, renderer="poppler", encoding=None):
+    img = Image.new("RGB", (target_longest_image_dim // 2, target_longest_image_dim), color="white")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+class TestPageCache(unittest.TestCase):
+    def test_image_keys(self):
+        cache = PageCache()
+        cache.put_image("a.pdf", 1, 1024, 0, "img0")
+        cache.put_image("a.pdf", 1, 1024, 90, "img90")
+
+        self.assertEqual(cache.get_image("a.pdf", 1, 1024, 0), "img0")
+        self.assertEqual(cache.get_image("a.pdf", 1, 1024, 90), "img90")
+        self.assertIsNone(cache.get_image("a.pdf", 1, 2048, 0))
+        self.assertIsNone(cache.get_image("a.pdf", 2, 1024, 0))
+        self.assertIsNone(cache.get_image("b.pdf", 1, 1024, 0))
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_eviction(self):
+        cache = PageCache()
+        report = PageReport(mediabox=BoundingBox(0, 0, 100, 100), text_elements=[], image_elements=[])
+        for page in (1, 2):
+            cache.put_image("a.pdf", page, 1024, 0, f"img{page}")
+            cache.put_report("a.pdf", page, report)
+        cache.put_image("b.pdf", 1, 1024, 0, "other")
+
+        cache.evict_page("a.pdf", 1)
+        self.assertIsNone(cache.get_image("a.pdf", 1, 1024, 0))
+        self.assertIsNone(cache.get_report("a.pdf", 1))
+        self.assertEqual(cache.get_image("a.pdf", 2, 1024, 0), "img2")
+        self.assertIs(cache.get_report("a.pdf", 2), report)
+
+        cache.evict_document("a.pdf")
+        self.assertIsNone(cache.get_image("a.pdf", 2, 1024, 0))
+        self.assertEqual(cache.num_documents, 1)
+
+        cache.evict_document("b.pdf")
+        self.assertEqual(cache.num_documents, 0)
+
+
+class TestPendingImages(unittest.IsolatedAsyncioTestCase):
+    async def test_resolve_and_evict(self):
+        cache = PageCache()
+        first = cache.add_pending_image("a.pdf", 1, 1024)
+        second = cache.add_pending_image("a.pdf", 2, 1024)
+        self.assertIs(cache.get_pending_image("a.pdf", 1, 1024), first)
+        self.assertIsNone(cache.get_pending_image("a.pdf", 1, 2048))
+
+        cache.resolve_pending_image("a.pdf", 1, 1024, "img1")
+        self.assertEqual(await first, "img1")
+        self.assertEqual(cache.get_image("a.pdf", 1, 1024, 0), "img1")
+        self.assertIsNone(cache.get_pending_image("a.pdf", 1, 1024))
+
+        # Images nobody is waiting for anymore are dropped
+        cache.resolve_pending_image("a.pdf", 1, 1024, "late")
+        self.assertEqual(cache.get_image("a.pdf", 1, 1024, 0), "img1")
+
+        cache.evict_document("a.pdf")
+        self.assertIsNone(await second)
+        self.assertEqual(cache.num_documents, 0)
+
+
+class TestBatchRender(unittest.IsolatedAsyncioTestCase):
+    async def test_pages_come_from_batches(self):
+        local_pdf_path = os.path.join(os.path.dirname(__file__), "gnarly_pdfs", "pdftotext_two_column_issue.pdf")
+        cache = PageCache()
+        batches = []
+
+        def fake_batch(path, first_page, last_page, target_longest_image_dim, encoding=None):
+            batches.append((first_page, last_page))
+            for page in range(first_page, last_page + 1):
+                yield page, fake_render(path, page, target_longest_image_dim)
+
+        with (
+            patch("olmocr.pipeline.render_pdf_to_base64png_batch", side_effect=fake_batch),
+            patch("olmocr.pipeline.render_pdf_to_base64png", side_effect=fake_render) as mock_render,
+            patch("olmocr.pipeline.process_pool", ThreadPoolExecutor(max_workers=1)),
+        ):
+            batch_render = BatchRender(cache, local_pdf_path, 1, 3, 1024, chunk_pages=2)
+            for page in (1, 2, 3):
+                batch_render.render(page)
+            queries = await asyncio.gather(*[build_page_query(local_pdf_path, page, 1024, 6000, page_cache=cache) for page in (1, 2, 3)])
+            await batch_render.wait()
+
+        self.assertEqual(sorted(batches), [(1, 2), (3, 3)])
+        self.assertEqual(mock_render.call_count, 0)
+        self.assertEqual(len(queries), 3)
+
+    async def test_chunks_start_on_demand(self):
+        cache = PageCache()
+        batches = []
+
+        def fake_batch(path, first_page, last_page, target_longest_image_dim, encoding=None):
+            batches.append((first_page, last_page))
+            for page in range(first_page, last_page + 1):
+                yield page, f"img{page}"
+
+        with patch("olmocr.pipeline.render_pdf_to_base64png_batch", side_effect=fake_batch):
+            batch_render = BatchRender(cache, "a.pdf", 5, 14, 1024, chunk_pages=4)
+            batch_render.render(6)
+            batch_render.render(5)
+            await batch_render.wait()
+
+            # Only the chunk that was asked for got rendered, and nothing else is pending
+            self.assertEqual(batches, [(5, 8)])
+            self.assertEqual(cache.get_image("a.pdf", 8, 1024, 0), "img8")
+            self.assertIsNone(cache.get_pending_image("a.pdf", 9, 1024))
+
+            batch_render.render(14)
+            self.assertIsNotNone(cache.get_pending_image("a.pdf", 14, 1024))
+            await batch_render.wait()
+
+        self.assertEqual(batches, [(5, 8), (13, 14)])
+        self.assertEqual(cache.get_image("a.pdf", 13, 1024, 0), "img13")
+
+    async def test_failed_batch_falls_back_to_single_pages(self):
+        local_pdf_path = os.path.join(os.path.dirname(__file__), "gnarly_pdfs", "pdftotext_two_column_issue.pdf")
+        cache = PageCache()
+
+        def broken_batch(path, first_page, last_page, target_longest_image_dim, encoding=None):
+            yield first_page, fake_render(path, first_page, target_longest_image_dim)
+            raise AssertionError("pdftoppm crashed")
+
+        with (
+            patch("olmocr.pipeline.render_pdf_to_base64png_batch", side_effect=broken_batch),
+            patch("olmocr.pipeline.render_pdf_to_base64png", side_effect=fake_render) as mock_render,
+            patch("olmocr.pipeline.process_pool", ThreadPoolExecutor(max_workers=1)),
+        ):
+            batch_render = BatchRender(cache, local_pdf_path, 1, 3, 1024)
+            batch_render.render(1)
+            await asyncio.gather(*[build_page_query(local_pdf_path, page, 1024, 6000, page_cache=cache) for page in (1, 2, 3)])
+            await batch_render.wait()
+
+        self.assertEqual(mock_render.call_count, 2)
+
+
+class TestBuildPageQueryCache(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_reuse_render_and_report(self):
+        local_pdf_path = os.path.join(os.path.dirname(__file__), "gnarly_pdfs", "pdftotext_two_column_issue.pdf")
+        cache = PageCache()
+
+        with (
+            patch("olmocr.pipeline.render_pdf_to_base64png", side_effect=fake_render) as mock_render,
+            patch("olmocr.pipeline._pdf_report", wraps=_pdf_report) as mock_report,
+            patch("olmocr.pipeline.process_pool", ThreadPoolExecutor(max_workers=1)),
+        ):
+            first = await build_page_query(local_pdf_path, 2, 1024, 6000, page_cache=cache)
+            smaller_anchor = await build_page_query(local_pdf_path, 2, 1024, 100, page_cache=cache)
+            rotated = await build_page_query(local_pdf_path, 2, 1024, 6000, image_rotation=90, page_cache=cache)
+            rotated_again = await build_page_query(local_pdf_path, 2, 1024, 6000, image_rotation=90, page_cache=cache)
+
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual(mock_report.call_count, 1)
+
+        first_text = first["messages"][0]["content"][0]["text"]
+        smaller_text = smaller_anchor["messages"][0]["content"][0]["text"]
+        self.assertLess(len(smaller_text), len(first_text))
+
+        rotated_url = rotated["messages"][0]["content"][1]["image_url"]["url"]
+        self.assertEqual(rotated_url, rotated_again["messages"][0]["content"][1]["image_url"]["url"])
+        with Image.open(BytesIO(base64.b64decode(rotated_url.split(",", 1)[1]))) as img:
+            self.assertEqual(img.size, (1024, 512))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from unittest.mock import patch
+
+from olmocr.pipeline import (
+    PageResult,
+    document_hash,
+    failed_partial_result,
+    list_partial_results,
+    merge_partial_results,
+    process_pdf,
+    write_partial_result,
+)
+from olmocr.prompts import PageResponse
+from olmocr.work_queue import (
+    LocalWorkQueue,
+    WorkQueue,
+    page_range_work_path,
+    parse_page_range_work_path,
+    split_page_ranges,
+)
+
+GNARLY_PDFS = os.path.join(os.path.dirname(__file__), "gnarly_pdfs")
+
+
+def make_page_result(pdf_path, page_num, is_fallback=False):
+    response = PageResponse(
+        primary_language="en",
+        is_rotation_valid=True,
+        rotation_correction=0,
+        is_table=False,
+        is_diagram=False,
+        natural_text=f"Page {page_num}",
+    )
+    return PageResult(pdf_path, page_num, response, input_tokens=10, output_tokens=1, is_fallback=is_fallback)
+
+
+def make_partial(pdf_path, num_pages, first_page, last_page):
+    return {
+        "Source-File": pdf_path,
+        "pdf-total-pages": num_pages,
+        "first_page": first_page,
+        "last_page": last_page,
+        "pages": [asdict(make_page_result(pdf_path, page_num)) for page_num in range(first_page, last_page + 1)],
+    }
+
+
+class TestPageRangeWorkPaths(unittest.TestCase):
+    def test_round_trip(self):
+        work_path = page_range_work_path("s3://bucket/big.pdf", 1001, 2000)
+        self.assertEqual(work_path, "s3://bucket/big.pdf#pages=1001-2000")
+        self.assertEqual(parse_page_range_work_path(work_path), ("s3://bucket/big.pdf", 1001, 2000))
+        self.assertEqual(parse_page_range_work_path("s3://bucket/big.pdf"), ("s3://bucket/big.pdf", None, None))
+        self.assertEqual(parse_page_range_work_path("s3://bucket/#pages=notes.pdf"), ("s3://bucket/#pages=notes.pdf", None, None))
+
+        work_path = page_range_work_path("s3://bucket/big.pdf", 2001, None)
+        self.assertEqual(work_path, "s3://bucket/big.pdf#pages=2001-")
+        self.assertEqual(parse_page_range_work_path(work_path), ("s3://bucket/big.pdf", 2001, None))
+
+    def test_split_evenly(self):
+        self.assertEqual(split_page_ranges(3000, 1000), [(1, 1000), (1001, 2000), (2001, 3000)])
+        self.assertEqual(split_page_ranges(1001, 1000), [(1, 501), (502, 1001)])
+        self.assertEqual(split_page_ranges(10, 1000), [(1, 10)])
+
+
+class TestPopulateQueueSplitting(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.work_queue = LocalWorkQueue(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def test_large_pdfs_become_page_range_items(self):
+        paths = ["a.pdf", "b.pdf", "c.pdf", "huge.pdf"]
+        page_counts = {"a.pdf": 10, "b.pdf": 20, "c.pdf": 30, "huge.pdf": 2500}
+
+        await self.work_queue.populate_queue(paths, items_per_group=2, page_counts=page_counts, max_pages_per_unit=1000)
+        await self.work_queue.initialize_queue()
+
+        items = []
+        while (item := await self.work_queue.get_work()) is not None:
+            items.append(item)
+
+        work_paths = sorted(tuple(item.work_paths) for item in items)
+        self.assertEqual(
+            work_paths,
+            [
+                ("a.pdf", "b.pdf"),
+                ("c.pdf",),
+                ("huge.pdf#pages=1-834",),
+                ("huge.pdf#pages=1669-",),
+                ("huge.pdf#pages=835-1668",),
+            ],
+        )
+        for item in items:
+            self.assertEqual(item.hash, WorkQueue._compute_workgroup_hash(item.work_paths))
+
+        # Adding the same pdfs again finds the split one already in the index
+        with patch.object(self.work_queue._index, "append") as mock_append:
+            await self.work_queue.populate_queue(paths, items_per_group=2, page_counts=page_counts, max_pages_per_unit=1000)
+        mock_append.assert_not_called()
+
+    async def test_no_splitting_by_default(self):
+        await self.work_queue.populate_queue(["huge.pdf"], items_per_group=1, page_counts={"huge.pdf": 5000})
+        await self.work_queue.initialize_queue()
+        self.assertEqual((await self.work_queue.get_work()).work_paths, ["huge.pdf"])
+
+
+class TestProcessPageRange(unittest.IsolatedAsyncioTestCase):
+    async def test_only_the_range_is_processed(self):
+        pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        args = argparse.Namespace(apply_filter=False, max_pages_in_flight_per_pdf=3, renderer="pdfium", target_longest_image_dim=1024, pdf_scratch_dir=None)
+
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_process_page(args, worker_id, pdf_orig_path, pdf_local_path, page_num, journal=None):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return make_page_result(pdf_orig_path, page_num)
+
+        with (
+            patch("olmocr.pipeline.process_page", side_effect=fake_process_page),
+            patch("olmocr.pipeline.process_pool", ThreadPoolExecutor(max_workers=1)),
+        ):
+            partial = await process_pdf(args, 0, page_range_work_path(pdf_path, 5, 12))
+
+        self.assertEqual(partial["Source-File"], pdf_path)
+        self.assertEqual(partial["pdf-total-pages"], 14)
+        self.assertEqual((partial["first_page"], partial["last_page"]), (5, 12))
+        self.assertEqual([page["page_num"] for page in partial["pages"]], list(range(5, 13)))
+        self.assertEqual(max_in_flight, 3)
+
+    async def test_last_range_runs_to_the_end(self):
+        # The pdf has more pages than it was split by, so the last range picks up the rest
+        pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        args = argparse.Namespace(apply_filter=False, max_pages_in_flight_per_pdf=3, renderer="pdfium", target_longest_image_dim=1024, pdf_scratch_dir=None)
+
+        async def fake_process_page(args, worker_id, pdf_orig_path, pdf_local_path, page_num, journal=None):
+            return make_page_result(pdf_orig_path, page_num)
+
+        with (
+            patch("olmocr.pipeline.process_page", side_effect=fake_process_page),
+            patch("olmocr.pipeline.process_pool", ThreadPoolExecutor(max_workers=1)),
+        ):
+            partial = await process_pdf(args, 0, page_range_work_path(pdf_path, 9, None))
+
+        self.assertEqual((partial["first_page"], partial["last_page"]), (9, 14))
+        self.assertEqual([page["page_num"] for page in partial["pages"]], list(range(9, 15)))
+
+
+class TestMergePartialResults(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = argparse.Namespace(workspace=self.tmpdir.name, output_compression="none", max_page_error_rate=0.004)
+        self.pdf_path = "s3://bucket/huge.pdf"
+        self.doc_hash = document_hash(self.pdf_path)
+        self.merged_path = os.path.join(self.tmpdir.name, "results", f"output_{self.doc_hash}.jsonl")
+        os.makedirs(os.path.join(self.tmpdir.name, "results"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_merges_once_every_range_is_done(self):
+        self.assertEqual(self.doc_hash, WorkQueue._compute_workgroup_hash([self.pdf_path]))
+
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 6, 9))
+        self.assertFalse(merge_partial_results(self.args, self.doc_hash))
+        self.assertFalse(os.path.exists(self.merged_path))
+
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 1, 5))
+        self.assertTrue(merge_partial_results(self.args, self.doc_hash))
+
+        with open(self.merged_path) as f:
+            docs = [json.loads(line) for line in f]
+        self.assertEqual(len(docs), 1)
+        doc = docs[0]
+        self.assertEqual(doc["text"], "\n".join(f"Page {page_num}" for page_num in range(1, 10)))
+        self.assertEqual(doc["metadata"]["Source-File"], self.pdf_path)
+        self.assertEqual(doc["metadata"]["pdf-total-pages"], 9)
+        self.assertEqual(doc["metadata"]["total-input-tokens"], 90)
+        self.assertEqual([span[2] for span in doc["attributes"]["pdf_page_numbers"]], list(range(1, 10)))
+        self.assertEqual(doc["text"][slice(*doc["attributes"]["pdf_page_numbers"][6][:2])], "Page 7\n")
+
+        # The partials are gone, so nothing is left to merge at the end of the run
+        self.assertEqual(list_partial_results(self.tmpdir.name), [])
+        self.assertFalse(merge_partial_results(self.args, self.doc_hash))
+
+    def test_failed_range_drops_the_document(self):
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 1, 5))
+        write_partial_result(self.args, failed_partial_result(page_range_work_path(self.pdf_path, 6, None)))
+
+        self.assertTrue(merge_partial_results(self.args, self.doc_hash))
+        self.assertFalse(os.path.exists(self.merged_path))
+        self.assertEqual(list_partial_results(self.tmpdir.name), [])
+
+    def test_failed_range_waits_for_the_others(self):
+        write_partial_result(self.args, failed_partial_result(page_range_work_path(self.pdf_path, 4, 6)))
+        self.assertFalse(merge_partial_results(self.args, self.doc_hash))
+
+        # A straggler copy of the failed range finished it after all
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 4, 6))
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 1, 3))
+        self.assertFalse(merge_partial_results(self.args, self.doc_hash))
+
+        write_partial_result(self.args, make_partial(self.pdf_path, 9, 7, 9))
+        self.assertTrue(merge_partial_results(self.args, self.doc_hash))
+        self.assertTrue(os.path.exists(self.merged_path))
+
+    def test_error_rate_applies_to_the_whole_document(self):
+        partial = make_partial(self.pdf_path, 4, 1, 4)
+        partial["pages"][2] = asdict(make_page_result(self.pdf_path, 3, is_fallback=True))
+        write_partial_result(self.args, partial)
+
+        self.assertTrue(merge_partial_results(self.args, self.doc_hash))
+        self.assertFalse(os.path.exists(self.merged_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
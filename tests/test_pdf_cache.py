@@ -0,0 +1,144 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from olmocr.pdf_cache import PDF_CACHE_LOCK_DIGITS, PdfCache
+
+
+class FakeS3Client:
+    """Objects in a dict, with ETags that change along with the content, counting downloads"""
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.num_downloads = 0
+        self.lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        return {"ETag": f'"{len(self.objects[Key])}-{self.objects[Key][:4].hex()}"'}
+
+    def get_object(self, Bucket, Key, IfMatch=None):
+        if IfMatch is not None and IfMatch != self.head_object(Bucket, Key)["ETag"]:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        with self.lock:
+            self.num_downloads += 1
+        # Slow enough that concurrent fills overlap
+        time.sleep(0.05)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+def fill_from_process(cache_dir):
+    """Runs in a process of its own, returning the path it got and how many downloads that took"""
+    s3_client = FakeS3Client({"a.pdf": b"%PDF-shared"})
+    path = PdfCache(cache_dir).get(s3_client, "s3://bucket/a.pdf")
+    return path, s3_client.num_downloads
+
+
+class TestPdfCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.s3_client = FakeS3Client({"a.pdf": b"%PDF-a" * 100, "b.pdf": b"%PDF-b" * 100, "c.pdf": b"%PDF-c" * 100})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hits_and_misses(self):
+        cache = PdfCache(self.tmpdir.name)
+        path = cache.get(self.s3_client, "s3://bucket/a.pdf")
+        self.assertEqual(cache.get(self.s3_client, "s3://bucket/a.pdf"), path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.s3_client.objects["a.pdf"])
+        self.assertEqual((cache.stats.hits, cache.stats.misses, self.s3_client.num_downloads), (1, 1, 1))
+
+        # A new version of the pdf is a new entry
+        self.s3_client.objects["a.pdf"] = b"%PDF-new"
+        self.assertNotEqual(cache.get(self.s3_client, "s3://bucket/a.pdf"), path)
+        self.assertEqual(self.s3_client.num_downloads, 2)
+
+        # Local paths are left alone
+        self.assertEqual(cache.get(self.s3_client, "/data/local.pdf"), "/data/local.pdf")
+
+    def test_concurrent_fills_download_once(self):
+        cache = PdfCache(self.tmpdir.name)
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(cache.get(self.s3_client, "s3://bucket/b.pdf"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.s3_client.num_downloads, 1)
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(4) as pool:
+            results = pool.map(fill_from_process, [self.tmpdir.name] * 4)
+        self.assertEqual(len({path for path, _ in results}), 1)
+        self.assertEqual(sum(num_downloads for _, num_downloads in results), 1)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = PdfCache(self.tmpdir.name, max_bytes=1500)
+        a = cache.get(self.s3_client, "s3://bucket/a.pdf")
+        b = cache.get(self.s3_client, "s3://bucket/b.pdf")
+        os.utime(a, (time.time() - 60, time.time() - 60))
+        os.utime(b, (time.time() - 120, time.time() - 120))
+
+        # a was used more recently than b, so b goes to make room for c
+        cache.get(self.s3_client, "s3://bucket/a.pdf")
+        c = cache.get(self.s3_client, "s3://bucket/c.pdf")
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+        self.assertTrue(os.path.exists(c))
+        self.assertEqual(cache.stats.evicted_files, 1)
+
+    def test_no_lock_file_per_entry(self):
+        cache = PdfCache(self.tmpdir.name)
+        paths = [cache.get(self.s3_client, f"s3://bucket/{key}") for key in ["a.pdf", "b.pdf", "c.pdf"]]
+
+        # Nothing but the entries themselves is left next to them, that eviction would have to clean up
+        for path in paths:
+            self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+        lock_files = os.listdir(os.path.join(self.tmpdir.name, ".locks"))
+        self.assertEqual(sorted(lock_files), sorted({f"{os.path.basename(path)[:PDF_CACHE_LOCK_DIGITS]}.lock" for path in paths}))
+
+    def test_links_survive_eviction(self):
+        cache = PdfCache(self.tmpdir.name)
+        dest = os.path.join(self.tmpdir.name, "document.pdf")
+        cache.link(self.s3_client, "s3://bucket/a.pdf", dest)
+        os.remove(cache.get(self.s3_client, "s3://bucket/a.pdf"))
+
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), self.s3_client.objects["a.pdf"])
+
+    def test_other_filesystem_downloads_straight_to_dest(self):
+        cache = PdfCache(os.path.join(self.tmpdir.name, "cache"))
+        dest = os.path.join(self.tmpdir.name, "document.pdf")
+
+        with patch.object(cache, "_on_cache_filesystem", return_value=False):
+            cache.link(self.s3_client, "s3://bucket/a.pdf", dest)
+
+            # Written once, to dest, and not into the cache
+            with open(dest, "rb") as f:
+                self.assertEqual(f.read(), self.s3_client.objects["a.pdf"])
+            etag = self.s3_client.head_object("bucket", "a.pdf")["ETag"].strip('"')
+            self.assertFalse(os.path.exists(cache.entry_path("s3://bucket/a.pdf", etag)))
+            self.assertEqual((cache.stats.misses, self.s3_client.num_downloads), (1, 1))
+
+            # A pdf that is in the cache already is copied from there
+            cached = cache.get(self.s3_client, "s3://bucket/b.pdf")
+            other_dest = os.path.join(self.tmpdir.name, "other.pdf")
+            cache.link(self.s3_client, "s3://bucket/b.pdf", other_dest)
+            self.assertEqual(self.s3_client.num_downloads, 2)
+            self.assertTrue(os.path.exists(cached))
+            with open(other_dest, "rb") as f:
+                self.assertEqual(f.read(), self.s3_client.objects["b.pdf"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pypdf import PdfReader
+
+from olmocr.pdf_handle import PdfHandleCache, get_pdf_handle
+from olmocr.prompts.anchor import _linearize_pdf_report, _pdf_report
+
+GNARLY_PDFS = os.path.join(os.path.dirname(__file__), "gnarly_pdfs")
+
+
+class TestPdfHandleCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _copy(self, name, dest_name=None):
+        dest = os.path.join(self.tmpdir, dest_name or name)
+        shutil.copy(os.path.join(GNARLY_PDFS, name), dest)
+        return dest
+
+    def test_reuses_handle(self):
+        cache = PdfHandleCache()
+        path = self._copy("pdftotext_two_column_issue.pdf")
+
+        handle = cache.get(path)
+        self.assertIs(cache.get(path), handle)
+        self.assertIs(cache.get(os.path.relpath(path)), handle)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(handle.num_pages, len(PdfReader(path).pages))
+
+    def test_rewritten_file_is_parsed_again(self):
+        cache = PdfHandleCache()
+        path = self._copy("pdftotext_two_column_issue.pdf", "doc.pdf")
+        handle = cache.get(path)
+
+        shutil.copy(os.path.join(GNARLY_PDFS, "skinnypage.pdf"), path)
+        new_handle = cache.get(path)
+
+        self.assertIsNot(new_handle, handle)
+        self.assertEqual(new_handle.num_pages, len(PdfReader(path).pages))
+        self.assertEqual(len(cache), 1)
+
+    def test_lru_eviction(self):
+        names = ["pdftotext_two_column_issue.pdf", "skinnypage.pdf", "olmo-page-1.pdf"]
+        paths = [self._copy(name) for name in names]
+
+        cache = PdfHandleCache(max_handles=2)
+        first = cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(paths[0]), first)
+        self.assertEqual(cache.misses, 3)
+
+        sizes = [os.path.getsize(path) for path in paths]
+        cache = PdfHandleCache(max_bytes=max(sizes) - 1)
+        for path in paths:
+            cache.get(path)
+        self.assertEqual(len(cache), 1)
+
+        cache.evict(paths[2])
+        self.assertEqual(len(cache), 0)
+
+    def test_deleted_files_are_dropped(self):
+        cache = PdfHandleCache()
+        gone = self._copy("pdftotext_two_column_issue.pdf", "scratch.pdf")
+        cache.get(gone)
+        os.remove(gone)
+
+        cache.get(self._copy("skinnypage.pdf"))
+        self.assertEqual(len(cache), 1)
+
+    def test_geometry_matches_pypdf(self):
+        for name in ["pdftotext_two_column_issue.pdf", "skinnypage.pdf", "edgar.pdf"]:
+            path = os.path.join(GNARLY_PDFS, name)
+            reader = PdfReader(path)
+            handle = get_pdf_handle(path)
+
+            for page_num in range(1, len(reader.pages) + 1):
+                geometry = handle.geometry(page_num)
+                self.assertAlmostEqual(geometry.width, reader.pages[page_num - 1].mediabox.width, places=3)
+                self.assertAlmostEqual(geometry.height, reader.pages[page_num - 1].mediabox.height, places=3)
+
+
+class TestPdfReportUsesHandle(unittest.TestCase):
+    def test_document_parsed_once(self):
+        path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        num_pages = len(PdfReader(path).pages)
+        cache = PdfHandleCache()
+
+        with patch("olmocr.pdf_handle._pdf_handle_cache", cache), patch("olmocr.pdf_handle.PdfReader", wraps=PdfReader) as mock_reader:
+            reports = [_pdf_report(path, page_num) for page_num in range(1, num_pages + 1)]
+            again = _pdf_report(path, 1)
+
+        self.assertEqual(mock_reader.call_count, 1)
+        self.assertEqual(_linearize_pdf_report(reports[0]), _linearize_pdf_report(again))
+        self.assertGreater(len(reports[-1].text_elements), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
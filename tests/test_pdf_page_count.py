@@ -0,0 +1,84 @@
+import glob
+import io
+import os
+import re
+import unittest
+
+from olmocr.pdf_handle import get_pdf_num_pages
+from olmocr.pdf_page_count import PdfRangeReader, PdfStructureError, read_page_count
+
+GNARLY_PDFS = os.path.join(os.path.dirname(__file__), "gnarly_pdfs")
+
+
+class FakeS3Client:
+    """Serves range requests out of local files, counting them"""
+
+    def __init__(self, local_path):
+        with open(local_path, "rb") as f:
+            self.data = f.read()
+        self.num_requests = 0
+        self.bytes_read = 0
+
+    def get_object(self, Bucket, Key, Range):
+        self.num_requests += 1
+        size = len(self.data)
+        if match := re.fullmatch(r"bytes=-(\d+)", Range):
+            start, end = max(0, size - int(match.group(1))), size - 1
+        else:
+            match = re.fullmatch(r"bytes=(\d+)-(\d+)", Range)
+            start, end = int(match.group(1)), min(int(match.group(2)), size - 1)
+
+        body = self.data[start : end + 1]
+        self.bytes_read += len(body)
+        return {"Body": io.BytesIO(body), "ContentRange": f"bytes {start}-{end}/{size}"}
+
+
+class TestReadPageCount(unittest.TestCase):
+    def test_matches_full_parse(self):
+        for pdf_path in sorted(glob.glob(os.path.join(GNARLY_PDFS, "*.pdf"))):
+            with self.subTest(pdf=os.path.basename(pdf_path)):
+                s3_client = FakeS3Client(pdf_path)
+                try:
+                    num_pages = read_page_count(s3_client, "s3://bucket/" + os.path.basename(pdf_path))
+                except PdfStructureError:
+                    # Falling back to a download is fine, as long as it's the exception rather than the rule
+                    continue
+                self.assertEqual(num_pages, get_pdf_num_pages(pdf_path))
+                self.assertLessEqual(s3_client.num_requests, 5)
+
+    def test_reads_little_of_large_files(self):
+        pdf_path = os.path.join(GNARLY_PDFS, "instructions_and_schematics.pdf")
+        s3_client = FakeS3Client(pdf_path)
+
+        self.assertEqual(read_page_count(s3_client, "s3://bucket/doc.pdf"), 106)
+        self.assertLess(s3_client.bytes_read, len(s3_client.data) / 10)
+
+    def test_encrypted_pdf_falls_back(self):
+        with self.assertRaises(PdfStructureError):
+            read_page_count(None, os.path.join(GNARLY_PDFS, "large_prompt_hint3.pdf"))
+
+    def test_not_a_pdf(self):
+        with self.assertRaises(PdfStructureError):
+            read_page_count(None, __file__)
+
+
+class TestPdfRangeReader(unittest.TestCase):
+    def test_reads_within_earlier_reads_are_free(self):
+        pdf_path = os.path.join(GNARLY_PDFS, "bws_book_ch2.pdf")
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+
+        reader = PdfRangeReader(FakeS3Client(pdf_path), "s3://bucket/doc.pdf")
+        tail_offset, tail = reader.tail(1024)
+        self.assertEqual(reader.size, len(data))
+        self.assertEqual(tail, data[-1024:])
+
+        self.assertEqual(reader.read(tail_offset + 100, 50), data[tail_offset + 100 : tail_offset + 150])
+        self.assertEqual(reader.s3_client.num_requests, 1)
+
+        self.assertEqual(reader.read(10, 20), data[10:30])
+        self.assertEqual(reader.s3_client.num_requests, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from olmocr.data.renderpdf import (
+    ImageEncoding,
+    PdfiumRenderer,
+    PngStreamSplitter,
+    get_pdf_media_box_width_height,
+    get_png_dimensions_from_base64,
+    get_renderer,
+    render_pdf_pages_to_base64png,
+    render_pdf_to_base64png,
+    render_pdf_to_base64png_batch,
+)
+
+GNARLY_PDFS = os.path.join(os.path.dirname(__file__), "gnarly_pdfs")
+
+
+def make_png(width, height):
+    img = Image.new("RGB", (width, height), color="white")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class TestPngStreamSplitter(unittest.TestCase):
+    def test_splits_concatenated_pngs(self):
+        pngs = [make_png(10 + i, 20 + i) for i in range(5)]
+        stream = b"".join(pngs)
+
+        for chunk_size in (1, 7, 4096, len(stream)):
+            splitter = PngStreamSplitter()
+            result = []
+            for i in range(0, len(stream), chunk_size):
+                result.extend(splitter.feed(stream[i : i + chunk_size]))
+            splitter.finish()
+            self.assertEqual(result, pngs)
+
+    def test_iend_inside_chunk_data(self):
+        # A chunk whose payload happens to contain the bytes of an IEND chunk must not end the image early
+        png = make_png(4, 4)
+        fake_iend = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+        text_chunk = len(fake_iend).to_bytes(4, "big") + b"tEXt" + fake_iend + b"\x00\x00\x00\x00"
+        tricky = png[:33] + text_chunk + png[33:]
+
+        splitter = PngStreamSplitter()
+        self.assertEqual(splitter.feed(tricky + png), [tricky, png])
+
+    def test_truncated_stream(self):
+        splitter = PngStreamSplitter()
+        self.assertEqual(splitter.feed(make_png(4, 4)[:-5]), [])
+        with self.assertRaises(ValueError):
+            splitter.finish()
+
+        with self.assertRaises(ValueError):
+            PngStreamSplitter().feed(b"not a png at all")
+
+
+class TestRenderPagesGrouping(unittest.TestCase):
+    def test_dense_runs_are_batched(self):
+        def fake_batch(local_pdf_path, first_page, last_page, target_longest_image_dim, encoding=None):
+            for page_num in range(first_page, last_page + 1):
+                yield page_num, f"batch{page_num}"
+
+        with (
+            patch("olmocr.data.renderpdf.render_pdf_to_base64png_batch", side_effect=fake_batch) as mock_batch,
+            patch("olmocr.data.renderpdf.render_pdf_to_base64png", side_effect=lambda path, page, dim, encoding=None: f"single{page}") as mock_single,
+        ):
+            result = render_pdf_pages_to_base64png("doc.pdf", [3, 1, 2, 5, 6, 20, 40], target_longest_image_dim=1024)
+
+        self.assertEqual(mock_batch.call_count, 1)
+        self.assertEqual(mock_batch.call_args.args, ("doc.pdf", 1, 6, 1024))
+        self.assertEqual(mock_single.call_count, 2)
+        self.assertEqual(result, {1: "batch1", 2: "batch2", 3: "batch3", 5: "batch5", 6: "batch6", 20: "single20", 40: "single40"})
+
+
+class TestPdfiumRenderer(unittest.TestCase):
+    def test_scales_to_longest_mediabox_side(self):
+        renderer = PdfiumRenderer()
+        for name in ["skinnypage.pdf", "pdftotext_two_column_issue.pdf"]:
+            local_pdf_path = os.path.join(GNARLY_PDFS, name)
+            width, height = get_pdf_media_box_width_height(local_pdf_path, 1)
+
+            img = renderer.render_image(local_pdf_path, 1, 1024)
+            self.assertEqual(img.mode, "RGB")
+            self.assertAlmostEqual(max(img.size), 1024, delta=1)
+            self.assertAlmostEqual(img.size[0] / img.size[1], width / height, places=2)
+
+    def test_scales_to_longest_cropbox_side(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Crop the page down to a square, the rendered image should be that square rather than the MediaBox's shape
+            writer = PdfWriter(clone_from=PdfReader(os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")))
+            page = writer.pages[0]
+            side = min(page.mediabox.width, page.mediabox.height) / 2
+            page.cropbox.lower_left = page.mediabox.lower_left
+            page.cropbox.upper_right = (page.mediabox.left + side, page.mediabox.bottom + side)
+            local_pdf_path = os.path.join(tmp_dir, "cropped.pdf")
+            writer.write(local_pdf_path)
+
+            img = PdfiumRenderer().render_image(local_pdf_path, 1, 512)
+            self.assertAlmostEqual(img.size[0], 512, delta=1)
+            self.assertAlmostEqual(img.size[1], 512, delta=1)
+
+    def test_closes_documents_of_deleted_files(self):
+        renderer = PdfiumRenderer()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            scratch = os.path.join(tmp_dir, "scratch.pdf")
+            shutil.copyfile(os.path.join(GNARLY_PDFS, "skinnypage.pdf"), scratch)
+
+            renderer.render_image(scratch, 1, 256)
+            renderer.close_deleted_documents()
+            self.assertEqual(len(renderer._documents), 1)
+
+            os.remove(scratch)
+            renderer.close_deleted_documents()
+            self.assertEqual(len(renderer._documents), 0)
+
+            # Rendering anything else also closes them
+            shutil.copyfile(os.path.join(GNARLY_PDFS, "skinnypage.pdf"), scratch)
+            renderer.render_image(scratch, 1, 256)
+            os.remove(scratch)
+            renderer.render_image(os.path.join(GNARLY_PDFS, "skinnypage.pdf"), 1, 256)
+            self.assertEqual([key[0] for key in renderer._documents], [os.path.abspath(os.path.join(GNARLY_PDFS, "skinnypage.pdf"))])
+        renderer.close()
+
+    def test_keeps_recent_documents_open(self):
+        renderer = PdfiumRenderer(max_open_documents=1)
+        first = os.path.join(GNARLY_PDFS, "skinnypage.pdf")
+        second = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+
+        renderer.render_image(second, 1, 256)
+        doc = next(iter(renderer._documents.values()))
+        renderer.render_image(second, 2, 256)
+        self.assertIs(next(iter(renderer._documents.values())), doc)
+
+        renderer.render_image(first, 1, 256)
+        self.assertEqual(len(renderer._documents), 1)
+        renderer.close()
+        self.assertEqual(len(renderer._documents), 0)
+
+    def test_dispatch_by_name(self):
+        local_pdf_path = os.path.join(GNARLY_PDFS, "skinnypage.pdf")
+        image_base64 = render_pdf_to_base64png(local_pdf_path, 1, 512, renderer="pdfium")
+        self.assertEqual(max(get_png_dimensions_from_base64(image_base64)), 512)
+
+        pages = render_pdf_pages_to_base64png(local_pdf_path, [1], 512, renderer="pdfium")
+        self.assertEqual(list(pages), [1])
+
+        self.assertIs(get_renderer("pdfium"), get_renderer("pdfium"))
+        with self.assertRaises(ValueError):
+            get_renderer("ghostscript")
+
+
+class TestPopplerRender(unittest.TestCase):
+    def test_leaves_parsing_to_pdftoppm(self):
+        # Reading the MediaBox or page count with pypdf would hold the GIL in the caller, which is the pipeline's event loop process
+        local_pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        completed = subprocess.CompletedProcess([], 0, stdout=make_png(20, 10), stderr=b"")
+
+        with (
+            patch("olmocr.data.renderpdf.subprocess.run", return_value=completed) as mock_run,
+            patch("olmocr.data.renderpdf.get_pdf_handle", side_effect=AssertionError("parsed with pypdf")),
+        ):
+            render_pdf_to_base64png(local_pdf_path, 3, 1024)
+
+        cmd = mock_run.call_args.args[0]
+        self.assertEqual(cmd[cmd.index("-scale-to") + 1], "1024")
+        self.assertEqual(cmd[cmd.index("-f") + 1 : cmd.index("-l") + 2], ["3", "-l", "3"])
+
+
+class TestImageEncoding(unittest.TestCase):
+    def test_encodings_of_a_scanned_page(self):
+        local_pdf_path = os.path.join(GNARLY_PDFS, "handwriting_bad_ocr.pdf")
+        png = render_pdf_to_base64png(local_pdf_path, 1, 1024, renderer="pdfium")
+
+        for encoding, pil_format, mode in [
+            (ImageEncoding("jpeg", quality=80), "JPEG", "RGB"),
+            (ImageEncoding("webp", quality=80), "WEBP", "RGB"),
+            (ImageEncoding("png", grayscale=True), "PNG", "L"),
+        ]:
+            image_base64 = render_pdf_to_base64png(local_pdf_path, 1, 1024, renderer="pdfium", encoding=encoding)
+            with Image.open(BytesIO(base64.b64decode(image_base64))) as img:
+                self.assertEqual((img.format, img.mode, max(img.size)), (pil_format, mode, 1024))
+            self.assertLess(len(image_base64), len(png))
+
+    def test_reencode_and_validation(self):
+        png = base64.b64encode(make_png(40, 30)).decode("utf-8")
+        jpeg = ImageEncoding("jpeg").reencode_base64(png)
+        with Image.open(BytesIO(base64.b64decode(jpeg))) as img:
+            self.assertEqual((img.format, img.size), ("JPEG", (40, 30)))
+        self.assertEqual(ImageEncoding("webp").mime_type, "image/webp")
+
+        with self.assertRaises(ValueError):
+            ImageEncoding("gif")
+        with self.assertRaises(ValueError):
+            ImageEncoding("jpeg", quality=0)
+
+
+@unittest.skipUnless(shutil.which("pdftoppm"), "requires poppler")
+class TestRenderBatch(unittest.TestCase):
+    def test_batch_matches_single_page_renders(self):
+        local_pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+
+        pages = list(render_pdf_to_base64png_batch(local_pdf_path, 1, 3, target_longest_image_dim=1024))
+        self.assertEqual([page_num for page_num, _ in pages], [1, 2, 3])
+
+        for page_num, image_base64 in pages:
+            single = render_pdf_to_base64png(local_pdf_path, page_num, target_longest_image_dim=1024)
+            with Image.open(BytesIO(base64.b64decode(image_base64))) as batch_img, Image.open(BytesIO(base64.b64decode(single))) as single_img:
+                self.assertEqual(batch_img.size, single_img.size)
+                self.assertEqual(max(batch_img.size), 1024)
+
+    def test_pdftoppm_writes_jpeg_and_grayscale(self):
+        local_pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        encoding = ImageEncoding("jpeg", quality=75, grayscale=True)
+
+        single = render_pdf_to_base64png(local_pdf_path, 1, 1024, encoding=encoding)
+        (_, batch), *_ = render_pdf_to_base64png_batch(local_pdf_path, 1, 2, 1024, encoding=encoding)
+        for image_base64 in (single, batch):
+            with Image.open(BytesIO(base64.b64decode(image_base64))) as img:
+                self.assertEqual((img.format, img.mode), ("JPEG", "L"))
+
+    def test_pdfium_matches_poppler_dimensions(self):
+        local_pdf_path = os.path.join(GNARLY_PDFS, "pdftotext_two_column_issue.pdf")
+        poppler = get_renderer("poppler").render_image(local_pdf_path, 1, 1024)
+        pdfium = get_renderer("pdfium").render_image(local_pdf_path, 1, 1024)
+        self.assertAlmostEqual(poppler.size[0], pdfium.size[0], delta=1)
+        self.assertAlmostEqual(poppler.size[1], pdfium.size[1], delta=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import hashlib
+import io
+import json
+import unittest
+
+from botocore.exceptions import ClientError
+
+from olmocr.result_summary import (
+    ResultSummary,
+    rollup_workspace_stats,
+    summary_path,
+    write_summary,
+)
+
+WORKSPACE = "s3://bucket/ws"
+
+
+def make_doc(source, pages, output_tokens):
+    return {"metadata": {"Source-File": source, "pdf-total-pages": pages, "total-input-tokens": 10 * pages, "total-output-tokens": output_tokens}}
+
+
+class FakeS3Client:
+    """Objects in a dict, with listings that carry ETags like S3's, counting reads"""
+
+    def __init__(self):
+        self.objects = {}
+        self.num_gets = 0
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = bytes(Body)
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        self.num_gets += 1
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter=None):
+                # The results and summaries are flat, so there are never any CommonPrefixes
+                contents = [
+                    {"Key": key, "ETag": f'"{hashlib.md5(data).hexdigest()}"'} for key, data in sorted(client.objects.items()) if key.startswith(Prefix)
+                ]
+                yield {"Contents": contents}
+
+        return Paginator()
+
+
+class TestRollupWorkspaceStats(unittest.TestCase):
+    def setUp(self):
+        self.s3_client = FakeS3Client()
+        self.index_items = {"new": ["a.pdf", "b.pdf"], "old": ["c.pdf"], "todo": ["d.pdf"]}
+
+        # A result written along with its summary, where b.pdf produced no document
+        new_summary = ResultSummary()
+        new_summary.add_doc(make_doc("a.pdf", pages=3, output_tokens=40000))
+        self.s3_client.put_object(Bucket="bucket", Key="ws/results/output_new.jsonl", Body=json.dumps(make_doc("a.pdf", 3, 40000)).encode())
+        write_summary(WORKSPACE, "new", new_summary, self.s3_client)
+
+        # And one from before summaries existed
+        self.s3_client.put_object(Bucket="bucket", Key="ws/results/output_old.jsonl", Body=json.dumps(make_doc("c.pdf", 5, 100)).encode())
+
+    def test_totals_match_the_results(self):
+        stats = rollup_workspace_stats(self.s3_client, WORKSPACE, self.index_items)
+
+        self.assertEqual(stats["completed_items"], 2)
+        self.assertEqual((stats["num_docs"], stats["pages"], stats["output_tokens"], stats["input_tokens"]), (2, 8, 40100, 80))
+        self.assertEqual((stats["long_context_docs"], stats["long_context_tokens"]), (1, 40000))
+        self.assertEqual(stats["skipped_paths"], 1)
+
+        # The old result got a summary of its own
+        self.assertIn("ws/summaries/output_old.json", self.s3_client.objects)
+
+    def test_only_changed_summaries_are_read(self):
+        first = rollup_workspace_stats(self.s3_client, WORKSPACE, self.index_items)
+
+        # The backfilled summary gets read once more, to learn its ETag
+        self.s3_client.num_gets = 0
+        self.assertEqual(rollup_workspace_stats(self.s3_client, WORKSPACE, self.index_items), first)
+        self.assertEqual(self.s3_client.num_gets, 2)
+
+        # After that, only the rollup itself
+        self.s3_client.num_gets = 0
+        self.assertEqual(rollup_workspace_stats(self.s3_client, WORKSPACE, self.index_items), first)
+        self.assertEqual(self.s3_client.num_gets, 1)
+
+        # A new result, and a removed one
+        todo_summary = ResultSummary()
+        todo_summary.add_doc(make_doc("d.pdf", pages=7, output_tokens=70))
+        self.s3_client.put_object(Bucket="bucket", Key="ws/results/output_todo.jsonl.zst", Body=b"")
+        write_summary(WORKSPACE, "todo", todo_summary, self.s3_client)
+        del self.s3_client.objects["ws/results/output_old.jsonl"]
+
+        stats = rollup_workspace_stats(self.s3_client, WORKSPACE, self.index_items)
+        self.assertEqual((stats["completed_items"], stats["num_docs"], stats["pages"]), (2, 2, 10))
+
+
+class TestResultSummary(unittest.TestCase):
+    def test_round_trip(self):
+        summary = ResultSummary()
+        summary.add_doc(make_doc("s3://bucket/a.pdf", pages=2, output_tokens=5))
+        self.assertEqual(ResultSummary.from_bytes(summary.to_bytes()), summary)
+        self.assertEqual(summary_path(WORKSPACE, "abc"), "s3://bucket/ws/summaries/output_abc.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from botocore.exceptions import ClientError
+
+from olmocr.result_writer import (
+    S3_MIN_PART_SIZE,
+    LocalResultWriter,
+    S3ResultWriter,
+    decode_result_bytes,
+    open_result_writer,
+    result_filename,
+    work_hash_from_result_filename,
+)
+
+
+def make_doc(i, text_len=100):
+    return {"id": f"doc{i}", "text": "x" * text_len, "metadata": {"total-input-tokens": i}}
+
+
+class TestResultFilenames(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(result_filename("abc"), "output_abc.jsonl")
+        self.assertEqual(result_filename("abc", "zstd"), "output_abc.jsonl.zst")
+
+        self.assertEqual(work_hash_from_result_filename("s3://bucket/ws/results/output_abc.jsonl"), "abc")
+        self.assertEqual(work_hash_from_result_filename("output_abc.jsonl.zst"), "abc")
+        self.assertIsNone(work_hash_from_result_filename(".output_abc.jsonl.1234.tmp"))
+        self.assertIsNone(work_hash_from_result_filename("output_abc.json"))
+        self.assertIsNone(work_hash_from_result_filename("merged_abc.jsonl"))
+
+
+class TestLocalResultWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_commit_is_atomic(self):
+        for compression in ("none", "zstd"):
+            output_path = os.path.join(self.tmpdir.name, result_filename(f"hash_{compression}", compression))
+            writer = open_result_writer(output_path, compression=compression)
+            self.assertIsInstance(writer, LocalResultWriter)
+
+            for i in range(10):
+                writer.write_doc(make_doc(i))
+            self.assertFalse(os.path.exists(output_path))
+            self.assertNotIn(f"hash_{compression}", [work_hash_from_result_filename(fn) for fn in os.listdir(self.tmpdir.name)])
+
+            writer.commit()
+
+            with open(output_path, "rb") as f:
+                lines = decode_result_bytes(output_path, f.read()).splitlines()
+            self.assertEqual([json.loads(line)["id"] for line in lines], [f"doc{i}" for i in range(10)])
+            self.assertEqual(writer.num_docs, 10)
+
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["output_hash_none.jsonl", "output_hash_zstd.jsonl.zst"])
+
+    def test_abort_leaves_nothing(self):
+        output_path = os.path.join(self.tmpdir.name, "output_abc.jsonl")
+        writer = open_result_writer(output_path)
+        writer.write_doc(make_doc(0))
+        writer.abort()
+        writer.abort()
+
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        with self.assertRaises(AssertionError):
+            writer.write_doc(make_doc(1))
+
+    def test_first_commit_wins(self):
+        output_path = os.path.join(self.tmpdir.name, "output_abc.jsonl")
+        first, second = open_result_writer(output_path), open_result_writer(output_path)
+        first.write_doc(make_doc(1))
+        second.write_doc(make_doc(2))
+
+        self.assertTrue(second.commit())
+        self.assertFalse(first.commit())
+
+        with open(output_path, "rb") as f:
+            self.assertEqual(json.loads(f.read())["id"], "doc2")
+        self.assertEqual(os.listdir(self.tmpdir.name), ["output_abc.jsonl"])
+
+    def test_empty_result(self):
+        output_path = os.path.join(self.tmpdir.name, "output_abc.jsonl.zst")
+        writer = open_result_writer(output_path, compression="zstd")
+        writer.commit()
+
+        with open(output_path, "rb") as f:
+            self.assertEqual(decode_result_bytes(output_path, f.read()), "")
+
+
+class TestS3ResultWriter(unittest.TestCase):
+    def test_small_result_uses_put_object(self):
+        s3_client = Mock()
+        writer = open_result_writer("s3://bucket/ws/results/output_abc.jsonl", s3_client)
+        self.assertIsInstance(writer, S3ResultWriter)
+
+        writer.write_doc(make_doc(0))
+        s3_client.put_object.assert_not_called()
+        writer.commit()
+
+        s3_client.create_multipart_upload.assert_not_called()
+        s3_client.put_object.assert_called_once()
+        kwargs = s3_client.put_object.call_args.kwargs
+        self.assertEqual((kwargs["Bucket"], kwargs["Key"]), ("bucket", "ws/results/output_abc.jsonl"))
+        self.assertEqual(json.loads(kwargs["Body"])["id"], "doc0")
+
+    def test_large_result_streams_parts(self):
+        s3_client = Mock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload1"}
+        s3_client.upload_part.side_effect = lambda **kwargs: {"ETag": f"etag{kwargs['PartNumber']}"}
+
+        writer = S3ResultWriter(s3_client, "s3://bucket/ws/results/output_abc.jsonl", part_size=S3_MIN_PART_SIZE)
+        num_docs = 120
+        for i in range(num_docs):
+            writer.write_doc(make_doc(i, text_len=100_000))
+
+            # Never more than one part is held in memory
+            self.assertLess(len(writer._buffer), S3_MIN_PART_SIZE)
+
+        self.assertEqual(s3_client.upload_part.call_count, 2)
+        s3_client.complete_multipart_upload.assert_not_called()
+
+        writer.commit()
+
+        bodies = [call.kwargs["Body"] for call in s3_client.upload_part.call_args_list]
+        self.assertEqual(len(bodies), 3)
+        self.assertTrue(all(len(body) >= S3_MIN_PART_SIZE for body in bodies[:-1]))
+        self.assertEqual([json.loads(line)["id"] for line in b"".join(bodies).decode().splitlines()], [f"doc{i}" for i in range(num_docs)])
+
+        s3_client.complete_multipart_upload.assert_called_once()
+        parts = s3_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+        self.assertEqual(parts, [{"PartNumber": n, "ETag": f"etag{n}"} for n in (1, 2, 3)])
+        s3_client.put_object.assert_not_called()
+
+    def test_commit_loses_to_existing_result(self):
+        s3_client = Mock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload1"}
+        s3_client.upload_part.return_value = {"ETag": "etag"}
+        s3_client.complete_multipart_upload.side_effect = ClientError({"Error": {"Code": "PreconditionFailed"}}, "CompleteMultipartUpload")
+
+        writer = S3ResultWriter(s3_client, "s3://bucket/ws/results/output_abc.jsonl", part_size=S3_MIN_PART_SIZE)
+        for i in range(60):
+            writer.write_doc(make_doc(i, text_len=100_000))
+        self.assertFalse(writer.commit())
+
+        self.assertEqual(s3_client.complete_multipart_upload.call_args.kwargs["IfNoneMatch"], "*")
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="ws/results/output_abc.jsonl", UploadId="upload1")
+
+    def test_abort_multipart(self):
+        s3_client = Mock()
+        s3_client.create_multipart_upload.return_value = {"UploadId": "upload1"}
+        s3_client.upload_part.return_value = {"ETag": "etag"}
+
+        writer = S3ResultWriter(s3_client, "s3://bucket/ws/results/output_abc.jsonl.zst", compression="zstd", part_size=S3_MIN_PART_SIZE)
+        for i in range(20):
+            writer.write_doc({"id": i, "text": os.urandom(500_000).hex()})
+        writer.abort()
+
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="ws/results/output_abc.jsonl.zst", UploadId="upload1")
+        s3_client.complete_multipart_upload.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
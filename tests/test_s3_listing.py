@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from olmocr.s3_utils import (
+    expand_s3_glob,
+    list_s3_objects,
+    load_listing_manifest,
+    save_listing_manifest,
+)
+
+
+class FakeS3Client:
+    """Keys in a bucket, listed one page at a time with S3's Delimiter and CommonPrefixes, counting the listings"""
+
+    def __init__(self, keys, page_size=2):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+        self.listed_prefixes = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter=None):
+                with client.lock:
+                    client.listed_prefixes.append(Prefix)
+
+                entries = []
+                for key in client.keys:
+                    if not key.startswith(Prefix):
+                        continue
+                    rest = key[len(Prefix) :]
+                    if Delimiter and Delimiter in rest:
+                        common_prefix = Prefix + rest[: rest.index(Delimiter) + 1]
+                        if not entries or entries[-1] != ("prefix", common_prefix):
+                            entries.append(("prefix", common_prefix))
+                    else:
+                        entries.append(("key", key))
+
+                for i in range(0, max(len(entries), 1), client.page_size):
+                    page = entries[i : i + client.page_size]
+                    yield {
+                        "Contents": [{"Key": value, "ETag": f'"etag-{value}"'} for kind, value in page if kind == "key"],
+                        "CommonPrefixes": [{"Prefix": value} for kind, value in page if kind == "prefix"],
+                    }
+
+        return Paginator()
+
+
+KEYS = [
+    "data/a/1.pdf",
+    "data/a/2.txt",
+    "data/a/deep/3.pdf",
+    "data/b/4.pdf",
+    "data/c/5.PDF",
+    "data/top.pdf",
+    "other/6.pdf",
+]
+
+
+class TestListS3Objects(unittest.TestCase):
+    def test_lists_every_prefix_once(self):
+        s3_client = FakeS3Client(KEYS)
+        listed = list_s3_objects(s3_client, "bucket", "data/", max_workers=4)
+
+        self.assertEqual(listed, {key: f"etag-{key}" for key in KEYS if key.startswith("data/")})
+        self.assertEqual(sorted(s3_client.listed_prefixes), ["data/", "data/a/", "data/a/deep/", "data/b/", "data/c/"])
+
+    def test_glob_matches_like_fnmatch(self):
+        s3_client = FakeS3Client(KEYS)
+
+        # * matches across / as well, so nested pdfs are included
+        self.assertEqual(
+            sorted(expand_s3_glob(s3_client, "s3://bucket/data/*.pdf")),
+            ["s3://bucket/data/a/1.pdf", "s3://bucket/data/a/deep/3.pdf", "s3://bucket/data/b/4.pdf", "s3://bucket/data/top.pdf"],
+        )
+        self.assertEqual(sorted(expand_s3_glob(s3_client, "s3://bucket/data/[ab]/?.pdf")), ["s3://bucket/data/a/1.pdf", "s3://bucket/data/b/4.pdf"])
+
+        # Only what comes before the first wildcard narrows the listing
+        s3_client.listed_prefixes.clear()
+        expand_s3_glob(s3_client, "s3://bucket/data/a*")
+        self.assertEqual(sorted(s3_client.listed_prefixes), ["data/a", "data/a/", "data/a/deep/"])
+
+
+class TestListingManifest(unittest.TestCase):
+    def test_round_trip(self):
+        listing = expand_s3_glob(FakeS3Client(KEYS), "s3://bucket/data/*.pdf")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest_path = os.path.join(tmpdir, "listings", "data.tsv.zst")
+            self.assertIsNone(load_listing_manifest(None, manifest_path, "s3://bucket/data/*.pdf"))
+
+            save_listing_manifest(None, manifest_path, "s3://bucket/data/*.pdf", listing)
+            self.assertEqual(load_listing_manifest(None, manifest_path, "s3://bucket/data/*.pdf"), listing)
+
+            # A manifest of some other glob doesn't count
+            self.assertIsNone(load_listing_manifest(None, manifest_path, "s3://bucket/other/*.pdf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
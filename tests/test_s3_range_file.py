@@ -0,0 +1,72 @@
+import io
+import os
+import random
+import unittest
+
+from pypdf import PdfReader
+
+from olmocr.s3_utils import S3RangeFile
+
+GNARLY_PDFS = os.path.join(os.path.dirname(__file__), "gnarly_pdfs")
+
+
+class FakeS3Client:
+    """Serves ranged GETs of a single object, recording every range that was requested"""
+
+    def __init__(self, data):
+        self.data = data
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data)}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(value) for value in Range[len("bytes=") :].split("-"))
+        self.ranges.append((start, end))
+        return {"Body": io.BytesIO(self.data[start : end + 1])}
+
+
+class TestS3RangeFile(unittest.TestCase):
+    def test_reads_match_the_object(self):
+        data = random.Random(0).randbytes(10_000)
+        range_file = S3RangeFile(FakeS3Client(data), "s3://bucket/object", block_size=1024, max_cached_blocks=3)
+
+        rng = random.Random(1)
+        for _ in range(200):
+            start = rng.randrange(len(data) + 100)
+            length = rng.randrange(3000)
+            self.assertEqual(range_file.seek(start), start)
+            self.assertEqual(range_file.read(length), data[start : start + length])
+            self.assertEqual(range_file.tell(), min(start + length, max(start, len(data))))
+
+        range_file.seek(-10, io.SEEK_END)
+        self.assertEqual(range_file.read(), data[-10:])
+        with self.assertRaises(ValueError):
+            range_file.seek(-1)
+
+    def test_blocks_are_fetched_once(self):
+        s3_client = FakeS3Client(bytes(range(256)) * 40)
+        range_file = S3RangeFile(s3_client, "s3://bucket/object", size=len(s3_client.data), block_size=1024)
+
+        range_file.seek(1000)
+        range_file.read(100)
+        range_file.seek(1500)
+        range_file.read(2000)
+
+        # The first read takes blocks 0 and 1 in one request, the second only needs blocks 2 and 3
+        self.assertEqual(s3_client.ranges, [(0, 2047), (2048, 4095)])
+        self.assertEqual(range_file.bytes_fetched, 4096)
+
+    def test_pypdf_reads_only_what_it_needs(self):
+        with open(os.path.join(GNARLY_PDFS, "map1.pdf"), "rb") as f:
+            data = f.read()
+
+        with S3RangeFile(FakeS3Client(data), "s3://bucket/document.pdf", block_size=16 * 1024) as range_file:
+            num_pages = len(PdfReader(range_file).pages)
+
+        self.assertEqual(num_pages, len(PdfReader(io.BytesIO(data)).pages))
+        self.assertLess(range_file.bytes_fetched, len(data) // 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import asyncio
 import datetime
 import hashlib
+import json
 import unittest
 from typing import Dict, List
 from unittest.mock import Mock, call, patch
@@ -8,6 +9,7 @@ from unittest.mock import Mock, call, patch
 from botocore.exceptions import ClientError
 
 # Import the classes we're testing
+from olmocr.work_index import ShardInfo
 from olmocr.work_queue import S3WorkQueue, WorkItem
 
 
@@ -16,6 +18,8 @@ class TestS3WorkQueue(unittest.TestCase):
         """Set up test fixtures before each test method."""
         self.s3_client = Mock()
         self.s3_client.exceptions.ClientError = ClientError
+        self.s3_client.list_objects_v2.return_value = {}  # No results yet
+        self.s3_client.put_object.return_value = {"ETag": '"lock-etag"'}
         self.work_queue = S3WorkQueue(self.s3_client, "s3://test-bucket/workspace")
         self.sample_paths = [
             "s3://test-bucket/data/file1.pdf",
@@ -45,8 +49,9 @@ class TestS3WorkQueue(unittest.TestCase):
         queue = S3WorkQueue(client, "s3://test-bucket/workspace/")
 
         self.assertEqual(queue.workspace_path, "s3://test-bucket/workspace")
-        self.assertEqual(queue._index_path, "s3://test-bucket/workspace/work_index_list.csv.zstd")
-        self.assertEqual(queue._output_glob, "s3://test-bucket/workspace/results/*.jsonl")
+        self.assertEqual(queue._index.manifest_path, "s3://test-bucket/workspace/work_index/manifest.json")
+        self.assertEqual(queue._results_prefix, "s3://test-bucket/workspace/results/output_")
+        self.assertEqual(queue._locks_prefix, "s3://test-bucket/workspace/worker_locks/output_")
 
     def asyncSetUp(self):
         """Set up async test fixtures"""
@@ -74,22 +79,21 @@ class TestS3WorkQueue(unittest.TestCase):
     async def test_populate_queue_new_items(self):
         """Test populating queue with new items"""
         # Mock empty existing index
-        with patch("olmocr.work_queue.download_zstd_csv", return_value=[]):
-            with patch("olmocr.work_queue.upload_zstd_csv") as mock_upload:
+        with patch.object(self.work_queue._index, "load_items", return_value={}):
+            with patch.object(self.work_queue._index, "append") as mock_append:
                 await self.work_queue.populate_queue(self.sample_paths, items_per_group=2)
 
-                # Verify upload was called with correct data
-                self.assertEqual(mock_upload.call_count, 1)
-                _, _, lines = mock_upload.call_args[0]
+                # Verify only the new groups are appended
+                self.assertEqual(mock_append.call_count, 1)
+                (groups,) = mock_append.call_args[0]
 
                 # Should create 2 work groups (2 files + 1 file)
-                self.assertEqual(len(lines), 2)
+                self.assertEqual(len(groups), 2)
 
-                # Verify format of uploaded lines
-                for line in lines:
-                    parts = line.split(",")
-                    self.assertGreaterEqual(len(parts), 2)  # Hash + at least one path
-                    self.assertEqual(len(parts[0]), 40)  # SHA1 hash length
+                for group_hash, group_paths, page_counts in groups:
+                    self.assertGreaterEqual(len(group_paths), 1)
+                    self.assertEqual(len(group_hash), 40)  # SHA1 hash length
+                    self.assertEqual(page_counts, [0] * len(group_paths))
 
     @async_test
     async def test_populate_queue_existing_items(self):
@@ -99,16 +103,14 @@ class TestS3WorkQueue(unittest.TestCase):
 
         # Create existing index content
         existing_hash = S3WorkQueue._compute_workgroup_hash(existing_paths)
-        existing_line = f"{existing_hash},{existing_paths[0]}"
 
-        with patch("olmocr.work_queue.download_zstd_csv", return_value=[existing_line]):
-            with patch("olmocr.work_queue.upload_zstd_csv") as mock_upload:
+        with patch.object(self.work_queue._index, "load_items", return_value={existing_hash: existing_paths}):
+            with patch.object(self.work_queue._index, "append") as mock_append:
                 await self.work_queue.populate_queue(existing_paths + new_paths, items_per_group=1)
 
-                # Verify upload called with both existing and new items
-                _, _, lines = mock_upload.call_args[0]
-                self.assertEqual(len(lines), 2)
-                self.assertIn(existing_line, lines)
+                # Verify that only the new item is appended, the existing shards are left alone
+                (groups,) = mock_append.call_args[0]
+                self.assertEqual(groups, [(S3WorkQueue._compute_workgroup_hash(new_paths), new_paths, [0])])
 
     @async_test
     async def test_initialize_queue(self):
@@ -116,16 +118,26 @@ class TestS3WorkQueue(unittest.TestCase):
         # Mock work items and completed items
         work_paths = ["s3://test/file1.pdf", "s3://test/file2.pdf"]
         work_hash = S3WorkQueue._compute_workgroup_hash(work_paths)
-        work_line = f"{work_hash},{work_paths[0]},{work_paths[1]}"
-
-        completed_items = [f"s3://test-bucket/workspace/results/output_{work_hash}.jsonl"]
-
-        with patch("olmocr.work_queue.download_zstd_csv", return_value=[work_line]):
-            with patch("olmocr.work_queue.expand_s3_glob", return_value=completed_items):
-                await self.work_queue.initialize_queue()
-
-                # Queue should be empty since all work is completed
-                self.assertTrue(self.work_queue._queue.empty())
+        other_paths = ["s3://test/file3.pdf"]
+        other_hash = S3WorkQueue._compute_workgroup_hash(other_paths)
+        shards = [ShardInfo("first.idx.zst", num_items=1, num_paths=2), ShardInfo("second.idx.zst", num_items=1, num_paths=1)]
+        shard_items = {"first.idx.zst": [(work_hash, work_paths, [1, 2])], "second.idx.zst": [(other_hash, other_paths, [3])]}
+
+        self.s3_client.list_objects_v2.side_effect = lambda Bucket, Prefix: (
+            {"Contents": [{"Key": f"workspace/results/output_{work_hash}.jsonl"}]} if Prefix == "workspace/results/output_" else {}
+        )
+
+        with (
+            patch("olmocr.work_queue.random.shuffle"),
+            patch.object(self.work_queue._index, "shards", return_value=shards),
+            patch.object(self.work_queue._index, "load_shard", side_effect=lambda shard: shard_items[shard.name]) as mock_load_shard,
+        ):
+            await self.work_queue.initialize_queue()
+
+            # The first shard only holds a completed item, so the second one gets loaded right away
+            self.assertEqual(self.work_queue.size, 1)
+            self.assertEqual([item.hash for item in self.work_queue._queue._queue], [other_hash])
+            self.assertEqual(mock_load_shard.call_count, 2)
 
     @async_test
     async def test_is_completed(self):
@@ -133,11 +145,17 @@ class TestS3WorkQueue(unittest.TestCase):
         work_hash = "testhash123"
 
         # Test completed work
-        self.s3_client.head_object.return_value = {"LastModified": datetime.datetime.now(datetime.timezone.utc)}
+        self.s3_client.list_objects_v2.return_value = {"Contents": [{"Key": f"workspace/results/output_{work_hash}.jsonl"}]}
         self.assertTrue(await self.work_queue.is_completed(work_hash))
 
-        # Test incomplete work
-        self.s3_client.head_object.side_effect = ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        # Test completed work with compressed output
+        self.s3_client.list_objects_v2.return_value = {"Contents": [{"Key": f"workspace/results/output_{work_hash}.jsonl.zst"}]}
+        self.assertTrue(await self.work_queue.is_completed(work_hash))
+
+        # Test incomplete work, including a different hash that shares the prefix
+        self.s3_client.list_objects_v2.return_value = {"Contents": [{"Key": f"workspace/results/output_{work_hash}.jsonl.tmp"}]}
+        self.assertFalse(await self.work_queue.is_completed(work_hash))
+        self.s3_client.list_objects_v2.return_value = {}
         self.assertFalse(await self.work_queue.is_completed(work_hash))
 
     @async_test
@@ -152,10 +170,13 @@ class TestS3WorkQueue(unittest.TestCase):
         result = await self.work_queue.get_work()
         self.assertEqual(result, work_item)
 
-        # Verify lock file was created
+        # Verify lock file was created, only if there was none, and names this worker
         self.s3_client.put_object.assert_called_once()
         bucket, key = self.s3_client.put_object.call_args[1]["Bucket"], self.s3_client.put_object.call_args[1]["Key"]
         self.assertTrue(key.endswith(f"output_{work_item.hash}.jsonl"))
+        self.assertEqual(self.s3_client.put_object.call_args[1]["IfNoneMatch"], "*")
+        self.assertEqual(json.loads(self.s3_client.put_object.call_args[1]["Body"])["worker"], self.work_queue.worker_id)
+        self.s3_client.head_object.assert_not_called()
 
     @async_test
     async def test_get_work_completed(self):
@@ -164,10 +185,13 @@ class TestS3WorkQueue(unittest.TestCase):
         await self.work_queue._queue.put(work_item)
 
         # Simulate completed work
-        self.s3_client.head_object.return_value = {"LastModified": datetime.datetime.now(datetime.timezone.utc)}
+        self.s3_client.list_objects_v2.side_effect = lambda Bucket, Prefix: (
+            {"Contents": [{"Key": f"workspace/results/output_{work_item.hash}.jsonl"}]} if Prefix == "workspace/results/output_" else {}
+        )
 
         result = await self.work_queue.get_work()
         self.assertIsNone(result)  # Should skip completed work
+        self.s3_client.head_object.assert_not_called()
 
     @async_test
     async def test_get_work_locked(self):
@@ -177,13 +201,16 @@ class TestS3WorkQueue(unittest.TestCase):
 
         # Simulate active lock
         recent_time = datetime.datetime.now(datetime.timezone.utc)
+        self.s3_client.put_object.side_effect = ClientError(
+            {"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions you specified did not hold"}}, "PutObject"
+        )
         self.s3_client.head_object.side_effect = [
-            ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"),  # Not completed
-            {"LastModified": recent_time},  # Active lock
+            {"LastModified": recent_time, "ETag": '"other-etag"'},  # Active lock
         ]
 
         result = await self.work_queue.get_work()
         self.assertIsNone(result)  # Should skip locked work
+        self.assertEqual(self.s3_client.put_object.call_count, 1)
 
     @async_test
     async def test_get_work_stale_lock(self):
@@ -193,14 +220,54 @@ class TestS3WorkQueue(unittest.TestCase):
 
         # Simulate stale lock
         stale_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        precondition_failed = ClientError(
+            {"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions you specified did not hold"}}, "PutObject"
+        )
+        self.s3_client.put_object.side_effect = [precondition_failed, {"ETag": '"new-etag"'}]
         self.s3_client.head_object.side_effect = [
-            ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"),  # Not completed
-            {"LastModified": stale_time},  # Stale lock
+            {"LastModified": stale_time, "ETag": '"stale-etag"'},  # Stale lock
         ]
 
         result = await self.work_queue.get_work()
         self.assertEqual(result, work_item)  # Should take work with stale lock
 
+        # The takeover only overwrites the exact stale lock that was looked at
+        self.assertEqual(self.s3_client.put_object.call_args[1]["IfMatch"], '"stale-etag"')
+
+    @async_test
+    async def test_get_work_stale_lock_race(self):
+        """Of two workers taking over the same stale lock, only the one whose conditional put lands first gets the item"""
+        work_item = WorkItem(hash="testhash123", work_paths=["s3://test/file1.pdf"])
+        await self.work_queue._queue.put(work_item)
+
+        stale_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        precondition_failed = ClientError(
+            {"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions you specified did not hold"}}, "PutObject"
+        )
+        self.s3_client.put_object.side_effect = [precondition_failed, precondition_failed]
+        self.s3_client.head_object.return_value = {"LastModified": stale_time, "ETag": '"stale-etag"'}
+
+        self.assertIsNone(await self.work_queue.get_work())
+
+    @async_test
+    async def test_renew_lock(self):
+        """Renewals rewrite the lock only while it is still the one this worker wrote"""
+        work_item = WorkItem(hash="testhash123", work_paths=["s3://test/file1.pdf"])
+        await self.work_queue._queue.put(work_item)
+        self.s3_client.put_object.side_effect = [{"ETag": '"etag1"'}, {"ETag": '"etag2"'}]
+        self.assertEqual(await self.work_queue.get_work(), work_item)
+
+        self.assertTrue(await self.work_queue.renew_lock(work_item))
+        self.assertEqual(self.s3_client.put_object.call_args[1]["IfMatch"], '"etag1"')
+
+        # Another worker took the item over after this one stalled past the lease
+        self.s3_client.put_object.side_effect = ClientError(
+            {"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions you specified did not hold"}}, "PutObject"
+        )
+        self.assertFalse(await self.work_queue.renew_lock(work_item))
+        self.assertEqual(self.s3_client.put_object.call_args[1]["IfMatch"], '"etag2"')
+        self.assertFalse(await self.work_queue.renew_lock(work_item))
+
     @async_test
     async def test_mark_done(self):
         """Test marking work as done"""
@@ -214,6 +281,99 @@ class TestS3WorkQueue(unittest.TestCase):
         bucket, key = self.s3_client.delete_object.call_args[1]["Bucket"], self.s3_client.delete_object.call_args[1]["Key"]
         self.assertTrue(key.endswith(f"output_{work_item.hash}.jsonl"))
 
+    @async_test
+    async def test_get_work_uses_listed_status(self):
+        """Done and locked items are skipped without a request of their own, only the chosen item is confirmed"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        done_items = [WorkItem(hash=f"done{i}", work_paths=[f"s3://test/done{i}.pdf"]) for i in range(50)]
+        locked_item = WorkItem(hash="locked", work_paths=["s3://test/locked.pdf"])
+        open_item = WorkItem(hash="open", work_paths=["s3://test/open.pdf"])
+
+        listings = {
+            "workspace/results/output_": [{"Key": f"workspace/results/output_{item.hash}.jsonl"} for item in done_items],
+            "workspace/worker_locks/output_": [{"Key": "workspace/worker_locks/output_locked.jsonl", "LastModified": now}],
+        }
+
+        def list_objects_v2(Bucket, Prefix, ContinuationToken=None):
+            # Two pages per listing, to exercise the continuation
+            contents = listings[Prefix]
+            if ContinuationToken is None:
+                return {"Contents": contents[:10], "IsTruncated": True, "NextContinuationToken": "page2"}
+            return {"Contents": contents[10:], "IsTruncated": False}
+
+        self.s3_client.list_objects_v2.side_effect = list_objects_v2
+        self.s3_client.head_object.side_effect = ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+
+        for item in done_items + [locked_item, open_item]:
+            await self.work_queue._queue.put(item)
+
+        result = await self.work_queue.get_work()
+        self.assertEqual(result, open_item)
+        self.assertEqual(self.s3_client.list_objects_v2.call_count, 4)
+        self.assertEqual(self.s3_client.put_object.call_count, 1)
+        self.assertTrue(self.s3_client.put_object.call_args.kwargs["Key"].endswith("output_open.jsonl"))
+        self.s3_client.head_object.assert_not_called()
+
+        # Finishing an item updates the view without waiting for the next listing
+        await self.work_queue.mark_done(result)
+        self.assertIn("open", self.work_queue._done_hashes)
+
+    @async_test
+    async def test_straggler_gets_copied(self):
+        """Once the queue is empty, a lock that was claimed long ago gets a copy, guarded by a marker next to the lock"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        lock_body = {
+            "worker": "other-worker",
+            "time": now.isoformat(),
+            "claimed": (now - datetime.timedelta(hours=1)).isoformat(),
+            "work_paths": ["s3://test/slow.pdf"],
+            "num_pages": 900,
+        }
+        self.s3_client.list_objects_v2.side_effect = lambda Bucket, Prefix: (
+            {"Contents": [{"Key": "workspace/worker_locks/output_slow.jsonl", "LastModified": now}]} if Prefix == "workspace/worker_locks/output_" else {}
+        )
+        self.s3_client.get_object.return_value = {"Body": Mock(read=Mock(return_value=json.dumps(lock_body).encode("utf-8")))}
+
+        queue = S3WorkQueue(self.s3_client, "s3://test-bucket/workspace", straggler_factor=3)
+        queue._durations = [10.0]
+        copy = await queue.get_work()
+
+        self.assertEqual(copy, WorkItem(hash="slow", work_paths=["s3://test/slow.pdf"], num_pages=900, speculative=True))
+        kwargs = self.s3_client.put_object.call_args.kwargs
+        self.assertEqual((kwargs["Key"], kwargs["IfNoneMatch"]), ("workspace/worker_locks/output_slow.jsonl.speculative", "*"))
+
+        # The copy only cleans up its own marker, the lock stays with the other worker
+        await queue.mark_done(copy)
+        self.assertEqual(self.s3_client.delete_object.call_args.kwargs["Key"], "workspace/worker_locks/output_slow.jsonl.speculative")
+
+    @async_test
+    async def test_status_refreshes_in_background(self):
+        """Once the view is older than the refresh interval, get_work starts a new listing without waiting on it"""
+        queue = S3WorkQueue(self.s3_client, "s3://test-bucket/workspace", status_refresh_interval=60.0)
+        await queue.refresh_status()
+        self.assertEqual(self.s3_client.list_objects_v2.call_count, 2)
+
+        # Age the view past the interval
+        queue._status_listed_at -= 120.0
+
+        item = WorkItem(hash="newlydone", work_paths=["s3://test/file.pdf"])
+        self.s3_client.list_objects_v2.side_effect = lambda Bucket, Prefix: (
+            {"Contents": [{"Key": "workspace/results/output_newlydone.jsonl"}]} if Prefix == "workspace/results/output_" else {}
+        )
+        self.s3_client.head_object.side_effect = ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+
+        # The refresh isn't done yet when this item gets checked
+        await queue._queue.put(item)
+        self.assertEqual(await queue.get_work(), item)
+
+        await queue._refresh_task
+        self.assertIn("newlydone", queue._done_hashes)
+
+        # A failed listing keeps the old view
+        self.s3_client.list_objects_v2.side_effect = Exception("SlowDown")
+        await queue._refresh_status_in_background()
+        self.assertIn("newlydone", queue._done_hashes)
+
     def test_queue_size(self):
         """Test queue size property"""
         self.assertEqual(self.work_queue.size, 0)
@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from olmocr.work_index import WorkIndex
+from olmocr.work_queue import SqliteWorkQueue
+
+NUM_PATHS = 200
+
+
+def drain_queue(workspace):
+    """Runs in a process of its own, claiming work items until there are none left"""
+
+    async def drain():
+        work_queue = SqliteWorkQueue(workspace)
+        await work_queue.initialize_queue()
+        claimed = []
+        while (work_item := await work_queue.get_work()) is not None:
+            claimed.append(work_item.hash)
+            await work_queue.mark_done(work_item)
+        return claimed
+
+    return asyncio.run(drain())
+
+
+class TestSqliteWorkQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.first = SqliteWorkQueue(self.tmpdir.name)
+        await self.first.populate_queue([f"{i}.pdf" for i in range(NUM_PATHS)], items_per_group=1)
+        await self.first.initialize_queue()
+
+        self.second = SqliteWorkQueue(self.tmpdir.name)
+        await self.second.initialize_queue()
+
+    async def asyncTearDown(self):
+        self.tmpdir.cleanup()
+
+    def _age_lease(self, work_item, seconds):
+        self.first._execute("UPDATE items SET lease_expires = lease_expires - ? WHERE hash = ?", (seconds, work_item.hash))
+
+    async def test_processes_never_share_items(self):
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(4) as pool:
+            claimed = pool.map(drain_queue, [self.tmpdir.name] * 4)
+
+        all_claimed = [work_hash for hashes in claimed for work_hash in hashes]
+        self.assertEqual(len(all_claimed), NUM_PATHS)
+        self.assertEqual(len(set(all_claimed)), NUM_PATHS)
+
+        # size is only as of the last operation on this queue, which the other processes' work doesn't count as
+        self.assertEqual(self.first.size, NUM_PATHS)
+        self.assertIsNone(await self.first.get_work())
+        self.assertEqual(self.first.size, 0)
+
+    async def test_expired_lease_is_taken_over(self):
+        work_item = await self.first.get_work()
+        self.assertTrue(await self.first.renew_lock(work_item))
+
+        # Until the lease runs out, the other queue only sees the remaining items
+        others = []
+        while (other := await self.second.get_work()) is not None:
+            others.append(other)
+        self.assertEqual(len(others), NUM_PATHS - 1)
+        self.assertNotIn(work_item.hash, [other.hash for other in others])
+
+        self._age_lease(work_item, 3600)
+        self.assertEqual(await self.second.get_work(), work_item)
+
+        # The first worker finds out on its next heartbeat that the item isn't its own any more
+        self.assertFalse(await self.first.renew_lock(work_item))
+        self.assertTrue(await self.second.renew_lock(work_item))
+
+    async def test_done_items_stay_done(self):
+        work_item = await self.first.get_work()
+        await self.first.mark_done(work_item)
+        self.assertTrue(await self.second.is_completed(work_item.hash))
+
+        # Reading the size doesn't go to the database, which would block the event loop
+        with patch.object(self.first, "_execute", side_effect=AssertionError("queried the database")):
+            self.assertEqual(self.first.size, NUM_PATHS - 1)
+
+        reopened = SqliteWorkQueue(self.tmpdir.name)
+        await reopened.initialize_queue()
+        self.assertEqual(reopened.size, NUM_PATHS - 1)
+
+    async def test_existing_results_count_as_done(self):
+        work_item = await self.first.get_work()
+
+        # The output was committed, but the worker died before marking the item done, and its lease ran out
+        with open(os.path.join(self.tmpdir.name, "results", f"output_{work_item.hash}.jsonl"), "w"):
+            pass
+        self._age_lease(work_item, 3600)
+
+        claimed = []
+        while (other := await self.second.get_work()) is not None:
+            claimed.append(other.hash)
+        self.assertNotIn(work_item.hash, claimed)
+        self.assertTrue(await self.first.is_completed(work_item.hash))
+
+    async def test_straggler_gets_one_copy(self):
+        work_item = await self.first.get_work()
+        self.first._execute("UPDATE items SET claimed_at = claimed_at - 3600 WHERE hash = ?", (work_item.hash,))
+
+        # Once the queue is empty, a worker that finished other items in about 10s takes a copy of the one held for an hour
+        self.second.straggler_factor = 3
+        self.second._durations = [10.0]
+        while not (other := await self.second.get_work()).speculative:
+            await self.second.mark_done(other)
+        self.assertEqual((other.hash, other.work_paths), (work_item.hash, work_item.work_paths))
+
+        # Which is the only copy, and the original stays leased to the first worker
+        third = SqliteWorkQueue(self.tmpdir.name, straggler_factor=3)
+        third._durations = [10.0]
+        self.assertIsNone(await third.get_work())
+        self.assertTrue(await self.first.renew_lock(work_item))
+
+        await self.second.mark_done(other)
+        self.assertTrue(await self.first.is_completed(work_item.hash))
+
+    async def test_new_shards_are_imported(self):
+        await self.first.populate_queue([f"{i}.pdf" for i in range(NUM_PATHS + 10)], items_per_group=5)
+        self.assertEqual(self.second.size, NUM_PATHS)
+
+        await self.second.initialize_queue()
+        self.assertEqual(self.second.size, NUM_PATHS + 2)
+
+
+class TestSqliteLongestFirst(unittest.IsolatedAsyncioTestCase):
+    async def test_largest_items_come_first(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            page_counts = [3, 50, 1, 20, 7]
+            WorkIndex(workspace).append([(f"{i:040x}", [f"{i}.pdf"], [num_pages]) for i, num_pages in enumerate(page_counts)])
+
+            work_queue = SqliteWorkQueue(workspace, scheduling="longest_first")
+            await work_queue.initialize_queue()
+            claimed = []
+            while (work_item := await work_queue.get_work()) is not None:
+                claimed.append(work_item.num_pages)
+            self.assertEqual(claimed, sorted(page_counts, reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
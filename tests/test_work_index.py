@@ -0,0 +1,229 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import zstandard as zstd
+from botocore.exceptions import ClientError
+
+from olmocr.work_index import (
+    LEGACY_INDEX_NAME,
+    ShardInfo,
+    WorkIndex,
+    decode_shard,
+    encode_shard,
+)
+from olmocr.work_queue import LocalWorkQueue, pack_by_pages
+
+
+def make_item(*paths, num_pages=0):
+    return (hashlib.sha1("".join(sorted(paths)).encode("utf-8")).hexdigest(), list(paths), [num_pages] * len(paths))
+
+
+def as_dict(items):
+    return {work_hash: paths for work_hash, paths, _ in items}
+
+
+class FakeS3Client:
+    """Just enough of an S3 client, backed by a dict, for conditional puts of the manifest"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def _error(self, code):
+        return ClientError({"Error": {"Code": code}}, "PutObject")
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        current = self.objects.get((Bucket, Key))
+        if IfNoneMatch == "*" and current is not None:
+            raise self._error("PreconditionFailed")
+        if IfMatch is not None and (current is None or current[1] != IfMatch):
+            raise self._error("PreconditionFailed")
+
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self.objects[(Bucket, Key)] = (bytes(Body), etag)
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._error("NoSuchKey")
+        data, etag = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(data), "ETag": etag}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._error("404")
+        return {"ETag": self.objects[(Bucket, Key)][1]}
+
+
+class TestShardEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        items = [
+            make_item("s3://bucket/a.pdf", "s3://bucket/b.pdf", num_pages=12),
+            make_item("s3://bucket/smith, john - report.pdf"),
+            make_item("/data/ünïcödé/file.pdf#pages=1-500", num_pages=500),
+        ]
+        self.assertEqual(decode_shard(encode_shard(items)), items)
+        self.assertEqual(decode_shard(encode_shard([])), [])
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            decode_shard(zstd.ZstdCompressor().compress(b"\0" * 64))
+
+
+class TestLocalWorkIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = WorkIndex(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_only_writes_new_shards(self):
+        first = [make_item("a.pdf"), make_item("b.pdf")]
+        self.index.append(first)
+        first_shards = self.index.shards()
+        self.assertEqual(first_shards, [ShardInfo(first_shards[0].name, num_items=2, num_paths=2)])
+
+        shard_path = os.path.join(self.index.index_dir, first_shards[0].name)
+        mtime = os.path.getmtime(shard_path)
+
+        second = [make_item("c.pdf", "d.pdf"), make_item("e.pdf"), make_item("f.pdf")]
+        new_shards = self.index.append(second, max_paths_per_shard=2)
+        self.assertEqual([shard.num_paths for shard in new_shards], [2, 2])
+
+        self.assertEqual(self.index.shards(), first_shards + new_shards)
+        self.assertEqual(os.path.getmtime(shard_path), mtime)
+        self.assertEqual(self.index.load_items(), as_dict(first + second))
+
+    def test_concurrent_appends_keep_all(self):
+        # Separate WorkIndex objects, like separate processes, each with their own lock file handle
+        def append_some(worker):
+            index = WorkIndex(self.tmpdir.name)
+            for i in range(10):
+                index.append([make_item(f"{worker}_{i}.pdf")])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(append_some, range(8)))
+
+        self.assertEqual(len(self.index.shards()), 80)
+        self.assertEqual(len(self.index.load_items()), 80)
+
+    def test_legacy_csv_is_read(self):
+        legacy_item = make_item("old1.pdf", "old2.pdf")
+        with open(os.path.join(self.tmpdir.name, LEGACY_INDEX_NAME), "wb") as f:
+            f.write(zstd.ZstdCompressor().compress(",".join([legacy_item[0]] + legacy_item[1]).encode("utf-8") + b"\n"))
+
+        self.index.append([make_item("new.pdf", num_pages=3)])
+
+        legacy_shard = self.index.shards()[0]
+        self.assertEqual(legacy_shard.name, LEGACY_INDEX_NAME)
+        self.assertEqual(self.index.load_shard(legacy_shard), [legacy_item])
+        self.assertEqual(self.index.load_items(), as_dict([legacy_item, make_item("new.pdf")]))
+
+
+class TestWorkQueueShards(unittest.IsolatedAsyncioTestCase):
+    async def test_queue_loads_shards_as_it_goes(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            WorkIndex(workspace).append(
+                [make_item("a.pdf", num_pages=1), make_item("b.pdf", num_pages=2), make_item("c.pdf", num_pages=3)], max_paths_per_shard=1
+            )
+
+            work_queue = LocalWorkQueue(workspace)
+            await work_queue.initialize_queue()
+            self.assertEqual(work_queue._queue.qsize(), 1)
+            self.assertEqual(work_queue.size, 3)
+
+            pages = {}
+            while (item := await work_queue.get_work()) is not None:
+                pages[item.work_paths[0]] = item.num_pages
+                await work_queue.mark_done(item)
+            self.assertEqual(pages, {"a.pdf": 1, "b.pdf": 2, "c.pdf": 3})
+
+    async def test_longest_first_sorts_across_shards(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            WorkIndex(workspace).append([make_item(f"{num_pages}.pdf", num_pages=num_pages) for num_pages in (5, 40, 1, 12)], max_paths_per_shard=1)
+
+            work_queue = LocalWorkQueue(workspace, scheduling="longest_first")
+            await work_queue.initialize_queue()
+            self.assertEqual(work_queue._pending_shards, [])
+
+            pages = []
+            while (item := await work_queue.get_work()) is not None:
+                pages.append(item.num_pages)
+                await work_queue.mark_done(item)
+            self.assertEqual(pages, [40, 12, 5, 1])
+
+
+class TestPackByPages(unittest.IsolatedAsyncioTestCase):
+    def test_groups_are_balanced(self):
+        page_counts = {f"{i}.pdf": num_pages for i, num_pages in enumerate([400, 300, 200, 100, 100, 90, 5, 3, 1, 1])}
+        groups = pack_by_pages(page_counts, pages_per_group=400)
+
+        self.assertEqual(sorted(path for group in groups for path in group), sorted(page_counts))
+        self.assertEqual([sum(page_counts[path] for path in group) for group in groups], [400, 400, 400])
+
+    async def test_populate_counts_only_new_paths(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            work_queue = LocalWorkQueue(workspace)
+            page_counts = {"a.pdf": 300, "b.pdf": 250, "c.pdf": 50, "d.pdf": 10}
+            counted = []
+
+            def count_pages(paths):
+                counted.extend(paths)
+                # d.pdf can't be counted, so it goes in a group by the average page count of the others
+                return {path: page_counts[path] for path in paths if path != "d.pdf"}
+
+            await work_queue.populate_queue(["a.pdf", "b.pdf", "c.pdf"], items_per_group=1, pages_per_group=300, count_pages=count_pages)
+            await work_queue.populate_queue(["a.pdf", "d.pdf"], items_per_group=1, pages_per_group=300, count_pages=count_pages)
+            self.assertEqual(counted, ["a.pdf", "b.pdf", "c.pdf", "d.pdf"])
+
+            items = [item for shard in work_queue._index.shards() for item in work_queue._index.load_shard(shard)]
+            self.assertEqual(
+                sorted((paths, counts) for _, paths, counts in items),
+                [(["a.pdf"], [300]), (["b.pdf", "c.pdf"], [250, 50]), (["d.pdf"], [0])],
+            )
+
+
+class TestS3WorkIndex(unittest.TestCase):
+    def setUp(self):
+        self.s3_client = FakeS3Client()
+        self.index = WorkIndex("s3://bucket/workspace", self.s3_client)
+
+    def test_append_and_load(self):
+        items = [make_item("s3://bucket/a,b.pdf"), make_item("s3://bucket/c.pdf")]
+        self.index.append(items)
+
+        self.assertIn(("bucket", "workspace/work_index/manifest.json"), self.s3_client.objects)
+        self.assertEqual(self.index.load_items(), as_dict(items))
+
+    def test_concurrent_appends_keep_both(self):
+        self.index.append([make_item("s3://bucket/a.pdf")])
+
+        # Another process adds its shard between our read of the manifest and our write of it
+        other = WorkIndex("s3://bucket/workspace", self.s3_client)
+        original_put = self.s3_client.put_object
+        raced = False
+
+        def put_object(Bucket, Key, Body, **kwargs):
+            nonlocal raced
+            if Key.endswith("manifest.json") and not raced:
+                raced = True
+                other.append([make_item("s3://bucket/b.pdf")])
+            return original_put(Bucket, Key, Body, **kwargs)
+
+        self.s3_client.put_object = put_object
+        self.index.append([make_item("s3://bucket/c.pdf")])
+        self.s3_client.put_object = original_put
+
+        self.assertEqual(
+            sorted(path for paths in self.index.load_items().values() for path in paths),
+            ["s3://bucket/a.pdf", "s3://bucket/b.pdf", "s3://bucket/c.pdf"],
+        )
+        self.assertEqual(len(self.index.shards()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()